@@ -1,6 +1,8 @@
 import os
+import time
+import logging
 import requests
-from typing import Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, Tuple, Union
 from dotenv import load_dotenv
 
 # Importaciones opcionales de APIs de IA
@@ -18,9 +20,14 @@ except ImportError:
     ANTHROPIC_AVAILABLE = False
     print("Advertencia: anthropic no está instalado. Claude no estará disponible.")
 
+from . import ai_governor, faq, singleflight
+from .metrics import AI_ERRORS, AI_LATENCY
+
 # Cargar variables de entorno
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class AIAPIClient:
     """Cliente para integrar diferentes APIs de IA"""
 
@@ -37,9 +44,13 @@ class AIAPIClient:
         self.anthropic_api_key = os.getenv("ANTHROPIC_API_KEY")
 
         # Proveedor preferido (se puede configurar)
-        self.preferred_provider = os.getenv("AI_PROVIDER", "openai")  # openai, grok, anthropic
+        self.preferred_provider = os.getenv("AI_PROVIDER", "openai")  # openai, grok, anthropic, stub
 
-    def ask_ai(self, question: str, context: str = "", max_tokens: int = 500) -> Optional[str]:
+        # Proveedor local sin red para pruebas de carga (AI_PROVIDER=stub)
+        self.stub_latency = float(os.getenv("AI_STUB_LATENCY_MS", "0")) / 1000
+
+    def ask_ai(self, question: str, context: str = "", max_tokens: int = 500,
+               priority: str = ai_governor.CUSTOMER) -> Optional[str]:
         """
         Hace una pregunta a la API de IA configurada
 
@@ -47,30 +58,103 @@ class AIAPIClient:
             question: La pregunta del usuario
             context: Contexto adicional sobre la papelería
             max_tokens: Máximo número de tokens en la respuesta
+            priority: ai_governor.STAFF (personal) o ai_governor.CUSTOMER (clientes por WhatsApp)
 
         Returns:
             Respuesta de la IA o None si hay error
         """
-        try:
-            if self.preferred_provider == "openai" and self.openai_api_key:
-                return self._ask_openai(question, context, max_tokens)
-            elif self.preferred_provider == "grok" and self.grok_api_key:
-                return self._ask_grok(question, context, max_tokens)
-            elif self.preferred_provider == "anthropic" and self.anthropic_api_key:
-                return self._ask_anthropic(question, context, max_tokens)
-            else:
-                # Fallback: intentar OpenAI si está disponible
-                if self.openai_api_key:
-                    return self._ask_openai(question, context, max_tokens)
-                elif self.grok_api_key:
-                    return self._ask_grok(question, context, max_tokens)
-                else:
-                    return "🤖 Lo siento, no tengo acceso a servicios de IA en este momento. ¿Puedo ayudarte con información sobre nuestros productos o inventario?"
+        selected = self._select_provider()
+        if selected is None:
+            return "🤖 Lo siento, no tengo acceso a servicios de IA en este momento. ¿Puedo ayudarte con información sobre nuestros productos o inventario?"
+        provider, ask = selected
 
+        try:
+            # La misma pregunta con el mismo contexto, hecha a la vez, sale una sola vez al proveedor. La
+            # prioridad va en la clave: el personal no hereda la cola ni el rechazo de una llamada de cliente
+            return singleflight.ai_calls.do(
+                (provider, priority, question, context, max_tokens),
+                self._governed_call, provider, ask, priority, question, context, max_tokens,
+            )
+        except ai_governor.GovernorRejected as e:
+            if e.reason == "budget":
+                return "🤖 El asistente de IA alcanzó su límite de uso por hoy. Puedo ayudarte con comandos como 'ayuda', 'stock' o 'precio'."
+            return "🤖 Estoy atendiendo muchas consultas en este momento. Intenta de nuevo en un minuto o usa un comando como 'ayuda'."
         except Exception as e:
-            print(f"Error en API de IA: {e}")
+            logger.error("Error en API de IA: %s", e)
             return "🤖 Disculpa, tuve un problema técnico. ¿Puedes reformular tu pregunta o intentar con un comando específico como 'ayuda'?"
 
+    def answer(self, question: str, context: Union[str, Callable[[], str]] = "", max_tokens: int = 500,
+               priority: str = ai_governor.CUSTOMER, prompt: Optional[str] = None) -> Tuple[Optional[str], str]:
+        """
+        Responde primero con el índice local de preguntas frecuentes y solo si no hay
+        una coincidencia confiable consulta a la IA (ver faq.py)
+
+        Args:
+            question: La pregunta tal como la escribió el usuario (se busca en el índice local)
+            context: Contexto para la IA, o una función que lo construye solo si hace falta
+            prompt: Texto que se envía a la IA en lugar de `question`
+
+        Returns:
+            (respuesta, origen) con origen 'faq', 'readme' o 'ai'
+        """
+        start = time.perf_counter()
+        match = faq.lookup(question)
+        if match is not None:
+            faq.record_local(time.perf_counter() - start)
+            return match.answer, match.source
+
+        start = time.perf_counter()
+        response = self.ask_ai(prompt or question, context() if callable(context) else context, max_tokens, priority)
+        faq.record_llm(time.perf_counter() - start)
+        return response, "ai"
+
+    def _select_provider(self) -> Optional[Tuple[str, Callable[[str, str, int], Optional[str]]]]:
+        """Proveedor preferido si tiene clave; si no, OpenAI o Grok; None si no hay ninguno"""
+        if self.preferred_provider == "stub":
+            return "stub", self._ask_stub
+        elif self.preferred_provider == "openai" and self.openai_api_key:
+            return "openai", self._ask_openai
+        elif self.preferred_provider == "grok" and self.grok_api_key:
+            return "grok", self._ask_grok
+        elif self.preferred_provider == "anthropic" and self.anthropic_api_key:
+            return "anthropic", self._ask_anthropic
+        # Fallback: intentar OpenAI si está disponible
+        elif self.openai_api_key:
+            return "openai", self._ask_openai
+        elif self.grok_api_key:
+            return "grok", self._ask_grok
+        return None
+
+    def _governed_call(self, provider: str, ask, priority: str, question: str, context: str,
+                       max_tokens: int) -> Optional[str]:
+        """Llamada con turno, ritmo y presupuesto del control de costo (ver ai_governor.py)"""
+        reserved = ai_governor.estimate_tokens(question, context) + max_tokens
+        ai_governor.governor.acquire(provider, priority, reserved)
+        response = None
+        try:
+            response = self._call_provider(provider, ask, question, context, max_tokens)
+            return response
+        finally:
+            ai_governor.governor.release(provider, reserved, ai_governor.estimate_tokens(question, context, response))
+
+    def _call_provider(self, provider: str, ask, question: str, context: str, max_tokens: int) -> Optional[str]:
+        """Ejecuta la consulta al proveedor midiendo latencia y errores"""
+        with AI_LATENCY.time(provider=provider):
+            try:
+                response = ask(question, context, max_tokens)
+            except Exception:
+                AI_ERRORS.inc(provider=provider)
+                raise
+        if response is None:
+            AI_ERRORS.inc(provider=provider)
+        return response
+
+    def _ask_stub(self, question: str, context: str, max_tokens: int) -> Optional[str]:
+        """Respuesta local fija que simula la latencia de un proveedor real"""
+        if self.stub_latency > 0:
+            time.sleep(self.stub_latency)
+        return f"🤖 (respuesta simulada) Recibí tu pregunta: {question[:80]}"
+
     def _ask_openai(self, question: str, context: str, max_tokens: int) -> Optional[str]:
         """Consulta a OpenAI GPT"""
         if not OPENAI_AVAILABLE:
@@ -102,7 +186,7 @@ Instrucciones:
             return response.choices[0].message.content.strip()
 
         except Exception as e:
-            print(f"Error en OpenAI API: {e}")
+            logger.error("Error en OpenAI API: %s", e)
             return None
 
     def _ask_grok(self, question: str, context: str, max_tokens: int) -> Optional[str]:
@@ -142,7 +226,7 @@ Instrucciones:
             return result["choices"][0]["message"]["content"].strip()
 
         except Exception as e:
-            print(f"Error en Grok API: {e}")
+            logger.error("Error en Grok API: %s", e)
             return None
 
     def _ask_anthropic(self, question: str, context: str, max_tokens: int) -> Optional[str]:
@@ -185,7 +269,7 @@ Instrucciones:
             return result["content"][0]["text"].strip()
 
         except Exception as e:
-            print(f"Error en Anthropic API: {e}")
+            logger.error("Error en Anthropic API: %s", e)
             return None
 
     def get_available_providers(self) -> Dict[str, bool]:
@@ -0,0 +1,235 @@
+"""
+Control de costo y ritmo de las llamadas a proveedores de IA.
+
+- Ritmo: un balde de fichas por proveedor (AI_RATE_LIMITS, llamadas por
+  minuto; AI_RATE_BURST de ráfaga) y a lo sumo AI_MAX_CONCURRENCY llamadas en
+  curso por proveedor.
+- Presupuesto diario (día UTC): AI_DAILY_TOKEN_BUDGET tokens y
+  AI_DAILY_COST_BUDGET dólares, con AI_COST_PER_1K_TOKENS por proveedor. Cada
+  llamada reserva al entrar los tokens del prompt más max_tokens y al salir se
+  cobra lo usado. Los tokens se estiman en 4 caracteres por token: los
+  proveedores se consultan por texto y su conteo no llega hasta aquí.
+- Cola: las llamadas que no pueden salir esperan en una cola por proveedor
+  ordenada por prioridad (STAFF antes que CUSTOMER, y en orden de llegada)
+  hasta AI_QUEUE_TIMEOUT_SECONDS. Con AI_QUEUE_MAX llamadas en espera, las de
+  clientes se rechazan de inmediato; las del personal siempre pueden esperar.
+
+Una llamada rechazada lanza GovernorRejected con el motivo ('budget',
+'timeout', 'queue_full'); ai_api.ask_ai la convierte en una respuesta de
+cortesía. Los límites son por proceso.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .metrics import REGISTRY
+
+# Los límites se leen al importar, posiblemente antes que ai_api
+load_dotenv()
+
+STAFF = "staff"
+CUSTOMER = "customer"
+PRIORITIES = {STAFF: 0, CUSTOMER: 1}
+
+CHARS_PER_TOKEN = 4
+
+
+def _parse_rates(raw: str) -> Dict[str, float]:
+    """'openai=60,anthropic=50' -> {'openai': 60.0, 'anthropic': 50.0}"""
+    rates = {}
+    for part in raw.split(","):
+        if "=" in part:
+            name, value = part.split("=", 1)
+            rates[name.strip()] = float(value)
+    return rates
+
+
+# Llamadas por minuto por proveedor; un proveedor sin entrada no tiene límite de ritmo
+RATE_LIMITS = _parse_rates(os.getenv("AI_RATE_LIMITS", "openai=60,grok=60,anthropic=50"))
+RATE_BURST = int(os.getenv("AI_RATE_BURST", "5"))
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+# 0 = sin límite
+DAILY_TOKEN_BUDGET = int(os.getenv("AI_DAILY_TOKEN_BUDGET", "0"))
+DAILY_COST_BUDGET = float(os.getenv("AI_DAILY_COST_BUDGET", "0"))
+COST_PER_1K_TOKENS = _parse_rates(os.getenv("AI_COST_PER_1K_TOKENS", "openai=0.002,grok=0.005,anthropic=0.001"))
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_QUEUE_TIMEOUT_SECONDS", "20"))
+QUEUE_MAX = int(os.getenv("AI_QUEUE_MAX", "50"))
+
+AI_GOVERNOR_REQUESTS = REGISTRY.counter(
+    "papeleria_ai_governor_requests_total", "Llamadas de IA admitidas o rechazadas por el control de costo y ritmo",
+    ("provider", "priority", "outcome"))
+AI_QUEUE_WAIT = REGISTRY.histogram(
+    "papeleria_ai_queue_wait_seconds", "Espera en la cola antes de llamar al proveedor de IA", ("priority",),
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 60))
+AI_TOKENS = REGISTRY.counter(
+    "papeleria_ai_tokens_total", "Tokens estimados consumidos en proveedores de IA", ("provider",))
+AI_COST = REGISTRY.counter(
+    "papeleria_ai_cost_usd_total", "Costo estimado de las llamadas de IA en dólares", ("provider",))
+
+
+class GovernorRejected(Exception):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def estimate_tokens(*texts: Optional[str]) -> int:
+    return sum(len(text or "") for text in texts) // CHARS_PER_TOKEN + 1
+
+
+class TokenBucket:
+    """`rate` fichas por segundo hasta `capacity`; cada llamada toma una"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Segundos hasta que haya una ficha (0 si ya la hay)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+
+class AIGovernor:
+    def __init__(self, rate_limits: Dict[str, float] = RATE_LIMITS, burst: int = RATE_BURST,
+                 max_concurrency: int = MAX_CONCURRENCY, daily_token_budget: int = DAILY_TOKEN_BUDGET,
+                 daily_cost_budget: float = DAILY_COST_BUDGET,
+                 cost_per_1k_tokens: Dict[str, float] = COST_PER_1K_TOKENS,
+                 queue_timeout: float = QUEUE_TIMEOUT_SECONDS, queue_max: int = QUEUE_MAX):
+        self.buckets = {name: TokenBucket(rate / 60.0, max(1, burst)) for name, rate in rate_limits.items() if rate > 0}
+        self.max_concurrency = max_concurrency
+        self.daily_token_budget = daily_token_budget
+        self.daily_cost_budget = daily_cost_budget
+        self.cost_per_1k_tokens = cost_per_1k_tokens
+        self.queue_timeout = queue_timeout
+        self.queue_max = queue_max
+        self._cond = threading.Condition()
+        self._queues: Dict[str, List[Tuple[int, int]]] = {}
+        self._in_flight: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._day = datetime.utcnow().date()
+        self._spent_tokens = 0
+        self._spent_cost = 0.0
+        self._reserved_tokens = 0
+        self._reserved_cost = 0.0
+
+    def _cost(self, provider: str, tokens: int) -> float:
+        return tokens / 1000 * self.cost_per_1k_tokens.get(provider, 0.0)
+
+    def _roll_day(self):
+        today = datetime.utcnow().date()
+        if today != self._day:
+            self._day, self._spent_tokens, self._spent_cost = today, 0, 0.0
+
+    def _over_budget(self, provider: str, tokens: int) -> bool:
+        if self.daily_token_budget and self._spent_tokens + self._reserved_tokens + tokens > self.daily_token_budget:
+            return True
+        cost = self._cost(provider, tokens)
+        return bool(self.daily_cost_budget) and self._spent_cost + self._reserved_cost + cost > self.daily_cost_budget
+
+    def _reject(self, provider: str, priority: str, reason: str):
+        AI_GOVERNOR_REQUESTS.inc(provider=provider, priority=priority, outcome=reason)
+        raise GovernorRejected(reason)
+
+    def acquire(self, provider: str, priority: str, tokens: int, timeout: Optional[float] = None):
+        """Espera turno, ficha y presupuesto para una llamada de `tokens` tokens; lanza GovernorRejected"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            self._roll_day()
+            if self._over_budget(provider, tokens):
+                self._reject(provider, priority, "budget")
+            queue = self._queues.setdefault(provider, [])
+            if priority != STAFF and len(queue) >= self.queue_max:
+                self._reject(provider, priority, "queue_full")
+            entry = (PRIORITIES.get(priority, PRIORITIES[CUSTOMER]), next(self._seq))
+            heapq.heappush(queue, entry)
+            bucket = self.buckets.get(provider)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = None
+                    if queue[0] == entry and self._in_flight.get(provider, 0) < self.max_concurrency:
+                        wait = bucket.wait_time(now) if bucket is not None else 0.0
+                        if wait == 0.0:
+                            # El presupuesto pudo agotarse mientras esperaba
+                            if self._over_budget(provider, tokens):
+                                self._reject(provider, priority, "budget")
+                            heapq.heappop(queue)
+                            entry = None
+                            if bucket is not None:
+                                bucket.take()
+                            self._in_flight[provider] = self._in_flight.get(provider, 0) + 1
+                            self._reserved_tokens += tokens
+                            self._reserved_cost += self._cost(provider, tokens)
+                            break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._reject(provider, priority, "timeout")
+                    self._cond.wait(min(remaining, wait) if wait else remaining)
+            finally:
+                if entry is not None:
+                    queue.remove(entry)
+                    heapq.heapify(queue)
+                # El siguiente de la cola puede pasar a ser el primero
+                self._cond.notify_all()
+        AI_GOVERNOR_REQUESTS.inc(provider=provider, priority=priority, outcome="admitted")
+        AI_QUEUE_WAIT.observe(time.monotonic() - start, priority=priority)
+
+    def release(self, provider: str, reserved_tokens: int, used_tokens: int):
+        """Libera el cupo de la llamada y cobra los tokens usados en el presupuesto del día"""
+        cost = self._cost(provider, used_tokens)
+        with self._cond:
+            self._in_flight[provider] = max(0, self._in_flight.get(provider, 0) - 1)
+            self._reserved_tokens -= reserved_tokens
+            self._reserved_cost -= self._cost(provider, reserved_tokens)
+            self._roll_day()
+            self._spent_tokens += used_tokens
+            self._spent_cost += cost
+            self._cond.notify_all()
+        AI_TOKENS.inc(used_tokens, provider=provider)
+        AI_COST.inc(cost, provider=provider)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            self._roll_day()
+            providers = {}
+            for provider in set(self.buckets) | set(self._queues) | set(self._in_flight):
+                bucket = self.buckets.get(provider)
+                if bucket is not None:
+                    bucket._refill(now)
+                providers[provider] = {
+                    "in_flight": self._in_flight.get(provider, 0),
+                    "queued": len(self._queues.get(provider, [])),
+                    "calls_per_minute": round(bucket.rate * 60, 2) if bucket else None,
+                    "available_calls": round(bucket.tokens, 2) if bucket else None,
+                }
+            return {
+                "day": self._day.isoformat(),
+                "spent_tokens": self._spent_tokens,
+                "spent_cost": round(self._spent_cost, 6),
+                "daily_token_budget": self.daily_token_budget or None,
+                "daily_cost_budget": self.daily_cost_budget or None,
+                "providers": providers,
+            }
+
+
+governor = AIGovernor()
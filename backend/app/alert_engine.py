@@ -0,0 +1,255 @@
+"""
+Motor de alertas de inventario dirigido por eventos.
+
+En lugar de recorrer el catálogo (y pronosticar cada producto) en cada lectura,
+las reglas se evalúan solo para los productos que cambian:
+
+- stock o stock mínimo modificados: reglas de stock bajo y de demanda, esta
+  última con el pronóstico guardado en demand_forecasts.
+- ventas nuevas o eliminadas: se recalcula el pronóstico del producto.
+- productos eliminados: sus alertas se resuelven.
+
+Los cambios hechos con la sesión ORM se detectan solos una vez instalado el
+motor (install); las escrituras con Core deben llamar a evaluate_products. El
+estado vigente vive en `alerts` (una fila por producto y tipo) y cada
+transición activa <-> resuelta queda en `alert_events` y se publica en el
+canal en vivo (live); reevaluar un producto cuyo estado no cambió solo
+actualiza los valores medidos.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, event, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from . import live, models
+from .prediction import predict_demand_batch
+
+LOW_STOCK = "stock_bajo"
+HIGH_DEMAND = "demanda_alta"
+# Las emite el detector de ventas atípicas (sales_anomalies.py) y se resuelven a mano, no por reglas
+SALE_ANOMALY = "venta_atipica"
+RULE_TYPES = (LOW_STOCK, HIGH_DEMAND)
+ALERT_TYPES = RULE_TYPES + (SALE_ANOMALY,)
+ALERT_LABELS = {LOW_STOCK: "Stock bajo", HIGH_DEMAND: "Demanda alta prevista", SALE_ANOMALY: "Venta atípica"}
+
+ACTIVE = "activa"
+RESOLVED = "resuelta"
+
+DEMAND_HORIZON_DAYS = 30
+
+alerts_table = models.Alert.__table__
+alert_events_table = models.AlertEvent.__table__
+forecasts_table = models.DemandForecast.__table__
+products_table = models.Product.__table__
+
+_PENDING_KEY = "papeleria_alert_changes"
+
+
+def evaluate_rules(stock: Optional[int], min_stock: Optional[int],
+                   predicted_demand: float) -> Dict[str, Optional[Dict]]:
+    """Estado deseado de cada tipo de alerta para un producto (None = sin alerta)"""
+    stock = stock or 0
+    min_stock = min_stock or 0
+    rules: Dict[str, Optional[Dict]] = {LOW_STOCK: None, HIGH_DEMAND: None}
+    if stock < min_stock:
+        rules[LOW_STOCK] = {
+            "current_stock": stock, "value": stock, "threshold": min_stock,
+            "message": f"Stock actual {stock}, mínimo requerido {min_stock}",
+        }
+    if predicted_demand > stock:
+        rules[HIGH_DEMAND] = {
+            "current_stock": stock, "value": predicted_demand, "threshold": stock,
+            "message": f"Se espera vender {predicted_demand:.1f} unidades en los próximos "
+                       f"{DEMAND_HORIZON_DAYS} días, pero solo hay {stock} en stock.",
+        }
+    return rules
+
+
+def refresh_forecasts(db: Session, product_ids: Optional[Iterable[int]] = None) -> Dict[int, float]:
+    """Recalcula y guarda el pronóstico de los productos (todos si product_ids es None)"""
+    ids = None if product_ids is None else sorted(set(product_ids))
+    if ids is not None and not ids:
+        return {}
+    return store_forecasts(db, predict_demand_batch(db, DEMAND_HORIZON_DAYS, ids), ids)
+
+
+def store_forecasts(db: Session, forecasts, ids: Optional[List[int]] = None) -> Dict[int, float]:
+    """
+    Reemplaza los pronósticos guardados de los productos (todos si ids es None).
+
+    forecasts tiene las columnas de predict_demand_batch (product_id,
+    predicted_demand, sales_count); las cargas masivas que ya calcularon las
+    sumas de la regresión lo llaman directo, sin volver a leer las ventas.
+    """
+    stmt = delete(forecasts_table)
+    if ids is not None:
+        stmt = stmt.where(forecasts_table.c.product_id.in_(ids))
+    db.execute(stmt)
+    now = datetime.utcnow()
+    rows = [{
+        "product_id": int(product_id), "predicted_demand": float(predicted), "days_ahead": DEMAND_HORIZON_DAYS,
+        "sales_count": int(count), "computed_at": now,
+    } for product_id, predicted, count in forecasts.itertuples(index=False)]
+    if rows:
+        db.execute(insert(forecasts_table), rows)
+    return {row["product_id"]: row["predicted_demand"] for row in rows}
+
+
+def _where_products(stmt, column, ids: Optional[List[int]]):
+    return stmt if ids is None else stmt.where(column.in_(ids))
+
+
+def _coalesce(column, name: str):
+    # Un parámetro en None conserva el valor guardado
+    return func.coalesce(bindparam(name, type_=column.type), column)
+
+
+def _sync(db: Session, ids: Optional[List[int]],
+          desired: Dict[Tuple[int, str], Optional[Dict]]) -> List[Dict]:
+    """Aplica el estado deseado sobre las alertas guardadas y registra las transiciones"""
+    existing = {
+        (row.product_id, row.alert_type): row
+        for row in db.execute(_where_products(
+            select(alerts_table.c.id, alerts_table.c.product_id, alerts_table.c.alert_type, alerts_table.c.status,
+                   alerts_table.c.value, alerts_table.c.threshold, alerts_table.c.current_stock
+                   ).where(alerts_table.c.alert_type.in_(RULE_TYPES)),
+            alerts_table.c.product_id, ids,
+        ))
+    }
+    # Alertas de productos que ya no existen (ids=None en una reconstrucción completa)
+    for key in existing.keys() - desired.keys():
+        desired[key] = None
+
+    now = datetime.utcnow()
+    inserts, updates, transitions = [], [], []
+    for (product_id, alert_type), state in desired.items():
+        row = existing.get((product_id, alert_type))
+        if state is not None:
+            if row is not None and row.status == ACTIVE:
+                # Sigue activa: se actualizan los valores medidos sin registrar una transición
+                if (row.value, row.threshold, row.current_stock) != (
+                        state["value"], state["threshold"], state["current_stock"]):
+                    updates.append({"alert_id": row.id, "status": ACTIVE, "opened_at": None,
+                                    "updated_at": now, "resolved_at": None, **state})
+                continue
+            if row is None:
+                inserts.append({"product_id": product_id, "alert_type": alert_type, "status": ACTIVE,
+                                "opened_at": now, "updated_at": now, "resolved_at": None, **state})
+            else:
+                updates.append({"alert_id": row.id, "status": ACTIVE, "opened_at": now,
+                                "updated_at": now, "resolved_at": None, **state})
+            transitions.append({"product_id": product_id, "alert_type": alert_type, "status": ACTIVE,
+                                "value": state["value"], "threshold": state["threshold"], "created_at": now})
+        elif row is not None and row.status == ACTIVE:
+            updates.append({
+                "alert_id": row.id, "status": RESOLVED, "opened_at": None, "updated_at": now, "resolved_at": now,
+                "current_stock": row.current_stock, "value": row.value, "threshold": row.threshold,
+                "message": None,
+            })
+            transitions.append({"product_id": product_id, "alert_type": alert_type, "status": RESOLVED,
+                                "value": row.value, "threshold": row.threshold, "created_at": now})
+
+    if inserts:
+        db.execute(insert(alerts_table), inserts)
+    if updates:
+        # Los nombres de columna están reservados para el SET: los parámetros llevan prefijo
+        db.execute(
+            update(alerts_table).where(alerts_table.c.id == bindparam("b_alert_id")).values(
+                status=bindparam("b_status"),
+                opened_at=_coalesce(alerts_table.c.opened_at, "b_opened_at"),
+                updated_at=bindparam("b_updated_at"),
+                resolved_at=bindparam("b_resolved_at"),
+                current_stock=bindparam("b_current_stock"),
+                value=bindparam("b_value"),
+                threshold=bindparam("b_threshold"),
+                message=_coalesce(alerts_table.c.message, "b_message"),
+            ),
+            [{f"b_{key}": value for key, value in row.items()} for row in updates],
+        )
+    if transitions:
+        db.execute(insert(alert_events_table), transitions)
+    return transitions
+
+
+def evaluate_products(db: Session, product_ids: Optional[Iterable[int]] = None,
+                      sales_changed: Iterable[int] = ()) -> List[Dict]:
+    """
+    Reevalúa las reglas de los productos indicados (todos si product_ids es None).
+
+    sales_changed son los productos con ventas nuevas o eliminadas: su
+    pronóstico se recalcula antes de evaluar. Devuelve las transiciones.
+    """
+    ids = None if product_ids is None else sorted(set(product_ids) | set(sales_changed))
+    if ids is not None and not ids:
+        return []
+    if sales_changed:
+        refresh_forecasts(db, sales_changed)
+
+    forecasts = dict(db.execute(_where_products(
+        select(forecasts_table.c.product_id, forecasts_table.c.predicted_demand),
+        forecasts_table.c.product_id, ids,
+    )).all())
+    products = db.execute(_where_products(
+        select(products_table.c.id, products_table.c.stock, products_table.c.min_stock),
+        products_table.c.id, ids,
+    )).all()
+
+    desired: Dict[Tuple[int, str], Optional[Dict]] = {}
+    for product_id, stock, min_stock in products:
+        for alert_type, state in evaluate_rules(stock, min_stock, forecasts.get(product_id, 0.0)).items():
+            desired[(product_id, alert_type)] = state
+    # Productos eliminados: sus alertas se resuelven en _sync
+    return _sync(db, ids, desired)
+
+
+def rebuild(db: Session) -> Dict[str, int]:
+    """Recalcula todos los pronósticos y el estado de todas las alertas (migraciones y cargas masivas)"""
+    if isinstance(db, Session):
+        # Las alertas se indexan por producto: se reconstruyen todas las del archivo, sin filtro de tienda
+        db = db.connection()
+    forecasts = refresh_forecasts(db)
+    transitions = evaluate_products(db)
+    return {
+        "forecasts": len(forecasts),
+        "opened": sum(1 for t in transitions if t["status"] == ACTIVE),
+        "resolved": sum(1 for t in transitions if t["status"] == RESOLVED),
+    }
+
+
+def _pending(session) -> Dict[str, Set[int]]:
+    return session.info.setdefault(_PENDING_KEY, {"products": set(), "sales": set()})
+
+
+def _after_flush(session, flush_context):
+    """Anota qué productos cambiaron en el flush; la evaluación se hace al confirmar"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, models.Product) and obj.id is not None:
+            _pending(session)["products"].add(obj.id)
+        elif isinstance(obj, models.Sale) and obj.product_id is not None:
+            _pending(session)["sales"].add(obj.product_id)
+
+
+def _before_commit(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    changed = session.info.pop(_PENDING_KEY, None)
+    if changed:
+        for transition in evaluate_products(session, changed["products"], changed["sales"]):
+            live.publish_after_commit(session, "alert", transition)
+
+
+def _discard_pending(session, *args):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def install(session_factory):
+    """Conecta el motor a los eventos de las sesiones creadas por session_factory"""
+    if getattr(session_factory, "_papeleria_alerts", False):
+        return session_factory
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_rollback", _discard_pending)
+    session_factory._papeleria_alerts = True
+    return session_factory
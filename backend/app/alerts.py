@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from . import alert_engine, queries, sales_anomalies, schemas, singleflight
+from .tenancy import get_db, heavy_job
+
+router = APIRouter(prefix="/alerts", tags=["alerts"])
+
+@router.get("/", response_model=List[schemas.Alert])
+def read_active_alerts(alert_type: Optional[str] = None, db: Session = Depends(get_db)):
+    if alert_type is not None and alert_type not in alert_engine.ALERT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Tipo de alerta no válido. Use uno de: {', '.join(alert_engine.ALERT_TYPES)}")
+    return queries.list_active_alerts(db, alert_type)
+
+@router.get("/events", response_model=List[schemas.AlertEvent])
+def read_alert_events(product_id: Optional[int] = None, limit: int = 100, db: Session = Depends(get_db)):
+    return queries.list_alert_events(db, product_id, limit)
+
+@router.post("/{alert_id}/resolve", response_model=schemas.Alert)
+def resolve_alert(alert_id: int, db: Session = Depends(get_db)):
+    # Solo las de venta atípica: las de stock y demanda se resuelven solas al cambiar el stock
+    alert = sales_anomalies.resolve(db, alert_id)
+    if alert is None:
+        raise HTTPException(status_code=404, detail="Alerta de venta atípica no encontrada")
+    db.commit()
+    return alert
+
+@router.post("/rebuild", response_model=schemas.AlertRebuild, dependencies=[Depends(heavy_job)])
+def rebuild_alerts(db: Session = Depends(get_db)):
+    # Para cargas hechas por fuera de la sesión ORM (importaciones masivas, SQL directo)
+    def rebuild():
+        stats = alert_engine.rebuild(db)
+        db.commit()
+        return stats
+    # Una reconstrucción en curso se comparte en lugar de repetir el pronóstico del catálogo
+    return singleflight.forecasts.do(("alerts_rebuild", singleflight.scope_of(db)), rebuild)
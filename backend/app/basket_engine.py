@@ -0,0 +1,260 @@
+"""
+Canastas de compra: qué productos se compran juntos.
+
+- Tickets: register_ticket guarda una compra como un ticket con sus líneas de
+  venta (sales.ticket_id) y descuenta el stock. Las ventas anteriores a los
+  tickets quedan sueltas y no cuentan para la minería.
+- Minería (mine_pairs): con las líneas (ticket, producto) de los tickets de los
+  últimos BASKET_WINDOW_DAYS arma una matriz dispersa tickets × productos (1 si
+  el producto está en el ticket) y, como la primera pasada de FP-growth,
+  descarta los productos que están en menos de BASKET_MIN_TICKETS tickets y los
+  tickets que quedan con un solo producto. Los tickets de cada par de productos
+  salen de un solo producto de matrices, Xᵀ·X, sin recorrer canastas en
+  Python. De cada par A, B sale la regla A -> B con
+  confidence = tickets(A y B) / tickets(A) y lift = confidence / P(B); se
+  conservan las de confidence >= BASKET_MIN_CONFIDENCE y lift >= BASKET_MIN_LIFT
+  (más frecuentes juntos que por azar) y, de cada producto, las
+  BASKET_TOP_K de mayor confianza.
+- Las reglas se guardan en product_associations con su posición (rank). Leer
+  los relacionados de un producto (related) es una búsqueda en el índice
+  (tienda, producto, rank), sin calcular nada en la petición.
+- BasketWorker repite run cada BASKET_INTERVAL_SECONDS en cada base de tiendas
+  (ver tenancy.store_engines).
+
+Ejecutar manualmente con: python -m app.basket_engine
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import models, tenancy
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INTERVAL_SECONDS = float(os.getenv("BASKET_INTERVAL_SECONDS", "86400"))
+WINDOW_DAYS = int(os.getenv("BASKET_WINDOW_DAYS", "365"))
+MIN_TICKETS = int(os.getenv("BASKET_MIN_TICKETS", "5"))
+MIN_CONFIDENCE = float(os.getenv("BASKET_MIN_CONFIDENCE", "0.05"))
+MIN_LIFT = float(os.getenv("BASKET_MIN_LIFT", "1.2"))
+TOP_K = int(os.getenv("BASKET_TOP_K", "10"))
+LOAD_BATCH_SIZE = 200_000
+INSERT_BATCH_SIZE = 10_000
+
+sales_table = models.Sale.__table__
+tickets_table = models.Ticket.__table__
+products_table = models.Product.__table__
+associations_table = models.ProductAssociation.__table__
+
+BASKET_MINING = REGISTRY.histogram(
+    "papeleria_basket_mining_seconds", "Duración de la minería de canastas por base de tiendas",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+BASKET_RULES = REGISTRY.counter(
+    "papeleria_basket_rules_total", "Reglas 'se compra con' escritas por la minería de canastas")
+BASKET_ERRORS = REGISTRY.counter(
+    "papeleria_basket_errors_total", "Corridas de minería de canastas fallidas (se reintentan en la siguiente)")
+
+# Una sola minería a la vez en el proceso (hilo de fondo o POST /baskets/mine)
+_run_lock = threading.Lock()
+
+
+def register_ticket(db: Session, lines: Sequence[Tuple[models.Product, int]], channel: str,
+                    customer_phone: Optional[str] = None) -> models.Ticket:
+    """Agrega a la sesión el ticket y una venta por línea y descuenta el stock; quien llama valida y confirma"""
+    ticket = models.Ticket(channel=channel, customer_phone=customer_phone,
+                           total_price=sum(product.price * quantity for product, quantity in lines))
+    db.add(ticket)
+    db.flush()
+    for product, quantity in lines:
+        db.add(models.Sale(product_id=product.id, quantity=quantity, total_price=product.price * quantity,
+                           customer_phone=customer_phone, ticket_id=ticket.id))
+        product.stock -= quantity
+    return ticket
+
+
+def mine_pairs(ticket_ids: np.ndarray, product_ids: np.ndarray, min_tickets: int = MIN_TICKETS,
+               min_confidence: float = MIN_CONFIDENCE, min_lift: float = MIN_LIFT,
+               top_k: int = TOP_K) -> Dict[str, np.ndarray]:
+    """Reglas producto -> relacionado a partir de las líneas (ticket, producto), ordenadas por producto y rank"""
+    columns = ("product_id", "related_product_id", "rank", "tickets", "support", "confidence", "lift")
+    empty = {name: np.empty(0) for name in columns}
+    if len(ticket_ids) == 0:
+        return empty
+    ticket_codes = np.unique(ticket_ids, return_inverse=True)[1]
+    products, product_codes = np.unique(product_ids, return_inverse=True)
+    total_tickets = int(ticket_codes.max()) + 1
+
+    baskets = sparse.csr_matrix(
+        (np.ones(len(ticket_codes), dtype=np.int32), (ticket_codes, product_codes)),
+        shape=(total_tickets, len(products)))
+    # Un producto repetido en el ticket cuenta una vez
+    baskets.data[:] = 1
+    item_tickets = np.asarray(baskets.sum(axis=0)).ravel()
+
+    frequent = np.flatnonzero(item_tickets >= min_tickets)
+    baskets = baskets[:, frequent]
+    products, item_tickets = products[frequent], item_tickets[frequent]
+    baskets = baskets[np.asarray(baskets.sum(axis=1)).ravel() >= 2]
+    if baskets.shape[0] == 0:
+        return empty
+
+    pairs = (baskets.T @ baskets).tocoo()
+    mask = (pairs.row != pairs.col) & (pairs.data >= min_tickets)
+    first, second, together = pairs.row[mask], pairs.col[mask], pairs.data[mask]
+    confidence = together / item_tickets[first]
+    lift = confidence / (item_tickets[second] / total_tickets)
+    keep = (confidence >= min_confidence) & (lift >= min_lift)
+    first, second, together, confidence, lift = (
+        values[keep] for values in (first, second, together, confidence, lift))
+
+    # Por producto, de mayor a menor confianza y, a igualdad, de mayor lift
+    order = np.lexsort((-lift, -confidence, first))
+    first, second, together, confidence, lift = (
+        values[order] for values in (first, second, together, confidence, lift))
+    starts = np.flatnonzero(np.r_[True, first[1:] != first[:-1]])
+    rank = np.arange(len(first)) - np.repeat(starts, np.diff(np.r_[starts, len(first)])) + 1
+    top = rank <= top_k
+    return {
+        "product_id": products[first[top]],
+        "related_product_id": products[second[top]],
+        "rank": rank[top],
+        "tickets": together[top],
+        "support": together[top] / total_tickets,
+        "confidence": confidence[top],
+        "lift": lift[top],
+    }
+
+
+def load_lines(conn: Connection, since: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(tienda, ticket, producto) de las líneas de los tickets desde `since`, leídas por bloques"""
+    # Tickets por el índice de fecha y sus líneas por el índice parcial (ticket_id, product_id, store_id)
+    stmt = select(sales_table.c.store_id, sales_table.c.ticket_id, sales_table.c.product_id).join(
+        tickets_table, tickets_table.c.id == sales_table.c.ticket_id
+    ).where(
+        tickets_table.c.created_at >= since, sales_table.c.product_id.is_not(None)
+    )
+    result = conn.execution_options(stream_results=True).execute(stmt)
+    # fromiter sobre las filas aplanadas: np.array sobre objetos Row es dos órdenes de magnitud más lento
+    chunks = [np.fromiter(chain.from_iterable(part), dtype=np.int64, count=3 * len(part)).reshape(-1, 3)
+              for part in result.partitions(LOAD_BATCH_SIZE)]
+    lines = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    return lines[:, 0], lines[:, 1], lines[:, 2]
+
+
+def write_rules(conn: Connection, store_id: int, rules: Dict[str, np.ndarray], computed_at: datetime) -> int:
+    """Reemplaza las reglas de la tienda"""
+    conn.execute(delete(associations_table).where(associations_table.c.store_id == store_id))
+    count = len(rules["product_id"])
+    for start in range(0, count, INSERT_BATCH_SIZE):
+        stop = min(start + INSERT_BATCH_SIZE, count)
+        conn.execute(insert(associations_table), [
+            {
+                "store_id": store_id,
+                "product_id": int(rules["product_id"][i]),
+                "related_product_id": int(rules["related_product_id"][i]),
+                "rank": int(rules["rank"][i]),
+                "tickets": int(rules["tickets"][i]),
+                "support": float(rules["support"][i]),
+                "confidence": float(rules["confidence"][i]),
+                "lift": float(rules["lift"][i]),
+                "computed_at": computed_at,
+            }
+            for i in range(start, stop)
+        ])
+    return count
+
+
+def mine(conn: Connection, window_days: int = WINDOW_DAYS, **params) -> Dict[str, int]:
+    """Mina los tickets de la ventana en una base y reescribe las reglas de cada tienda que tenga tickets"""
+    now = datetime.utcnow()
+    stores, tickets, products = load_lines(conn, now - timedelta(days=window_days))
+    stats = {"tickets": int(len(np.unique(tickets))), "lines": int(len(tickets)), "rules": 0}
+    # Tiendas sin tickets en la ventana: sin reglas
+    conn.execute(delete(associations_table).where(
+        associations_table.c.store_id.not_in([int(store_id) for store_id in np.unique(stores)])))
+    for store_id in np.unique(stores):
+        in_store = stores == store_id
+        rules = mine_pairs(tickets[in_store], products[in_store], **params)
+        stats["rules"] += write_rules(conn, int(store_id), rules, now)
+    BASKET_RULES.inc(stats["rules"])
+    return stats
+
+
+def run(window_days: int = WINDOW_DAYS) -> Dict[str, int]:
+    """Mina todas las bases de tiendas"""
+    with _run_lock:
+        engines = tenancy.store_engines()
+        stats = {"databases": len(engines), "tickets": 0, "lines": 0, "rules": 0}
+        for engine in engines:
+            start = time.perf_counter()
+            with engine.begin() as conn:
+                for key, value in mine(conn, window_days).items():
+                    stats[key] += value
+            BASKET_MINING.observe(time.perf_counter() - start)
+        return stats
+
+
+def related(db: Session, product_id: int, limit: int = 5) -> List[Dict[str, Any]]:
+    """Productos que más se compran con product_id, ya ordenados (el filtro de tienda lo pone la sesión)"""
+    stmt = select(
+        associations_table.c.related_product_id, products_table.c.name, products_table.c.price,
+        products_table.c.stock, associations_table.c.rank, associations_table.c.tickets,
+        associations_table.c.confidence, associations_table.c.lift,
+    ).join(
+        products_table, products_table.c.id == associations_table.c.related_product_id
+    ).where(
+        associations_table.c.product_id == product_id
+    ).order_by(associations_table.c.rank).limit(limit)
+    return [dict(row) for row in db.execute(stmt).mappings()]
+
+
+class BasketWorker:
+    """Hilo de fondo que mina las canastas cada `interval` segundos"""
+
+    def __init__(self, interval: float, window_days: int = WINDOW_DAYS):
+        self.interval = interval
+        self.window_days = window_days
+        self.last_run: Optional[Dict[str, int]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="baskets", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_run = run(self.window_days)
+            except Exception:
+                BASKET_ERRORS.inc()
+                logger.exception("No se pudo minar las canastas de compra")
+
+    def close(self):
+        self._stop.set()
+
+
+_worker: Optional[BasketWorker] = None
+
+
+def start_worker() -> Optional[BasketWorker]:
+    """Arranca el hilo de minería una vez por proceso (nada si BASKET_INTERVAL_SECONDS <= 0)"""
+    global _worker
+    if _worker is None and INTERVAL_SECONDS > 0:
+        _worker = BasketWorker(INTERVAL_SECONDS)
+    return _worker
+
+
+if __name__ == "__main__":
+    from .migrations import run_migrations
+
+    run_migrations()
+    print(run())
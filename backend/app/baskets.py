@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+from . import basket_engine, loyalty_engine, models, schemas
+from .tenancy import get_db, get_read_db
+
+router = APIRouter(prefix="/baskets", tags=["baskets"])
+
+def _ticket_response(db: Session, ticket: models.Ticket):
+    lines = db.query(models.Sale).filter(models.Sale.ticket_id == ticket.id).order_by(models.Sale.id).all()
+    return {
+        "id": ticket.id, "channel": ticket.channel, "customer_phone": ticket.customer_phone,
+        "total_price": ticket.total_price, "created_at": ticket.created_at, "lines": lines,
+    }
+
+@router.post("/tickets", response_model=schemas.Ticket, status_code=status.HTTP_201_CREATED)
+def create_ticket(ticket: schemas.TicketCreate, db: Session = Depends(get_db)):
+    # Una compra con varias líneas; cada línea es una venta del ticket
+    quantities = {}
+    for line in ticket.lines:
+        quantities[line.product_id] = quantities.get(line.product_id, 0) + line.quantity
+    products = {product.id: product for product in
+                db.query(models.Product).filter(models.Product.id.in_(quantities)).all()}
+    missing = [product_id for product_id in quantities if product_id not in products]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Productos no encontrados: {', '.join(map(str, missing))}")
+    short = [products[product_id].name for product_id, quantity in quantities.items()
+             if products[product_id].stock < quantity]
+    if short:
+        raise HTTPException(status_code=400, detail=f"No hay suficiente stock de: {', '.join(short)}")
+
+    db_ticket = basket_engine.register_ticket(
+        db, [(products[product_id], quantity) for product_id, quantity in quantities.items()], "api",
+        loyalty_engine.normalize_phone(ticket.customer_phone))
+    db.commit()
+    return _ticket_response(db, db_ticket)
+
+@router.get("/tickets/{ticket_id}", response_model=schemas.Ticket)
+def read_ticket(ticket_id: int, db: Session = Depends(get_db)):
+    db_ticket = db.query(models.Ticket).filter(models.Ticket.id == ticket_id).first()
+    if db_ticket is None:
+        raise HTTPException(status_code=404, detail="Ticket no encontrado")
+    return _ticket_response(db, db_ticket)
+
+@router.get("/products/{product_id}/related", response_model=List[schemas.RelatedProduct])
+def read_related_products(product_id: int, limit: int = 5, db: Session = Depends(get_read_db)):
+    # Precalculado por la minería de canastas: una lectura del índice por producto
+    return basket_engine.related(db, product_id, min(limit, basket_engine.TOP_K))
+
+@router.post("/mine", response_model=schemas.BasketRun)
+def run_mining(window_days: int = basket_engine.WINDOW_DAYS):
+    # Lo mismo que hace el hilo de fondo cada BASKET_INTERVAL_SECONDS, en todas las tiendas
+    if window_days < 1:
+        raise HTTPException(status_code=400, detail="window_days debe ser al menos 1")
+    return basket_engine.run(window_days)
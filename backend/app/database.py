@@ -1,24 +1,60 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import create_engine, event, text, Column, Integer, String, Float, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, relationship
 from datetime import datetime
+import os
 
-# Configuración de la base de datos
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db" # Usaremos SQLite por simplicidad inicial
+# Configuración de la base de datos (SQLite por defecto, DATABASE_URL para otra ruta o motor)
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+def is_sqlite_file(engine) -> bool:
+    return engine.url.get_backend_name() == "sqlite" and engine.url.database not in (None, "", ":memory:")
+
+def enable_wal(engine):
+    """Modo WAL en SQLite de archivo: las lecturas largas y las copias no bloquean las escrituras"""
+    if is_sqlite_file(engine):
+        @event.listens_for(engine, "connect")
+        def _set_wal(dbapi_connection, connection_record):
+            dbapi_connection.execute("PRAGMA journal_mode=WAL")
+    return engine
+
+engine = enable_wal(create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False} if SQLALCHEMY_DATABASE_URL.startswith("sqlite") else {}
+))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# Tienda a la que pertenecen los datos previos a la multitienda y las peticiones sin X-Store-ID
+DEFAULT_STORE_ID = 1
+# Clave de Session.info con la tienda de la sesión (ver tenancy.py)
+STORE_INFO_KEY = "papeleria_store_id"
+
+def store_column():
+    # server_default: las cargas con SQL directo (seed_data.py) también quedan en una tienda
+    return Column(Integer, nullable=False, default=DEFAULT_STORE_ID, server_default=str(DEFAULT_STORE_ID))
+
 # Modelos de la base de datos
+class Store(Base):
+    __tablename__ = "stores"
+
+    # Catálogo de tiendas; el de la base principal (DATABASE_URL) es el que vale
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # El nombre es único dentro de cada tienda
+        Index("ux_products_store_name", "store_id", "name", unique=True),
+        Index("ux_products_sync_id", "sync_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
+    store_id = store_column()
+    name = Column(String, index=True)
     description = Column(String, nullable=True)
     price = Column(Float, default=0.0)
     stock = Column(Integer, default=0)
@@ -26,46 +62,313 @@ class Product(Base):
     category = Column(String, nullable=True)
     supplier = Column(String, nullable=True)
     last_updated = Column(DateTime, default=datetime.utcnow)
+    # Sincronización entre nodos (ver sync.py): identificador global y versión de los campos distintos del stock
+    sync_id = Column(String, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    sync_origin = Column(String, nullable=True) # Nodo que escribió esa versión
 
 class Sale(Base):
     __tablename__ = "sales"
+    __table_args__ = (
+        # Cubre las agregaciones por ventana de fechas sin leer la tabla, también filtradas por tienda
+        Index("ix_sales_date_product_store", "sale_date", "product_id", "quantity", "store_id"),
+        # Solo las ventas con cliente que aún no sumaron puntos (ver loyalty_engine.py)
+        Index("ix_sales_loyalty_pending", "id",
+              sqlite_where=text("customer_phone IS NOT NULL AND loyalty_points IS NULL"),
+              postgresql_where=text("customer_phone IS NOT NULL AND loyalty_points IS NULL")),
+        # Parcial: las ventas cargadas sin sincronización no tienen sync_id y no ocupan el índice
+        Index("ux_sales_sync_id", "sync_id", unique=True, sqlite_where=text("sync_id IS NOT NULL"),
+              postgresql_where=text("sync_id IS NOT NULL")),
+        # Líneas de cada ticket, leídas por la minería de canastas sin tocar la tabla (ver basket_engine.py)
+        Index("ix_sales_ticket_product", "ticket_id", "product_id", "store_id", sqlite_where=text("ticket_id IS NOT NULL"),
+              postgresql_where=text("ticket_id IS NOT NULL")),
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    # Sin índice aparte: en SQLite la clave primaria entera ya es el rowid de la tabla
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
     product_id = Column(Integer, index=True)
     quantity = Column(Integer, default=1)
     sale_date = Column(DateTime, default=datetime.utcnow)
     total_price = Column(Float, default=0.0)
+    customer_phone = Column(String, nullable=True) # Teléfono normalizado del comprador (remitente de WhatsApp)
+    customer_id = Column(Integer, nullable=True) # Lo asigna el motor de fidelización
+    loyalty_points = Column(Integer, nullable=True) # Puntos otorgados; NULL mientras la venta está pendiente
+    sync_id = Column(String, nullable=True) # Identificador global de la venta entre nodos
+    ticket_id = Column(Integer, nullable=True) # Ticket (canasta) al que pertenece la línea; NULL en ventas sueltas anteriores
+
+class Ticket(Base):
+    __tablename__ = "tickets"
+
+    # Una compra: agrupa las líneas de venta que se pagaron juntas (la clave primaria es el rowid, sin índice aparte)
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
+    channel = Column(String, nullable=True) # 'api', 'whatsapp', 'streamlit'
+    customer_phone = Column(String, nullable=True)
+    total_price = Column(Float, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 class Customer(Base):
     __tablename__ = "customers"
+    __table_args__ = (
+        Index("ux_customers_store_phone", "store_id", "phone_number", unique=True),
+        # Ranking de la tienda y ranking por nivel, leídos en orden del índice
+        Index("ix_customers_store_points", "store_id", "loyalty_points"),
+        Index("ix_customers_store_level_points", "store_id", "membership_level", "loyalty_points"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    store_id = store_column()
     name = Column(String, index=True)
-    phone_number = Column(String, unique=True, index=True)
+    phone_number = Column(String, index=True)
     loyalty_points = Column(Integer, default=0)
     membership_level = Column(String, default="Bronce")
     last_purchase = Column(DateTime, default=datetime.utcnow)
 
 class SchoolList(Base):
     __tablename__ = "school_lists"
+    __table_args__ = (
+        Index("ix_school_lists_year_grade", "year", "grade"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     school_name = Column(String, index=True)
     grade = Column(String, index=True)
     year = Column(Integer, default=datetime.utcnow().year)
-    items = Column(String) # JSON string of items and quantities
+    items_json = Column("items", String, nullable=True) # Legado: JSON migrado a school_list_items
+
+    items = relationship("SchoolListItem", lazy="selectin", cascade="all, delete-orphan", order_by="SchoolListItem.id")
+
+class SchoolListItem(Base):
+    __tablename__ = "school_list_items"
+    __table_args__ = (
+        # Cubre el join con school_lists y la suma de cantidades por producto
+        Index("ix_school_list_items_list_product", "school_list_id", "product_id", "quantity"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    school_list_id = Column(Integer, ForeignKey("school_lists.id", ondelete="CASCADE"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True, index=True)
+    description = Column(String, nullable=True) # Texto original cuando no se asoció a un producto
+    quantity = Column(Integer, default=1)
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_store_status_due_date", "store_id", "status", "due_date"),
+        # Cola de impresión: pendientes de la tienda ya en el orden en que se atienden (ver print_queue.py)
+        Index("ix_orders_print_queue", "store_id", "order_type", "status", "priority", "due_date", "pages"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    store_id = store_column()
     customer_id = Column(Integer, nullable=True)
     order_type = Column(String) # 'impresion', 'producto', 'lista_escolar'
-    status = Column(String, default="Pendiente")
-    details = Column(String) # JSON string of order details
+    status = Column(String, default="Pendiente") # 'Pendiente', 'En proceso', 'Listo', 'Entregado', 'Cancelado'
+    details = Column(String, nullable=True) # Especificaciones libres (color, anillado...); los productos van en order_items
     total_amount = Column(Float, default=0.0)
     created_at = Column(DateTime, default=datetime.utcnow)
     due_date = Column(DateTime, nullable=True)
+    priority = Column(Integer, nullable=False, default=1, server_default="1") # 0 urgente, 1 normal, 2 baja
+    pages = Column(Integer, nullable=True) # Tamaño de un trabajo de impresión (páginas × copias)
+    printer_id = Column(Integer, nullable=True) # Impresora que lo atiende mientras está 'En proceso'
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+
+    items = relationship("OrderItem", lazy="selectin", cascade="all, delete-orphan", order_by="OrderItem.id")
+
+class OrderItem(Base):
+    __tablename__ = "order_items"
+    __table_args__ = (
+        Index("ix_order_items_product_order", "product_id", "order_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"), nullable=False, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=True)
+    description = Column(String, nullable=True)
+    quantity = Column(Integer, default=1)
+    unit_price = Column(Float, default=0.0)
+
+class DemandForecast(Base):
+    __tablename__ = "demand_forecasts"
+
+    # Último pronóstico por producto; se recalcula solo cuando cambian sus ventas
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    predicted_demand = Column(Float, default=0.0)
+    days_ahead = Column(Integer, default=30)
+    sales_count = Column(Integer, default=0)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class Alert(Base):
+    __tablename__ = "alerts"
+    __table_args__ = (
+        # Una fila por producto y tipo: reevaluar no duplica alertas
+        Index("ux_alerts_product_type", "product_id", "alert_type", unique=True),
+        # Las lecturas solo recorren las alertas activas
+        Index("ix_alerts_status_type", "status", "alert_type", "product_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    alert_type = Column(String, nullable=False) # 'stock_bajo', 'demanda_alta', 'venta_atipica'
+    status = Column(String, default="activa") # 'activa', 'resuelta'
+    current_stock = Column(Integer, default=0)
+    value = Column(Float, default=0.0) # Lo medido: stock o demanda prevista
+    threshold = Column(Float, default=0.0) # El límite cruzado: stock mínimo o stock actual
+    message = Column(String, nullable=True)
+    opened_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    resolved_at = Column(DateTime, nullable=True)
+
+class AlertEvent(Base):
+    __tablename__ = "alert_events"
+    __table_args__ = (
+        Index("ix_alert_events_product_created", "product_id", "created_at"),
+    )
+
+    # Historial de transiciones (activa <-> resuelta); solo se escribe cuando el estado cambia,
+    # salvo las ventas atípicas: cada una queda registrada
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, nullable=False)
+    alert_type = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    value = Column(Float, default=0.0)
+    threshold = Column(Float, default=0.0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class InventoryMovement(Base):
+    __tablename__ = "inventory_movements"
+    __table_args__ = (
+        # Kardex de un producto y suma de sus movimientos posteriores a un corte, sin leer la tabla
+        Index("ix_inventory_movements_product_created", "product_id", "created_at", "quantity"),
+        # Rangos de fechas de la tienda: listados, cortes periódicos y compactación
+        Index("ix_inventory_movements_created_store", "created_at", "store_id"),
+        # Los ids no se reutilizan tras compactar: los archivos y el libro no comparten números
+        {"sqlite_autoincrement": True},
+    )
+
+    # Libro de inventario de solo inserción: cada cambio de stock con su motivo (ver inventory_ledger.py)
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
+    product_id = Column(Integer, nullable=False)
+    movement_type = Column(String, nullable=False) # 'inicial', 'venta', 'reposicion', 'ajuste', 'devolucion'
+    quantity = Column(Integer, nullable=False) # Con signo: positivo entra, negativo sale
+    stock_after = Column(Integer, nullable=True) # Stock que quedó en el producto (NULL en cargas masivas)
+    reference = Column(String, nullable=True) # Origen del movimiento: 'venta:123', factura, 'sync:<nodo>'
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class InventorySnapshot(Base):
+    __tablename__ = "inventory_snapshots"
+    __table_args__ = (
+        # Un corte por producto y fecha; el último anterior a una fecha se lee del índice
+        Index("ux_inventory_snapshots_product_at", "product_id", "snapshot_at", unique=True),
+    )
+
+    # Stock de cada producto con movimientos en el periodo, al cierre del periodo
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
+    product_id = Column(Integer, nullable=False)
+    snapshot_at = Column(DateTime, nullable=False)
+    stock = Column(Integer, nullable=False)
+    movements = Column(Integer, default=0) # Movimientos del periodo que cierra
+
+class InventoryArchive(Base):
+    __tablename__ = "inventory_archives"
+
+    # Compactaciones del libro: movimientos hasta compacted_before archivados y borrados
+    id = Column(Integer, primary_key=True)
+    compacted_before = Column(DateTime, nullable=False)
+    movements = Column(Integer, default=0)
+    path = Column(String, nullable=True) # Archivo JSON Lines comprimido; NULL si no se archivó
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SyncChange(Base):
+    __tablename__ = "sync_changes"
+    __table_args__ = (
+        # Un cambio llega una sola vez aunque se reenvíe el lote
+        Index("ux_sync_changes_origin_seq", "origin", "origin_seq", unique=True),
+        Index("ix_sync_changes_store_id", "store_id", "id"),
+    )
+
+    # Registro de cambios de productos y ventas, en orden de confirmación (ver sync.py)
+    id = Column(Integer, primary_key=True)
+    store_id = Column(Integer, nullable=False)
+    origin = Column(String, nullable=False) # Nodo donde ocurrió el cambio
+    origin_seq = Column(Integer, nullable=True) # Su número en el nodo de origen; NULL si el origen es este nodo
+    entity = Column(String, nullable=False) # 'product', 'sale'
+    op = Column(String, nullable=False) # 'upsert', 'delete', 'insert'
+    key = Column(String, nullable=False) # sync_id de la fila
+    version = Column(Integer, default=1)
+    payload = Column(String, nullable=False) # JSON con los campos y el delta de stock
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ProductAssociation(Base):
+    __tablename__ = "product_associations"
+    __table_args__ = (
+        # "Se compra con": los relacionados de un producto ya en orden, leídos del índice
+        Index("ux_product_associations_store_product_rank", "store_id", "product_id", "rank", unique=True),
+    )
+
+    # Reglas producto -> producto relacionado precalculadas por basket_engine.py
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
+    product_id = Column(Integer, nullable=False)
+    related_product_id = Column(Integer, nullable=False)
+    rank = Column(Integer, nullable=False) # 1 = el más relacionado
+    tickets = Column(Integer, nullable=False) # Tickets con ambos productos
+    support = Column(Float, nullable=False) # tickets / tickets analizados
+    confidence = Column(Float, nullable=False) # P(relacionado | producto)
+    lift = Column(Float, nullable=False) # confidence / P(relacionado)
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class SalesDaily(Base):
+    __tablename__ = "sales_daily"
+    __table_args__ = (
+        Index("ux_sales_daily_store_product_day", "store_id", "product_id", "day", unique=True),
+        # Cubre las lecturas por ventana de días de la analítica sin tocar la tabla
+        Index("ix_sales_daily_store_day", "store_id", "day", "product_id", "units", "revenue"),
+    )
+
+    # Ventas por producto y día, mantenidas en la misma transacción que cada venta (ver sales_rollup.py)
+    id = Column(Integer, primary_key=True)
+    store_id = store_column()
+    product_id = Column(Integer, nullable=False)
+    day = Column(Integer, nullable=False) # Días desde 1970-01-01 (UTC)
+    units = Column(Integer, nullable=False, default=0)
+    revenue = Column(Float, nullable=False, default=0.0)
+    sales = Column(Integer, nullable=False, default=0) # Número de ventas del día
+
+class SalesArchive(Base):
+    __tablename__ = "sales_archives"
+
+    # Archivos de ventas archivadas (ver sales_archive.py): uno por mes de cada corrida
+    id = Column(Integer, primary_key=True)
+    archived_before = Column(DateTime, nullable=False) # Corte de la corrida (medianoche UTC)
+    first_day = Column(Integer, nullable=False) # Primer y último día con ventas del archivo (días desde 1970-01-01)
+    last_day = Column(Integer, nullable=False)
+    sales = Column(Integer, default=0)
+    path = Column(String, nullable=False)
+    format = Column(String, nullable=False) # 'parquet' o 'npz'
+    bytes = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    # Identificador de este nodo y cursores de sincronización
+    key = Column(String, primary_key=True)
+    value = Column(String, nullable=True)
+
+class WebhookMessage(Base):
+    __tablename__ = "webhook_messages"
+
+    # Mensajes de WhatsApp ya procesados, por identificador del proveedor, para responder igual a los reintentos
+    message_id = Column(String, primary_key=True)
+    store_id = Column(Integer, nullable=True)
+    sender = Column(String, nullable=True)
+    response = Column(String, nullable=True) # Nulo si el proceso se interrumpió antes de responder
+    received_at = Column(DateTime, default=datetime.utcnow, index=True)
 
 # Función para crear las tablas en la base de datos
 def create_db_and_tables():
@@ -0,0 +1,293 @@
+"""
+Respuestas locales a preguntas frecuentes, antes de llamar a un proveedor de IA.
+
+- Índice BM25 en memoria sobre las preguntas frecuentes curadas (FAQ_ENTRIES)
+  y la sección de conocimiento del negocio del README ("Conocimientos
+  Específicos"). El resto del README describe el sistema, no el negocio: no
+  se indexa, para no responderle a un cliente con la especificación. Se
+  construye una vez por proceso, en la primera consulta, y cada búsqueda toma
+  milisegundos en CPU.
+- lookup devuelve la mejor coincidencia si su confianza supera FAQ_MIN_SCORE.
+  La confianza es el puntaje BM25 dividido entre el máximo que podrían sumar
+  los términos de la pregunta (IDF × (k1 + 1) cada uno), acotada a 1: una
+  pregunta con términos que el índice no conoce queda por debajo del umbral y
+  va al proveedor de IA.
+- record_local y record_llm llevan la cuenta de consultas resueltas aquí
+  (desviadas del proveedor) y del tiempo ahorrado: por cada respuesta local,
+  la latencia media observada del proveedor (FAQ_ASSUMED_LLM_SECONDS hasta
+  tener mediciones) menos lo que tomó la búsqueda.
+"""
+
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from .metrics import REGISTRY
+
+# El umbral se lee al importar, posiblemente antes que ai_api
+load_dotenv()
+
+FAQ_MIN_SCORE = float(os.getenv("FAQ_MIN_SCORE", "0.4"))
+FAQ_ASSUMED_LLM_SECONDS = float(os.getenv("FAQ_ASSUMED_LLM_SECONDS", "2.5"))
+FAQ_README_PATH = os.getenv(
+    "FAQ_README_PATH", os.path.join(os.path.dirname(__file__), os.pardir, os.pardir, "README.MD"))
+# Solo conocimiento del negocio: "Funcionalidades Principales" es la especificación del agente ("Debes...")
+README_SECTIONS = ("Conocimientos Específicos",)
+# Largo máximo de una respuesta tomada del README
+README_ANSWER_CHARS = 700
+
+FAQ_QUERIES = REGISTRY.counter(
+    "papeleria_faq_queries_total", "Preguntas del chatbot resueltas con el índice local o con el proveedor de IA",
+    ("outcome",))
+FAQ_LOOKUP = REGISTRY.histogram(
+    "papeleria_faq_lookup_seconds", "Duración de la búsqueda en el índice local de preguntas frecuentes",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+FAQ_SAVED = REGISTRY.counter(
+    "papeleria_faq_latency_saved_seconds_total", "Latencia estimada ahorrada al no llamar al proveedor de IA")
+
+
+class FAQEntry(NamedTuple):
+    questions: Tuple[str, ...]  # Formas de preguntar lo mismo
+    answer: str
+
+
+class Match(NamedTuple):
+    answer: str
+    source: str  # 'faq' o 'readme'
+    title: str  # Pregunta o sección que coincidió
+    score: float  # Confianza entre 0 y 1
+
+
+FAQ_ENTRIES: Tuple[FAQEntry, ...] = (
+    FAQEntry(
+        ("¿Cuál es el horario de atención?", "¿A qué hora abren?", "¿A qué hora cierran?",
+         "¿Abren los domingos?", "¿Atienden los sábados?"),
+        "🕐 **HORARIOS DE ATENCIÓN:**\n\n• Lunes a Viernes: 7:00 AM - 6:00 PM\n• Sábados: 8:00 AM - 4:00 PM\n"
+        "• Domingos: 9:00 AM - 2:00 PM\n\n📍 Ubicados en el centro de Andes, Antioquia",
+    ),
+    FAQEntry(
+        ("¿Dónde quedan ubicados?", "¿Dónde están?", "¿Cuál es la dirección de la papelería?", "¿Cuál es el teléfono?",
+         "¿Cómo los contacto?", "¿Tienen correo electrónico?"),
+        "📍 **UBICACIÓN:**\n\nPapelería Inteligente Andes\nCarrera 5 # 8-45, Centro\nAndes, Antioquia, Colombia\n\n"
+        "📞 Teléfono: (604) 855-1234\n📧 Email: info@papeleriaandes.com",
+    ),
+    FAQEntry(
+        ("¿Qué servicios ofrecen?", "¿Hacen fotocopias?", "¿Plastifican documentos?", "¿Hacen enmarcados?",
+         "¿Anillan trabajos?"),
+        "🖨️ **SERVICIOS:** fotocopias, impresiones en blanco y negro y a color, anillados, plastificados y "
+        "enmarcados. Las órdenes de impresión se atienden por prioridad y fecha de entrega.",
+    ),
+    FAQEntry(
+        ("¿Cuánto cuesta imprimir a color?", "¿Cuál es el precio de las impresiones?",
+         "¿Cuánto vale el anillado?", "¿Cuánto cobran por anillar?", "¿Cuánto cuesta una impresión urgente?"),
+        "💰 **IMPRESIONES:**\n\n• Impresión a color: $400 por hoja\n• Anillado: $5.000\n"
+        "• Pasta transparente: $2.000\n• Entrega urgente (1,5 horas): +$10.000\n\n"
+        "⏱️ Un trabajo normal de 200 páginas está listo en unas 4 horas.",
+    ),
+    FAQEntry(
+        ("¿Cómo funciona el programa de fidelización?", "¿Cómo acumulo puntos?", "¿Qué niveles de membresía hay?",
+         "¿Cuántos puntos necesito para ser Oro?", "¿Qué beneficios tiene el nivel Plata?"),
+        "🎁 **PROGRAMA DE FIDELIZACIÓN:**\n\n• 1 punto por cada $1.000 en compras\n"
+        "• Niveles: Bronce, Plata desde 500 puntos y Oro desde 1.500 puntos\n"
+        "• Nivel Plata: 10% de descuento permanente en fotocopias, 15% en compras mayores a $50.000 y "
+        "apartado prioritario de listas escolares\n• Los puntos se canjean por productos (p. ej. 20 puntos = "
+        "una resma de papel)",
+    ),
+    FAQEntry(
+        ("¿Cuándo es la temporada escolar?", "¿Cuándo se vende más?", "¿Qué productos recomiendan para el regreso a clases?",
+         "¿Qué se vende en vacaciones?"),
+        "📅 **TEMPORADAS:**\n\n• Alta (enero-febrero): cuadernos, sets de útiles completos, mochilas y material de arte\n"
+        "• Media-alta (junio-julio): cuadernos de reposición, libros y útiles de geometría\n"
+        "• Exámenes (mayo, octubre-noviembre): fotocopias e impresiones\n"
+        "• Baja (diciembre): regalos, juguetes educativos y manualidades",
+    ),
+    FAQEntry(
+        ("¿Cotizan listas escolares?", "¿Me arman la lista de útiles del colegio?", "¿Pueden cotizar la lista de mi hijo?"),
+        "📝 **LISTAS ESCOLARES:** envíanos la foto o el texto de la lista y te cotizamos cada artículo con "
+        "precio y disponibilidad. Podemos apartarla y tenerla lista para recoger.",
+    ),
+    FAQEntry(
+        ("¿Hacen domicilios?", "¿Puedo hacer un pedido anticipado?", "¿Puedo apartar productos?"),
+        "📦 **PEDIDOS:** recibimos pedidos anticipados por WhatsApp (p. ej. \"Necesito 50 cuadernos para el "
+        "lunes\") y te confirmamos disponibilidad y fecha de entrega.",
+    ),
+    FAQEntry(
+        ("¿Qué productos venden?", "¿Qué categorías de productos tienen?", "¿Venden tecnología?"),
+        "🏪 **PRODUCTOS:** útiles escolares, material de oficina, papel (resmas, cartulinas, papel kraft), "
+        "arte, tecnología básica (memorias USB, mouse, teclados, audífonos) y accesorios como mochilas y "
+        "cartucheras. Pregunta por un producto para ver precio y stock.",
+    ),
+)
+
+_STOPWORDS = frozenset("""
+a al algo algun alguna ante con contra de del desde el ella ellos en entre era es esa ese eso esta estan este esto
+fue ha han hay la las le les lo los me mi mis muy nos o os para pero por que quien se sea si sin sobre son su
+sus te tiene tienen tu tus un una uno unos usted ustedes y ya yo hola buenas buenos dias tardes noches favor
+gracias quiero quisiera necesito saber puedo pueden podria como cual cuales
+""".split())
+
+
+def _fold(text: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> List[str]:
+    """Minúsculas sin tildes, sin palabras vacías y con el plural recortado ('horarios' -> 'horario')"""
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", _fold(text)):
+        if token in _STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 4 and token.endswith("es") and token[-3] not in "aeiou":
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Índice BM25 clásico (k1, b) sobre documentos cortos"""
+
+    def __init__(self, documents: List[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(tokenize(document)) for document in documents]
+        self.lengths = [sum(freqs.values()) for freqs in self.term_freqs]
+        self.avg_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        count = len(documents)
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for doc_id, freqs in enumerate(self.term_freqs):
+            for term, freq in freqs.items():
+                postings.setdefault(term, []).append((doc_id, freq))
+        self.postings = postings
+        self.idf = {term: math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5)) for term, docs in postings.items()}
+        # Un término que el índice no conoce pesa como uno que aparece en un solo documento
+        self.unknown_idf = math.log(1 + (count - 0.5) / 1.5) if count else 0.0
+
+    def search(self, query: str, top: int = 3) -> List[Tuple[int, float, float]]:
+        """[(documento, puntaje, confianza)] de mayor a menor puntaje"""
+        terms = set(tokenize(query))
+        if not terms or not self.avg_length:
+            return []
+        scores: Dict[int, float] = {}
+        for term in terms:
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / self.avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        ceiling = sum(self.idf.get(term, self.unknown_idf) for term in terms) * (self.k1 + 1)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top]
+        return [(doc_id, score, min(1.0, score / ceiling)) for doc_id, score in ranked]
+
+
+def readme_sections(path: str = FAQ_README_PATH, sections=README_SECTIONS) -> List[Tuple[str, str]]:
+    """(título, texto) de cada subsección ### dentro de las secciones ## indicadas; [] si no hay README"""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            text = handle.read()
+    except OSError:
+        return []
+    chunks, current, title, body = [], None, None, []
+    for line in text.splitlines() + ["## "]:
+        if line.startswith("## ") or line.startswith("### "):
+            if current in sections and title and "".join(body).strip():
+                chunks.append((title, "\n".join(body).strip()))
+            if line.startswith("## "):
+                current, title = line[3:].strip(), None
+            else:
+                title = line[4:].strip()
+            body = []
+        else:
+            body.append(line)
+    return chunks
+
+
+class FAQIndex:
+    def __init__(self, entries=FAQ_ENTRIES, readme_path: Optional[str] = FAQ_README_PATH):
+        self.documents: List[Tuple[str, str, str]] = []  # (fuente, título, respuesta)
+        texts = []
+        for entry in entries:
+            self.documents.append(("faq", entry.questions[0], entry.answer))
+            # Las preguntas pesan el doble que la respuesta
+            texts.append(" ".join(entry.questions * 2) + " " + entry.answer)
+        for title, body in readme_sections(readme_path) if readme_path else []:
+            answer = body if len(body) <= README_ANSWER_CHARS else body[:README_ANSWER_CHARS].rsplit("\n", 1)[0] + "\n…"
+            self.documents.append(("readme", title, f"📚 **{title}**\n\n{answer}"))
+            texts.append(f"{title} {body}")
+        self.index = BM25Index(texts)
+
+    def lookup(self, question: str, min_score: float = FAQ_MIN_SCORE) -> Optional[Match]:
+        results = self.index.search(question, top=1)
+        if not results or results[0][2] < min_score:
+            return None
+        doc_id, _, confidence = results[0]
+        source, title, answer = self.documents[doc_id]
+        return Match(answer, source, title, round(confidence, 3))
+
+
+_index: Optional[FAQIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> FAQIndex:
+    """Índice del proceso, construido en la primera consulta"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = FAQIndex()
+    return _index
+
+
+def lookup(question: str, min_score: float = FAQ_MIN_SCORE) -> Optional[Match]:
+    with FAQ_LOOKUP.time():
+        return get_index().lookup(question, min_score)
+
+
+# --- Desvío del proveedor de IA --------------------------------------------------
+
+_stats_lock = threading.Lock()
+_stats = {"local": 0, "llm": 0, "local_seconds": 0.0, "llm_seconds": 0.0, "saved_seconds": 0.0}
+
+
+def record_local(lookup_seconds: float):
+    with _stats_lock:
+        llm_mean = _stats["llm_seconds"] / _stats["llm"] if _stats["llm"] else FAQ_ASSUMED_LLM_SECONDS
+        saved = max(0.0, llm_mean - lookup_seconds)
+        _stats["local"] += 1
+        _stats["local_seconds"] += lookup_seconds
+        _stats["saved_seconds"] += saved
+    FAQ_QUERIES.inc(outcome="local")
+    FAQ_SAVED.inc(saved)
+
+
+def record_llm(seconds: float):
+    with _stats_lock:
+        _stats["llm"] += 1
+        _stats["llm_seconds"] += seconds
+    FAQ_QUERIES.inc(outcome="llm")
+
+
+def stats() -> Dict[str, Any]:
+    with _stats_lock:
+        local, llm = _stats["local"], _stats["llm"]
+        total = local + llm
+        return {
+            "queries": total,
+            "answered_locally": local,
+            "sent_to_ai": llm,
+            "deflection_rate": round(local / total, 4) if total else 0.0,
+            "avg_local_ms": round(_stats["local_seconds"] / local * 1000, 3) if local else None,
+            "avg_ai_seconds": round(_stats["llm_seconds"] / llm, 3) if llm else None,
+            "latency_saved_seconds": round(_stats["saved_seconds"], 3),
+            "documents": len(_index.documents) if _index is not None else 0,
+            "min_score": FAQ_MIN_SCORE,
+        }
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import List, Optional
+from . import inventory_analytics, inventory_ledger, schemas, singleflight
+from .tenancy import get_db, get_read_db, heavy_job
+
+router = APIRouter(prefix="/inventory", tags=["inventory"])
+
+def _check_type(movement_type: Optional[str]):
+    if movement_type is not None and movement_type not in inventory_ledger.MOVEMENT_TYPES:
+        raise HTTPException(status_code=400, detail=f"Tipo de movimiento no válido. Use uno de: {', '.join(inventory_ledger.MOVEMENT_TYPES)}")
+
+@router.get("/movements", response_model=List[schemas.InventoryMovement])
+def read_movements(product_id: Optional[int] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                   movement_type: Optional[str] = None, limit: int = 500, db: Session = Depends(get_db)):
+    _check_type(movement_type)
+    return inventory_ledger.list_movements(db, product_id, start, end, movement_type, min(limit, 5000))
+
+@router.get("/products/{product_id}/stock-at", response_model=schemas.StockAt)
+def read_stock_at(product_id: int, at: datetime, db: Session = Depends(get_db)):
+    # Último corte anterior a `at` más los movimientos posteriores, no toda la historia
+    return inventory_ledger.stock_as_of(db, product_id, at)
+
+@router.get("/products/{product_id}/kardex", response_model=schemas.Kardex)
+def read_kardex(product_id: int, start: datetime, end: Optional[datetime] = None, limit: int = 500,
+                db: Session = Depends(get_db)):
+    end = end or datetime.utcnow()
+    if end < start:
+        raise HTTPException(status_code=400, detail="La fecha final es anterior a la inicial")
+    return inventory_ledger.kardex(db, product_id, start, end, min(limit, 5000))
+
+@router.post("/snapshots", response_model=schemas.InventoryRun)
+def run_snapshots():
+    # Lo mismo que hace el hilo de fondo cada INVENTORY_SNAPSHOT_INTERVAL_SECONDS, en todas las tiendas
+    return inventory_ledger.run()
+
+@router.post("/compact", response_model=schemas.InventoryRun)
+def run_compaction(retention_days: int = 365):
+    if retention_days < 1:
+        raise HTTPException(status_code=400, detail="retention_days debe ser al menos 1")
+    return inventory_ledger.run(datetime.utcnow() - timedelta(days=retention_days))
+
+@router.post("/reconcile", dependencies=[Depends(heavy_job)])
+def reconcile_ledger(db: Session = Depends(get_db)):
+    # Para cargas hechas por fuera de la sesión ORM (importaciones masivas, SQL directo)
+    movements = inventory_ledger.reconcile(db)
+    db.commit()
+    return {"movements": movements}
+
+@router.get("/classification", response_model=schemas.InventoryClassification, dependencies=[Depends(heavy_job)])
+def read_classification(history_days: int = 730, period_days: int = 7, recent_days: int = 90,
+                        dead_stock_days: int = 60, a_share: float = 0.8, b_share: float = 0.95,
+                        x_cv: float = 0.5, y_cv: float = 1.0, cost_ratio: float = 1.0,
+                        abc: Optional[str] = None, xyz: Optional[str] = None, dead_stock: Optional[bool] = None,
+                        skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    if min(history_days, period_days, recent_days, dead_stock_days) < 1:
+        raise HTTPException(status_code=400, detail="Los días deben ser al menos 1")
+    if not 0 < a_share <= b_share <= 1 or not 0 <= x_cv <= y_cv:
+        raise HTTPException(status_code=400, detail="Cortes no válidos: 0 < a_share <= b_share <= 1 y 0 <= x_cv <= y_cv")
+    if abc is not None and abc not in inventory_analytics.ABC_CLASSES:
+        raise HTTPException(status_code=400, detail="Clase ABC no válida. Use A, B o C.")
+    if xyz is not None and xyz not in inventory_analytics.XYZ_CLASSES:
+        raise HTTPException(status_code=400, detail="Clase XYZ no válida. Use X, Y o Z.")
+    params = {
+        "history_days": history_days, "period_days": period_days, "recent_days": recent_days,
+        "dead_stock_days": dead_stock_days, "a_share": a_share, "b_share": b_share, "x_cv": x_cv, "y_cv": y_cv,
+        "cost_ratio": cost_ratio,
+    }
+    # Todo el catálogo se clasifica una vez por parámetros; los filtros y la página se aplican después
+    result = singleflight.forecasts.do(("inventory_classification", singleflight.scope_of(db), params),
+                                       inventory_analytics.build_classification, db, **params)
+    return {
+        "generated_at": result["generated_at"],
+        "summary": result["summary"],
+        "products": inventory_analytics.select_rows(result["rows"], abc, xyz, dead_stock, max(skip, 0), min(limit, 5000)),
+    }
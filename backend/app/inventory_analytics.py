@@ -0,0 +1,325 @@
+"""
+Clasificación ABC/XYZ y stock muerto para todo el catálogo en una sola pasada.
+
+Se leen los agregados de la ventana de history_days ya mantenidos en
+sales_daily (ver sales_rollup.py), reducidos en SQL a una fila por producto:
+la consulta interna suma por producto y período de period_days días y la
+externa junta los períodos (unidades, ingresos, suma de cuadrados de las
+unidades por período, unidades recientes y último día con ventas). Los días
+cerrados (antes de hoy) se agregan una vez por día y parámetros y quedan en
+memoria hasta INVENTORY_STATS_CACHE_SECONDS o hasta que una venta toque un
+día pasado; cada consulta solo agrega en vivo las filas de hoy. StatsWarmer
+los recalcula en segundo plano para los parámetros por defecto al arrancar,
+al cambiar el día y antes de que venzan. El resto son operaciones
+vectorizadas de NumPy sobre esas filas, sin consultas por producto:
+
+- ABC por participación en los ingresos: ordenados de mayor a menor, A hasta
+  acumular a_share de los ingresos (incluido el producto que cruza el corte),
+  B hasta b_share y C el resto, también los que no vendieron.
+- XYZ por variabilidad de la demanda: coeficiente de variación (σ / media) de
+  las unidades por período de period_days días, contando los períodos sin
+  ventas como cero. X hasta x_cv, Y hasta y_cv, Z por encima o sin ventas.
+- Días de cobertura (stock / demanda diaria promedio) y sell-through
+  (vendido / (vendido + stock)) sobre los últimos recent_days días.
+- Stock muerto: productos con stock y sin ventas en dead_stock_days días; el
+  capital inmovilizado es stock × precio × cost_ratio.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+from . import queries, sales_rollup, singleflight, tenancy
+from .database import STORE_INFO_KEY
+
+logger = logging.getLogger(__name__)
+
+ABC_CLASSES = ("A", "B", "C")
+XYZ_CLASSES = ("X", "Y", "Z")
+
+# Vigencia de los agregados de días cerrados; acota lo que no se ve de otros procesos (0 los desactiva)
+INVENTORY_STATS_CACHE_SECONDS = float(os.getenv("INVENTORY_STATS_CACHE_SECONDS", "3600"))
+
+STATS_COLUMNS = ["product_id", "units_sold", "revenue", "period_sq_sum", "recent_units", "days_since_last_sale"]
+
+ROW_COLUMNS = [
+    "product_id", "product_name", "category", "supplier", "price", "current_stock",
+    "units_sold", "revenue", "revenue_share", "cumulative_share", "abc",
+    "demand_cv", "xyz", "avg_daily_demand", "days_of_cover", "sell_through",
+    "days_since_last_sale", "dead_stock", "dead_stock_value",
+]
+
+
+def load_catalog(db: Session) -> pd.DataFrame:
+    products = queries.products_table
+    stmt = select(
+        products.c.id, products.c.name, products.c.category, products.c.supplier,
+        products.c.price, products.c.stock
+    )
+    df = pd.DataFrame(
+        db.execute(stmt).all(),
+        columns=["product_id", "product_name", "category", "supplier", "price", "current_stock"],
+    )
+    df["price"] = df["price"].fillna(0.0).astype(float)
+    df["current_stock"] = df["current_stock"].fillna(0).astype(int)
+    return df
+
+
+def closed_day_stats(db: Session, today: int, since: int, period_days: int, recent_days: int) -> pd.DataFrame:
+    """
+    Agregados por producto de los días [since, today): unidades, ingresos, suma
+    de cuadrados de las unidades por período, unidades del período en curso
+    (period_units), unidades recientes y días desde la última venta.
+    """
+    daily = sales_rollup.daily_table
+    days_ago = today - daily.c.day
+    periods = select(
+        daily.c.product_id,
+        (days_ago // period_days).label("period"),
+        func.sum(daily.c.units).label("units"),
+        func.sum(daily.c.revenue).label("revenue"),
+        func.sum(case((days_ago < recent_days, daily.c.units), else_=0)).label("recent"),
+        func.min(days_ago).label("last"),
+    ).where(daily.c.day >= since, daily.c.day < today).group_by(daily.c.product_id, days_ago // period_days)
+    # La sesión filtra la tienda solo en el FROM de primer nivel: la subconsulta lleva su filtro
+    store_id = db.info.get(STORE_INFO_KEY)
+    if store_id is not None:
+        periods = periods.where(daily.c.store_id == store_id)
+    periods = periods.subquery()
+    stmt = select(
+        periods.c.product_id, func.sum(periods.c.units), func.sum(periods.c.revenue),
+        func.sum(periods.c.units * periods.c.units),
+        func.sum(case((periods.c.period == 0, periods.c.units), else_=0)),
+        func.sum(periods.c.recent), func.min(periods.c.last),
+    ).group_by(periods.c.product_id)
+    columns = ["product_id", "units_sold", "revenue", "period_sq_sum", "period_units", "recent_units",
+               "days_since_last_sale"]
+    stats = pd.DataFrame(db.execute(stmt).all(), columns=columns)
+    return stats.astype({column: float for column in columns[1:]}).astype({"product_id": np.int64})
+
+
+_closed_cache: Dict[tuple, tuple] = {}
+_closed_lock = threading.Lock()
+
+
+def _cached_closed_day_stats(db: Session, today: int, since: int, period_days: int, recent_days: int,
+                             refresh: bool = False) -> pd.DataFrame:
+    key = (singleflight.scope_of(db), today, since, period_days, recent_days)
+    now = time.monotonic()
+    with _closed_lock:
+        entry = _closed_cache.get(key)
+    if not refresh and entry is not None and entry[0] == sales_rollup.past_day_writes() and entry[1] > now:
+        return entry[2]
+    # Se toma antes de leer: una venta pasada durante la consulta invalida lo leído
+    writes = sales_rollup.past_day_writes()
+    stats = closed_day_stats(db, today, since, period_days, recent_days)
+    if INVENTORY_STATS_CACHE_SECONDS > 0:
+        with _closed_lock:
+            # Lo de días anteriores ya no sirve: los períodos se cuentan desde hoy
+            for old in [old for old in _closed_cache if old[1] != today]:
+                del _closed_cache[old]
+            _closed_cache[key] = (writes, now + INVENTORY_STATS_CACHE_SECONDS, stats)
+    return stats
+
+
+def load_sales_stats(db: Session, history_days: int, period_days: int = 7, recent_days: int = 90) -> pd.DataFrame:
+    """Una fila por producto con ventas en la ventana (STATS_COLUMNS): días cerrados en caché más las ventas de hoy"""
+    daily = sales_rollup.daily_table
+    today = sales_rollup.today()
+    closed = _cached_closed_day_stats(db, today, today - history_days + 1, period_days, recent_days)
+    # Ventas con fecha posterior a hoy (relojes desfasados) cuentan como de hoy
+    live = pd.DataFrame(db.execute(select(
+        daily.c.product_id, func.sum(daily.c.units), func.sum(daily.c.revenue)
+    ).where(daily.c.day >= today).group_by(daily.c.product_id)).all(),
+        columns=["product_id", "units_today", "revenue_today"])
+
+    stats = closed.merge(live.astype({"product_id": np.int64}), on="product_id", how="outer")
+    last = np.where(stats["units_today"].notna(), 0.0, stats["days_since_last_sale"])
+    stats = stats.fillna(0.0)
+    units_today = stats["units_today"].to_numpy(dtype=float)
+    # El período en curso suma lo de hoy: su cuadrado se recalcula
+    period_units = stats["period_units"].to_numpy()
+    return pd.DataFrame({
+        "product_id": stats["product_id"].to_numpy(dtype=np.int64),
+        "units_sold": stats["units_sold"].to_numpy() + units_today,
+        "revenue": stats["revenue"].to_numpy() + stats["revenue_today"].to_numpy(dtype=float),
+        "period_sq_sum": stats["period_sq_sum"].to_numpy() - period_units ** 2 + (period_units + units_today) ** 2,
+        "recent_units": stats["recent_units"].to_numpy() + units_today,
+        "days_since_last_sale": last,
+    }, columns=STATS_COLUMNS)
+
+
+def _classes(values: np.ndarray, limits: List[float], labels) -> np.ndarray:
+    """Etiqueta de cada valor según el primer límite que no supera"""
+    return np.asarray(labels)[np.searchsorted(np.asarray(limits), values, side="left")]
+
+
+def classify(catalog: pd.DataFrame, stats: pd.DataFrame, history_days: int = 730, period_days: int = 7,
+             recent_days: int = 90, dead_stock_days: int = 60, a_share: float = 0.8, b_share: float = 0.95,
+             x_cv: float = 0.5, y_cv: float = 1.0, cost_ratio: float = 1.0) -> pd.DataFrame:
+    """Una fila por producto del catálogo con sus clases y métricas, a partir de load_sales_stats, vectorizado"""
+    n = len(catalog)
+    product_ids = catalog["product_id"].to_numpy(dtype=np.int64)
+    # Fila del catálogo de cada producto con ventas; los demás quedan en cero
+    index, known = sales_rollup.catalog_rows(product_ids, stats["product_id"].to_numpy(dtype=np.int64))
+
+    def column(name: str, empty: float = 0.0) -> np.ndarray:
+        values = np.full(n, empty)
+        values[index] = stats[name].to_numpy(dtype=float)[known]
+        return values
+
+    units_sold = column("units_sold")
+    revenue = column("revenue")
+
+    # ABC: participación acumulada de mayor a menor ingreso
+    total_revenue = revenue.sum()
+    by_revenue = np.argsort(-revenue, kind="stable")
+    share = revenue / total_revenue if total_revenue > 0 else np.zeros(n)
+    cumulative = np.empty(n)
+    cumulative[by_revenue] = np.cumsum(share[by_revenue])
+    # El producto que cruza el corte entra en la clase: se compara lo acumulado antes de él
+    before = cumulative - share
+    abc = _classes(before, [a_share, b_share], ABC_CLASSES)
+    abc[revenue <= 0] = "C"
+
+    # XYZ: media y varianza de las unidades por período con sumas y sumas de cuadrados
+    periods = max(1, -(-history_days // period_days))
+    mean = units_sold / periods
+    std = np.sqrt(np.clip(column("period_sq_sum") / periods - mean ** 2, 0, None))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.where(mean > 0, std / mean, np.inf)
+    xyz = _classes(cv, [x_cv, y_cv], XYZ_CLASSES)
+    xyz[~np.isfinite(cv)] = "Z"
+
+    # Ritmo reciente: cobertura y sell-through
+    stock = catalog["current_stock"].to_numpy(dtype=float)
+    recent_units = column("recent_units")
+    avg_daily = recent_units / recent_days
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(avg_daily > 0, np.maximum(stock, 0) / avg_daily, np.inf)
+        sell_through = np.where(recent_units + np.maximum(stock, 0) > 0,
+                                recent_units / (recent_units + np.maximum(stock, 0)), 0.0)
+
+    # Último día con ventas (días atrás); sin ventas en la ventana queda NaN
+    days_since_last_sale = column("days_since_last_sale", np.nan)
+    dead = (stock > 0) & ~(days_since_last_sale < dead_stock_days)
+    dead_value = np.where(dead, stock * catalog["price"].to_numpy() * cost_ratio, 0.0)
+
+    return catalog.assign(
+        units_sold=units_sold.astype(np.int64),
+        revenue=revenue,
+        revenue_share=share,
+        cumulative_share=cumulative,
+        abc=abc,
+        demand_cv=np.round(cv, 3),
+        xyz=xyz,
+        avg_daily_demand=np.round(avg_daily, 3),
+        days_of_cover=days_of_cover,
+        sell_through=np.round(sell_through, 4),
+        days_since_last_sale=days_since_last_sale,
+        dead_stock=dead,
+        dead_stock_value=dead_value,
+    )[ROW_COLUMNS]
+
+
+def summarize(rows: pd.DataFrame) -> Dict:
+    """Matriz ABC × XYZ (productos, ingresos, valor del stock) y totales de stock muerto"""
+    stock_value = rows["current_stock"].clip(lower=0) * rows["price"]
+    grouped = rows.assign(stock_value=stock_value).groupby(["abc", "xyz"]).agg(
+        products=("product_id", "size"), revenue=("revenue", "sum"), stock_value=("stock_value", "sum"))
+    matrix = [
+        {"abc": abc, "xyz": xyz, "products": int(cell.products), "revenue": float(cell.revenue),
+         "stock_value": float(cell.stock_value)}
+        for (abc, xyz), cell in zip(grouped.index, grouped.itertuples())
+    ]
+    dead = rows["dead_stock"]
+    return {
+        "products": len(rows),
+        "revenue": float(rows["revenue"].sum()),
+        "stock_value": float(stock_value.sum()),
+        "dead_stock_products": int(dead.sum()),
+        "dead_stock_value": float(rows.loc[dead, "dead_stock_value"].sum()),
+        "matrix": matrix,
+    }
+
+
+def build_classification(db: Session, history_days: int = 730, period_days: int = 7, recent_days: int = 90,
+                         dead_stock_days: int = 60, a_share: float = 0.8, b_share: float = 0.95,
+                         x_cv: float = 0.5, y_cv: float = 1.0, cost_ratio: float = 1.0) -> Dict:
+    rows = classify(
+        load_catalog(db), load_sales_stats(db, history_days, period_days, recent_days),
+        history_days=history_days, period_days=period_days, recent_days=recent_days,
+        dead_stock_days=dead_stock_days, a_share=a_share, b_share=b_share, x_cv=x_cv, y_cv=y_cv,
+        cost_ratio=cost_ratio,
+    )
+    return {"generated_at": datetime.utcnow(), "summary": summarize(rows), "rows": rows}
+
+
+def warm(history_days: int = 730, period_days: int = 7, recent_days: int = 90) -> int:
+    """Recalcula en caché los días cerrados de cada tienda con estos parámetros; devuelve las tiendas"""
+    today = sales_rollup.today()
+    stores = tenancy.list_stores()
+    for store in stores:
+        # La misma sesión de lectura que GET /inventory/classification: misma clave de caché
+        with tenancy.session_for(store["id"], read_only=True) as db:
+            _cached_closed_day_stats(db, today, today - history_days + 1, period_days, recent_days, refresh=True)
+    return len(stores)
+
+
+class StatsWarmer:
+    """Hilo de fondo que mantiene en caché los días cerrados (al arrancar, al cambiar el día y antes de vencer)"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="inventory-stats", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        delay = 0.0
+        while not self._stop.wait(delay):
+            try:
+                warm()
+            except Exception:
+                logger.exception("No se pudieron precalcular los agregados de inventario")
+            until_tomorrow = 86_400 - time.time() % 86_400 + 1
+            delay = min(until_tomorrow, self.ttl * 0.9)
+
+    def close(self):
+        self._stop.set()
+
+
+_warmer: Optional[StatsWarmer] = None
+
+
+def start_warmer() -> Optional[StatsWarmer]:
+    """Arranca el precálculo una vez por proceso (nada si INVENTORY_STATS_CACHE_SECONDS <= 0)"""
+    global _warmer
+    if _warmer is None and INVENTORY_STATS_CACHE_SECONDS > 0:
+        _warmer = StatsWarmer(INVENTORY_STATS_CACHE_SECONDS)
+    return _warmer
+
+
+def select_rows(rows: pd.DataFrame, abc: Optional[str] = None, xyz: Optional[str] = None,
+                dead_stock: Optional[bool] = None, skip: int = 0, limit: int = 100) -> List[Dict]:
+    """Filtra y pagina: stock muerto por capital inmovilizado, el resto por ingresos"""
+    mask = np.ones(len(rows), dtype=bool)
+    if abc is not None:
+        mask &= rows["abc"].to_numpy() == abc
+    if xyz is not None:
+        mask &= rows["xyz"].to_numpy() == xyz
+    if dead_stock is not None:
+        mask &= rows["dead_stock"].to_numpy() == dead_stock
+    selected = rows[mask]
+    key = "dead_stock_value" if dead_stock else "revenue"
+    selected = selected.sort_values([key, "product_id"], ascending=[False, True], kind="stable")
+    page = selected.iloc[skip:skip + limit]
+    return page.replace({np.inf: None, np.nan: None}).to_dict(orient="records")
@@ -0,0 +1,373 @@
+"""
+Libro de inventario: cada cambio de stock queda como un movimiento con motivo.
+
+- Registro: una vez instalado (install), cada flush ORM que cambia
+  Product.stock agrega filas a inventory_movements en la misma transacción,
+  con la cantidad con signo, el stock resultante y una referencia. El motivo
+  se deduce (producto nuevo 'inicial'; baja acompañada de una venta nueva del
+  producto 'venta'; otra baja 'ajuste'; alza 'reposicion') salvo que el código
+  lo indique antes con note() ('devolucion', 'sincronizacion', número de
+  factura...). El libro solo recibe inserciones.
+- Cortes: take_snapshots guarda en inventory_snapshots el stock al cierre de
+  cada producto con movimientos desde su corte anterior. El stock a una fecha
+  es el último corte anterior más la suma de los movimientos entre ese corte
+  y la fecha, leídos del índice (product_id, created_at, quantity): el costo
+  depende de un corte y de los movimientos del periodo, no de toda la historia.
+- Compactación: compact corta en la fecha límite, escribe los movimientos
+  anteriores en un archivo JSON Lines comprimido (INVENTORY_ARCHIVE_DIR) y
+  los borra. Antes del límite la historia consultable queda con la resolución
+  de los cortes.
+- Las cargas hechas por fuera de la sesión ORM (seed_data.py, SQL directo) se
+  concilian con reconcile, que asienta la diferencia entre el stock y el
+  saldo del libro.
+- InventoryWorker corta cada INVENTORY_SNAPSHOT_INTERVAL_SECONDS y, con
+  INVENTORY_RETENTION_DAYS > 0, compacta lo anterior a esa ventana, en cada
+  base de tiendas (ver tenancy.store_engines).
+
+Ejecutar manualmente con: python -m app.inventory_ledger [--compact]
+"""
+
+import gzip
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from . import models, tenancy
+from .metrics import REGISTRY
+from .responses import dumps
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("INVENTORY_SNAPSHOT_INTERVAL_SECONDS", "86400"))
+# Días de movimientos que se conservan en el libro; 0 desactiva la compactación automática
+RETENTION_DAYS = int(os.getenv("INVENTORY_RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("INVENTORY_ARCHIVE_DIR", "./inventory_archive")
+ARCHIVE_BATCH_SIZE = 10_000
+
+OPENING = "inicial"
+SALE = "venta"
+RESTOCK = "reposicion"
+ADJUSTMENT = "ajuste"
+RETURN = "devolucion"
+SYNC = "sincronizacion"
+MOVEMENT_TYPES = (OPENING, SALE, RESTOCK, ADJUSTMENT, RETURN, SYNC)
+
+movements_table = models.InventoryMovement.__table__
+snapshots_table = models.InventorySnapshot.__table__
+archives_table = models.InventoryArchive.__table__
+products_table = models.Product.__table__
+
+INVENTORY_MOVEMENTS = REGISTRY.counter(
+    "papeleria_inventory_movements_total", "Movimientos registrados en el libro de inventario", ("movement_type",))
+INVENTORY_SNAPSHOT = REGISTRY.histogram(
+    "papeleria_inventory_snapshot_seconds", "Duración de cada corte del libro de inventario por base",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+INVENTORY_ERRORS = REGISTRY.counter(
+    "papeleria_inventory_errors_total", "Cortes o compactaciones fallidos (se reintentan en la siguiente)")
+
+# Session.info: motivos indicados con note() para la transacción en curso
+_NOTES_KEY = "papeleria_inventory_notes"
+
+# Un corte o compactación a la vez en el proceso (hilo de fondo o endpoints)
+_run_lock = threading.Lock()
+
+
+# --- Registro de movimientos -------------------------------------------------
+
+def note(session: Session, movement_type: str, reference: Optional[str] = None, product=None):
+    """Motivo de los próximos cambios de stock de `product` (o de todos) en la transacción de la sesión"""
+    if movement_type not in MOVEMENT_TYPES:
+        raise ValueError(f"Tipo de movimiento no válido: {movement_type}")
+    session.info.setdefault(_NOTES_KEY, {})[product] = (movement_type, reference)
+
+
+def _stock_delta(obj, created: bool) -> int:
+    if created:
+        return obj.stock or 0
+    history = inspect(obj).attrs.stock.history
+    if not history.has_changes():
+        return 0
+    old = history.deleted[0] if history.deleted else 0
+    return (obj.stock or 0) - (old or 0)
+
+
+def _after_flush(session, flush_context):
+    new_sales = {}
+    for obj in session.new:
+        if isinstance(obj, models.Sale) and obj.product_id is not None:
+            new_sales[obj.product_id] = obj
+    notes = session.info.get(_NOTES_KEY, {})
+    now = datetime.utcnow()
+    rows = []
+    for obj, created in [(obj, True) for obj in session.new] + [(obj, False) for obj in session.dirty]:
+        if not isinstance(obj, models.Product):
+            continue
+        delta = _stock_delta(obj, created)
+        if not delta and not created:
+            continue
+        movement_type, reference = notes.get(obj) or notes.get(None) or (None, None)
+        if movement_type is None:
+            sale = new_sales.get(obj.id)
+            if created:
+                movement_type = OPENING
+            elif delta < 0 and sale is not None:
+                movement_type, reference = SALE, f"venta:{sale.id}"
+            else:
+                movement_type = RESTOCK if delta > 0 else ADJUSTMENT
+        rows.append({
+            "store_id": obj.store_id, "product_id": obj.id, "movement_type": movement_type, "quantity": delta,
+            "stock_after": obj.stock or 0, "reference": reference, "created_at": now,
+        })
+    if rows:
+        session.connection().execute(insert(movements_table), rows)
+        for row in rows:
+            INVENTORY_MOVEMENTS.inc(movement_type=row["movement_type"])
+
+
+def _discard_notes(session, *args):
+    session.info.pop(_NOTES_KEY, None)
+
+
+def install(session_factory):
+    """Registra en el libro los cambios de stock hechos con las sesiones de session_factory"""
+    if getattr(session_factory, "_papeleria_inventory", False):
+        return session_factory
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "after_commit", _discard_notes)
+    event.listen(session_factory, "after_rollback", _discard_notes)
+    session_factory._papeleria_inventory = True
+    return session_factory
+
+
+# --- Consultas ---------------------------------------------------------------------
+
+def _last_snapshot(db, product_id: int, at: datetime) -> Optional[Tuple[datetime, int]]:
+    row = db.execute(
+        select(snapshots_table.c.snapshot_at, snapshots_table.c.stock)
+        .where(snapshots_table.c.product_id == product_id, snapshots_table.c.snapshot_at <= at)
+        .order_by(snapshots_table.c.snapshot_at.desc()).limit(1)
+    ).first()
+    return (row[0], row[1]) if row is not None else None
+
+
+def stock_as_of(db, product_id: int, at: datetime) -> Dict[str, Any]:
+    """Stock del producto tras los movimientos hasta `at`: último corte más los movimientos posteriores"""
+    snapshot = _last_snapshot(db, product_id, at)
+    stmt = select(func.coalesce(func.sum(movements_table.c.quantity), 0), func.count()).where(
+        movements_table.c.product_id == product_id, movements_table.c.created_at <= at)
+    if snapshot is not None:
+        stmt = stmt.where(movements_table.c.created_at > snapshot[0])
+    delta, count = db.execute(stmt).one()
+    return {
+        "product_id": product_id, "at": at, "stock": (snapshot[1] if snapshot else 0) + int(delta),
+        "snapshot_at": snapshot[0] if snapshot else None, "movements_applied": count,
+    }
+
+
+def list_movements(db, product_id: Optional[int] = None, start: Optional[datetime] = None,
+                   end: Optional[datetime] = None, movement_type: Optional[str] = None,
+                   limit: int = 500) -> List[Dict[str, Any]]:
+    """Movimientos con start < created_at <= end, en orden de registro"""
+    m = movements_table
+    stmt = select(m.c.id, m.c.product_id, m.c.movement_type, m.c.quantity, m.c.stock_after, m.c.reference,
+                  m.c.created_at)
+    if product_id is not None:
+        stmt = stmt.where(m.c.product_id == product_id)
+    if start is not None:
+        stmt = stmt.where(m.c.created_at > start)
+    if end is not None:
+        stmt = stmt.where(m.c.created_at <= end)
+    if movement_type is not None:
+        stmt = stmt.where(m.c.movement_type == movement_type)
+    return [dict(row) for row in db.execute(stmt.order_by(m.c.created_at, m.c.id).limit(limit)).mappings()]
+
+
+def kardex(db, product_id: int, start: datetime, end: datetime, limit: int = 500) -> Dict[str, Any]:
+    """Saldo inicial, movimientos del rango (start, end] y saldo final del producto"""
+    opening = stock_as_of(db, product_id, start)
+    closing = stock_as_of(db, product_id, end)
+    movements = list_movements(db, product_id, start, end, limit=limit)
+    return {
+        "product_id": product_id, "start": start, "end": end, "opening_stock": opening["stock"],
+        "closing_stock": closing["stock"], "movements": movements, "truncated": len(movements) == limit,
+    }
+
+
+# --- Cortes, conciliación y compactación --------------------------------------------
+
+def ledger_balances(db, at: datetime) -> Dict[int, Dict[str, int]]:
+    """
+    Saldo del libro a `at` de cada producto con historia:
+    {product_id: {"store_id", "stock", "pending"}}, donde pending son los
+    movimientos posteriores a su último corte.
+    """
+    s, m = snapshots_table, movements_table
+    last = select(s.c.product_id, func.max(s.c.snapshot_at).label("snapshot_at")).where(
+        s.c.snapshot_at <= at).group_by(s.c.product_id).subquery()
+
+    balances = {}
+    for product_id, store_id, stock in db.execute(
+            select(s.c.product_id, s.c.store_id, s.c.stock).join(
+                last, (last.c.product_id == s.c.product_id) & (last.c.snapshot_at == s.c.snapshot_at))):
+        balances[product_id] = {"store_id": store_id, "stock": stock, "pending": 0}
+
+    pending = db.execute(
+        select(m.c.product_id, func.min(m.c.store_id), func.sum(m.c.quantity), func.count())
+        .select_from(m.outerjoin(last, last.c.product_id == m.c.product_id))
+        .where(m.c.created_at <= at, or_(last.c.snapshot_at.is_(None), m.c.created_at > last.c.snapshot_at))
+        .group_by(m.c.product_id)
+    )
+    for product_id, store_id, delta, count in pending:
+        balance = balances.setdefault(product_id, {"store_id": store_id, "stock": 0, "pending": 0})
+        balance["stock"] += int(delta or 0)
+        balance["pending"] = count
+    return balances
+
+
+def take_snapshots(db, at: Optional[datetime] = None) -> int:
+    """Corta a `at` los productos con movimientos desde su corte anterior; devuelve cuántos cortes guardó"""
+    at = at or datetime.utcnow()
+    rows = [
+        {"store_id": balance["store_id"], "product_id": product_id, "snapshot_at": at, "stock": balance["stock"],
+         "movements": balance["pending"]}
+        for product_id, balance in ledger_balances(db, at).items() if balance["pending"]
+    ]
+    if rows:
+        db.execute(insert(snapshots_table), rows)
+    return len(rows)
+
+
+def reconcile(db, reference: str = "conciliacion") -> int:
+    """
+    Asienta la diferencia entre Product.stock y el saldo del libro (cargas
+    por fuera de la sesión ORM); devuelve cuántos movimientos agregó.
+    """
+    now = datetime.utcnow()
+    balances = ledger_balances(db, now)
+    rows = []
+    for product_id, store_id, stock in db.execute(select(products_table.c.id, products_table.c.store_id,
+                                                         products_table.c.stock)):
+        stock = stock or 0
+        balance = balances.get(product_id)
+        delta = stock - (balance["stock"] if balance else 0)
+        if delta or balance is None:
+            rows.append({
+                "store_id": store_id, "product_id": product_id,
+                "movement_type": OPENING if balance is None else ADJUSTMENT, "quantity": delta,
+                "stock_after": stock, "reference": reference, "created_at": now,
+            })
+    if rows:
+        db.execute(insert(movements_table), rows)
+        for row in rows:
+            INVENTORY_MOVEMENTS.inc(movement_type=row["movement_type"])
+    return len(rows)
+
+
+def _archive_path(archive_dir: str, before: datetime) -> str:
+    os.makedirs(archive_dir, exist_ok=True)
+    stamp = before.strftime("%Y%m%dT%H%M%S")
+    return os.path.join(archive_dir, f"inventory_movements_{stamp}_{int(time.time() * 1000)}.jsonl.gz")
+
+
+def compact(db, before: datetime, archive_dir: Optional[str] = ARCHIVE_DIR) -> Dict[str, Any]:
+    """
+    Corta a `before`, archiva los movimientos hasta esa fecha (sin archivo si
+    archive_dir es None) y los borra del libro.
+    """
+    snapshots = take_snapshots(db, before)
+    m = movements_table
+    old = m.c.created_at <= before
+    count = db.execute(select(func.count()).select_from(m).where(old)).scalar()
+    path = None
+    if count and archive_dir:
+        path = _archive_path(archive_dir, before)
+        # Por lotes de id: el archivo se escribe sin cargar todos los movimientos en memoria
+        with gzip.open(path, "wb") as archive:
+            last_id = 0
+            while True:
+                rows = db.execute(select(m).where(old, m.c.id > last_id).order_by(m.c.id)
+                                  .limit(ARCHIVE_BATCH_SIZE)).mappings().all()
+                if not rows:
+                    break
+                for row in rows:
+                    archive.write(dumps(dict(row)) + b"\n")
+                last_id = rows[-1]["id"]
+    if count:
+        db.execute(delete(m).where(old))
+    db.execute(insert(archives_table).values(compacted_before=before, movements=count, path=path,
+                                             created_at=datetime.utcnow()))
+    return {"snapshots": snapshots, "archived": count, "path": path}
+
+
+def run(compact_before: Optional[datetime] = None, archive_dir: Optional[str] = ARCHIVE_DIR) -> Dict[str, Any]:
+    """Corta todas las bases de tiendas y, con compact_before, compacta lo anterior"""
+    with _run_lock:
+        engines = tenancy.store_engines()
+        stats = {"databases": len(engines), "snapshots": 0, "archived": 0}
+        now = datetime.utcnow()
+        for engine in engines:
+            start = time.perf_counter()
+            # Las bases por tienda no comparten ids de producto: cada una se corta entera, sin filtro de tienda
+            with engine.begin() as conn:
+                if compact_before is not None:
+                    result = compact(conn, compact_before, archive_dir)
+                    stats["snapshots"] += result["snapshots"]
+                    stats["archived"] += result["archived"]
+                stats["snapshots"] += take_snapshots(conn, now)
+            INVENTORY_SNAPSHOT.observe(time.perf_counter() - start)
+        return stats
+
+
+class InventoryWorker:
+    """Hilo de fondo que corta el libro cada `interval` segundos y compacta fuera de la retención"""
+
+    def __init__(self, interval: float, retention_days: int = RETENTION_DAYS):
+        self.interval = interval
+        self.retention_days = retention_days
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="inventory-ledger", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            before = datetime.utcnow() - timedelta(days=self.retention_days) if self.retention_days > 0 else None
+            try:
+                self.last_run = run(before)
+            except Exception:
+                INVENTORY_ERRORS.inc()
+                logger.exception("No se pudo cortar el libro de inventario")
+
+    def close(self):
+        self._stop.set()
+
+
+_worker: Optional[InventoryWorker] = None
+
+
+def start_worker() -> Optional[InventoryWorker]:
+    """Arranca el hilo de cortes una vez por proceso (nada si INVENTORY_SNAPSHOT_INTERVAL_SECONDS <= 0)"""
+    global _worker
+    if _worker is None and SNAPSHOT_INTERVAL_SECONDS > 0:
+        _worker = InventoryWorker(SNAPSHOT_INTERVAL_SECONDS)
+    return _worker
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .migrations import run_migrations
+
+    run_migrations()
+    for engine in tenancy.store_engines():
+        with engine.begin() as conn:
+            print(f"{engine.url.database}: {reconcile(conn)} movimientos de conciliación")
+    days = RETENTION_DAYS or 365
+    print(run(datetime.utcnow() - timedelta(days=days) if "--compact" in sys.argv else None))
@@ -0,0 +1,291 @@
+"""
+Canal de actualizaciones en vivo: cambios de productos y stock, ventas y
+transiciones de alertas, publicados desde un bus en memoria del proceso.
+
+- Los cambios hechos con la sesión ORM se publican solos después del commit
+  (install); nada se publica si la transacción se revierte.
+- GET /live/events (Server-Sent Events) y /live/ws (WebSocket) entregan deltas
+  por tema (product, sale, alert) en lugar de volver a pedir /products/.
+- Cada evento se serializa una sola vez y se reparte a todos los clientes en
+  el hilo del event loop; cada cliente tiene un búfer acotado
+  (LIVE_CLIENT_BUFFER). Si un cliente lento lo desborda se descartan sus
+  eventos pendientes y recibe un evento "resync" para recargar el estado.
+- Un historial corto (LIVE_HISTORY) permite reconectar con Last-Event-ID sin
+  perder deltas.
+- Cada evento lleva la tienda de la sesión que lo confirmó; los clientes
+  reciben solo los de su tienda (?store_id=, la principal por defecto).
+
+El bus es por proceso: con varios workers cada uno publica sus propios cambios.
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event
+
+from . import database, models
+from .metrics import REGISTRY
+from .responses import dumps
+
+TOPICS = ("product", "sale", "alert")
+CLIENT_BUFFER = int(os.getenv("LIVE_CLIENT_BUFFER", "256"))
+HISTORY_SIZE = int(os.getenv("LIVE_HISTORY", "1000"))
+HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+LIVE_EVENTS = REGISTRY.counter(
+    "papeleria_live_events_total", "Eventos publicados en el canal en vivo", ("topic",))
+LIVE_OVERFLOWS = REGISTRY.counter(
+    "papeleria_live_client_overflows_total", "Clientes lentos que desbordaron su búfer y deben resincronizar")
+
+_PENDING_KEY = "papeleria_live_events"
+
+
+class LiveEvent:
+    __slots__ = ("id", "topic", "store_id", "data", "sse")
+
+    def __init__(self, event_id: int, topic: str, data: Dict[str, Any], store_id: Optional[int] = None):
+        self.id = event_id
+        self.topic = topic
+        self.store_id = store_id
+        self.data = dumps(data)
+        # Trama SSE lista para enviar, compartida por todos los clientes
+        self.sse = b"id: %d\nevent: %s\ndata: %s\n\n" % (event_id, topic.encode(), self.data)
+
+
+class Subscriber:
+    """Búfer acotado de un cliente; vive en el hilo del event loop"""
+
+    def __init__(self, topics: Optional[FrozenSet[str]], maxsize: int, store_id: Optional[int] = None):
+        self.topics = topics
+        self.store_id = store_id
+        self.maxsize = maxsize
+        self.buffer: Deque[LiveEvent] = deque()
+        self.last_id = 0
+        # Motivo pendiente de resincronización ("buffer_overflow" o "history_gap")
+        self.resync: Optional[str] = None
+        self.wakeup = asyncio.Event()
+
+    def push(self, live_event: LiveEvent):
+        # El mismo evento puede llegar por la repetición del historial y por el reparto
+        if live_event.id <= self.last_id or (self.topics and live_event.topic not in self.topics):
+            return
+        if self.store_id is not None and live_event.store_id not in (None, self.store_id):
+            return
+        self.last_id = live_event.id
+        if len(self.buffer) >= self.maxsize:
+            self.buffer.clear()
+            self.resync = "buffer_overflow"
+            LIVE_OVERFLOWS.inc()
+        self.buffer.append(live_event)
+        self.wakeup.set()
+
+    async def next_batch(self, timeout: float) -> Tuple[Optional[str], List[LiveEvent]]:
+        """(motivo de resync o None, eventos pendientes); ambos vacíos si pasó `timeout` sin novedades"""
+        if not self.buffer and not self.resync:
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None, []
+        resync, self.resync = self.resync, None
+        batch = list(self.buffer)
+        self.buffer.clear()
+        return resync, batch
+
+
+class EventBus:
+    def __init__(self, history_size: int = HISTORY_SIZE, client_buffer: int = CLIENT_BUFFER):
+        self.client_buffer = client_buffer
+        self._lock = threading.Lock()
+        self._last_id = 0
+        self._history: Deque[LiveEvent] = deque(maxlen=history_size)
+        self._subscribers: Set[Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, topic: str, data: Dict[str, Any], store_id: Optional[int] = None) -> LiveEvent:
+        """Publica desde cualquier hilo; el reparto ocurre en el event loop"""
+        with self._lock:
+            self._last_id += 1
+            live_event = LiveEvent(self._last_id, topic, data, store_id)
+            self._history.append(live_event)
+        LIVE_EVENTS.inc(topic=topic)
+        loop = self._loop
+        if loop is not None and self._subscribers and not loop.is_closed():
+            loop.call_soon_threadsafe(self._fan_out, live_event)
+        return live_event
+
+    def _fan_out(self, live_event: LiveEvent):
+        for subscriber in list(self._subscribers):
+            subscriber.push(live_event)
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None, last_event_id: Optional[int] = None,
+                  store_id: Optional[int] = None) -> Subscriber:
+        """Registra un cliente (llamar desde el event loop) y repite lo que se perdió desde last_event_id"""
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(frozenset(topics) if topics else None, self.client_buffer, store_id)
+        with self._lock:
+            current = self._last_id
+            missed = [e for e in self._history if last_event_id is not None and e.id > last_event_id]
+            oldest = self._history[0].id if self._history else current + 1
+            # Dentro del candado: lo publicado desde aquí llega por _fan_out
+            self._subscribers.add(subscriber)
+        if last_event_id is None:
+            subscriber.last_id = current
+        elif last_event_id + 1 < oldest:
+            # El historial ya no cubre el hueco: el cliente debe recargar el estado
+            subscriber.last_id = current
+            subscriber.resync = "history_gap"
+        else:
+            subscriber.last_id = last_event_id
+            for live_event in missed:
+                subscriber.push(live_event)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self._subscribers.discard(subscriber)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "clients": len(self._subscribers),
+            "last_event_id": self._last_id,
+            "history": len(self._history),
+            "client_buffer": self.client_buffer,
+        }
+
+
+bus = EventBus()
+
+
+# --- Publicación desde la sesión ORM ---------------------------------------
+
+def publish_after_commit(session, topic: str, data: Dict[str, Any]):
+    """Encola un evento que solo se publica si la transacción de `session` se confirma"""
+    session.info.setdefault(_PENDING_KEY, []).append((topic, data))
+
+
+def _product_delta(product, deleted: bool = False) -> Dict[str, Any]:
+    if deleted:
+        return {"op": "delete", "product_id": product.id, "store_id": product.store_id}
+    return {
+        "op": "upsert", "product_id": product.id, "store_id": product.store_id, "name": product.name,
+        "price": product.price,
+        "stock": product.stock, "min_stock": product.min_stock, "last_updated": product.last_updated,
+    }
+
+
+def _after_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, models.Product) and obj.id is not None:
+            publish_after_commit(session, "product", _product_delta(obj))
+        elif isinstance(obj, models.Sale) and obj in session.new:
+            publish_after_commit(session, "sale", {
+                "sale_id": obj.id, "store_id": obj.store_id, "product_id": obj.product_id, "quantity": obj.quantity,
+                "total_price": obj.total_price, "sale_date": obj.sale_date,
+            })
+    for obj in session.deleted:
+        if isinstance(obj, models.Product):
+            publish_after_commit(session, "product", _product_delta(obj, deleted=True))
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    store_id = session.info.get(database.STORE_INFO_KEY)
+    # Varios flushes del mismo producto en una transacción: basta el último estado
+    latest_product = {}
+    for index, (topic, data) in enumerate(pending):
+        if topic == "product":
+            latest_product[data["product_id"]] = index
+    for index, (topic, data) in enumerate(pending):
+        if topic != "product" or latest_product[data["product_id"]] == index:
+            bus.publish(topic, data, store_id)
+
+
+def _discard_pending(session, *args):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def install(session_factory):
+    """Publica en el bus los cambios confirmados por las sesiones de session_factory"""
+    if getattr(session_factory, "_papeleria_live", False):
+        return session_factory
+    event.listen(session_factory, "after_flush", _after_flush)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _discard_pending)
+    session_factory._papeleria_live = True
+    return session_factory
+
+
+# --- Endpoints --------------------------------------------------------------
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+
+def _parse_topics(topics: Optional[str]) -> Optional[List[str]]:
+    if not topics:
+        return None
+    return [topic.strip() for topic in topics.split(",") if topic.strip() in TOPICS] or None
+
+
+def _resync_data(reason: str, subscriber: Subscriber) -> bytes:
+    return dumps({"reason": reason, "last_event_id": subscriber.last_id})
+
+
+@router.get("/events")
+async def live_events(request: Request, topics: Optional[str] = None, store_id: int = database.DEFAULT_STORE_ID,
+                      last_event_id: Optional[int] = Header(None)):
+    """Server-Sent Events de la tienda store_id; topics=product,sale,alert filtra los temas"""
+    subscriber = bus.subscribe(_parse_topics(topics), last_event_id, store_id)
+
+    async def stream():
+        try:
+            yield b"retry: 3000\n\n"
+            while not await request.is_disconnected():
+                resync, batch = await subscriber.next_batch(HEARTBEAT_SECONDS)
+                if resync is not None:
+                    yield b"event: resync\ndata: %s\n\n" % _resync_data(resync, subscriber)
+                if batch:
+                    yield b"".join(live_event.sse for live_event in batch)
+                elif resync is None:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield b": ping\n\n"
+        finally:
+            bus.unsubscribe(subscriber)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
+
+@router.websocket("/ws")
+async def live_websocket(websocket: WebSocket, topics: Optional[str] = None, last_event_id: Optional[int] = None,
+                         store_id: int = database.DEFAULT_STORE_ID):
+    """Mismos eventos que /live/events como mensajes JSON {id, event, data}"""
+    await websocket.accept()
+    subscriber = bus.subscribe(_parse_topics(topics), last_event_id, store_id)
+    try:
+        while True:
+            resync, batch = await subscriber.next_batch(HEARTBEAT_SECONDS)
+            if resync is not None:
+                await websocket.send_text((b'{"event":"resync","data":%s}' % _resync_data(resync, subscriber)).decode())
+            for live_event in batch:
+                await websocket.send_text((b'{"id":%d,"event":"%s","data":%s}' % (
+                    live_event.id, live_event.topic.encode(), live_event.data)).decode())
+            if not batch and resync is None:
+                await websocket.send_text('{"event":"ping"}')
+    except WebSocketDisconnect:
+        pass
+    finally:
+        bus.unsubscribe(subscriber)
+
+
+@router.get("/stats")
+def live_stats():
+    return bus.stats()
@@ -0,0 +1,38 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from . import loyalty_engine, queries, schemas
+from .tenancy import get_db, get_read_db
+
+router = APIRouter(prefix="/loyalty", tags=["loyalty"])
+
+LEVEL_NAMES = [name for name, _ in loyalty_engine.LEVELS]
+
+@router.get("/leaderboard", response_model=List[schemas.LoyaltyCustomer])
+def read_leaderboard(limit: int = 20, offset: int = 0, level: Optional[str] = None,
+                     db: Session = Depends(get_read_db)):
+    if level is not None and level not in LEVEL_NAMES:
+        raise HTTPException(status_code=400, detail=f"Nivel no válido. Use uno de: {', '.join(LEVEL_NAMES)}")
+    return queries.loyalty_leaderboard(db, min(limit, 500), offset, level)
+
+@router.get("/levels", response_model=List[schemas.LoyaltyLevel])
+def read_levels(db: Session = Depends(get_read_db)):
+    counts = queries.loyalty_levels(db)
+    return [
+        {"membership_level": name, "min_points": minimum, "customers": counts.get(name, (0, 0))[0],
+         "points": counts.get(name, (0, 0))[1]}
+        for name, minimum in loyalty_engine.LEVELS
+    ]
+
+@router.get("/customers/{phone_number}", response_model=schemas.LoyaltyStatus)
+def read_customer_loyalty(phone_number: str, db: Session = Depends(get_db)):
+    customer = queries.customer_loyalty(db, loyalty_engine.normalize_phone(phone_number) or phone_number)
+    if customer is None:
+        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+    customer["next_level"], customer["points_to_next_level"] = loyalty_engine.next_level(customer["loyalty_points"] or 0)
+    return customer
+
+@router.post("/run", response_model=schemas.LoyaltyRun)
+def run_accrual(recompute_levels: bool = False):
+    # Lo mismo que hace el hilo de fondo cada LOYALTY_INTERVAL_SECONDS, en todas las tiendas
+    return loyalty_engine.run(recompute=recompute_levels)
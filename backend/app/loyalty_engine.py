@@ -0,0 +1,234 @@
+"""
+Programa de fidelización: puntos y niveles de los clientes.
+
+- Las ventas llevan el teléfono del comprador (customer_phone, el remitente de
+  WhatsApp). Una venta con teléfono y sin loyalty_points está pendiente; el
+  índice parcial ix_sales_loyalty_pending contiene solo esas.
+- accrue_batch procesa un lote de pendientes en una transacción con sentencias
+  SQL sobre conjuntos, sin cargar ventas ni clientes en Python: crea los
+  clientes nuevos por (tienda, teléfono), asigna customer_id a las ventas, suma
+  los puntos (uno por cada POINT_VALUE pesos) y la última compra, recalcula el
+  nivel (Bronce/Plata/Oro) solo de los clientes tocados y marca las ventas con
+  sus puntos.
+- LoyaltyWorker repite accrue cada LOYALTY_INTERVAL_SECONDS en un hilo de
+  fondo, sobre cada base de tiendas (ver tenancy.store_engines). Con varios
+  procesos del servidor conviene dejarlo activo en uno solo
+  (LOYALTY_INTERVAL_SECONDS=0 en los demás).
+
+Ejecutar manualmente con: python -m app.loyalty_engine
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import Integer, and_, case, cast, exists, func, literal, or_, select, update
+from sqlalchemy.engine import Connection, Engine
+
+from . import models, tenancy
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("LOYALTY_BATCH_SIZE", "5000"))
+INTERVAL_SECONDS = float(os.getenv("LOYALTY_INTERVAL_SECONDS", "60"))
+
+# Un punto por cada $1.000 de compra
+POINT_VALUE = 1000.0
+# Nivel y puntos mínimos, de mayor a menor
+LEVELS: Tuple[Tuple[str, int], ...] = (("Oro", 1500), ("Plata", 500), ("Bronce", 0))
+BASE_LEVEL = LEVELS[-1][0]
+
+sales_table = models.Sale.__table__
+customers_table = models.Customer.__table__
+
+LOYALTY_SALES = REGISTRY.counter(
+    "papeleria_loyalty_sales_total", "Ventas que sumaron puntos de fidelización")
+LOYALTY_BATCH = REGISTRY.histogram(
+    "papeleria_loyalty_batch_seconds", "Duración de cada lote de acumulación de puntos",
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+LOYALTY_ERRORS = REGISTRY.counter(
+    "papeleria_loyalty_errors_total", "Corridas de acumulación fallidas (se reintentan en la siguiente)")
+
+# Una sola acumulación a la vez en el proceso (hilo de fondo o POST /loyalty/run)
+_run_lock = threading.Lock()
+
+
+def normalize_phone(raw: Optional[str]) -> Optional[str]:
+    """'whatsapp:+57 300-123 4567' -> '+573001234567'; a los celulares de 10 dígitos se les antepone 57"""
+    digits = re.sub(r"\D", "", raw or "")
+    if not digits:
+        return None
+    if len(digits) == 10 and digits.startswith("3"):
+        digits = "57" + digits
+    return "+" + digits
+
+
+def points_for(total_price: Optional[float]) -> int:
+    return int((total_price or 0) // POINT_VALUE)
+
+
+def level_for(points: int) -> str:
+    return next(name for name, minimum in LEVELS if points >= minimum)
+
+
+def next_level(points: int) -> Tuple[Optional[str], int]:
+    """(siguiente nivel, puntos que faltan); (None, 0) en el nivel más alto"""
+    for name, minimum in reversed(LEVELS):
+        if points < minimum:
+            return name, minimum - points
+    return None, 0
+
+
+def _level_case(points):
+    return case(*((points >= minimum, name) for name, minimum in LEVELS[:-1]), else_=BASE_LEVEL)
+
+
+def _sale_points():
+    return cast(func.coalesce(sales_table.c.total_price, 0) / POINT_VALUE, Integer)
+
+
+def _empty_stats() -> Dict[str, int]:
+    return {"sales": 0, "points": 0, "customers_created": 0, "customers_updated": 0, "level_changes": 0}
+
+
+def accrue_batch(conn: Connection, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Acumula los puntos de hasta batch_size ventas pendientes, en la transacción de conn"""
+    sales, customers = sales_table, customers_table
+    pending = and_(sales.c.customer_phone.isnot(None), sales.c.loyalty_points.is_(None))
+    first_pending = select(sales.c.id).where(pending).order_by(sales.c.id).limit(batch_size).subquery()
+    upper = conn.execute(select(func.max(first_pending.c.id))).scalar()
+    if upper is None:
+        return _empty_stats()
+    batch = and_(pending, sales.c.id <= upper)
+    same_customer = and_(customers.c.store_id == sales.c.store_id, customers.c.phone_number == sales.c.customer_phone)
+
+    # 1. Clientes nuevos: uno por (tienda, teléfono) sin registro
+    created = conn.execute(customers.insert().from_select(
+        ["store_id", "name", "phone_number", "loyalty_points", "membership_level", "last_purchase"],
+        select(
+            sales.c.store_id, sales.c.customer_phone, sales.c.customer_phone, literal(0), literal(BASE_LEVEL),
+            func.min(sales.c.sale_date),
+        ).where(batch, ~exists().where(same_customer)).group_by(sales.c.store_id, sales.c.customer_phone),
+    )).rowcount
+
+    # 2. Cada venta del lote con su cliente
+    conn.execute(update(sales).where(batch).values(
+        customer_id=select(customers.c.id).where(same_customer).scalar_subquery()
+    ))
+
+    # 3. Puntos y última compra, agregados por cliente
+    totals = select(
+        sales.c.customer_id,
+        func.sum(_sale_points()).label("points"),
+        func.max(sales.c.sale_date).label("last_purchase"),
+    ).where(batch).group_by(sales.c.customer_id).subquery()
+    updated = conn.execute(update(customers).where(customers.c.id == totals.c.customer_id).values(
+        loyalty_points=func.coalesce(customers.c.loyalty_points, 0) + totals.c.points,
+        last_purchase=case(
+            (or_(customers.c.last_purchase.is_(None), totals.c.last_purchase > customers.c.last_purchase),
+             totals.c.last_purchase),
+            else_=customers.c.last_purchase,
+        ),
+    )).rowcount
+
+    # 4. Nivel, solo de los clientes del lote cuyo nivel cambió
+    level_changes = conn.execute(update(customers).where(
+        customers.c.id.in_(select(sales.c.customer_id).where(batch)),
+        customers.c.membership_level.is_distinct_from(_level_case(customers.c.loyalty_points)),
+    ).values(membership_level=_level_case(customers.c.loyalty_points))).rowcount
+
+    # 5. Las ventas dejan de estar pendientes
+    points = conn.execute(select(func.coalesce(func.sum(_sale_points()), 0)).where(batch)).scalar()
+    marked = conn.execute(update(sales).where(batch).values(loyalty_points=_sale_points())).rowcount
+    return {
+        "sales": marked, "points": int(points), "customers_created": created, "customers_updated": updated,
+        "level_changes": level_changes,
+    }
+
+
+def recompute_levels(conn: Connection) -> int:
+    """Recalcula el nivel de todos los clientes (p. ej. tras cambiar LEVELS); devuelve cuántos cambiaron"""
+    customers = customers_table
+    return conn.execute(update(customers).where(
+        customers.c.membership_level.is_distinct_from(_level_case(func.coalesce(customers.c.loyalty_points, 0)))
+    ).values(membership_level=_level_case(func.coalesce(customers.c.loyalty_points, 0)))).rowcount
+
+
+def accrue(engine: Engine, batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """Procesa todas las ventas pendientes de la base, un lote por transacción"""
+    stats = _empty_stats()
+    database_name = engine.url.database or str(engine.url)
+    while True:
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            batch = accrue_batch(conn, batch_size)
+        LOYALTY_BATCH.observe(time.perf_counter() - start)
+        LOYALTY_SALES.inc(batch["sales"])
+        for key, value in batch.items():
+            stats[key] += value
+        if batch["sales"] < batch_size:
+            break
+    if stats["sales"]:
+        logger.info("Fidelización %s: %d ventas, %d puntos", database_name, stats["sales"], stats["points"])
+    return stats
+
+
+def run(batch_size: int = BATCH_SIZE, recompute: bool = False) -> Dict[str, int]:
+    """Acumula los puntos pendientes en todas las bases de tiendas"""
+    with _run_lock:
+        engines = tenancy.store_engines()
+        stats = _empty_stats()
+        for engine in engines:
+            if recompute:
+                with engine.begin() as conn:
+                    stats["level_changes"] += recompute_levels(conn)
+            for key, value in accrue(engine, batch_size).items():
+                stats[key] += value
+        stats["databases"] = len(engines)
+        return stats
+
+
+class LoyaltyWorker:
+    """Hilo de fondo que acumula los puntos pendientes cada `interval` segundos"""
+
+    def __init__(self, interval: float, batch_size: int = BATCH_SIZE):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.last_run: Optional[Dict[str, int]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="loyalty", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_run = run(self.batch_size)
+            except Exception:
+                LOYALTY_ERRORS.inc()
+                logger.exception("No se pudieron acumular los puntos de fidelización")
+
+    def close(self):
+        self._stop.set()
+
+
+_worker: Optional[LoyaltyWorker] = None
+
+
+def start_worker() -> Optional[LoyaltyWorker]:
+    """Arranca el hilo de acumulación una vez por proceso (nada si LOYALTY_INTERVAL_SECONDS <= 0)"""
+    global _worker
+    if _worker is None and INTERVAL_SECONDS > 0:
+        _worker = LoyaltyWorker(INTERVAL_SECONDS)
+    return _worker
+
+
+if __name__ == "__main__":
+    from .migrations import run_migrations
+
+    run_migrations()
+    print(run(recompute=True))
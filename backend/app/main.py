@@ -1,31 +1,105 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Response, status
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.orm import Session
-from typing import List
-from . import models, schemas, database
+from typing import List, Optional
+from datetime import datetime
+from . import models, schemas, database, queries
+from .tenancy import get_db, get_read_db, heavy_job
+from .migrations import run_migrations
 from .prediction import predict_demand
+from . import ai_governor, alert_engine, basket_engine, faq, inventory_analytics, inventory_ledger, live, loyalty_engine, metrics, profiling, reorder, sales_anomalies, sales_archive, sales_rollup, singleflight, stockout_risk, sync, tenancy
+from .responses import FastJSONResponse
 from .whatsapp import router as whatsapp_router
+from .school_lists import router as school_lists_router
+from .orders import router as orders_router
+from .alerts import router as alerts_router
+from .stores import router as stores_router
+from .loyalty import router as loyalty_router
+from .inventory import router as inventory_router
+from .baskets import router as baskets_router
+from .sales import router as sales_router
 
-app = FastAPI()
+app = FastAPI(default_response_class=FastJSONResponse)
+
+# Instrumentación: latencia por ruta y consultas SQL por petición
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(database.engine)
+
+# Sesiones por tienda (X-Store-ID): filtro por store_id y, opcionalmente, un archivo por tienda
+tenancy.install(database.SessionLocal)
+
+# Alertas evaluadas por eventos al confirmar cambios de stock, productos y ventas
+alert_engine.install(database.SessionLocal)
+# Cada cambio de stock queda en el libro de inventario, en la misma transacción
+inventory_ledger.install(database.SessionLocal)
+# Agregados diarios de ventas por producto, en la misma transacción que cada venta
+sales_rollup.install(database.SessionLocal)
+# Ventas atípicas (cantidad o pico del día) detectadas al registrarlas
+sales_anomalies.install(database.SessionLocal)
+# Cambios confirmados publicados a los clientes de /live
+live.install(database.SessionLocal)
+# Registro de cambios para sincronizar nodos sin conexión con la central (SYNC_ENABLED)
+sync.install(database.SessionLocal)
 
 # Incluir routers
 app.include_router(whatsapp_router)
-
-# Dependency para obtener la sesión de la base de datos
-def get_db():
-    db = database.SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+app.include_router(school_lists_router)
+app.include_router(orders_router)
+app.include_router(alerts_router)
+app.include_router(live.router)
+app.include_router(stores_router)
+app.include_router(loyalty_router)
+app.include_router(inventory_router)
+app.include_router(baskets_router)
+app.include_router(sales_router)
+app.include_router(sync.router)
 
 @app.on_event("startup")
 def on_startup():
     database.create_db_and_tables()
+    run_migrations()
+    # Nodo de tienda: historia heredada e identificador antes de registrar cambios propios
+    sync.prepare_node()
+    # Primera copia de lectura al arrancar y no en la primera consulta analítica
+    tenancy.read_engine_for(database.DEFAULT_STORE_ID)
+    # Puntos de fidelización de las ventas con comprador, por lotes en segundo plano
+    loyalty_engine.start_worker()
+    # Cortes periódicos del libro de inventario (y compactación con INVENTORY_RETENTION_DAYS)
+    inventory_ledger.start_worker()
+    # Archivado de ventas antiguas a archivos columnares (con SALES_RETENTION_DAYS)
+    sales_archive.start_worker()
+    # Minería periódica de canastas: "se compra con" precalculado por producto
+    basket_engine.start_worker()
+    # Nodo de tienda: sincronización de fondo con SYNC_CENTRAL_URL
+    sync.start_worker()
+    # Agregados de días cerrados para la clasificación ABC/XYZ, fuera del camino de las peticiones
+    inventory_analytics.start_warmer()
 
 @app.get("/")
 def read_root():
     return {"message": "Bienvenido al Agente de Gestión Inteligente para Papelerías"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def read_metrics():
+    # Formato de texto de Prometheus
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/ai/governor", response_model=schemas.AIGovernorStatus)
+def read_ai_governor():
+    # Consumo del día, límites y colas por proveedor de IA (ver ai_governor.py)
+    return ai_governor.governor.status()
+
+@app.get("/ai/faq", response_model=Optional[schemas.FAQMatch])
+def read_faq_answer(q: str):
+    # Respuesta del índice local de preguntas frecuentes, o null si la IA tendría que responder
+    match = faq.lookup(q)
+    return match._asdict() if match is not None else None
+
+@app.get("/ai/faq/stats", response_model=schemas.FAQStats)
+def read_faq_stats():
+    # Parte de las preguntas resueltas sin llamar a la IA y latencia ahorrada (ver faq.py)
+    return faq.stats()
+
 # Endpoints CRUD para productos
 @app.post("/products/", response_model=schemas.Product, status_code=status.HTTP_201_CREATED)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)):
@@ -45,8 +119,22 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
 
 @app.get("/products/", response_model=List[schemas.Product])
 def read_products(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    products = db.query(models.Product).offset(skip).limit(limit).all()
-    return products
+    rows = queries.list_products(db, skip, limit)
+    return Response(content=queries.dump_products(rows), media_type="application/json")
+
+# Declarada antes de /products/{product_id} para que esa ruta no la capture
+@app.get("/products/demand-alerts", response_model=List[schemas.DemandAlert])
+def get_demand_alerts(with_risk: bool = False, db: Session = Depends(get_db)):
+    # Alertas materializadas por el motor de alertas: O(alertas activas), sin pronosticar el catálogo
+    alerts = queries.list_demand_alerts(db)
+    if with_risk and alerts:
+        # Probabilidad de quiebre de los productos alertados, simulando solo esos
+        risks = stockout_risk.risk_by_product(db, [alert["product_id"] for alert in alerts])
+        for alert in alerts:
+            risk = risks.get(alert["product_id"], {})
+            alert["stockout_probability"] = risk.get("stockout_probability", 0.0)
+            alert["expected_lost_units"] = risk.get("expected_lost_units", 0.0)
+    return alerts
 
 @app.get("/products/{product_id}", response_model=schemas.Product)
 def read_product(product_id: int, db: Session = Depends(get_db)):
@@ -70,34 +158,28 @@ def update_product(product_id: int, product: schemas.ProductCreate, db: Session
 
 @app.get("/products/low-stock/", response_model=List[schemas.Product])
 def get_low_stock_products(db: Session = Depends(get_db)):
-    low_stock_products = db.query(models.Product).filter(models.Product.stock < models.Product.min_stock).all()
-    return low_stock_products
+    rows = queries.list_low_stock_products(db)
+    return Response(content=queries.dump_products(rows), media_type="application/json")
 
 @app.get("/products/low-rotation/", response_model=List[schemas.Product])
-def get_low_rotation_products(db: Session = Depends(get_db)):
-    sixty_days_ago = datetime.utcnow() - timedelta(days=60)
-    
-    # Subconsulta para obtener los product_id que han tenido ventas en los últimos 60 días
-    recent_sales_product_ids = db.query(models.Sale.product_id).filter(
-        models.Sale.sale_date >= sixty_days_ago
-    ).distinct().subquery()
-
-    # Productos que no están en la lista de productos con ventas recientes
-    low_rotation_products = db.query(models.Product).filter(
-        ~models.Product.id.in_(recent_sales_product_ids)
-    ).all()
-    
-    return low_rotation_products
+def get_low_rotation_products(db: Session = Depends(get_read_db)):
+    # Productos sin ventas en los últimos 60 días (subconsulta NOT IN en Core)
+    rows = queries.list_low_rotation_products(db, days=60)
+    return Response(content=queries.dump_products(rows), media_type="application/json")
 
-@app.get("/products/{product_id}/reorder-suggestion", response_model=dict)
-def get_reorder_suggestion(product_id: int, db: Session = Depends(get_db)):
+@app.get("/products/{product_id}/reorder-suggestion", response_model=schemas.ReorderSuggestion,
+         dependencies=[Depends(heavy_job)])
+def get_reorder_suggestion(product_id: int, db: Session = Depends(get_read_db)):
     product = db.query(models.Product).filter(models.Product.id == product_id).first()
     if product is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
     
-    suggested_quantity = 0
-    if product.stock < product.min_stock:
-        suggested_quantity = product.min_stock * 2 # Simple heuristic for now
+    # Mismo cálculo que /reorder-plan con los parámetros por defecto, restringido al producto
+    lines = reorder.plan_quantities(
+        reorder.load_products(db, [product_id]),
+        reorder.load_demand_stats(db, product_ids=[product_id])
+    )
+    suggested_quantity = int(lines["quantity"].sum())
 
     return {
         "product_id": product.id,
@@ -105,9 +187,24 @@ def get_reorder_suggestion(product_id: int, db: Session = Depends(get_db)):
         "current_stock": product.stock,
         "min_stock": product.min_stock,
         "suggested_reorder_quantity": suggested_quantity,
-        "message": "Cantidad sugerida basada en el doble del stock mínimo si el stock actual es bajo."
+        "message": "Cantidad sugerida para cubrir plazo de entrega y revisión con nivel de servicio del 95%."
     }
 
+@app.post("/reorder-plan", response_model=schemas.ReorderPlan, dependencies=[Depends(heavy_job)])
+def get_reorder_plan(request: schemas.ReorderPlanRequest, db: Session = Depends(get_read_db)):
+    """Órdenes de compra por proveedor para todo el catálogo"""
+    params = request.model_dump()
+    # Peticiones simultáneas con los mismos parámetros comparten un solo cálculo
+    return singleflight.forecasts.do(("reorder_plan", singleflight.scope_of(db), params),
+                                     reorder.build_reorder_plan, db, **params)
+
+@app.post("/stockout-risk", response_model=schemas.StockoutRiskReport, dependencies=[Depends(heavy_job)])
+def get_stockout_risk(request: schemas.StockoutRiskRequest, db: Session = Depends(get_read_db)):
+    """Probabilidad de quiebre y ventas perdidas en el plazo de entrega, por simulación, para todo el catálogo"""
+    params = request.model_dump()
+    return singleflight.forecasts.do(("stockout_risk", singleflight.scope_of(db), params),
+                                     stockout_risk.build_risk, db, **params)
+
 @app.delete("/products/{product_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_product(product_id: int, db: Session = Depends(get_db)):
     db_product = db.query(models.Product).filter(models.Product.id == product_id).first()
@@ -124,6 +221,13 @@ def update_product_stock(product_id: int, stock_update: schemas.ProductUpdateSto
     if db_product is None:
         raise HTTPException(status_code=404, detail="Producto no encontrado")
 
+    if stock_update.reason is not None or stock_update.reference is not None:
+        reason = stock_update.reason or (
+            inventory_ledger.RESTOCK if stock_update.operation == "add" else inventory_ledger.ADJUSTMENT)
+        if reason not in (inventory_ledger.RESTOCK, inventory_ledger.ADJUSTMENT, inventory_ledger.RETURN):
+            raise HTTPException(status_code=400, detail="Motivo no válido. Use 'reposicion', 'ajuste' o 'devolucion'.")
+        inventory_ledger.note(db, reason, stock_update.reference, db_product)
+
     if stock_update.operation == "add":
         db_product.stock += stock_update.quantity
     elif stock_update.operation == "subtract":
@@ -138,28 +242,15 @@ def update_product_stock(product_id: int, stock_update: schemas.ProductUpdateSto
     db.refresh(db_product)
     return db_product
 
-@app.get("/products/{product_id}/demand-prediction", response_model=dict)
-def get_demand_prediction(product_id: int, days_ahead: int = 30, db: Session = Depends(get_db)):
-    prediction = predict_demand(product_id, db, days_ahead)
-    return prediction
+@app.get("/products/{product_id}/pending-orders", response_model=List[schemas.ProductOrderLine])
+def get_pending_orders_for_product(product_id: int, order_status: str = "Pendiente", db: Session = Depends(get_db)):
+    return queries.orders_containing_product(db, product_id, order_status)
 
-@app.get("/products/demand-alerts", response_model=List[dict])
-def get_demand_alerts(db: Session = Depends(get_db)):
-    products = db.query(models.Product).all()
-    alerts = []
-    
-    for product in products:
-        prediction = predict_demand(product.id, db, 30)
-        predicted_demand = prediction.get("predicted_demand", 0)
-        
-        if predicted_demand > product.stock:
-            alerts.append({
-                "product_id": product.id,
-                "product_name": product.name,
-                "current_stock": product.stock,
-                "predicted_demand": predicted_demand,
-                "alert_type": "Demanda alta prevista",
-                "message": f"Se espera vender {predicted_demand} unidades en los próximos 30 días, pero solo hay {product.stock} en stock."
-            })
-    
-    return alerts
\ No newline at end of file
+@app.get("/products/{product_id}/demand-prediction", response_model=schemas.DemandPrediction,
+         dependencies=[Depends(heavy_job)])
+def get_demand_prediction(product_id: int, days_ahead: int = 30, db: Session = Depends(get_read_db)):
+    return singleflight.forecasts.do(("predict_demand", singleflight.scope_of(db), product_id, days_ahead),
+                                     predict_demand, product_id, db, days_ahead)
+
+# Perfilado opcional (PROFILING_ENABLED=1); se instala al final para envolver todas las rutas
+profiling.install(app)
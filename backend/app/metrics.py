@@ -0,0 +1,305 @@
+"""
+Instrumentación de rendimiento exportada en formato de texto de Prometheus.
+
+- MetricsMiddleware: latencia por ruta y estado de cada petición HTTP.
+- instrument_engine: cuenta consultas SQL (también las que fallan), su
+  duración y el tiempo total en la base por petición, y marca patrones N+1
+  (la misma sentencia repetida muchas veces en una petición).
+- timed: decorador/contexto para medir pronósticos y llamadas a proveedores de IA.
+
+Sin dependencias externas: el registro es propio y seguro entre hilos.
+"""
+
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A partir de cuántas ejecuciones de la misma sentencia en una petición se considera N+1
+N_PLUS_ONE_THRESHOLD = int(os.getenv("METRICS_N_PLUS_ONE_THRESHOLD", "10"))
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Por combinación de etiquetas: [conteos por cubeta (+Inf al final), suma, total]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = self._header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_REQUESTS = REGISTRY.counter(
+    "papeleria_http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+HTTP_LATENCY = REGISTRY.histogram(
+    "papeleria_http_request_duration_seconds", "Latencia de peticiones HTTP por ruta", ("method", "route"))
+DB_QUERIES = REGISTRY.counter(
+    "papeleria_db_queries_total", "Consultas SQL ejecutadas", ("route",))
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "papeleria_db_query_duration_seconds", "Duración de cada consulta SQL", ("route",))
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "papeleria_db_queries_per_request", "Consultas SQL por petición HTTP", ("route",),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 1000))
+DB_SECONDS_PER_REQUEST = REGISTRY.histogram(
+    "papeleria_db_seconds_per_request", "Tiempo total en consultas SQL por petición HTTP", ("route",))
+DB_QUERY_ERRORS = REGISTRY.counter(
+    "papeleria_db_query_errors_total", "Consultas SQL que terminaron en error", ("route",))
+N_PLUS_ONE = REGISTRY.counter(
+    "papeleria_db_n_plus_one_total", "Peticiones con la misma sentencia repetida (patrón N+1)", ("route",))
+FORECAST_LATENCY = REGISTRY.histogram(
+    "papeleria_forecast_duration_seconds", "Duración de los pronósticos de demanda", ("function",))
+AI_LATENCY = REGISTRY.histogram(
+    "papeleria_ai_request_duration_seconds", "Latencia de llamadas a proveedores de IA", ("provider",))
+AI_ERRORS = REGISTRY.counter(
+    "papeleria_ai_request_errors_total", "Llamadas fallidas a proveedores de IA", ("provider",))
+
+
+def _route_label(scope) -> str:
+    # Plantilla de la ruta (/products/{product_id}) para no disparar la cardinalidad
+    route = scope.get("route")
+    return getattr(route, "path", None) or "sin_ruta"
+
+
+class RequestStats:
+    """Consultas SQL acumuladas durante una petición"""
+
+    __slots__ = ("scope", "queries", "db_seconds", "statements")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: _Tally = _Tally()
+
+    @property
+    def route(self) -> str:
+        # El router de FastAPI agrega "route" al scope al resolver la petición
+        return _route_label(self.scope)
+
+
+_current_request: ContextVar[Optional[RequestStats]] = ContextVar("papeleria_request_stats", default=None)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: latencia y estado por ruta, y resumen de SQL por petición"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = _current_request.set(stats)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            route = _route_label(scope)
+            HTTP_REQUESTS.inc(method=scope["method"], route=route, status=status_code)
+            HTTP_LATENCY.observe(duration, method=scope["method"], route=route)
+            if stats.queries:
+                DB_QUERIES_PER_REQUEST.observe(stats.queries, route=route)
+                DB_SECONDS_PER_REQUEST.observe(stats.db_seconds, route=route)
+                statement, repeats = stats.statements.most_common(1)[0]
+                if repeats >= N_PLUS_ONE_THRESHOLD:
+                    N_PLUS_ONE.inc(route=route)
+                    logger.warning(
+                        "Posible N+1 en %s: %d ejecuciones de %s", route, repeats, " ".join(statement.split())[:120]
+                    )
+            _current_request.reset(token)
+
+
+def instrument_engine(engine):
+    """Registra los eventos de SQLAlchemy que miden cada consulta del engine"""
+    from sqlalchemy import event
+
+    if getattr(engine, "_papeleria_instrumented", False):
+        return engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("papeleria_query_start", []).append(time.perf_counter())
+
+    def _record(conn, statement) -> str:
+        duration = time.perf_counter() - conn.info["papeleria_query_start"].pop()
+        stats = _current_request.get()
+        route = stats.route if stats is not None else "fuera_de_peticion"
+        DB_QUERIES.inc(route=route)
+        DB_QUERY_LATENCY.observe(duration, route=route)
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += duration
+            stats.statements[statement] += 1
+        return route
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record(conn, statement)
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # Sin esto el inicio de una consulta fallida quedaría en la pila y desfasaría las siguientes de la conexión
+        conn = exception_context.connection
+        if conn is None or exception_context.execution_context is None or not conn.info.get("papeleria_query_start"):
+            return
+        DB_QUERY_ERRORS.inc(route=_record(conn, exception_context.statement))
+
+    engine._papeleria_instrumented = True
+    return engine
+
+
+def timed(histogram: Histogram, **labels):
+    """Decorador que observa la duración de la función en el histograma"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with histogram.time(**labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,263 @@
+"""
+Migraciones ligeras del esquema.
+
+create_all() solo crea tablas nuevas: las columnas e índices agregados a tablas
+existentes y las transformaciones de datos se aplican aquí una sola vez y
+quedan registradas en la tabla schema_migrations.
+Ejecutar manualmente con: python -m app.migrations
+"""
+
+import json
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.engine import Connection
+
+from . import alert_engine, database, sales_rollup
+
+logger = logging.getLogger(__name__)
+
+# Migraciones registradas en orden de aplicación: (nombre, función)
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = []
+
+
+def migration(name: str):
+    """Registra una función como migración con un nombre único"""
+    def decorator(func: Callable[[Connection], None]):
+        MIGRATIONS.append((name, func))
+        return func
+    return decorator
+
+
+def add_column(conn: Connection, table: str, column: str, ddl: str):
+    """ALTER TABLE ... ADD COLUMN solo si la columna no existe todavía"""
+    existing = {col["name"] for col in inspect(conn).get_columns(table)}
+    if column not in existing:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def create_missing_indexes(conn: Connection, skip: Optional[Callable[[Any], bool]] = None) -> List[str]:
+    """Crea los índices declarados en los modelos que falten en tablas existentes (salvo los de skip); devuelve sus nombres"""
+    inspector = inspect(conn)
+    created = []
+    for table in database.Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if (skip is not None and skip(index)) or inspector.has_index(table.name, index.name):
+                continue
+            start = time.perf_counter()
+            index.create(conn)
+            created.append(index.name)
+            logger.info("Índice %s creado en %.1f s", index.name, time.perf_counter() - start)
+    return created
+
+
+def _as_int(value: Any, default: int = 1) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def parse_json_items(raw: Optional[str], allow_mapping: bool = True) -> List[Dict[str, Any]]:
+    """
+    Convierte el JSON legado de ítems en una lista de diccionarios con
+    product_id, name, quantity y unit_price.
+
+    Formatos aceptados: lista de objetos o de nombres, {"items": [...]} y,
+    si allow_mapping, {"nombre producto": cantidad}.
+    """
+    try:
+        data = json.loads(raw) if raw else None
+    except (TypeError, ValueError):
+        return []
+
+    if isinstance(data, dict):
+        nested = data.get("items", data.get("productos"))
+        if isinstance(nested, list):
+            data = nested
+        elif allow_mapping:
+            data = [{"name": name, "quantity": quantity} for name, quantity in data.items()]
+        else:
+            return []
+    if not isinstance(data, list):
+        return []
+
+    items = []
+    for entry in data:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        if not isinstance(entry, dict):
+            continue
+        items.append({
+            "product_id": entry.get("product_id"),
+            "name": entry.get("name") or entry.get("product") or entry.get("producto") or entry.get("nombre"),
+            "quantity": _as_int(entry.get("quantity", entry.get("cantidad", 1))),
+            "unit_price": entry.get("unit_price", entry.get("price", entry.get("precio"))),
+        })
+    return items
+
+
+def _resolve_product(item: Dict[str, Any], product_ids: Dict[str, int], known_ids: set) -> Optional[int]:
+    product_id = _as_int(item["product_id"], default=0)
+    if product_id in known_ids:
+        return product_id
+    if item["name"]:
+        return product_ids.get(str(item["name"]).strip().lower())
+    return None
+
+
+@migration("0001_json_items_to_tables")
+def migrate_json_items(conn: Connection):
+    """Pasa SchoolList.items y Order.details (JSON) a school_list_items y order_items"""
+    products = database.Product.__table__
+    product_ids = {name.strip().lower(): pid for pid, name in conn.execute(select(products.c.id, products.c.name)) if name}
+    known_ids = set(product_ids.values())
+
+    school_lists = database.SchoolList.__table__
+    list_items = []
+    for list_id, raw in conn.execute(select(school_lists.c.id, school_lists.c["items"])):
+        for item in parse_json_items(raw):
+            list_items.append({
+                "school_list_id": list_id,
+                "product_id": _resolve_product(item, product_ids, known_ids),
+                "description": item["name"],
+                "quantity": item["quantity"],
+            })
+    if list_items:
+        conn.execute(database.SchoolListItem.__table__.insert(), list_items)
+
+    orders = database.Order.__table__
+    order_items = []
+    for order_id, raw in conn.execute(select(orders.c.id, orders.c.details)):
+        # En órdenes un objeto suelto son especificaciones de impresión, no productos
+        for item in parse_json_items(raw, allow_mapping=False):
+            order_items.append({
+                "order_id": order_id,
+                "product_id": _resolve_product(item, product_ids, known_ids),
+                "description": item["name"],
+                "quantity": item["quantity"],
+                "unit_price": item["unit_price"] or 0.0,
+            })
+    if order_items:
+        conn.execute(database.OrderItem.__table__.insert(), order_items)
+
+
+@migration("0002_materialize_alerts")
+def materialize_alerts(conn: Connection):
+    """Pronósticos y alertas iniciales; desde aquí el motor de alertas los mantiene por eventos"""
+    alert_engine.rebuild(conn)
+
+
+@migration("0003_multi_store")
+def add_store_columns(conn: Connection):
+    """store_id en productos, ventas, clientes y órdenes; los datos existentes quedan en la tienda por defecto"""
+    for table in ("products", "sales", "customers", "orders"):
+        add_column(conn, table, "store_id", f"INTEGER NOT NULL DEFAULT {database.DEFAULT_STORE_ID}")
+
+    # Nombre de producto y teléfono de cliente pasan de únicos globales a únicos por tienda
+    # (create_missing_indexes recrea los índices con la definición nueva)
+    inspector = inspect(conn)
+    for table, name in (("products", "ix_products_name"), ("customers", "ix_customers_phone_number")):
+        if any(index["name"] == name and index["unique"] for index in inspector.get_indexes(table)):
+            conn.execute(text(f"DROP INDEX {name}"))
+    conn.execute(text("DROP INDEX IF EXISTS ix_sales_sale_date_product"))
+
+    stores = database.Store.__table__
+    if conn.execute(select(stores.c.id).where(stores.c.id == database.DEFAULT_STORE_ID)).first() is None:
+        conn.execute(stores.insert().values(
+            id=database.DEFAULT_STORE_ID, name="Papelería principal", created_at=datetime.utcnow()
+        ))
+
+
+@migration("0004_loyalty")
+def add_loyalty_columns(conn: Connection):
+    """Comprador de cada venta y puntos otorgados; las ventas existentes no tienen comprador y no suman puntos"""
+    add_column(conn, "sales", "customer_phone", "VARCHAR")
+    add_column(conn, "sales", "customer_id", "INTEGER")
+    add_column(conn, "sales", "loyalty_points", "INTEGER")
+
+
+@migration("0005_print_queue")
+def add_print_queue_columns(conn: Connection):
+    """Prioridad, tamaño e impresora de las órdenes; las páginas de impresión salen de sus ítems"""
+    add_column(conn, "orders", "priority", "INTEGER NOT NULL DEFAULT 1")
+    for column, ddl in (("pages", "INTEGER"), ("printer_id", "INTEGER"), ("started_at", "DATETIME"),
+                        ("completed_at", "DATETIME")):
+        add_column(conn, "orders", column, ddl)
+    conn.execute(text(
+        "UPDATE orders SET pages = (SELECT SUM(quantity) FROM order_items WHERE order_items.order_id = orders.id) "
+        "WHERE order_type = 'impresion' AND pages IS NULL"
+    ))
+    # Reemplazado por ix_orders_store_status_due_date
+    conn.execute(text("DROP INDEX IF EXISTS ix_orders_status_due_date"))
+
+
+@migration("0006_sync")
+def add_sync_columns(conn: Connection):
+    """Columnas de sincronización e identificador propio de esta base como nodo"""
+    add_column(conn, "products", "sync_id", "VARCHAR")
+    add_column(conn, "products", "version", "INTEGER NOT NULL DEFAULT 1")
+    add_column(conn, "products", "sync_origin", "VARCHAR")
+    add_column(conn, "sales", "sync_id", "VARCHAR")
+    state = database.SyncState.__table__
+    if conn.execute(select(state.c.value).where(state.c.key == "node_id")).first() is None:
+        conn.execute(state.insert().values(key="node_id", value=uuid.uuid4().hex))
+
+
+@migration("0007_inventory_ledger")
+def open_inventory_ledger(conn: Connection):
+    """Saldo inicial del libro de inventario: el stock actual de cada producto (ver inventory_ledger.py)"""
+    conn.execute(text(
+        "INSERT INTO inventory_movements (store_id, product_id, movement_type, quantity, stock_after, reference, created_at) "
+        "SELECT store_id, id, 'inicial', COALESCE(stock, 0), COALESCE(stock, 0), 'migracion', :now FROM products"
+    ), {"now": datetime.utcnow()})
+
+
+@migration("0008_tickets")
+def add_sale_tickets(conn: Connection):
+    """Ticket de cada línea de venta; las ventas anteriores quedan sueltas (ticket_id NULL)"""
+    add_column(conn, "sales", "ticket_id", "INTEGER")
+
+
+@migration("0009_sales_daily")
+def fill_sales_daily(conn: Connection):
+    """Agregados diarios de las ventas existentes; desde aquí los mantiene sales_rollup en cada venta"""
+    sales_rollup.rebuild(conn)
+
+
+def run_migrations(bind=None) -> List[str]:
+    """Crea tablas e índices faltantes y aplica las migraciones pendientes"""
+    bind = bind if bind is not None else database.engine
+    database.Base.metadata.create_all(bind=bind)
+
+    applied_now = []
+    with bind.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations (name VARCHAR PRIMARY KEY, applied_at DATETIME)"
+        ))
+        applied = {row[0] for row in conn.execute(text("SELECT name FROM schema_migrations"))}
+        for name, func in MIGRATIONS:
+            if name in applied:
+                continue
+            func(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (name, applied_at) VALUES (:name, :applied_at)"),
+                {"name": name, "applied_at": datetime.utcnow()},
+            )
+            applied_now.append(name)
+        created = create_missing_indexes(conn)
+        if created and conn.dialect.name == "sqlite":
+            # Estadísticas del planificador para los índices nuevos, p. ej. los que seed_data.py deja para el primer arranque
+            for name in created:
+                conn.execute(text(f"ANALYZE {name}"))
+    return applied_now
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    applied = run_migrations()
+    print(f"Migraciones aplicadas: {', '.join(applied) if applied else 'ninguna pendiente'}")
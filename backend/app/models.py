@@ -1 +1,4 @@
-from .database import Product, Sale, Customer, SchoolList, Order
\ No newline at end of file
+from .database import (
+    Store, Product, Sale, Ticket, Customer, SchoolList, SchoolListItem, Order, OrderItem, DemandForecast, Alert, AlertEvent,
+    InventoryMovement, InventorySnapshot, InventoryArchive, ProductAssociation, SalesDaily, SalesArchive, SyncChange, SyncState, WebhookMessage
+)
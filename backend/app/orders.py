@@ -0,0 +1,103 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from datetime import datetime
+from . import models, print_queue, queries, schemas
+from .tenancy import get_db
+
+router = APIRouter(prefix="/orders", tags=["orders"])
+
+def _get_order(db: Session, order_id: int) -> models.Order:
+    order = db.query(models.Order).filter(models.Order.id == order_id).first()
+    if order is None:
+        raise HTTPException(status_code=404, detail="Orden no encontrada")
+    return order
+
+@router.post("/", response_model=schemas.Order, status_code=status.HTTP_201_CREATED)
+def create_order(order: schemas.OrderCreate, db: Session = Depends(get_db)):
+    if order.status not in print_queue.STATUSES:
+        raise HTTPException(status_code=400, detail=f"Estado no válido. Use uno de: {', '.join(print_queue.STATUSES)}")
+    missing = queries.missing_products(db, [item.product_id for item in order.items])
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Productos no encontrados: {', '.join(map(str, missing))}")
+    data = order.model_dump(exclude={"items"})
+    if order.order_type == print_queue.PRINT_ORDER_TYPE:
+        # Tamaño y entrega definen el lugar del trabajo en la cola
+        if data["pages"] is None:
+            data["pages"] = sum(item.quantity for item in order.items)
+        if data["due_date"] is None:
+            data["due_date"] = datetime.utcnow() + print_queue.DEFAULT_TURNAROUND
+    db_order = models.Order(
+        **data,
+        items=[models.OrderItem(**item.model_dump()) for item in order.items]
+    )
+    db.add(db_order)
+    db.commit()
+    db.refresh(db_order)
+    return db_order
+
+@router.get("/", response_model=List[schemas.Order])
+def read_orders(status: Optional[str] = None, order_type: Optional[str] = None, skip: int = 0, limit: int = 100,
+                db: Session = Depends(get_db)):
+    query = db.query(models.Order)
+    if status is not None:
+        query = query.filter(models.Order.status == status)
+    if order_type is not None:
+        query = query.filter(models.Order.order_type == order_type)
+    return query.order_by(models.Order.due_date, models.Order.id).offset(skip).limit(limit).all()
+
+# Declaradas antes de /orders/{order_id}
+@router.get("/print-queue", response_model=List[schemas.PrintJobEstimate])
+def read_print_queue(limit: Optional[int] = None, db: Session = Depends(get_db)):
+    """Trabajos de impresión pendientes en orden de atención, con impresora, inicio y fin estimados"""
+    pending = print_queue.pending_jobs(db, limit)
+    return print_queue.schedule(pending, print_queue.running_jobs(db), print_queue.printers(), datetime.utcnow())
+
+@router.post("/print-queue/dispatch", response_model=List[schemas.PrintAssignment])
+def dispatch_print_jobs(db: Session = Depends(get_db)):
+    """Asigna el siguiente trabajo de la cola a cada impresora libre"""
+    return print_queue.dispatch(db, print_queue.printers(), datetime.utcnow())
+
+@router.get("/printers", response_model=List[schemas.PrinterStatus])
+def read_printers(db: Session = Depends(get_db)):
+    return print_queue.printer_status(db, print_queue.printers(), datetime.utcnow())
+
+@router.get("/{order_id}", response_model=schemas.Order)
+def read_order(order_id: int, db: Session = Depends(get_db)):
+    return _get_order(db, order_id)
+
+@router.patch("/{order_id}", response_model=schemas.Order)
+def update_order(order_id: int, changes: schemas.OrderUpdate, db: Session = Depends(get_db)):
+    order = _get_order(db, order_id)
+    for field, value in changes.model_dump(exclude_unset=True).items():
+        setattr(order, field, value)
+    db.commit()
+    db.refresh(order)
+    return order
+
+@router.post("/{order_id}/status", response_model=schemas.Order)
+def update_order_status(order_id: int, change: schemas.OrderStatusUpdate, db: Session = Depends(get_db)):
+    order = _get_order(db, order_id)
+    if not print_queue.is_allowed(order.status, change.status):
+        raise HTTPException(status_code=400, detail=f"Transición no válida: {order.status} -> {change.status}")
+    printer_id = None
+    if change.status == print_queue.IN_PROGRESS and order.order_type == print_queue.PRINT_ORDER_TYPE:
+        printers = print_queue.printers()
+        busy = {job["printer_id"] for job in print_queue.running_jobs(db)}
+        idle = [pid for pid in printers if pid not in busy]
+        if change.printer_id is not None and change.printer_id not in printers:
+            raise HTTPException(status_code=400, detail="Impresora no encontrada")
+        if change.printer_id is not None and change.printer_id not in idle:
+            raise HTTPException(status_code=400, detail="La impresora está ocupada")
+        if not idle:
+            raise HTTPException(status_code=400, detail="No hay impresoras libres")
+        printer_id = change.printer_id if change.printer_id is not None else idle[0]
+    print_queue.apply_transition(order, change.status, datetime.utcnow(), printer_id)
+    db.commit()
+    db.refresh(order)
+    return order
+
+@router.delete("/{order_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_order(order_id: int, db: Session = Depends(get_db)):
+    db.delete(_get_order(db, order_id))
+    db.commit()
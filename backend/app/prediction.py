@@ -1,9 +1,13 @@
 from sklearn.linear_model import LinearRegression
 import pandas as pd
 from datetime import datetime, timedelta
+from typing import Iterable, Optional
 from . import models
+from .metrics import FORECAST_LATENCY, timed
+from sqlalchemy import Integer, cast, func, select
 from sqlalchemy.orm import Session
 
+@timed(FORECAST_LATENCY, function="predict_demand")
 def predict_demand(product_id: int, db: Session, days_ahead: int = 30):
     """
     Predice la demanda futura para un producto basado en datos históricos de ventas.
@@ -41,4 +45,45 @@ def predict_demand(product_id: int, db: Session, days_ahead: int = 30):
         "predicted_demand": max(0, predicted_demand),  # No permitir valores negativos
         "days_ahead": days_ahead,
         "message": f"Predicción basada en {len(sales)} ventas históricas."
-    }
\ No newline at end of file
+    }
+
+@timed(FORECAST_LATENCY, function="predict_demand_batch")
+def predict_demand_batch(db: Session, days_ahead: int = 30, product_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Misma regresión lineal de predict_demand para muchos productos a la vez.
+
+    La recta de mínimos cuadrados sale de sumas (n, Σx, Σy, Σxy, Σx²) que SQLite
+    agrega por producto en una sola pasada, sin traer las ventas a Python. x son
+    los días completos desde la primera venta del producto, como en predict_demand.
+    """
+    sales = models.Sale.__table__
+    first_sale = select(
+        sales.c.product_id, func.min(sales.c.sale_date).label("first_sale")
+    ).where(sales.c.product_id.is_not(None)).group_by(sales.c.product_id)
+    if product_ids is not None:
+        first_sale = first_sale.where(sales.c.product_id.in_(list(product_ids)))
+    first_sale = first_sale.subquery()
+
+    x = cast(func.julianday(sales.c.sale_date) - func.julianday(first_sale.c.first_sale), Integer)
+    y = sales.c.quantity
+    stmt = select(
+        sales.c.product_id, func.count(), func.sum(x), func.sum(y), func.sum(x * y), func.sum(x * x), func.max(x)
+    ).join(first_sale, first_sale.c.product_id == sales.c.product_id).group_by(sales.c.product_id)
+
+    sums = pd.DataFrame(db.execute(stmt).all(), columns=["product_id", "n", "sx", "sy", "sxy", "sxx", "max_x"])
+    return forecast_from_sums(sums, days_ahead)
+
+def forecast_from_sums(sums: pd.DataFrame, days_ahead: int = 30) -> pd.DataFrame:
+    """Pronóstico por producto a partir de las sumas (product_id, n, sx, sy, sxy, sxx, max_x) de sus ventas"""
+    n = sums["n"].astype(float)
+    var_x = sums["sxx"] - sums["sx"] ** 2 / n
+    cov_xy = sums["sxy"] - sums["sx"] * sums["sy"] / n
+    # Todas las ventas el mismo día: la recta es horizontal en la media, igual que sklearn
+    slope = (cov_xy / var_x.where(var_x > 1e-9)).fillna(0.0)
+    intercept = sums["sy"] / n - slope * sums["sx"] / n
+    predicted = (intercept + slope * (sums["max_x"] + days_ahead)).clip(lower=0)
+    return pd.DataFrame({
+        "product_id": sums["product_id"],
+        "predicted_demand": predicted.where(sums["n"] >= 2, 0.0),
+        "sales_count": sums["n"],
+    })
@@ -0,0 +1,195 @@
+"""
+Cola y planificación de los trabajos de impresión.
+
+Las órdenes con order_type='impresion' forman la cola de su tienda:
+
+- Orden de atención: prioridad (0 urgente, 1 normal, 2 baja), fecha de
+  entrega y, a igualdad, el trabajo más corto primero. La consulta de la cola
+  sale en ese orden del índice ix_orders_print_queue.
+- Impresoras simuladas: PRINTER_PAGES_PER_MINUTE lista la velocidad de cada
+  una (p. ej. "40,40,60" son tres impresoras). Un trabajo tarda
+  PRINT_JOB_SETUP_SECONDS (alistamiento, acabados) más sus páginas a la
+  velocidad de la impresora.
+- schedule estima inicio y fin de cada pendiente repartiendo la cola, en
+  orden, a la impresora que se libera primero (un montículo por hora de
+  disponibilidad); dispatch asigna los siguientes trabajos a las impresoras
+  libres.
+- Estados: Pendiente -> En proceso -> Listo -> Entregado; Pendiente y En
+  proceso pueden cancelarse y un trabajo En proceso puede volver a la cola.
+"""
+
+import heapq
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+from .queries import fetch_dicts
+
+PRINT_ORDER_TYPE = "impresion"
+
+PENDING = "Pendiente"
+IN_PROGRESS = "En proceso"
+READY = "Listo"
+DELIVERED = "Entregado"
+CANCELLED = "Cancelado"
+STATUSES = (PENDING, IN_PROGRESS, READY, DELIVERED, CANCELLED)
+
+# Estados a los que se puede pasar desde cada estado
+TRANSITIONS = {
+    PENDING: (IN_PROGRESS, CANCELLED),
+    IN_PROGRESS: (READY, PENDING, CANCELLED),
+    READY: (DELIVERED,),
+    DELIVERED: (),
+    CANCELLED: (),
+}
+
+PRIORITIES = {"urgente": 0, "normal": 1, "baja": 2}
+
+PRINTER_SPEEDS = tuple(
+    float(speed) for speed in os.getenv("PRINTER_PAGES_PER_MINUTE", "40,40").split(",") if speed.strip()
+)
+JOB_SETUP_SECONDS = float(os.getenv("PRINT_JOB_SETUP_SECONDS", "90"))
+# Entrega por defecto de un trabajo creado sin due_date
+DEFAULT_TURNAROUND = timedelta(hours=float(os.getenv("PRINT_DEFAULT_TURNAROUND_HOURS", "24")))
+
+orders_table = models.Order.__table__
+
+QUEUE_COLUMNS = (
+    orders_table.c.id, orders_table.c.priority, orders_table.c.due_date, orders_table.c.pages,
+    orders_table.c.printer_id, orders_table.c.started_at,
+)
+
+
+def printers(speeds: Tuple[float, ...] = PRINTER_SPEEDS) -> Dict[int, float]:
+    """{printer_id: páginas por minuto}; las impresoras se numeran desde 1"""
+    return {printer_id: speed for printer_id, speed in enumerate(speeds, start=1)}
+
+
+def job_seconds(pages: Optional[int], pages_per_minute: float, setup_seconds: float = JOB_SETUP_SECONDS) -> float:
+    return setup_seconds + (pages or 0) * 60.0 / pages_per_minute
+
+
+def queue_key(priority: Optional[int], due_date: Optional[datetime], pages: Optional[int], order_id: int):
+    """Clave de orden de la cola, la misma del ORDER BY de pending_jobs (los trabajos nuevos siempre tienen due_date)"""
+    return (priority if priority is not None else 1, due_date or datetime.max, pages or 0, order_id)
+
+
+def is_allowed(current: str, new: str) -> bool:
+    return new in TRANSITIONS.get(current, ())
+
+
+def pending_jobs(db: Session, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Trabajos pendientes de la tienda de la sesión, en orden de atención"""
+    stmt = select(*QUEUE_COLUMNS).where(
+        orders_table.c.order_type == PRINT_ORDER_TYPE, orders_table.c.status == PENDING
+    ).order_by(orders_table.c.priority, orders_table.c.due_date, orders_table.c.pages, orders_table.c.id)
+    return fetch_dicts(db, stmt if limit is None else stmt.limit(limit))
+
+
+def running_jobs(db: Session) -> List[Dict[str, Any]]:
+    return fetch_dicts(db, select(*QUEUE_COLUMNS).where(
+        orders_table.c.order_type == PRINT_ORDER_TYPE, orders_table.c.status == IN_PROGRESS
+    ))
+
+
+def printer_availability(running: List[Dict[str, Any]], speeds: Dict[int, float],
+                         now: datetime) -> Dict[int, Tuple[datetime, Optional[int]]]:
+    """{printer_id: (hora estimada en que queda libre, orden en curso o None)}"""
+    available = {printer_id: (now, None) for printer_id in speeds}
+    for job in running:
+        printer_id = job["printer_id"]
+        if printer_id not in speeds:
+            # En proceso sin impresora (registros anteriores a la cola): no ocupa ninguna
+            continue
+        finish = (job["started_at"] or now) + timedelta(seconds=job_seconds(job["pages"], speeds[printer_id]))
+        available[printer_id] = (max(finish, now), job["id"])
+    return available
+
+
+def schedule(pending: List[Dict[str, Any]], running: List[Dict[str, Any]], speeds: Dict[int, float],
+             now: datetime) -> List[Dict[str, Any]]:
+    """
+    Estima impresora, inicio y fin de cada trabajo pendiente (ya ordenados por
+    queue_key): cada uno va a la impresora que se libera primero.
+    """
+    if not speeds:
+        return []
+    free = [(available, printer_id) for printer_id, (available, _) in
+            printer_availability(running, speeds, now).items()]
+    heapq.heapify(free)
+    estimates = []
+    for job in pending:
+        start, printer_id = heapq.heappop(free)
+        finish = start + timedelta(seconds=job_seconds(job["pages"], speeds[printer_id]))
+        heapq.heappush(free, (finish, printer_id))
+        estimates.append({
+            "order_id": job["id"], "priority": job["priority"], "pages": job["pages"], "due_date": job["due_date"],
+            "printer_id": printer_id, "estimated_start": start, "estimated_finish": finish,
+            "wait_minutes": round((start - now).total_seconds() / 60, 1),
+            "late": job["due_date"] is not None and finish > job["due_date"],
+        })
+    return estimates
+
+
+def printer_status(db: Session, speeds: Dict[int, float], now: datetime) -> List[Dict[str, Any]]:
+    """Estado de cada impresora: trabajo en curso, trabajos asignados por schedule y capacidad"""
+    running = running_jobs(db)
+    pending = pending_jobs(db)
+    available = printer_availability(running, speeds, now)
+    estimates = schedule(pending, running, speeds, now)
+    queued = {printer_id: [] for printer_id in speeds}
+    for estimate in estimates:
+        queued[estimate["printer_id"]].append(estimate)
+    # Capacidad medida con el tamaño medio de los trabajos en cola
+    mean_pages = sum(job["pages"] or 0 for job in pending) / len(pending) if pending else 0
+    return [{
+        "printer_id": printer_id,
+        "pages_per_minute": speed,
+        "current_order_id": available[printer_id][1],
+        "busy_until": available[printer_id][0] if available[printer_id][1] is not None else None,
+        "queued_jobs": len(queued[printer_id]),
+        "backlog_minutes": round(sum(
+            (estimate["estimated_finish"] - estimate["estimated_start"]).total_seconds() for estimate in queued[printer_id]
+        ) / 60, 1),
+        "jobs_per_hour": round(3600 / job_seconds(mean_pages, speed), 1),
+    } for printer_id, speed in speeds.items()]
+
+
+def dispatch(db: Session, speeds: Dict[int, float], now: datetime) -> List[Dict[str, Any]]:
+    """Pasa a 'En proceso' el siguiente trabajo de cada impresora libre; devuelve las asignaciones"""
+    busy = {job["printer_id"] for job in running_jobs(db)}
+    idle = [printer_id for printer_id in speeds if printer_id not in busy]
+    if not idle:
+        return []
+    assigned = []
+    queue = iter(pending_jobs(db, limit=len(idle) * 2))
+    for printer_id in idle:
+        for job in queue:
+            # Condicionado al estado: otro despacho simultáneo pudo tomar el trabajo
+            taken = db.execute(update(orders_table).where(and_(
+                orders_table.c.id == job["id"], orders_table.c.status == PENDING
+            )).values(status=IN_PROGRESS, printer_id=printer_id, started_at=now)).rowcount
+            if taken:
+                finish = now + timedelta(seconds=job_seconds(job["pages"], speeds[printer_id]))
+                assigned.append({"order_id": job["id"], "printer_id": printer_id, "estimated_finish": finish})
+                break
+    db.commit()
+    return assigned
+
+
+def apply_transition(order: models.Order, new_status: str, now: datetime, printer_id: Optional[int] = None):
+    """Cambia el estado de la orden y sus marcas de tiempo; la validez se comprueba con is_allowed"""
+    if new_status == IN_PROGRESS:
+        order.printer_id = printer_id
+        order.started_at = now
+    elif new_status == PENDING:
+        # Vuelve a la cola (impresora atascada, archivo corregido)
+        order.printer_id = None
+        order.started_at = None
+    elif new_status == READY:
+        order.completed_at = now
+    order.status = new_status
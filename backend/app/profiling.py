@@ -0,0 +1,207 @@
+"""
+Modo de perfilado opcional para la API y las páginas de Streamlit.
+
+Se activa con PROFILING_ENABLED=1. Cada petición se perfila con cProfile si
+trae la cabecera X-Profile: 1 o si cae en la muestra PROFILING_SAMPLE_RATE
+(0.0-1.0). Los perfiles se guardan en PROFILING_DIR (rotando a los últimos
+PROFILING_MAX_FILES) y GET /debug/profiles resume las funciones más costosas
+por ruta. Con el modo apagado no se instala nada: el costo es nulo.
+"""
+
+import cProfile
+import inspect
+import os
+import pstats
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, List, Optional
+from urllib.parse import quote, unquote
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "").lower() in ("1", "true", "yes")
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = os.getenv("PROFILING_DIR", "profiles")
+PROFILING_MAX_FILES = int(os.getenv("PROFILING_MAX_FILES", "200"))
+PROFILING_HEADER = b"x-profile"
+
+# Esperas del event loop y de locks: tiempo ocioso, no trabajo de la petición
+IDLE_BUILTINS = ("poll", "select", "acquire")
+
+# cProfile reemplaza al perfilador activo del hilo: una petición perfilada a la vez
+_busy = threading.Lock()
+_thread_state = threading.local()
+
+
+class RequestProfile:
+    """Perfiles de los hilos que participaron en una petición"""
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+
+
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("papeleria_request_profile", default=None)
+
+
+def _sampled(forced: bool = False) -> bool:
+    return forced or (PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE)
+
+
+def save_profile(kind: str, name: str, profiles: List[cProfile.Profile]) -> Optional[str]:
+    """Guarda los perfiles combinados y elimina los más antiguos del directorio"""
+    if not profiles:
+        return None
+    os.makedirs(PROFILING_DIR, exist_ok=True)
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    path = os.path.join(PROFILING_DIR, f"{time.time_ns()}_{kind}_{quote(name, safe='')}.prof")
+    stats.dump_stats(path)
+
+    files = sorted(
+        (entry.path for entry in os.scandir(PROFILING_DIR) if entry.name.endswith(".prof")),
+        key=os.path.getmtime,
+    )
+    for old in files[:-PROFILING_MAX_FILES] if PROFILING_MAX_FILES > 0 else []:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+    return path
+
+
+class ProfilingMiddleware:
+    """Perfila el hilo del event loop (ruteo, validación, serialización) de las peticiones elegidas"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        forced = dict(scope["headers"]).get(PROFILING_HEADER, b"").lower() in (b"1", b"true")
+        if not _sampled(forced) or not _busy.acquire(blocking=False):
+            await self.app(scope, receive, send)
+            return
+
+        request_profile = RequestProfile()
+        token = _current_profile.set(request_profile)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                profile.disable()
+            request_profile.profiles.append(profile)
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            save_profile("api", f"{scope['method']} {route}", request_profile.profiles)
+        finally:
+            _current_profile.reset(token)
+            _busy.release()
+
+
+def profile_sync_endpoint(call):
+    """Los endpoints síncronos corren en el threadpool: se perfilan en su propio hilo"""
+    @wraps(call)
+    def wrapper(*args, **kwargs):
+        request_profile = _current_profile.get()
+        if request_profile is None:
+            return call(*args, **kwargs)
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profile.disable()
+            request_profile.profiles.append(profile)
+    return wrapper
+
+
+def _is_idle(function_key: tuple) -> bool:
+    filename, _, function = function_key
+    return filename == "~" and any(word in function for word in IDLE_BUILTINS)
+
+
+def profile_report(top: int = 15, kind: Optional[str] = None) -> List[Dict]:
+    """Funciones con más tiempo propio por ruta, combinando todos los perfiles guardados"""
+    if not os.path.isdir(PROFILING_DIR):
+        return []
+    by_route: Dict[tuple, List[str]] = {}
+    for entry in os.scandir(PROFILING_DIR):
+        if not entry.name.endswith(".prof"):
+            continue
+        try:
+            _, file_kind, name = entry.name[:-len(".prof")].split("_", 2)
+        except ValueError:
+            continue
+        if kind is None or file_kind == kind:
+            by_route.setdefault((file_kind, unquote(name)), []).append(entry.path)
+
+    report = []
+    for (file_kind, name), paths in sorted(by_route.items()):
+        stats = pstats.Stats(*paths)
+        rows = sorted(
+            (item for item in stats.stats.items() if not _is_idle(item[0])),
+            key=lambda item: item[1][2],
+            reverse=True,
+        )[:top]
+        report.append({
+            "kind": file_kind,
+            "route": name,
+            "profiles": len(paths),
+            "total_time": stats.total_tt,
+            "top_functions": [{
+                "function": function,
+                "file": filename,
+                "line": line,
+                "calls": calls,
+                "self_time": self_time,
+                "cumulative_time": cumulative,
+            } for (filename, line, function), (_, calls, self_time, cumulative, _) in rows],
+        })
+    return report
+
+
+def install(app):
+    """Instala el perfilado en la aplicación FastAPI si PROFILING_ENABLED está activo"""
+    if not PROFILING_ENABLED:
+        return app
+    from fastapi.routing import APIRoute
+
+    for route in app.routes:
+        if isinstance(route, APIRoute) and not inspect.iscoroutinefunction(route.dependant.call):
+            route.dependant.call = profile_sync_endpoint(route.dependant.call)
+
+    @app.get("/debug/profiles", include_in_schema=False)
+    def read_profiles(top: int = 15, kind: Optional[str] = None):
+        return profile_report(top, kind)
+
+    app.add_middleware(ProfilingMiddleware)
+    return app
+
+
+def start_page_profile(page: str, forced: bool = False) -> Optional[tuple]:
+    """Empieza a perfilar una ejecución de página de Streamlit (None si no toca)"""
+    # Una ejecución anterior cortada por st.rerun() no llega a finish_page_profile
+    leftover = getattr(_thread_state, "profile", None)
+    if leftover is not None:
+        leftover.disable()
+        _thread_state.profile = None
+    if not PROFILING_ENABLED or not _sampled(forced):
+        return None
+    profile = cProfile.Profile()
+    _thread_state.profile = profile
+    profile.enable()
+    return page, profile
+
+
+def finish_page_profile(state: Optional[tuple]):
+    if state is None:
+        return
+    page, profile = state
+    profile.disable()
+    _thread_state.profile = None
+    save_profile("streamlit", page, [profile])
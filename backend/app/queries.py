@@ -0,0 +1,314 @@
+"""
+Consultas de solo lectura construidas con SQLAlchemy Core.
+
+Las rutas de lectura intensiva (listados de productos, alertas de stock) no
+necesitan instancias ORM: se leen tuplas ligeras con select() y se serializan
+directamente a JSON con un TypeAdapter construido una sola vez.
+"""
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import alert_engine, models, sales_archive, schemas
+
+products_table = models.Product.__table__
+sales_table = models.Sale.__table__
+daily_table = models.SalesDaily.__table__
+school_lists_table = models.SchoolList.__table__
+school_list_items_table = models.SchoolListItem.__table__
+orders_table = models.Order.__table__
+order_items_table = models.OrderItem.__table__
+alerts_table = models.Alert.__table__
+alert_events_table = models.AlertEvent.__table__
+
+# Estados en los que una orden ya no compromete inventario
+CLOSED_ORDER_STATUSES = ("Entregado", "Cancelado")
+
+# Serializador pre-construido para listas de productos como diccionarios
+product_list_adapter = TypeAdapter(List[schemas.ProductRow])
+
+
+def fetch_dicts(db: Session, stmt) -> List[Dict[str, Any]]:
+    """Ejecuta una sentencia Core y devuelve cada fila como diccionario plano"""
+    result = db.execute(stmt)
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def select_products():
+    """Sentencia base con todas las columnas de productos, ordenada por id"""
+    return select(products_table).order_by(products_table.c.id)
+
+
+def select_products_with_alert(alert_type: str):
+    """Productos con una alerta activa del tipo dado, leídos de la tabla materializada"""
+    return select_products().join(
+        alerts_table, alerts_table.c.product_id == products_table.c.id
+    ).where(
+        alerts_table.c.status == alert_engine.ACTIVE, alerts_table.c.alert_type == alert_type
+    )
+
+
+def select_low_stock_products():
+    return select_products_with_alert(alert_engine.LOW_STOCK)
+
+
+def select_low_rotation_products(days: int = 60):
+    """Productos sin ventas en los últimos `days` días"""
+    since = datetime.utcnow() - timedelta(days=days)
+    recent_sales_product_ids = select(sales_table.c.product_id).where(
+        sales_table.c.sale_date >= since
+    ).distinct()
+    return select_products().where(products_table.c.id.not_in(recent_sales_product_ids))
+
+
+def list_products(db: Session, skip: int = 0, limit: Optional[int] = 100) -> List[Dict[str, Any]]:
+    stmt = select_products().offset(skip)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return fetch_dicts(db, stmt)
+
+
+def list_low_stock_products(db: Session) -> List[Dict[str, Any]]:
+    return fetch_dicts(db, select_low_stock_products())
+
+
+def list_low_rotation_products(db: Session, days: int = 60) -> List[Dict[str, Any]]:
+    return fetch_dicts(db, select_low_rotation_products(days))
+
+
+def list_product_names(db: Session) -> Dict[int, str]:
+    """Mapa id -> nombre para selectores, sin cargar el resto de columnas"""
+    stmt = select(products_table.c.id, products_table.c.name).order_by(products_table.c.id)
+    return {product_id: name for product_id, name in db.execute(stmt)}
+
+
+def missing_products(db: Session, product_ids) -> List[int]:
+    """Ids de la lista que no son productos de la tienda de la sesión (SQLite no exige las claves foráneas)"""
+    wanted = {product_id for product_id in product_ids if product_id is not None}
+    if not wanted:
+        return []
+    found = set(db.execute(select(products_table.c.id).where(products_table.c.id.in_(wanted))).scalars())
+    return sorted(wanted - found)
+
+
+def list_sales_history(db: Session, product_id: int) -> List[Dict[str, Any]]:
+    """Fecha y cantidad de las ventas de un producto, en orden cronológico, incluidas las archivadas"""
+    sales = sales_archive.load_sales(db, product_ids=[product_id], columns=["sale_date", "quantity"])
+    return [{"sale_date": sale_date.to_pydatetime(), "quantity": int(quantity)}
+            for sale_date, quantity in zip(sales["sale_date"], sales["quantity"])]
+
+
+def dump_products(rows: List[Dict[str, Any]]) -> bytes:
+    """Serializa filas de productos a JSON sin pasar por modelos Pydantic"""
+    return product_list_adapter.dump_json(rows)
+
+
+def select_school_list_demand(year: int, grade: Optional[str] = None, product_id: Optional[int] = None):
+    """Unidades requeridas por producto sumando todas las listas escolares del año"""
+    stmt = select(
+        school_list_items_table.c.product_id,
+        products_table.c.name.label("product_name"),
+        func.sum(school_list_items_table.c.quantity).label("total_quantity"),
+        func.count(func.distinct(school_list_items_table.c.school_list_id)).label("list_count"),
+    ).join(
+        school_lists_table, school_lists_table.c.id == school_list_items_table.c.school_list_id
+    ).join(
+        products_table, products_table.c.id == school_list_items_table.c.product_id
+    ).where(
+        school_lists_table.c.year == year
+    ).group_by(
+        school_list_items_table.c.product_id, products_table.c.name
+    ).order_by(func.sum(school_list_items_table.c.quantity).desc())
+
+    if grade is not None:
+        stmt = stmt.where(school_lists_table.c.grade == grade)
+    if product_id is not None:
+        stmt = stmt.where(school_list_items_table.c.product_id == product_id)
+    return stmt
+
+
+def school_list_demand(db: Session, year: int, grade: Optional[str] = None,
+                       product_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    return fetch_dicts(db, select_school_list_demand(year, grade, product_id))
+
+
+def orders_containing_product(db: Session, product_id: int, status: Optional[str] = "Pendiente") -> List[Dict[str, Any]]:
+    """Órdenes (por defecto pendientes) que incluyen el producto, con la cantidad pedida"""
+    stmt = select(
+        orders_table.c.id.label("order_id"),
+        orders_table.c.order_type,
+        orders_table.c.status,
+        orders_table.c.due_date,
+        func.sum(order_items_table.c.quantity).label("quantity"),
+    ).join(
+        order_items_table, order_items_table.c.order_id == orders_table.c.id
+    ).where(
+        order_items_table.c.product_id == product_id
+    ).group_by(orders_table.c.id).order_by(orders_table.c.due_date, orders_table.c.id)
+
+    if status is not None:
+        stmt = stmt.where(orders_table.c.status == status)
+    return fetch_dicts(db, stmt)
+
+
+def committed_quantities(db: Session) -> List[Tuple[int, int]]:
+    """(product_id, unidades) comprometidas en órdenes que siguen abiertas"""
+    stmt = select(
+        order_items_table.c.product_id,
+        func.sum(order_items_table.c.quantity),
+    ).join(
+        orders_table, orders_table.c.id == order_items_table.c.order_id
+    ).where(
+        order_items_table.c.product_id.is_not(None),
+        orders_table.c.status.not_in(CLOSED_ORDER_STATUSES),
+    ).group_by(order_items_table.c.product_id)
+    return [tuple(row) for row in db.execute(stmt)]
+
+
+def list_school_grades(db: Session, year: int) -> List[str]:
+    """Grados distintos con lista escolar registrada en el año"""
+    stmt = select(school_lists_table.c.grade).where(
+        school_lists_table.c.year == year
+    ).distinct().order_by(school_lists_table.c.grade)
+    return [grade for (grade,) in db.execute(stmt)]
+
+
+def select_active_alerts(alert_type: Optional[str] = None):
+    """Alertas activas con el nombre del producto; recorre solo las activas (ix_alerts_status_type)"""
+    stmt = select(
+        alerts_table, products_table.c.name.label("product_name")
+    ).join(
+        products_table, products_table.c.id == alerts_table.c.product_id
+    ).where(
+        alerts_table.c.status == alert_engine.ACTIVE
+    ).order_by(alerts_table.c.alert_type, alerts_table.c.product_id)
+    if alert_type is not None:
+        stmt = stmt.where(alerts_table.c.alert_type == alert_type)
+    return stmt
+
+
+def list_active_alerts(db: Session, alert_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    return fetch_dicts(db, select_active_alerts(alert_type))
+
+
+def count_active_alerts(db: Session, alert_type: str) -> int:
+    # El join con products deja el conteo dentro de la tienda de la sesión
+    stmt = select(func.count()).select_from(
+        alerts_table.join(products_table, products_table.c.id == alerts_table.c.product_id)
+    ).where(
+        alerts_table.c.status == alert_engine.ACTIVE, alerts_table.c.alert_type == alert_type
+    )
+    return db.execute(stmt).scalar_one()
+
+
+def list_demand_alerts(db: Session) -> List[Dict[str, Any]]:
+    """Alertas de demanda activas con la forma de schemas.DemandAlert"""
+    return [{
+        "product_id": alert["product_id"],
+        "product_name": alert["product_name"],
+        "current_stock": alert["current_stock"],
+        "predicted_demand": alert["value"],
+        "alert_type": alert_engine.ALERT_LABELS[alert_engine.HIGH_DEMAND],
+        "message": alert["message"],
+    } for alert in list_active_alerts(db, alert_engine.HIGH_DEMAND)]
+
+
+def list_alert_events(db: Session, product_id: Optional[int] = None, limit: int = 100) -> List[Dict[str, Any]]:
+    """Transiciones de alertas de los productos de la tienda, las más recientes primero"""
+    stmt = select(alert_events_table).join(
+        products_table, products_table.c.id == alert_events_table.c.product_id
+    ).order_by(alert_events_table.c.id.desc()).limit(limit)
+    if product_id is not None:
+        stmt = stmt.where(alert_events_table.c.product_id == product_id)
+    return fetch_dicts(db, stmt)
+
+
+def store_summary(db: Session, days: int = 30) -> Dict[str, Any]:
+    """Inventario, ventas de los últimos `days` días y alertas activas de la tienda de la sesión"""
+    since = datetime.utcnow() - timedelta(days=days)
+    product_count, stock_units, inventory_value = db.execute(select(
+        func.count(),
+        func.coalesce(func.sum(products_table.c.stock), 0),
+        func.coalesce(func.sum(products_table.c.stock * products_table.c.price), 0.0),
+    ).select_from(products_table)).one()
+    sales_count, units_sold, revenue = db.execute(select(
+        func.count(),
+        func.coalesce(func.sum(sales_table.c.quantity), 0),
+        func.coalesce(func.sum(sales_table.c.total_price), 0.0),
+    ).select_from(sales_table).where(sales_table.c.sale_date >= since)).one()
+    active_alerts = db.execute(select(func.count()).select_from(
+        alerts_table.join(products_table, products_table.c.id == alerts_table.c.product_id)
+    ).where(alerts_table.c.status == alert_engine.ACTIVE)).scalar_one()
+    return {
+        "product_count": product_count, "stock_units": int(stock_units), "inventory_value": float(inventory_value),
+        "sales_count": sales_count, "units_sold": int(units_sold), "revenue": float(revenue),
+        "active_alerts": active_alerts,
+    }
+
+
+def dashboard_summary(db: Session, days: int = 30, top: int = 10) -> Dict[str, Any]:
+    """Totales del tablero y productos más vendidos en los últimos `days` días"""
+    since = datetime.utcnow() - timedelta(days=days)
+    product_count, stock_units = db.execute(select(
+        func.count(), func.coalesce(func.sum(products_table.c.stock), 0)
+    ).select_from(products_table)).one()
+    # Todas las ventas, también las archivadas, desde los agregados diarios y no contando la tabla sales
+    sales_count = db.execute(select(func.coalesce(func.sum(daily_table.c.sales), 0))).scalar_one()
+    top_products = db.execute(select(
+        products_table.c.name, func.sum(sales_table.c.quantity).label("total_quantity")
+    ).select_from(sales_table.join(products_table, products_table.c.id == sales_table.c.product_id)).where(
+        sales_table.c.sale_date >= since
+    ).group_by(products_table.c.id).order_by(func.sum(sales_table.c.quantity).desc()).limit(top)).all()
+    return {
+        "product_count": product_count, "stock_units": int(stock_units), "sales_count": sales_count,
+        "low_stock": count_active_alerts(db, alert_engine.LOW_STOCK),
+        "top_products": [(name, int(quantity)) for name, quantity in top_products],
+    }
+
+
+# --- Fidelización ------------------------------------------------------------
+
+customers_table = models.Customer.__table__
+
+LOYALTY_COLUMNS = (
+    customers_table.c.id, customers_table.c.name, customers_table.c.phone_number, customers_table.c.loyalty_points,
+    customers_table.c.membership_level, customers_table.c.last_purchase,
+)
+
+
+def loyalty_leaderboard(db: Session, limit: int = 20, offset: int = 0,
+                        level: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Clientes con más puntos de la tienda, o de un nivel; se leen en orden de ix_customers_store_*"""
+    stmt = select(*LOYALTY_COLUMNS)
+    if level is not None:
+        stmt = stmt.where(customers_table.c.membership_level == level)
+    stmt = stmt.order_by(customers_table.c.loyalty_points.desc(), customers_table.c.id.desc())
+    return fetch_dicts(db, stmt.offset(offset).limit(limit))
+
+
+def loyalty_levels(db: Session) -> Dict[str, Tuple[int, int]]:
+    """{nivel: (clientes, puntos)} de la tienda"""
+    rows = db.execute(select(
+        customers_table.c.membership_level,
+        func.count(),
+        func.coalesce(func.sum(customers_table.c.loyalty_points), 0),
+    ).group_by(customers_table.c.membership_level))
+    return {level: (count, int(points)) for level, count, points in rows}
+
+
+def customer_loyalty(db: Session, phone_number: str) -> Optional[Dict[str, Any]]:
+    """Puntos, nivel y posición en el ranking del cliente con ese teléfono"""
+    rows = fetch_dicts(db, select(*LOYALTY_COLUMNS).where(customers_table.c.phone_number == phone_number))
+    if not rows:
+        return None
+    customer = rows[0]
+    ahead = db.execute(select(func.count()).select_from(customers_table).where(
+        customers_table.c.loyalty_points > (customer["loyalty_points"] or 0)
+    )).scalar_one()
+    customer["rank"] = ahead + 1
+    return customer
@@ -0,0 +1,216 @@
+"""
+Plan de reabastecimiento para todo el catálogo en una sola pasada.
+
+La demanda diaria (media y desviación) sale de los agregados diarios de ventas
+(sales_daily, ver sales_rollup.py); con ella se calcula stock de seguridad
+para el nivel de servicio pedido, punto de reorden y nivel objetivo (revisión
+periódica, order-up-to). Las líneas se agrupan por proveedor en órdenes de
+compra y se aplican las restricciones de pedido mínimo por proveedor y de
+presupuesto total.
+"""
+
+from datetime import datetime
+from statistics import NormalDist
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from . import queries, sales_rollup
+
+NO_SUPPLIER = "Sin proveedor"
+
+LINE_COLUMNS = [
+    "product_id", "product_name", "supplier", "current_stock", "committed_in_orders",
+    "avg_daily_demand", "safety_stock", "reorder_point", "order_up_to", "quantity",
+    "unit_cost", "line_cost", "days_of_cover",
+]
+
+
+def load_products(db: Session, product_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    products = queries.products_table
+    stmt = select(
+        products.c.id, products.c.name, products.c.supplier, products.c.price,
+        products.c.stock, products.c.min_stock
+    )
+    if product_ids is not None:
+        stmt = stmt.where(products.c.id.in_(list(product_ids)))
+    df = pd.DataFrame(
+        db.execute(stmt).all(),
+        columns=["product_id", "product_name", "supplier", "price", "current_stock", "min_stock"],
+    )
+    committed = pd.DataFrame(
+        queries.committed_quantities(db), columns=["product_id", "committed_in_orders"]
+    ).astype("int64")
+    df = df.merge(committed, on="product_id", how="left")
+    df["supplier"] = df["supplier"].fillna(NO_SUPPLIER)
+    df[["price"]] = df[["price"]].fillna(0.0)
+    df[["current_stock", "min_stock", "committed_in_orders"]] = (
+        df[["current_stock", "min_stock", "committed_in_orders"]].fillna(0).astype(int)
+    )
+    return df
+
+
+def load_demand_stats(db: Session, history_days: int = 90,
+                      product_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+    """
+    Media y desviación estándar de la demanda diaria por producto.
+
+    SQLite suma unidades y unidades² por producto sobre los agregados diarios
+    (sales_daily) de los history_days días completos anteriores a hoy: una
+    fila por producto, sin agrupar ventas por fecha. Los días sin ventas
+    cuentan como cero porque la media y la varianza se calculan sobre
+    history_days.
+    """
+    daily = sales_rollup.daily_table
+    today = sales_rollup.today()
+    stmt = select(
+        daily.c.product_id, func.sum(daily.c.units), func.sum(daily.c.units * daily.c.units)
+    ).where(
+        daily.c.day >= today - history_days, daily.c.day < today
+    ).group_by(daily.c.product_id)
+    if product_ids is not None:
+        stmt = stmt.where(daily.c.product_id.in_(list(product_ids)))
+
+    sums = pd.DataFrame(db.execute(stmt).all(), columns=["product_id", "units", "units_sq"])
+    return demand_stats(sums, history_days)
+
+
+def demand_stats(sums: pd.DataFrame, history_days: int) -> pd.DataFrame:
+    """(product_id, suma de unidades y de unidades² por día) -> media y desviación sobre history_days días"""
+    units = sums["units"].astype(float)
+    mean = units / history_days
+    variance = (sums["units_sq"].astype(float) / history_days - mean ** 2).clip(lower=0)
+    return pd.DataFrame({
+        "product_id": sums["product_id"],
+        "avg_daily_demand": mean,
+        "std_daily_demand": np.sqrt(variance),
+    })
+
+
+def plan_quantities(products: pd.DataFrame, stats: pd.DataFrame, lead_time_days: float = 7,
+                    review_period_days: float = 7, service_level: float = 0.95,
+                    supplier_lead_times: Optional[Dict[str, float]] = None,
+                    cost_ratio: float = 1.0) -> pd.DataFrame:
+    """
+    Cantidades a pedir por producto, vectorizado sobre todo el catálogo.
+
+    Punto de reorden = demanda en el plazo de entrega + z·σ·√L, nunca por
+    debajo de min_stock. Si la posición (stock - comprometido) cae en o bajo
+    ese punto se pide hasta cubrir plazo + período de revisión.
+    """
+    df = products.merge(stats, on="product_id", how="left")
+    df[["avg_daily_demand", "std_daily_demand"]] = df[["avg_daily_demand", "std_daily_demand"]].fillna(0.0)
+
+    lead_time = np.full(len(df), float(lead_time_days))
+    if supplier_lead_times:
+        lead_time = df["supplier"].map(supplier_lead_times).fillna(lead_time_days).to_numpy(dtype=float)
+    z = NormalDist().inv_cdf(service_level)
+
+    mean = df["avg_daily_demand"].to_numpy()
+    std = df["std_daily_demand"].to_numpy()
+    horizon = lead_time + review_period_days
+    safety_stock = z * std * np.sqrt(horizon)
+    reorder_point = np.maximum(mean * lead_time + z * std * np.sqrt(lead_time), df["min_stock"].to_numpy())
+    order_up_to = np.maximum(mean * horizon + safety_stock, reorder_point)
+
+    position = (df["current_stock"] - df["committed_in_orders"]).to_numpy()
+    needs_order = position <= reorder_point
+    quantity = np.where(needs_order, np.ceil(order_up_to - position), 0).astype(int)
+    quantity = np.maximum(quantity, 0)
+
+    unit_cost = df["price"].to_numpy() * cost_ratio
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days_of_cover = np.where(mean > 0, np.maximum(position, 0) / mean, np.inf)
+
+    df = df.assign(
+        safety_stock=np.round(safety_stock, 2),
+        reorder_point=np.ceil(reorder_point).astype(int),
+        order_up_to=np.ceil(order_up_to).astype(int),
+        quantity=quantity,
+        unit_cost=unit_cost,
+        line_cost=quantity * unit_cost,
+        days_of_cover=days_of_cover,
+        avg_daily_demand=np.round(mean, 3),
+    )
+    return df[df["quantity"] > 0][LINE_COLUMNS].sort_values("days_of_cover").reset_index(drop=True)
+
+
+def apply_constraints(lines: pd.DataFrame, min_order_value: float = 0.0,
+                      supplier_min_order_values: Optional[Dict[str, float]] = None,
+                      budget: Optional[float] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Separa las líneas aprobadas de las diferidas.
+
+    1. Los proveedores cuyo pedido no alcanza su mínimo se difieren completos.
+    2. Con presupuesto, se aprueban líneas por urgencia (menos días de
+       cobertura primero); la línea que lo cruza se recorta a lo que alcance.
+    """
+    minimums = lines["supplier"].map(supplier_min_order_values or {}).fillna(min_order_value)
+    supplier_totals = lines.groupby("supplier")["line_cost"].transform("sum")
+    below_minimum = supplier_totals < minimums
+    approved, deferred = lines[~below_minimum].copy(), lines[below_minimum].copy()
+
+    if budget is not None and not approved.empty:
+        approved = approved.sort_values("days_of_cover", kind="stable")
+        spent_before = approved["line_cost"].cumsum() - approved["line_cost"]
+        remaining = (budget - spent_before).clip(lower=0).to_numpy()
+        unit_cost = approved["unit_cost"].to_numpy()
+        with np.errstate(divide="ignore", invalid="ignore"):
+            affordable = np.where(unit_cost > 0, np.floor(remaining / unit_cost), approved["quantity"].to_numpy())
+        funded = np.minimum(approved["quantity"].to_numpy(), affordable).astype(int)
+
+        over_budget = approved.assign(quantity=approved["quantity"] - funded)
+        over_budget = over_budget[over_budget["quantity"] > 0]
+        over_budget["line_cost"] = over_budget["quantity"] * over_budget["unit_cost"]
+
+        approved = approved.assign(quantity=funded, line_cost=funded * unit_cost)
+        approved = approved[approved["quantity"] > 0]
+        deferred = pd.concat([deferred, over_budget], ignore_index=True)
+
+    return approved.reset_index(drop=True), deferred.reset_index(drop=True)
+
+
+def group_purchase_orders(lines: pd.DataFrame, min_order_value: float = 0.0,
+                          supplier_min_order_values: Optional[Dict[str, float]] = None) -> List[Dict]:
+    """Órdenes de compra por proveedor, de mayor a menor valor"""
+    minimums = supplier_min_order_values or {}
+    orders = []
+    for supplier, group in lines.groupby("supplier", sort=False):
+        total = float(group["line_cost"].sum())
+        orders.append({
+            "supplier": supplier,
+            "total_cost": total,
+            "total_units": int(group["quantity"].sum()),
+            "meets_minimum": total >= minimums.get(supplier, min_order_value),
+            "lines": group.replace({np.inf: None}).to_dict(orient="records"),
+        })
+    return sorted(orders, key=lambda order: order["total_cost"], reverse=True)
+
+
+def build_reorder_plan(db: Session, history_days: int = 90, lead_time_days: float = 7,
+                       review_period_days: float = 7, service_level: float = 0.95,
+                       supplier_lead_times: Optional[Dict[str, float]] = None, cost_ratio: float = 1.0,
+                       min_order_value: float = 0.0, supplier_min_order_values: Optional[Dict[str, float]] = None,
+                       budget: Optional[float] = None, product_ids: Optional[Iterable[int]] = None) -> Dict:
+    lines = plan_quantities(
+        load_products(db, product_ids),
+        load_demand_stats(db, history_days, product_ids),
+        lead_time_days=lead_time_days,
+        review_period_days=review_period_days,
+        service_level=service_level,
+        supplier_lead_times=supplier_lead_times,
+        cost_ratio=cost_ratio,
+    )
+    approved, deferred = apply_constraints(lines, min_order_value, supplier_min_order_values, budget)
+    purchase_orders = group_purchase_orders(approved, min_order_value, supplier_min_order_values)
+    return {
+        "generated_at": datetime.utcnow(),
+        "service_level": service_level,
+        "budget": budget,
+        "total_cost": float(approved["line_cost"].sum()),
+        "purchase_orders": purchase_orders,
+        "deferred": group_purchase_orders(deferred, min_order_value, supplier_min_order_values),
+    }
@@ -0,0 +1,161 @@
+"""
+Lecturas analíticas fuera de la base transaccional.
+
+Los endpoints y páginas de análisis (pronósticos, planes de compra, baja
+rotación, tableros) abren su sesión con tenancy.get_read_db, que usa el engine
+de lectura de la tienda:
+
+- READ_DATABASE_URL: una réplica (p. ej. de Postgres) de la base principal;
+  STORE_READ_DATABASE_URL, con {store_id}, la de las tiendas con archivo propio
+  (ver STORE_DATABASE_URL en tenancy.py).
+- SNAPSHOT_INTERVAL_SECONDS > 0: para bases SQLite sin réplica, una copia
+  hecha con la API de backup de SQLite cada tantos segundos y abierta en solo
+  lectura e inmutable (sin bloqueos). Cada copia es un archivo nuevo; las
+  sesiones en curso terminan sobre la anterior, que se borra en la siguiente
+  renovación.
+- Sin ninguna de las dos, las lecturas van a la base principal (en modo WAL,
+  ver database.enable_wal).
+
+Las lecturas de réplica o copia pueden ir hasta un intervalo atrasadas: las
+rutas que leen y escriben en la misma petición siguen usando get_db.
+"""
+
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+
+from . import database, metrics
+from .metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+READ_DATABASE_URL = os.getenv("READ_DATABASE_URL")
+STORE_READ_DATABASE_URL = os.getenv("STORE_READ_DATABASE_URL")
+SNAPSHOT_INTERVAL_SECONDS = float(os.getenv("SNAPSHOT_INTERVAL_SECONDS", "0"))
+# Carpeta de las copias; por defecto <base>.snapshots junto al archivo original
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR")
+
+SNAPSHOT_REFRESH = REGISTRY.histogram(
+    "papeleria_snapshot_refresh_seconds", "Duración de cada copia de lectura de SQLite", ("database",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+SNAPSHOT_ERRORS = REGISTRY.counter(
+    "papeleria_snapshot_errors_total", "Copias de lectura fallidas (se sigue usando la anterior)", ("database",)
+)
+
+
+class SnapshotReplica:
+    """Copia de solo lectura de una base SQLite, renovada en un hilo de fondo"""
+
+    def __init__(self, source: Engine, interval: float, directory: Optional[str] = None):
+        self.source = source
+        self.interval = interval
+        path = os.path.abspath(source.url.database)
+        self.name = os.path.basename(path)
+        self.directory = directory or path + ".snapshots"
+        os.makedirs(self.directory, exist_ok=True)
+        # Copias que dejó un proceso anterior
+        for leftover in glob.glob(os.path.join(glob.escape(self.directory), glob.escape(self.name) + ".*.db")):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+        self._lock = threading.Lock()
+        self._current: Optional[Tuple[Engine, str]] = None
+        self._retired: List[Tuple[Engine, str]] = []
+        self.refreshed_at = 0.0
+        # La primera copia se hace aquí: get_read_db nunca ve una réplica vacía
+        self.refresh()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"snapshot-{self.name}", daemon=True)
+        self._thread.start()
+
+    @property
+    def engine(self) -> Engine:
+        return self._current[0]
+
+    def refresh(self):
+        """Copia la base con la API de backup y cambia las lecturas nuevas a la copia"""
+        start = time.perf_counter()
+        path = os.path.join(self.directory, f"{self.name}.{int(time.time() * 1000)}.db")
+        source = self.source.raw_connection()
+        try:
+            target = sqlite3.connect(path)
+            try:
+                # Una sola pasada: con WAL la lectura de origen no bloquea a los escritores
+                source.driver_connection.backup(target)
+                target.execute("PRAGMA journal_mode=DELETE")
+            finally:
+                target.close()
+        finally:
+            source.close()
+        engine = metrics.instrument_engine(create_engine(
+            f"sqlite:///file:{path}?mode=ro&immutable=1&uri=true", connect_args={"check_same_thread": False}
+        ))
+        with self._lock:
+            # La copia anterior se descarta en la próxima renovación, cuando sus lecturas ya terminaron
+            stale, self._retired = self._retired, ([self._current] if self._current else [])
+            self._current = (engine, path)
+        self.refreshed_at = time.time()
+        for old_engine, old_path in stale:
+            old_engine.dispose()
+            try:
+                os.remove(old_path)
+            except OSError:
+                # Windows no borra archivos abiertos: se reintenta con la próxima copia
+                self._retired.append((old_engine, old_path))
+        SNAPSHOT_REFRESH.observe(time.perf_counter() - start, database=self.name)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                SNAPSHOT_ERRORS.inc(database=self.name)
+                logger.exception("No se pudo renovar la copia de lectura de %s", self.name)
+
+    def close(self):
+        self._stop.set()
+        for engine, _ in ([self._current] if self._current else []) + self._retired:
+            engine.dispose()
+
+
+_read_engines: Dict[str, Engine] = {}
+_snapshots: Dict[str, SnapshotReplica] = {}
+_lock = threading.Lock()
+
+
+def replica_url(store_id: int, own_database: bool) -> Optional[str]:
+    if own_database:
+        return STORE_READ_DATABASE_URL.format(store_id=store_id) if STORE_READ_DATABASE_URL else None
+    return READ_DATABASE_URL
+
+
+def read_engine(primary: Engine, store_id: int, own_database: bool = False) -> Engine:
+    """Engine para lecturas analíticas de la tienda: réplica, copia o la misma base principal"""
+    url = replica_url(store_id, own_database)
+    key = url or str(primary.url)
+    if url is not None:
+        engine = _read_engines.get(key)
+        if engine is None:
+            with _lock:
+                engine = _read_engines.get(key)
+                if engine is None:
+                    engine = _read_engines[key] = metrics.instrument_engine(create_engine(url, pool_pre_ping=True))
+        return engine
+    if SNAPSHOT_INTERVAL_SECONDS <= 0 or not database.is_sqlite_file(primary):
+        return primary
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        with _lock:
+            snapshot = _snapshots.get(key)
+            if snapshot is None:
+                snapshot = _snapshots[key] = SnapshotReplica(primary, SNAPSHOT_INTERVAL_SECONDS, SNAPSHOT_DIR)
+    return snapshot.engine
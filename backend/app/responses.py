@@ -0,0 +1,47 @@
+"""
+Clase de respuesta JSON rápida para toda la API.
+
+Usa orjson cuando está instalado (fechas, numpy y claves no textuales se
+serializan de forma nativa) y cae al codificador estándar de FastAPI si no.
+"""
+
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+# Importación opcional del serializador rápido
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("Advertencia: orjson no está instalado. Se usará el serializador JSON estándar.")
+
+if ORJSON_AVAILABLE:
+    # Fechas sin zona horaria salen igual que con Pydantic ("2025-01-31T10:00:00")
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj: Any):
+    """Tipos que orjson no conoce (Decimal, modelos Pydantic, etc.)"""
+    return jsonable_encoder(obj)
+
+
+def dumps(content: Any) -> bytes:
+    """Serializa contenido arbitrario a JSON en bytes"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(content, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(
+        jsonable_encoder(content), ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """Respuesta JSON por defecto de la aplicación"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from typing import List, Optional
+from . import sales_archive, schemas
+from .tenancy import get_db, get_read_db, heavy_job
+
+router = APIRouter(prefix="/sales", tags=["sales"])
+
+HISTORY_COLUMNS = ["id", "product_id", "quantity", "total_price", "sale_date", "customer_phone", "ticket_id"]
+# Sin start, el historial cubre los últimos días antes de end (o de ahora)
+HISTORY_DEFAULT_DAYS = 90
+HISTORY_MAX_LIMIT = 5000
+
+@router.get("/history", response_model=schemas.SalesHistory, dependencies=[Depends(heavy_job)])
+def read_sales_history(start: Optional[datetime] = None, end: Optional[datetime] = None,
+                       product_id: Optional[int] = None, skip: int = 0, limit: int = 500,
+                       db: Session = Depends(get_read_db)):
+    if start is not None and end is not None and end < start:
+        raise HTTPException(status_code=400, detail="La fecha final es anterior a la inicial")
+    if start is None:
+        start = (end or datetime.utcnow()) - timedelta(days=HISTORY_DEFAULT_DAYS)
+    product_ids = [product_id] if product_id is not None else None
+    # Ventas de la base y archivadas del rango, como si fueran una sola tabla: solo la página, no el rango entero
+    page = sales_archive.load_sales_page(db, start, end, product_ids, HISTORY_COLUMNS,
+                                         max(skip, 0), min(max(limit, 0), HISTORY_MAX_LIMIT))
+    return {
+        "start": start, "end": end, **sales_archive.sales_totals(db, start, end, product_ids),
+        "sales": page.astype(object).where(page.notna(), None).to_dict(orient="records"),
+    }
+
+@router.get("/archives", response_model=List[schemas.SalesArchiveFile])
+def read_sales_archives(db: Session = Depends(get_db)):
+    return sales_archive.list_archives(db)
+
+@router.post("/archive", response_model=schemas.SalesArchiveRun)
+def run_sales_archive(retention_days: int = 730, vacuum: bool = True):
+    # Lo mismo que hace el hilo de fondo con SALES_RETENTION_DAYS, en todas las tiendas
+    if retention_days < 1:
+        raise HTTPException(status_code=400, detail="retention_days debe ser al menos 1")
+    return sales_archive.run(datetime.utcnow() - timedelta(days=retention_days), run_vacuum=vacuum)
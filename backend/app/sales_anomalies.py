@@ -0,0 +1,353 @@
+"""
+Detección en línea de ventas atípicas.
+
+Un "vendí 500 cuadernos" mal escrito en el chatbot o un pico repentino de un
+producto se marcan al registrar la venta, sin recorrer la historia:
+
+- Estado por producto de tamaño fijo (un registro de STATE_DTYPE, 33
+  bytes): media y varianza exponencialmente ponderadas (EWMA, peso
+  ANOMALY_ALPHA) de la cantidad por venta y de las unidades por día, el día en
+  curso con sus unidades y marcas. Cada venta lo actualiza en O(1).
+- Venta atípica: la cantidad supera media + ANOMALY_Z·σ de las ventas
+  anteriores del producto (con al menos ANOMALY_MIN_SALES ventas). Día atípico:
+  las unidades del día superan media + ANOMALY_Z·σ de los días anteriores (con
+  al menos ANOMALY_MIN_DAYS días), una vez por día. σ nunca baja de la de
+  una demanda de Poisson (√max(media, 1) por venta; por día, la de un Poisson
+  compuesto con el tamaño de venta del producto): un producto que siempre se
+  vende de a uno no se marca por una venta de dos, ni uno que se vende poco
+  por un día con una sola venta normal.
+- Las observaciones atípicas entran al estado recortadas al límite, para que
+  un error de digitación no infle la media y esconda el siguiente.
+- Cada anomalía abre (o actualiza) la alerta 'venta_atipica' del producto en
+  la misma transacción que la venta, deja un evento en alert_events y se
+  publica en el canal en vivo. Se resuelve a mano (POST /alerts/{id}/resolve).
+- El estado vive en memoria de cada proceso. Tras un reinicio, el de cada
+  producto se reconstruye la primera vez que se vende a partir de sus
+  ANOMALY_RECOVERY_DAYS días en sales_daily (ver sales_rollup.py): una lectura
+  del índice (tienda, producto, día).
+- El estado solo cambia con ventas confirmadas: cada transacción evalúa sus
+  ventas sobre una copia de los registros que toca y las aplica al estado en
+  after_commit; si se revierte, se descartan. Una venta con fecha de un día ya
+  cerrado actualiza el tamaño de venta, no las unidades del día en curso.
+"""
+
+import math
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import event, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from . import alert_engine, live, models, sales_rollup
+from .database import DEFAULT_STORE_ID, STORE_INFO_KEY
+from .metrics import REGISTRY
+
+ANOMALY_ALPHA = float(os.getenv("ANOMALY_ALPHA", "0.1"))
+ANOMALY_Z = float(os.getenv("ANOMALY_Z", "4"))
+ANOMALY_MIN_SALES = int(os.getenv("ANOMALY_MIN_SALES", "10"))
+ANOMALY_MIN_DAYS = int(os.getenv("ANOMALY_MIN_DAYS", "14"))
+ANOMALY_RECOVERY_DAYS = int(os.getenv("ANOMALY_RECOVERY_DAYS", "90"))
+
+SALE = "venta"
+DAY = "dia"
+
+# Marcas del registro
+DAY_FLAGGED = 1  # El día en curso ya se reportó (o superó el límite junto con una venta atípica)
+
+# Ventas de la transacción en curso por (alcance, producto), pendientes de llevar al estado confirmado
+_PENDING_KEY = "papeleria_anomaly_sales"
+
+STATE_DTYPE = np.dtype([
+    ("sale_mean", "f4"), ("sale_var", "f4"), ("sales", "i4"),
+    ("day_mean", "f4"), ("day_var", "f4"), ("days", "i4"),
+    ("day", "i4"), ("day_units", "f4"), ("flags", "u1"),
+])
+
+alerts_table = models.Alert.__table__
+alert_events_table = models.AlertEvent.__table__
+daily_table = models.SalesDaily.__table__
+products_table = models.Product.__table__
+
+SALES_ANOMALIES = REGISTRY.counter(
+    "papeleria_sales_anomalies_total", "Ventas y días atípicos detectados al registrar ventas", ("kind",))
+
+
+def _sigma(mean: float, var: float) -> float:
+    return math.sqrt(max(var, mean, 1.0))
+
+
+def _fold(mean: float, var: float, value: float, alpha: float) -> Tuple[float, float]:
+    """Una observación en la media y la varianza EWMA"""
+    diff = value - mean
+    increment = alpha * diff
+    return mean + increment, (1 - alpha) * (var + diff * increment)
+
+
+class DetectorState:
+    """Registros de tamaño fijo por (base y tienda, producto), en un arreglo que crece por duplicación"""
+
+    def __init__(self, alpha: float = ANOMALY_ALPHA, z: float = ANOMALY_Z, min_sales: int = ANOMALY_MIN_SALES,
+                 min_days: int = ANOMALY_MIN_DAYS, recovery_days: int = ANOMALY_RECOVERY_DAYS):
+        self.alpha = alpha
+        self.z = z
+        self.min_sales = min_sales
+        self.min_days = min_days
+        self.recovery_days = recovery_days
+        self._lock = threading.Lock()
+        self._records = np.zeros(1024, dtype=STATE_DTYPE)
+        self._index: Dict[Tuple[Hashable, int], int] = {}
+
+    def __len__(self):
+        return len(self._index)
+
+    def get(self, scope: Hashable, product_id: int) -> Optional[np.void]:
+        row = self._index.get((scope, product_id))
+        return None if row is None else self._records[row]
+
+    def _slot(self, scope: Hashable, product_id: int) -> int:
+        row = self._index.get((scope, product_id))
+        if row is None:
+            row = len(self._index)
+            if row == len(self._records):
+                self._records = np.concatenate([self._records, np.zeros(len(self._records), dtype=STATE_DTYPE)])
+            self._index[(scope, product_id)] = row
+        return row
+
+    def record(self, scope: Hashable, product_id: int) -> Optional[Tuple]:
+        """Copia del registro confirmado de un producto, None si no tiene estado"""
+        with self._lock:
+            row = self._index.get((scope, product_id))
+            return None if row is None else self._records[row].item()
+
+    def recovered(self, daily: np.ndarray, today: int) -> Tuple:
+        """Registro de un producto a partir de sus agregados diarios (day, units, sales), sin el día de hoy"""
+        if len(daily) == 0:
+            return (0.0, 0.0, 0, 0.0, 0.0, 0, today, 0.0, 0)
+        days, units, sales = daily[:, 0].astype(np.int64), daily[:, 1], daily[:, 2]
+        past = days < today
+        if not past.any():
+            return (0.0, 0.0, 0, 0.0, 0.0, 0, today, float(units.sum()), 0)
+        # Desde el primer día con ventas, los días sin ventas como cero; la venta promedio de cada día como una observación
+        start = int(days[past].min())
+        series = np.zeros(today - start)
+        series[days[past] - start] = units[past]
+        # Cada media parte de la primera observación, no de cero
+        day_mean, day_var = float(series[0]), 0.0
+        for value in series[1:]:
+            day_mean, day_var = _fold(day_mean, day_var, value, self.alpha)
+        sale_sizes = units[past] / np.maximum(sales[past], 1)
+        sale_mean, sale_var = float(sale_sizes[0]), 0.0
+        for value in sale_sizes[1:]:
+            sale_mean, sale_var = _fold(sale_mean, sale_var, float(value), self.alpha)
+        return (sale_mean, sale_var, int(sales[past].sum()), day_mean, day_var, len(series), today,
+                float(units[~past].sum()), 0)
+
+    def recover(self, scope: Hashable, product_id: int, daily: np.ndarray, today: int):
+        """Reemplaza el estado de un producto por el recuperado de sus agregados diarios"""
+        record = self.recovered(daily, today)
+        with self._lock:
+            self._records[self._slot(scope, product_id)] = record
+
+    def _sale_limit(self, sale_mean: float, sale_var: float) -> float:
+        return sale_mean + self.z * _sigma(sale_mean, sale_var)
+
+    def _day_limit(self, day_mean: float, day_var: float, sale_mean: float, sale_var: float) -> float:
+        # Un día es una suma de ventas: σ al menos la de un Poisson compuesto con el tamaño de venta del producto,
+        # y nunca por debajo del límite de una sola venta (un día con una venta normal no es atípico)
+        spread = max(day_mean, 1.0) * (sale_mean + sale_var / max(sale_mean, 1.0))
+        return max(day_mean + self.z * math.sqrt(max(day_var, spread)), self._sale_limit(sale_mean, sale_var))
+
+    def observe(self, scope: Hashable, product_id: int, quantity: float, day: int) -> List[Dict]:
+        """Actualiza el estado con una venta y devuelve las anomalías que produce"""
+        with self._lock:
+            slot = self._slot(scope, product_id)
+            # Se trabaja sobre escalares de Python y se escribe el registro una vez: acceder campo por campo
+            # a un registro de NumPy cuesta más que toda la aritmética
+            record, anomalies = self.step(self._records[slot].item(), quantity, day)
+            self._records[slot] = record
+            return anomalies
+
+    def apply(self, scope: Hashable, product_id: int, base: Optional[Tuple], sales: List[Tuple[float, int]]):
+        """Lleva al estado confirmado las ventas (cantidad, día) de una transacción confirmada"""
+        with self._lock:
+            row = self._index.get((scope, product_id))
+            if row is None:
+                row = self._slot(scope, product_id)
+                if base is not None:
+                    self._records[row] = base
+            record = self._records[row].item()
+            for quantity, day in sales:
+                record, _ = self.step(record, quantity, day)
+            self._records[row] = record
+
+    def step(self, record: Tuple, quantity: float, day: int) -> Tuple[Tuple, List[Dict]]:
+        """El registro tras una venta y las anomalías que produce, sin tocar el estado"""
+        sale_mean, sale_var, sales, day_mean, day_var, days, current, day_units, flags = record
+        if day > current:
+            day_mean, day_var = self._close_days(day_mean, day_var, days, day_units, sale_mean, sale_var,
+                                                 day - current)
+            days += day - current
+            current, day_units, flags = day, 0.0, flags & ~DAY_FLAGGED
+        anomalies = []
+
+        # Cantidad de la venta frente a las ventas anteriores
+        limit = self._sale_limit(sale_mean, sale_var)
+        if sales >= self.min_sales and quantity > limit:
+            anomalies.append({"kind": SALE, "value": quantity, "threshold": limit, "expected": sale_mean})
+        if sales == 0:
+            sale_mean, sale_var = quantity, 0.0
+        else:
+            sale_mean, sale_var = _fold(
+                sale_mean, sale_var, min(quantity, limit) if sales >= self.min_sales else quantity, self.alpha)
+        sales += 1
+
+        # Unidades del día frente a los días anteriores, una vez por día. Una venta con fecha de un día ya
+        # cerrado solo cuenta para el tamaño de venta: sumarla al día en curso lo inflaría
+        if day == current:
+            day_units += quantity
+            limit = self._day_limit(day_mean, day_var, sale_mean, sale_var)
+            if days >= self.min_days and day_units > limit and not flags & DAY_FLAGGED:
+                # Si la venta misma ya es atípica, el día no se reporta aparte
+                if not anomalies:
+                    anomalies.append({"kind": DAY, "value": day_units, "threshold": limit, "expected": day_mean})
+                flags |= DAY_FLAGGED
+
+        return (sale_mean, sale_var, sales, day_mean, day_var, days, current, day_units, flags), anomalies
+
+    def _close_days(self, day_mean: float, day_var: float, days: int, day_units: float, sale_mean: float,
+                    sale_var: float, elapsed: int) -> Tuple[float, float]:
+        """Media y varianza diarias tras pasar el día en curso y los elapsed - 1 días sin ventas siguientes"""
+        if days == 0:
+            day_mean, day_var = day_units, 0.0
+        else:
+            if days >= self.min_days:
+                day_units = min(day_units, self._day_limit(day_mean, day_var, sale_mean, sale_var))
+            day_mean, day_var = _fold(day_mean, day_var, day_units, self.alpha)
+        # k ceros seguidos en forma cerrada: media·r^k y r^k·(varianza + media²·(1 - r^k)), con r = 1 - α
+        decay = (1 - self.alpha) ** (elapsed - 1)
+        return day_mean * decay, decay * (day_var + day_mean ** 2 * (1 - decay))
+
+
+state = DetectorState()
+
+
+def _load_product_days(conn: Connection, store_id: int, product_id: int, since: int) -> np.ndarray:
+    rows = conn.execute(select(daily_table.c.day, daily_table.c.units, daily_table.c.sales).where(
+        daily_table.c.store_id == store_id, daily_table.c.product_id == product_id, daily_table.c.day >= since
+    )).all()
+    return np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+
+def _message(product_name: str, anomaly: Dict) -> str:
+    if anomaly["kind"] == SALE:
+        return (f"Venta de {anomaly['value']:.0f} unidades de {product_name}; lo normal es cerca de "
+                f"{anomaly['expected']:.1f} por venta. ¿Error de digitación?")
+    return (f"{product_name} lleva {anomaly['value']:.0f} unidades vendidas hoy; lo normal es cerca de "
+            f"{anomaly['expected']:.1f} por día.")
+
+
+def emit(conn: Connection, session: Session, product_id: int, anomaly: Dict, now: datetime):
+    """Abre o actualiza la alerta 'venta_atipica' del producto y registra el evento"""
+    product = conn.execute(select(products_table.c.name, products_table.c.stock).where(
+        products_table.c.id == product_id)).first()
+    name, stock = (product.name, product.stock or 0) if product is not None else (f"producto {product_id}", 0)
+    values = {"status": alert_engine.ACTIVE, "current_stock": stock, "value": anomaly["value"],
+              "threshold": anomaly["threshold"], "message": _message(name, anomaly), "updated_at": now,
+              "resolved_at": None}
+    existing = conn.execute(select(alerts_table.c.id, alerts_table.c.status).where(
+        alerts_table.c.product_id == product_id, alerts_table.c.alert_type == alert_engine.SALE_ANOMALY)).first()
+    if existing is None:
+        conn.execute(insert(alerts_table).values(product_id=product_id, alert_type=alert_engine.SALE_ANOMALY,
+                                                 opened_at=now, **values))
+    else:
+        if existing.status != alert_engine.ACTIVE:
+            values["opened_at"] = now
+        conn.execute(update(alerts_table).where(alerts_table.c.id == existing.id).values(**values))
+    # Cada anomalía queda en el historial, aunque la alerta ya estuviera activa
+    transition = {"product_id": product_id, "alert_type": alert_engine.SALE_ANOMALY, "status": alert_engine.ACTIVE,
+                  "value": anomaly["value"], "threshold": anomaly["threshold"], "created_at": now}
+    conn.execute(insert(alert_events_table), [transition])
+    live.publish_after_commit(session, "alert", transition)
+    SALES_ANOMALIES.inc(kind=anomaly["kind"])
+
+
+def _before_flush(session, flush_context, instances):
+    # Antes del flush: sales_daily todavía no incluye estas ventas, así que recuperar no las cuenta dos veces
+    new_sales = [obj for obj in session.new if isinstance(obj, models.Sale) and obj.product_id is not None]
+    if not new_sales:
+        return
+    conn = session.connection()
+    url = str(conn.engine.url)
+    now = datetime.utcnow()
+    today = sales_rollup.today()
+    # El estado confirmado no se toca hasta el commit: la transacción trabaja sobre su propia copia de cada
+    # registro y guarda sus ventas para aplicarlas en after_commit (o descartarlas si se revierte)
+    pending = session.info.setdefault(_PENDING_KEY, {})
+    for sale in new_sales:
+        # La tienda de la sesión manda: tenancy la asigna en su propio before_flush, quizá después de este
+        store_id = session.info.get(STORE_INFO_KEY) or sale.store_id or DEFAULT_STORE_ID
+        key = ((url, store_id), sale.product_id)
+        day = sales_rollup.day_number(sale.sale_date or now)
+        quantity = float(sale.quantity or 1)
+        entry = pending.get(key)
+        if entry is None:
+            record, base = state.record(*key), None
+            if record is None:
+                # Primera venta tras un reinicio, y primera de la transacción: sales_daily aún no tiene las suyas
+                current = max(day, today)
+                record = base = state.recovered(
+                    _load_product_days(conn, store_id, sale.product_id, current - state.recovery_days), current)
+            entry = pending[key] = {"base": base, "record": record, "sales": []}
+        entry["record"], anomalies = state.step(entry["record"], quantity, day)
+        entry["sales"].append((quantity, day))
+        for anomaly in anomalies:
+            emit(conn, session, sale.product_id, anomaly, now)
+
+
+def _after_commit(session):
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    for (scope, product_id), entry in pending.items():
+        state.apply(scope, product_id, entry["base"], entry["sales"])
+
+
+def _discard_pending(session, *args):
+    session.info.pop(_PENDING_KEY, None)
+
+
+def install(session_factory):
+    """Revisa las ventas nuevas de las sesiones de session_factory al hacer flush y confirma su estado al commit"""
+    if getattr(session_factory, "_papeleria_sales_anomalies", False):
+        return session_factory
+    event.listen(session_factory, "before_flush", _before_flush)
+    event.listen(session_factory, "after_commit", _after_commit)
+    event.listen(session_factory, "after_rollback", _discard_pending)
+    session_factory._papeleria_sales_anomalies = True
+    return session_factory
+
+
+def resolve(db: Session, alert_id: int) -> Optional[Dict]:
+    """Marca como revisada una alerta de venta atípica; None si no existe en la tienda o no es de ese tipo"""
+    # El join con products deja la búsqueda dentro de la tienda de la sesión
+    stmt = select(alerts_table, products_table.c.name.label("product_name")).join(
+        products_table, products_table.c.id == alerts_table.c.product_id
+    ).where(alerts_table.c.id == alert_id, alerts_table.c.alert_type == alert_engine.SALE_ANOMALY)
+    alert = db.execute(stmt).mappings().first()
+    if alert is None:
+        return None
+    if alert["status"] == alert_engine.ACTIVE:
+        now = datetime.utcnow()
+        db.execute(update(alerts_table).where(alerts_table.c.id == alert_id).values(
+            status=alert_engine.RESOLVED, updated_at=now, resolved_at=now))
+        transition = {"product_id": alert["product_id"], "alert_type": alert_engine.SALE_ANOMALY,
+                      "status": alert_engine.RESOLVED, "value": alert["value"], "threshold": alert["threshold"],
+                      "created_at": now}
+        db.execute(insert(alert_events_table), [transition])
+        live.publish_after_commit(db, "alert", transition)
+        alert = db.execute(stmt).mappings().first()
+    return dict(alert)
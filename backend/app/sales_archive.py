@@ -0,0 +1,469 @@
+"""
+Archivo de ventas antiguas en almacenamiento frío.
+
+La tabla sales crece sin fin y con ella cada consulta por ventana de fechas y
+cada copia de la base. Este módulo saca de la base las ventas anteriores a un
+horizonte y las deja en archivos columnares comprimidos:
+
+- Archivado: archive corta a medianoche, escribe las ventas anteriores al
+  corte en un archivo por mes (Parquet con zstd si pyarrow está instalado; si
+  no, .npz comprimido de NumPy, una columna por arreglo) bajo
+  SALES_ARCHIVE_DIR/<base>/year=AAAA/month=MM/, los registra en
+  sales_archives y las borra, todo en la misma transacción de la base. Las
+  ventas con puntos de fidelización pendientes se quedan hasta sumarlos.
+- Los agregados diarios (sales_daily) no se tocan: la analítica, las alertas
+  y el detector de ventas atípicas siguen viendo toda la historia, y
+  sales_rollup.rebuild no reescribe los días archivados.
+- Lectura: load_sales une las ventas de la base y las de los archivos del
+  rango pedido en un solo DataFrame, con el mismo filtro de tienda que la
+  sesión. Solo se abren los archivos cuyo rango de días cruza el pedido, y de
+  ellos solo las columnas pedidas. load_sales_page lee una página sin cargar
+  el rango completo y sales_totals suma el rango desde sales_daily.
+- Espacio: borrar filas no achica sql_app.db; vacuum ejecuta VACUUM (SQLite)
+  o VACUUM ANALYZE sales (PostgreSQL) después de archivar.
+- SalesArchiveWorker archiva cada SALES_ARCHIVE_INTERVAL_SECONDS lo anterior a
+  SALES_RETENTION_DAYS días (0 lo desactiva), en cada base de tiendas.
+
+Los pronósticos y la minería de canastas leen solo las ventas de la base: la
+retención debe ser mayor que sus ventanas.
+
+Ejecutar manualmente con: python -m app.sales_archive [días] [--vacuum]
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, Float, Integer, and_, delete, func, insert, or_, select
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from . import models, sales_rollup, tenancy
+from .database import STORE_INFO_KEY
+from .metrics import REGISTRY
+
+# Importación opcional de Parquet
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Días de ventas que se conservan en la base; 0 desactiva el archivado automático
+RETENTION_DAYS = int(os.getenv("SALES_RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("SALES_ARCHIVE_DIR", "./sales_archive")
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("SALES_ARCHIVE_INTERVAL_SECONDS", "86400"))
+# VACUUM después de cada archivado automático; bloquea la base mientras dura
+ARCHIVE_VACUUM = os.getenv("SALES_ARCHIVE_VACUUM", "1") == "1"
+ARCHIVE_BATCH_SIZE = 50_000
+
+PARQUET = "parquet"
+NPZ = "npz"
+ARCHIVE_FORMAT = PARQUET if PARQUET_AVAILABLE else NPZ
+
+sales_table = models.Sale.__table__
+daily_table = models.SalesDaily.__table__
+archives_table = models.SalesArchive.__table__
+COLUMNS = [column.name for column in sales_table.columns]
+
+SALES_ARCHIVED = REGISTRY.counter("papeleria_sales_archived_total", "Ventas movidas de la base a archivos")
+SALES_ARCHIVE = REGISTRY.histogram(
+    "papeleria_sales_archive_seconds", "Duración del archivado de ventas por base (sin VACUUM)",
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+SALES_ARCHIVE_ERRORS = REGISTRY.counter(
+    "papeleria_sales_archive_errors_total", "Archivados de ventas fallidos (se reintentan en el siguiente)")
+
+# Un archivado a la vez en el proceso (hilo de fondo o endpoint)
+_run_lock = threading.Lock()
+
+
+def _frame(rows: Sequence, columns: Sequence[str]) -> pd.DataFrame:
+    """Filas de sales como DataFrame con tipos fijos por columna: enteros anulables, fechas y texto"""
+    df = pd.DataFrame.from_records(rows, columns=list(columns))
+    for name in columns:
+        kind = sales_table.c[name].type
+        if isinstance(kind, DateTime):
+            df[name] = pd.to_datetime(df[name])
+        elif isinstance(kind, Integer):
+            df[name] = df[name].astype("Int64")
+        elif isinstance(kind, Float):
+            df[name] = df[name].astype(float)
+        else:
+            df[name] = df[name].astype(object).where(df[name].notna(), None)
+    return df
+
+
+# --- Formato de los archivos --------------------------------------------------------
+
+def _write(df: pd.DataFrame, path: str, fmt: str):
+    if fmt == PARQUET:
+        pq.write_table(pa.Table.from_pandas(df, preserve_index=False), path, compression="zstd")
+        return
+    arrays = {}
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.Int64Dtype):
+            # Los nulos van en una máscara aparte: el arreglo queda entero
+            arrays[name] = column.fillna(0).to_numpy(dtype=np.int64)
+            if column.isna().any():
+                arrays[f"{name}__null"] = column.isna().to_numpy()
+        elif column.dtype.kind == "M":
+            arrays[name] = column.to_numpy(dtype="datetime64[us]")
+        elif column.dtype == object:
+            arrays[name] = column.fillna("").to_numpy(dtype=str)
+            arrays[f"{name}__null"] = column.isna().to_numpy()
+        else:
+            arrays[name] = column.to_numpy()
+    with open(path, "wb") as archive:
+        np.savez_compressed(archive, **arrays)
+
+
+def _read(path: str, fmt: str, columns: Sequence[str], start: Optional[datetime], end: Optional[datetime],
+          product_ids: Optional[List[int]], store_id: Optional[int]) -> pd.DataFrame:
+    """Ventas de un archivo que cumplen los filtros, solo con las columnas pedidas"""
+    if fmt == PARQUET:
+        filters = []
+        if start is not None:
+            filters.append(("sale_date", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("sale_date", "<", pd.Timestamp(end)))
+        if product_ids is not None:
+            filters.append(("product_id", "in", product_ids))
+        if store_id is not None:
+            filters.append(("store_id", "==", store_id))
+        return pq.read_table(path, columns=list(columns), filters=filters or None).to_pandas()
+
+    # .npz se descomprime por columna al accederla: primero las de los filtros, el resto solo de las filas que quedan
+    with np.load(path) as archive:
+        names = set(archive.files)
+        dates = archive["sale_date"]
+        mask = np.ones(len(dates), dtype=bool)
+        if start is not None:
+            mask &= dates >= np.datetime64(start)
+        if end is not None:
+            mask &= dates < np.datetime64(end)
+        if product_ids is not None:
+            mask &= np.isin(archive["product_id"], product_ids)
+            if "product_id__null" in names:
+                mask &= ~archive["product_id__null"]
+        if store_id is not None:
+            mask &= archive["store_id"] == store_id
+        data = {}
+        for name in columns:
+            values = archive[name][mask]
+            nulls = archive[f"{name}__null"][mask] if f"{name}__null" in names else None
+            kind = sales_table.c[name].type
+            if isinstance(kind, Integer):
+                values = pd.array(values, dtype="Int64")
+                if nulls is not None:
+                    values[nulls] = pd.NA
+            elif nulls is not None:
+                values = values.astype(object)
+                values[nulls] = None
+            data[name] = values
+    return pd.DataFrame(data, columns=list(columns))
+
+
+def _database_name(engine: Engine) -> str:
+    if engine.url.database:
+        return os.path.splitext(os.path.basename(engine.url.database))[0]
+    return engine.url.host or "db"
+
+
+def _partition_path(archive_dir: str, database: str, month: pd.Period, fmt: str) -> str:
+    directory = os.path.join(archive_dir, database, f"year={month.year:04d}", f"month={month.month:02d}")
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"sales_{int(time.time() * 1000)}.{fmt}")
+
+
+# --- Archivado ----------------------------------------------------------------------
+
+def archivable(before: datetime):
+    """Ventas anteriores al corte que pueden salir de la base (sin puntos de fidelización pendientes)"""
+    s = sales_table.c
+    return and_(s.sale_date < before, or_(s.customer_phone.is_(None), s.loyalty_points.is_not(None)))
+
+
+def _write_month(rows: List, month: pd.Period, archive_dir: str, database: str, fmt: str) -> Dict[str, Any]:
+    """Escribe las ventas de un mes y devuelve su fila para sales_archives"""
+    df = _frame(rows, COLUMNS)
+    path = _partition_path(archive_dir, database, month, fmt)
+    _write(df, path, fmt)
+    return {"first_day": sales_rollup.day_number(df["sale_date"].min()),
+            "last_day": sales_rollup.day_number(df["sale_date"].max()),
+            "sales": len(df), "path": path, "format": fmt, "bytes": os.path.getsize(path)}
+
+
+def archive(conn: Connection, before: datetime, archive_dir: str = ARCHIVE_DIR,
+            fmt: str = ARCHIVE_FORMAT) -> Dict[str, Any]:
+    """
+    Archiva las ventas anteriores a la medianoche de `before` (un archivo por
+    mes), las registra en sales_archives y las borra de sales. Sin commit: si
+    la transacción falla, los archivos escritos quedan sin registrar y no se
+    leen.
+    """
+    if fmt == PARQUET and not PARQUET_AVAILABLE:
+        raise RuntimeError("pyarrow no está instalado: use el formato npz")
+    # Días completos: sales_daily no distingue ventas archivadas y calientes de un mismo día
+    before = datetime.combine(before.date(), datetime.min.time())
+    old = archivable(before)
+    database = _database_name(conn.engine)
+    files = []
+    # Una sola lectura en orden de fecha (índice por sale_date); en memoria solo el mes en curso
+    result = conn.execute(select(sales_table).where(old).order_by(sales_table.c.sale_date),
+                          execution_options={"stream_results": True})
+    month, rows = None, []
+    for part in result.partitions(ARCHIVE_BATCH_SIZE):
+        for row in part:
+            sale_date = row.sale_date
+            if month is None or sale_date.month != month.month or sale_date.year != month.year:
+                if rows:
+                    files.append(_write_month(rows, month, archive_dir, database, fmt))
+                month, rows = pd.Period(sale_date, freq="M"), []
+            rows.append(row)
+    if rows:
+        files.append(_write_month(rows, month, archive_dir, database, fmt))
+    if files:
+        now = datetime.utcnow()
+        conn.execute(insert(archives_table), [{**file, "archived_before": before, "created_at": now} for file in files])
+        conn.execute(delete(sales_table).where(old))
+    return {"archived": sum(file["sales"] for file in files), "files": len(files),
+            "bytes": sum(file["bytes"] for file in files)}
+
+
+def vacuum(engine: Engine) -> int:
+    """Devuelve al sistema el espacio de las filas borradas; bytes recuperados (0 si no se puede medir)"""
+    path = engine.url.database if engine.dialect.name == "sqlite" else None
+    size = os.path.getsize(path) if path and os.path.exists(path) else None
+    # VACUUM no corre dentro de una transacción
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if engine.dialect.name == "postgresql":
+            conn.exec_driver_sql(f"VACUUM ANALYZE {sales_table.name}")
+        else:
+            conn.exec_driver_sql("VACUUM")
+            # En modo WAL la base reescrita queda en el -wal hasta el checkpoint
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    return max(size - os.path.getsize(path), 0) if size is not None else 0
+
+
+def run(before: datetime, archive_dir: str = ARCHIVE_DIR, run_vacuum: bool = True) -> Dict[str, Any]:
+    """Archiva lo anterior a `before` en todas las bases de tiendas y, con run_vacuum, las compacta"""
+    with _run_lock:
+        engines = tenancy.store_engines()
+        stats = {"databases": len(engines), "archived": 0, "files": 0, "bytes": 0, "reclaimed_bytes": 0}
+        for engine in engines:
+            start = time.perf_counter()
+            # Las bases por tienda no comparten ids: cada una se archiva entera, sin filtro de tienda
+            with engine.begin() as conn:
+                result = archive(conn, before, archive_dir)
+            SALES_ARCHIVE.observe(time.perf_counter() - start)
+            SALES_ARCHIVED.inc(result["archived"])
+            for key in ("archived", "files", "bytes"):
+                stats[key] += result[key]
+            if run_vacuum and result["archived"]:
+                stats["reclaimed_bytes"] += vacuum(engine)
+        return stats
+
+
+# --- Lectura ------------------------------------------------------------------------
+
+def list_archives(db) -> List[Dict[str, Any]]:
+    """Archivos registrados, del más antiguo al más reciente, con sus días como fechas"""
+    rows = db.execute(select(archives_table).order_by(archives_table.c.first_day, archives_table.c.id))
+    return [{**row, "first_day": sales_rollup.day_date(row["first_day"]),
+             "last_day": sales_rollup.day_date(row["last_day"])} for row in rows.mappings()]
+
+
+def _database_sales(columns: Sequence[str], start: Optional[datetime], end: Optional[datetime],
+                    product_ids: Optional[List[int]]):
+    """Consulta de las ventas de la base del rango, en orden de fecha (el filtro de tienda lo pone la sesión)"""
+    s = sales_table.c
+    stmt = select(*(s[name] for name in columns))
+    if start is not None:
+        stmt = stmt.where(s.sale_date >= start)
+    if end is not None:
+        stmt = stmt.where(s.sale_date < end)
+    if product_ids is not None:
+        stmt = stmt.where(s.product_id.in_(product_ids))
+    return stmt.order_by(s.sale_date, s.id)
+
+
+def _archive_files(db, start: Optional[datetime], end: Optional[datetime]) -> List:
+    """(ruta, formato, primer día) de los archivos registrados cuyo rango de días cruza [start, end)"""
+    catalog = select(archives_table.c.path, archives_table.c.format, archives_table.c.first_day)
+    if start is not None:
+        catalog = catalog.where(archives_table.c.last_day >= sales_rollup.day_number(start))
+    if end is not None:
+        catalog = catalog.where(archives_table.c.first_day <= sales_rollup.day_number(end))
+    files = []
+    for path, fmt, first_day in db.execute(catalog.order_by(archives_table.c.first_day, archives_table.c.id)).all():
+        if not os.path.exists(path):
+            logger.warning("Archivo de ventas registrado pero ausente: %s", path)
+            continue
+        files.append((path, fmt, first_day))
+    return files
+
+
+def _union(parts: List[pd.DataFrame], columns: Sequence[str]) -> pd.DataFrame:
+    """Las ventas de la base (la primera parte) y las archivadas en una sola tabla en orden de fecha"""
+    parts = [parts[0]] + [part.astype({name: parts[0][name].dtype for name in columns})
+                          for part in parts[1:] if len(part)]
+    if len(parts) == 1:
+        return parts[0]
+    return pd.concat(parts, ignore_index=True).sort_values("sale_date", kind="stable", ignore_index=True)
+
+
+def load_sales(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+               product_ids: Optional[Iterable[int]] = None, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Ventas de [start, end) de la base y de los archivos, en orden de fecha.
+
+    Las de la base llevan el filtro de tienda de la sesión; las archivadas se
+    filtran por la misma tienda (STORE_INFO_KEY) al leerlas.
+    """
+    wanted = list(columns or COLUMNS)
+    # La fecha se lee siempre para ordenar la unión
+    columns = wanted if "sale_date" in wanted else wanted + ["sale_date"]
+    product_ids = list(product_ids) if product_ids is not None else None
+    parts = [_frame(db.execute(_database_sales(columns, start, end, product_ids)).all(), columns)]
+    store_id = db.info.get(STORE_INFO_KEY) if isinstance(db, Session) else None
+    for path, fmt, _ in _archive_files(db, start, end):
+        parts.append(_read(path, fmt, columns, start, end, product_ids, store_id))
+    return _union(parts, columns)[wanted]
+
+
+def load_sales_page(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    product_ids: Optional[Iterable[int]] = None, columns: Optional[Sequence[str]] = None,
+                    skip: int = 0, limit: int = 500) -> pd.DataFrame:
+    """
+    Ventas [skip, skip + limit) de las de load_sales, sin cargar el rango completo.
+
+    Sin archivos en el rango, la página sale de la base con OFFSET/LIMIT. Con
+    archivos, basta mezclar las primeras skip + limit ventas de la base con
+    las de los archivos leídos en orden de primer día, hasta que el siguiente
+    archivo empiece después del día de la venta skip + limit ya leída.
+    """
+    wanted = list(columns or COLUMNS)
+    columns = wanted if "sale_date" in wanted else wanted + ["sale_date"]
+    product_ids = list(product_ids) if product_ids is not None else None
+    stmt = _database_sales(columns, start, end, product_ids)
+    files = _archive_files(db, start, end)
+    if not files:
+        return _frame(db.execute(stmt.offset(skip).limit(limit)).all(), columns)[wanted]
+
+    needed = skip + limit
+    parts = [_frame(db.execute(stmt.limit(needed)).all(), columns)]
+    store_id = db.info.get(STORE_INFO_KEY) if isinstance(db, Session) else None
+    dates = []
+    for path, fmt, first_day in files:
+        read = sum(len(part) for part in dates)
+        if read >= needed:
+            # Los archivos que faltan empiezan en first_day o después: no pueden entrar en la página
+            last_needed = np.partition(np.concatenate(dates), needed - 1)[needed - 1]
+            if first_day > sales_rollup.day_number(pd.Timestamp(last_needed)):
+                break
+        part = _read(path, fmt, columns, start, end, product_ids, store_id)
+        parts.append(part)
+        dates.append(part["sale_date"].to_numpy(dtype="datetime64[us]"))
+    return _union(parts, columns).iloc[skip:needed][wanted].reset_index(drop=True)
+
+
+def sales_totals(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 product_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+    """
+    Ventas, unidades e ingresos de [start, end), en la base y archivados.
+
+    Los días completos del rango salen de sales_daily; solo las horas de los
+    días de los extremos se suman desde las ventas. Como sales_daily, cuenta
+    las ventas con producto.
+    """
+    product_ids = list(product_ids) if product_ids is not None else None
+    first_day = last_day = None
+    edges = []
+    if start is not None:
+        first_day = sales_rollup.day_number(start)
+        midnight = datetime.combine(start.date(), datetime.min.time())
+        if start > midnight:
+            first_day += 1
+            edges.append((start, midnight + timedelta(days=1)))
+    if end is not None:
+        last_day = sales_rollup.day_number(end)
+        midnight = datetime.combine(end.date(), datetime.min.time())
+        if end > midnight:
+            edges.append((midnight, end))
+    if first_day is not None and last_day is not None and first_day > last_day:
+        # El rango no llega a la medianoche siguiente: todo sale de las ventas
+        first_day, edges = last_day, [(start, end)]
+
+    d = daily_table.c
+    stmt = select(func.coalesce(func.sum(d.sales), 0), func.coalesce(func.sum(d.units), 0),
+                  func.coalesce(func.sum(d.revenue), 0.0)).select_from(daily_table)
+    if first_day is not None:
+        stmt = stmt.where(d.day >= first_day)
+    if last_day is not None:
+        stmt = stmt.where(d.day < last_day)
+    if product_ids is not None:
+        stmt = stmt.where(d.product_id.in_(product_ids))
+    count, units, revenue = db.execute(stmt).one()
+    count, units, revenue = int(count), int(units), float(revenue)
+    for edge_start, edge_end in edges:
+        sales = load_sales(db, edge_start, edge_end, product_ids, ["product_id", "quantity", "total_price"])
+        sales = sales[sales["product_id"].notna()]
+        count += len(sales)
+        units += int(sales["quantity"].sum())
+        revenue += float(sales["total_price"].sum())
+    return {"sales_count": count, "units": units, "revenue": revenue}
+
+
+class SalesArchiveWorker:
+    """Hilo de fondo que archiva cada `interval` segundos las ventas fuera de la retención"""
+
+    def __init__(self, interval: float, retention_days: int = RETENTION_DAYS, run_vacuum: bool = ARCHIVE_VACUUM):
+        self.interval = interval
+        self.retention_days = retention_days
+        self.run_vacuum = run_vacuum
+        self.last_run: Optional[Dict[str, Any]] = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sales-archive", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.last_run = run(datetime.utcnow() - timedelta(days=self.retention_days),
+                                    run_vacuum=self.run_vacuum)
+            except Exception:
+                SALES_ARCHIVE_ERRORS.inc()
+                logger.exception("No se pudieron archivar las ventas")
+
+    def close(self):
+        self._stop.set()
+
+
+_worker: Optional[SalesArchiveWorker] = None
+
+
+def start_worker() -> Optional[SalesArchiveWorker]:
+    """Arranca el hilo de archivado una vez por proceso (nada si SALES_RETENTION_DAYS <= 0)"""
+    global _worker
+    if _worker is None and RETENTION_DAYS > 0 and ARCHIVE_INTERVAL_SECONDS > 0:
+        _worker = SalesArchiveWorker(ARCHIVE_INTERVAL_SECONDS)
+    return _worker
+
+
+if __name__ == "__main__":
+    import sys
+
+    from .migrations import run_migrations
+
+    run_migrations()
+    days = next((int(arg) for arg in sys.argv[1:] if arg.isdigit()), RETENTION_DAYS or 730)
+    print(run(datetime.utcnow() - timedelta(days=days), run_vacuum="--vacuum" in sys.argv))
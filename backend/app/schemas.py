@@ -1,6 +1,8 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional
+from typing_extensions import Annotated, TypedDict
+from datetime import date, datetime
+from .stockout_risk import MAX_HISTORY_DAYS, MAX_LEAD_TIME_DAYS
 
 class ProductBase(BaseModel):
     name: str
@@ -16,14 +18,30 @@ class ProductCreate(ProductBase):
 
 class Product(ProductBase):
     id: int
+    store_id: int
     last_updated: datetime
 
     class Config:
         from_attributes = True
 
+class ProductRow(TypedDict):
+    # Misma forma que Product, para serializar filas Core sin instanciar modelos
+    id: int
+    store_id: int
+    name: str
+    description: Optional[str]
+    price: float
+    stock: int
+    min_stock: int
+    category: Optional[str]
+    supplier: Optional[str]
+    last_updated: datetime
+
 class ProductUpdateStock(BaseModel):
     quantity: int
     operation: str # "add" or "subtract"
+    reason: Optional[str] = None # Motivo en el libro de inventario: 'reposicion', 'ajuste', 'devolucion'
+    reference: Optional[str] = None # Factura, venta devuelta, etc.
 
 class SaleBase(BaseModel):
     product_id: int
@@ -51,22 +69,89 @@ class CustomerCreate(CustomerBase):
 
 class Customer(CustomerBase):
     id: int
+    store_id: int
     last_purchase: datetime
 
     class Config:
         from_attributes = True
 
+class SchoolListItemBase(BaseModel):
+    product_id: Optional[int] = None
+    description: Optional[str] = None
+    quantity: int = 1
+
+class SchoolListItemCreate(SchoolListItemBase):
+    pass
+
+class SchoolListItem(SchoolListItemBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
 class SchoolListBase(BaseModel):
     school_name: str
     grade: str
     year: int
-    items: str # JSON string
 
 class SchoolListCreate(SchoolListBase):
-    pass
+    items: List[SchoolListItemCreate] = []
 
 class SchoolList(SchoolListBase):
     id: int
+    items: List[SchoolListItem] = []
+
+    class Config:
+        from_attributes = True
+
+class SchoolListDemand(BaseModel):
+    product_id: int
+    product_name: str
+    total_quantity: int
+    list_count: int
+
+class SchoolEnrollment(BaseModel):
+    school_name: str
+    grade: str
+    students: int
+
+class SchoolDemandRequest(BaseModel):
+    year: int
+    enrollment_by_grade: Dict[str, int] = {} # grado -> estudiantes esperados
+    school_enrollment: List[SchoolEnrollment] = [] # tiene prioridad sobre enrollment_by_grade
+    default_students: int = 0
+
+class SchoolDemandLine(BaseModel):
+    product_id: int
+    product_name: str
+    supplier: Optional[str] = None
+    school_count: int
+    projected_demand: int
+    current_stock: int
+    committed_in_orders: int
+    available_stock: int
+    shortfall: int
+    suggested_order_quantity: int
+    estimated_cost: float
+
+class SchoolDemandProjection(BaseModel):
+    year: int
+    total_projected_units: int
+    total_suggested_units: int
+    total_estimated_cost: float
+    items: List[SchoolDemandLine]
+
+class OrderItemBase(BaseModel):
+    product_id: Optional[int] = None
+    description: Optional[str] = None
+    quantity: int = 1
+    unit_price: float = 0.0
+
+class OrderItemCreate(OrderItemBase):
+    pass
+
+class OrderItem(OrderItemBase):
+    id: int
 
     class Config:
         from_attributes = True
@@ -75,16 +160,408 @@ class OrderBase(BaseModel):
     customer_id: Optional[int] = None
     order_type: str
     status: str = "Pendiente"
-    details: str # JSON string
+    details: Optional[str] = None # Especificaciones libres del pedido
     total_amount: float
     due_date: Optional[datetime] = None
+    priority: int = Field(1, ge=0, le=2) # 0 urgente, 1 normal, 2 baja
+    pages: Optional[int] = Field(None, ge=0) # Impresión: páginas × copias; por defecto la suma de los ítems
 
 class OrderCreate(OrderBase):
-    pass
+    items: List[OrderItemCreate] = []
+
+class OrderUpdate(BaseModel):
+    customer_id: Optional[int] = None
+    details: Optional[str] = None
+    total_amount: Optional[float] = None
+    due_date: Optional[datetime] = None
+    priority: Optional[int] = Field(None, ge=0, le=2)
+    pages: Optional[int] = Field(None, ge=0)
+
+class OrderStatusUpdate(BaseModel):
+    status: str
+    printer_id: Optional[int] = None # Al pasar a 'En proceso'; por defecto la primera impresora libre
 
 class Order(OrderBase):
     id: int
+    store_id: int
     created_at: datetime
+    printer_id: Optional[int] = None
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    items: List[OrderItem] = []
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class PrintJobEstimate(BaseModel):
+    order_id: int
+    priority: int
+    pages: Optional[int] = None
+    due_date: Optional[datetime] = None
+    printer_id: int
+    estimated_start: datetime
+    estimated_finish: datetime
+    wait_minutes: float
+    late: bool # Terminaría después de due_date
+
+class PrinterStatus(BaseModel):
+    printer_id: int
+    pages_per_minute: float
+    current_order_id: Optional[int] = None
+    busy_until: Optional[datetime] = None
+    queued_jobs: int
+    backlog_minutes: float
+    jobs_per_hour: float
+
+class PrintAssignment(BaseModel):
+    order_id: int
+    printer_id: int
+    estimated_finish: datetime
+
+class ProductOrderLine(BaseModel):
+    order_id: int
+    order_type: Optional[str] = None
+    status: str
+    due_date: Optional[datetime] = None
+    quantity: int
+
+# Respuestas tipadas de endpoints de análisis
+class DemandPrediction(BaseModel):
+    predicted_demand: float
+    days_ahead: Optional[int] = None
+    message: str
+
+class ReorderSuggestion(BaseModel):
+    product_id: int
+    product_name: str
+    current_stock: int
+    min_stock: int
+    suggested_reorder_quantity: int
+    message: str
+
+class DemandAlert(BaseModel):
+    product_id: int
+    product_name: str
+    current_stock: int
+    predicted_demand: float
+    alert_type: str
+    message: str
+    # Solo con ?with_risk=true: simulación de Monte Carlo del plazo de entrega (ver stockout_risk.py)
+    stockout_probability: Optional[float] = None
+    expected_lost_units: Optional[float] = None
+
+class Alert(BaseModel):
+    id: int
+    product_id: int
+    product_name: str
+    alert_type: str
+    status: str
+    current_stock: int
+    value: float
+    threshold: float
+    message: Optional[str] = None
+    opened_at: datetime
+    updated_at: datetime
+    resolved_at: Optional[datetime] = None
+
+class AlertEvent(BaseModel):
+    id: int
+    product_id: int
+    alert_type: str
+    status: str
+    value: float
+    threshold: float
+    created_at: datetime
+
+class AlertRebuild(BaseModel):
+    forecasts: int
+    opened: int
+    resolved: int
+
+class StoreCreate(BaseModel):
+    name: str
+
+class Store(StoreCreate):
+    id: int
+    created_at: datetime
+
+class StoreSummary(BaseModel):
+    store_id: int
+    store_name: str
+    product_count: int
+    stock_units: int
+    inventory_value: float
+    sales_count: int # En la ventana de `days` días
+    units_sold: int
+    revenue: float
+    active_alerts: int
+
+class LoyaltyCustomer(BaseModel):
+    id: int
+    name: Optional[str] = None
+    phone_number: str
+    loyalty_points: int = 0
+    membership_level: str = "Bronce"
+    last_purchase: Optional[datetime] = None
+
+class LoyaltyStatus(LoyaltyCustomer):
+    rank: int # 1 = más puntos de la tienda
+    next_level: Optional[str] = None
+    points_to_next_level: int = 0
+
+class LoyaltyLevel(BaseModel):
+    membership_level: str
+    min_points: int
+    customers: int
+    points: int
+
+class LoyaltyRun(BaseModel):
+    databases: int
+    sales: int
+    points: int
+    customers_created: int
+    customers_updated: int
+    level_changes: int
+
+class AIProviderStatus(BaseModel):
+    in_flight: int
+    queued: int
+    calls_per_minute: Optional[float] = None # None: sin límite de ritmo
+    available_calls: Optional[float] = None
+
+class AIGovernorStatus(BaseModel):
+    day: str
+    spent_tokens: int
+    spent_cost: float
+    daily_token_budget: Optional[int] = None
+    daily_cost_budget: Optional[float] = None
+    providers: Dict[str, AIProviderStatus]
+
+class FAQMatch(BaseModel):
+    answer: str
+    source: str
+    title: str
+    score: float
+
+class FAQStats(BaseModel):
+    queries: int
+    answered_locally: int
+    sent_to_ai: int
+    deflection_rate: float
+    avg_local_ms: Optional[float] = None
+    avg_ai_seconds: Optional[float] = None
+    latency_saved_seconds: float
+    documents: int
+    min_score: float
+
+class InventoryMovement(BaseModel):
+    id: int
+    product_id: int
+    movement_type: str
+    quantity: int
+    stock_after: Optional[int] = None
+    reference: Optional[str] = None
+    created_at: datetime
+
+class StockAt(BaseModel):
+    product_id: int
+    at: datetime
+    stock: int
+    snapshot_at: Optional[datetime] = None # Corte de partida; None si se sumó desde el inicio del libro
+    movements_applied: int
+
+class Kardex(BaseModel):
+    product_id: int
+    start: datetime
+    end: datetime
+    opening_stock: int
+    closing_stock: int
+    movements: List[InventoryMovement]
+    truncated: bool # Hay más movimientos en el rango que `limit`
+
+class InventoryRun(BaseModel):
+    databases: int
+    snapshots: int
+    archived: int
+
+class SaleRecord(BaseModel):
+    id: int
+    product_id: Optional[int] = None
+    quantity: int
+    total_price: float
+    sale_date: datetime
+    customer_phone: Optional[str] = None
+    ticket_id: Optional[int] = None
+
+class SalesHistory(BaseModel):
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    sales_count: int # Ventas con producto del rango, en la base y archivadas (desde sales_daily)
+    units: int
+    revenue: float
+    sales: List[SaleRecord] # La página pedida (skip, limit), en orden de fecha
+
+class SalesArchiveFile(BaseModel):
+    id: int
+    archived_before: datetime
+    first_day: date
+    last_day: date
+    sales: int
+    path: str
+    format: str
+    bytes: int
+    created_at: datetime
+
+class SalesArchiveRun(BaseModel):
+    databases: int
+    archived: int
+    files: int
+    bytes: int
+    reclaimed_bytes: int
+
+
+class TicketLine(BaseModel):
+    product_id: int
+    quantity: int = Field(1, gt=0)
+
+class TicketCreate(BaseModel):
+    lines: List[TicketLine] = Field(..., min_length=1)
+    customer_phone: Optional[str] = None
+
+class Ticket(BaseModel):
+    id: int
+    channel: Optional[str] = None
+    customer_phone: Optional[str] = None
+    total_price: float
+    created_at: datetime
+    lines: List[Sale]
+
+class RelatedProduct(BaseModel):
+    related_product_id: int
+    name: str
+    price: float
+    stock: int
+    rank: int
+    tickets: int
+    confidence: float
+    lift: float
+
+class BasketRun(BaseModel):
+    databases: int
+    tickets: int
+    lines: int
+    rules: int
+
+
+class ReorderPlanRequest(BaseModel):
+    history_days: int = Field(90, gt=0)
+    # Plazo cero (proveedor del mismo día) es válido; uno negativo daría la raíz de un negativo en el stock de seguridad
+    lead_time_days: float = Field(7, ge=0, le=MAX_LEAD_TIME_DAYS)
+    review_period_days: float = Field(7, ge=0)
+    service_level: float = Field(0.95, gt=0, lt=1)
+    supplier_lead_times: Dict[str, Annotated[float, Field(ge=0, le=MAX_LEAD_TIME_DAYS)]] = {}
+    cost_ratio: float = Field(1.0, gt=0) # costo de compra como fracción del precio de venta
+    min_order_value: float = 0.0
+    supplier_min_order_values: Dict[str, float] = {}
+    budget: Optional[float] = None
+
+class ReorderLine(BaseModel):
+    product_id: int
+    product_name: str
+    current_stock: int
+    committed_in_orders: int
+    avg_daily_demand: float
+    safety_stock: float
+    reorder_point: int
+    order_up_to: int
+    quantity: int
+    unit_cost: float
+    line_cost: float
+    days_of_cover: Optional[float] = None # None cuando no hay demanda histórica
+
+class PurchaseOrder(BaseModel):
+    supplier: str
+    total_cost: float
+    total_units: int
+    meets_minimum: bool
+    lines: List[ReorderLine]
+
+class ReorderPlan(BaseModel):
+    generated_at: datetime
+    service_level: float
+    budget: Optional[float] = None
+    total_cost: float
+    purchase_orders: List[PurchaseOrder]
+    deferred: List[PurchaseOrder]
+
+class StockoutRiskRequest(BaseModel):
+    history_days: int = Field(90, gt=0, le=MAX_HISTORY_DAYS)
+    lead_time_days: float = Field(7, gt=0, le=MAX_LEAD_TIME_DAYS)
+    supplier_lead_times: Dict[str, Annotated[float, Field(gt=0, le=MAX_LEAD_TIME_DAYS)]] = {}
+    paths: int = Field(5000, gt=0, le=20000)
+    seed: Optional[int] = 42 # None: caminos distintos en cada corrida
+    min_probability: float = Field(0.0, ge=0, le=1)
+    limit: int = Field(100, gt=0, le=5000)
+
+class StockoutRisk(BaseModel):
+    product_id: int
+    product_name: str
+    supplier: str
+    current_stock: int
+    committed_in_orders: int
+    lead_time_days: int
+    expected_demand: float
+    stockout_probability: float
+    expected_lost_units: float
+    expected_lost_revenue: float
+
+class StockoutRiskReport(BaseModel):
+    generated_at: datetime
+    paths: int
+    history_days: int
+    products: int
+    products_at_risk: int
+    expected_lost_units: float
+    expected_lost_revenue: float
+    risks: List[StockoutRisk]
+
+class ClassificationCell(BaseModel):
+    abc: str
+    xyz: str
+    products: int
+    revenue: float
+    stock_value: float
+
+class ClassificationSummary(BaseModel):
+    products: int
+    revenue: float
+    stock_value: float
+    dead_stock_products: int
+    dead_stock_value: float
+    matrix: List[ClassificationCell]
+
+class ClassifiedProduct(BaseModel):
+    product_id: int
+    product_name: str
+    category: Optional[str] = None
+    supplier: Optional[str] = None
+    price: float
+    current_stock: int
+    units_sold: int
+    revenue: float
+    revenue_share: float
+    cumulative_share: float
+    abc: str
+    demand_cv: Optional[float] = None # None cuando no hubo ventas en la ventana
+    xyz: str
+    avg_daily_demand: float
+    days_of_cover: Optional[float] = None # None cuando no hay demanda reciente
+    sell_through: float
+    days_since_last_sale: Optional[int] = None
+    dead_stock: bool
+    dead_stock_value: float
+
+class InventoryClassification(BaseModel):
+    generated_at: datetime
+    summary: ClassificationSummary
+    products: List[ClassifiedProduct]
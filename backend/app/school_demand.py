@@ -0,0 +1,109 @@
+"""
+Proyección de demanda de temporada escolar a partir de las listas de útiles.
+
+Cada ítem de lista se multiplica por los estudiantes esperados en su colegio y
+grado, y la demanda se agrega por producto en una sola pasada con pandas. El
+resultado se cruza con el stock actual y las órdenes abiertas para sugerir
+cuánto pedir antes de la temporada.
+"""
+
+from typing import Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import queries
+
+
+def load_list_items(db: Session, year: int) -> pd.DataFrame:
+    """Ítems de todas las listas del año asociados a un producto"""
+    lists = queries.school_lists_table
+    items = queries.school_list_items_table
+    stmt = select(
+        lists.c.school_name, lists.c.grade, items.c.product_id, items.c.quantity
+    ).join(
+        lists, lists.c.id == items.c.school_list_id
+    ).where(
+        lists.c.year == year, items.c.product_id.is_not(None)
+    )
+    df = pd.DataFrame(db.execute(stmt).all(), columns=["school_name", "grade", "product_id", "quantity"])
+    df["grade"] = df["grade"].astype(str).str.strip()
+    return df
+
+
+def load_stock_position(db: Session) -> pd.DataFrame:
+    """Stock actual, mínimo y unidades comprometidas en órdenes abiertas por producto"""
+    products = queries.products_table
+    stock = pd.DataFrame(
+        db.execute(select(
+            products.c.id, products.c.name, products.c.supplier, products.c.price,
+            products.c.stock, products.c.min_stock
+        )).all(),
+        columns=["product_id", "product_name", "supplier", "price", "current_stock", "min_stock"],
+    )
+    committed = pd.DataFrame(
+        queries.committed_quantities(db), columns=["product_id", "committed_in_orders"]
+    ).astype("int64")
+    stock = stock.merge(committed, on="product_id", how="left")
+    stock["committed_in_orders"] = stock["committed_in_orders"].fillna(0).astype(int)
+    stock[["current_stock", "min_stock"]] = stock[["current_stock", "min_stock"]].fillna(0).astype(int)
+    return stock
+
+
+def project_demand(items: pd.DataFrame, enrollment_by_grade: Optional[Dict[str, int]] = None,
+                   school_enrollment: Optional[List[Dict]] = None, default_students: int = 0) -> pd.DataFrame:
+    """
+    Expande lista × estudiantes y agrega por producto.
+
+    La matrícula de un colegio y grado concreto tiene prioridad sobre la del
+    grado en general; si no hay ninguna se usa default_students.
+    """
+    if items.empty:
+        return pd.DataFrame(columns=["product_id", "projected_demand", "school_count"])
+
+    students = pd.Series(float("nan"), index=items.index)
+    if school_enrollment:
+        per_school = pd.DataFrame(school_enrollment, columns=["school_name", "grade", "students"])
+        per_school["grade"] = per_school["grade"].astype(str).str.strip()
+        per_school = per_school.drop_duplicates(["school_name", "grade"], keep="last")
+        students = items[["school_name", "grade"]].merge(
+            per_school, on=["school_name", "grade"], how="left"
+        )["students"].set_axis(items.index)
+    if enrollment_by_grade:
+        by_grade = {str(grade).strip(): count for grade, count in enrollment_by_grade.items()}
+        students = students.fillna(items["grade"].map(by_grade))
+    students = students.fillna(default_students)
+
+    expanded = items.assign(projected_demand=items["quantity"] * students)
+    expanded = expanded[expanded["projected_demand"] > 0]
+    return expanded.groupby("product_id", as_index=False).agg(
+        projected_demand=("projected_demand", "sum"),
+        school_count=("school_name", "nunique"),
+    )
+
+
+def build_reorder_plan(db: Session, year: int, enrollment_by_grade: Optional[Dict[str, int]] = None,
+                       school_enrollment: Optional[List[Dict]] = None, default_students: int = 0) -> pd.DataFrame:
+    """
+    Demanda proyectada por producto frente al stock disponible.
+
+    La cantidad sugerida cubre la demanda de la temporada, lo ya comprometido
+    en órdenes abiertas y deja el producto en su stock mínimo al terminar.
+    """
+    demand = project_demand(load_list_items(db, year), enrollment_by_grade, school_enrollment, default_students)
+    plan = demand.merge(load_stock_position(db), on="product_id", how="inner")
+
+    plan["projected_demand"] = plan["projected_demand"].round().astype(int)
+    plan["available_stock"] = plan["current_stock"] - plan["committed_in_orders"]
+    plan["shortfall"] = (plan["projected_demand"] - plan["available_stock"]).clip(lower=0)
+    plan["suggested_order_quantity"] = (
+        plan["projected_demand"] + plan["min_stock"] - plan["available_stock"]
+    ).clip(lower=0)
+    plan["estimated_cost"] = plan["suggested_order_quantity"] * plan["price"].fillna(0)
+
+    return plan.sort_values(["shortfall", "projected_demand"], ascending=False)[[
+        "product_id", "product_name", "supplier", "school_count", "projected_demand",
+        "current_stock", "committed_in_orders", "available_stock", "shortfall",
+        "suggested_order_quantity", "estimated_cost",
+    ]].reset_index(drop=True)
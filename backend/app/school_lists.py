@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from . import models, schemas, queries, singleflight
+from .school_demand import build_reorder_plan
+from .tenancy import get_db, get_read_db, heavy_job
+
+router = APIRouter(prefix="/school-lists", tags=["school-lists"])
+
+@router.post("/", response_model=schemas.SchoolList, status_code=status.HTTP_201_CREATED)
+def create_school_list(school_list: schemas.SchoolListCreate, db: Session = Depends(get_db)):
+    missing = queries.missing_products(db, [item.product_id for item in school_list.items])
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Productos no encontrados: {', '.join(map(str, missing))}")
+    db_list = models.SchoolList(
+        school_name=school_list.school_name,
+        grade=school_list.grade,
+        year=school_list.year,
+        items=[models.SchoolListItem(**item.model_dump()) for item in school_list.items]
+    )
+    db.add(db_list)
+    db.commit()
+    db.refresh(db_list)
+    return db_list
+
+@router.get("/", response_model=List[schemas.SchoolList])
+def read_school_lists(year: Optional[int] = None, school_name: Optional[str] = None, db: Session = Depends(get_db)):
+    query = db.query(models.SchoolList)
+    if year is not None:
+        query = query.filter(models.SchoolList.year == year)
+    if school_name is not None:
+        query = query.filter(models.SchoolList.school_name == school_name)
+    return query.order_by(models.SchoolList.school_name, models.SchoolList.grade).all()
+
+# Declarada antes de /{school_list_id} para que esa ruta no la capture
+@router.get("/demand", response_model=List[schemas.SchoolListDemand])
+def get_school_list_demand(year: int, grade: Optional[str] = None, product_id: Optional[int] = None,
+                           db: Session = Depends(get_read_db)):
+    # Un solo GROUP BY sobre school_list_items en lugar de decodificar JSON por lista
+    return queries.school_list_demand(db, year, grade, product_id)
+
+@router.post("/projection", response_model=schemas.SchoolDemandProjection, dependencies=[Depends(heavy_job)])
+def project_school_demand(request: schemas.SchoolDemandRequest, db: Session = Depends(get_read_db)):
+    """Demanda de temporada (listas × matrícula) cruzada con stock y órdenes abiertas"""
+    plan = singleflight.forecasts.do(
+        ("school_demand", singleflight.scope_of(db), request.model_dump()),
+        build_reorder_plan,
+        db,
+        request.year,
+        enrollment_by_grade=request.enrollment_by_grade,
+        school_enrollment=[entry.model_dump() for entry in request.school_enrollment],
+        default_students=request.default_students
+    )
+    return {
+        "year": request.year,
+        "total_projected_units": int(plan["projected_demand"].sum()),
+        "total_suggested_units": int(plan["suggested_order_quantity"].sum()),
+        "total_estimated_cost": float(plan["estimated_cost"].sum()),
+        "items": plan.to_dict(orient="records")
+    }
+
+@router.get("/{school_list_id}", response_model=schemas.SchoolList)
+def read_school_list(school_list_id: int, db: Session = Depends(get_db)):
+    school_list = db.query(models.SchoolList).filter(models.SchoolList.id == school_list_id).first()
+    if school_list is None:
+        raise HTTPException(status_code=404, detail="Lista escolar no encontrada")
+    return school_list
+
+@router.delete("/{school_list_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_school_list(school_list_id: int, db: Session = Depends(get_db)):
+    school_list = db.query(models.SchoolList).filter(models.SchoolList.id == school_list_id).first()
+    if school_list is None:
+        raise HTTPException(status_code=404, detail="Lista escolar no encontrada")
+    db.delete(school_list)
+    db.commit()
@@ -0,0 +1,102 @@
+"""
+Coalescencia de cálculos idénticos concurrentes ("single flight").
+
+Si varias peticiones piden a la vez lo mismo (el pronóstico de un producto,
+el plan de compras con los mismos parámetros, el resumen del tablero, la
+misma pregunta a la IA), solo la primera lo calcula; las demás esperan y
+reciben el mismo resultado, o la misma excepción. No es una caché: cuando el
+cálculo termina la clave se libera y la siguiente petición calcula de nuevo.
+
+La clave debe incluir todo lo que cambia el resultado, en particular la base
+y la tienda de la sesión (scope_of). El resultado se comparte entre hilos:
+quien lo recibe no debe modificarlo. No coalescer cálculos que lean cambios
+sin confirmar de la transacción propia (p. ej. el motor de alertas en un flush).
+"""
+
+import json
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+from .database import STORE_INFO_KEY
+from .metrics import REGISTRY
+
+T = TypeVar("T")
+
+SINGLEFLIGHT_CALLS = REGISTRY.counter(
+    "papeleria_singleflight_calls_total", "Cálculos coalescidos: ejecutados (leader) o compartidos (shared)",
+    ("group", "outcome"))
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Grupo de cálculos coalescidos por clave, seguro entre hilos"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    @staticmethod
+    def _normalize(key: Any) -> Hashable:
+        try:
+            hash(key)
+            return key
+        except TypeError:
+            # Claves con diccionarios o listas (parámetros de un plan): su JSON ordenado
+            return json.dumps(key, sort_keys=True, default=str)
+
+    def do(self, key: Any, func: Callable[..., T], *args, **kwargs) -> T:
+        """Ejecuta func(*args, **kwargs) o espera el resultado de la ejecución en curso con la misma clave"""
+        key = self._normalize(key)
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                call.waiters += 1
+
+        if not leader:
+            SINGLEFLIGHT_CALLS.inc(group=self.name, outcome="shared")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLEFLIGHT_CALLS.inc(group=self.name, outcome="leader")
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+def scope_of(db) -> Tuple[str, Optional[int]]:
+    """Base y tienda de una sesión o conexión, para las claves"""
+    bind = db.get_bind() if hasattr(db, "get_bind") else db
+    info = getattr(db, "info", {}) or {}
+    return str(bind.engine.url), info.get(STORE_INFO_KEY)
+
+
+# Grupos compartidos por la API y Streamlit
+forecasts = SingleFlight("forecasts")
+aggregates = SingleFlight("aggregates")
+ai_calls = SingleFlight("ai")
@@ -0,0 +1,145 @@
+"""
+Riesgo de quiebre de stock por simulación de Monte Carlo para todo el catálogo.
+
+La alerta de demanda compara un pronóstico puntual con el stock; aquí se
+simula la demanda del plazo de entrega muchas veces por producto y se cuenta
+en cuántos caminos supera al stock disponible (stock - comprometido en órdenes):
+
+- Distribución empírica: la demanda de cada uno de los history_days días
+  completos anteriores a hoy, leída de sales_daily (ver sales_rollup.py), con
+  los días sin ventas como cero. Cada día simulado toma un día de la historia
+  al azar (bootstrap), así se conservan los días sin ventas y los picos sin
+  suponer una distribución.
+- Vectorizado sobre productos × caminos: en cada día del plazo se sortea un
+  índice por celda y se suma la demanda de ese día. Los productos se procesan
+  por bloques de a lo sumo STOCKOUT_CHUNK_CELLS celdas (productos × caminos)
+  para acotar la memoria, sin importar el tamaño del catálogo.
+- Los productos sin ventas, y los que ni vendiendo su peor día durante todo el
+  plazo se quedarían sin stock, no se simulan: su riesgo es cero.
+
+Resultado por producto: probabilidad de quiebre en el plazo, ventas perdidas
+esperadas (E[max(demanda - stock, 0)]) en unidades y en dinero, y demanda
+esperada del plazo.
+"""
+
+import os
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from . import sales_rollup
+
+# Productos × caminos simulados a la vez; cada celda ocupa unos 14 bytes (índice, día sorteado, acumulado)
+CHUNK_CELLS = int(os.getenv("STOCKOUT_CHUNK_CELLS", "8000000"))
+# Los índices sorteados son int16: la mitad de memoria y tiempo que int32
+MAX_HISTORY_DAYS = 3650
+# La simulación recorre el plazo día por día: un plazo sin tope la deja corriendo indefinidamente
+MAX_LEAD_TIME_DAYS = 365
+
+RISK_COLUMNS = [
+    "product_id", "product_name", "supplier", "current_stock", "committed_in_orders", "lead_time_days",
+    "expected_demand", "stockout_probability", "expected_lost_units", "expected_lost_revenue",
+]
+
+
+def load_history(db: Session, product_ids: np.ndarray, history_days: int, only_these: bool = False) -> np.ndarray:
+    """Matriz productos × días con las unidades vendidas en los history_days días completos anteriores a hoy"""
+    today = sales_rollup.today()
+    # Con pocos productos se leen solo los suyos; con el catálogo completo, la ventana entera
+    daily = sales_rollup.load_daily(db, today - history_days, today - 1, product_ids.tolist() if only_these else None)
+    history = np.zeros((len(product_ids), history_days), dtype=np.float32)
+    rows, known = sales_rollup.catalog_rows(product_ids, daily["product_id"])
+    history[rows, daily["day"][known] - (today - history_days)] = daily["units"][known]
+    return history
+
+
+def simulate(history: np.ndarray, available: np.ndarray, lead_times: np.ndarray, paths: int = 5000,
+             seed: Optional[int] = None, chunk_cells: int = CHUNK_CELLS) -> Dict[str, np.ndarray]:
+    """Probabilidad de quiebre y unidades perdidas esperadas por producto, por bootstrap de la historia diaria"""
+    n, days = history.shape
+    probability = np.zeros(n)
+    lost = np.zeros(n)
+    lead_times = np.maximum(np.asarray(lead_times, dtype=np.int64), 0)
+    if n == 0 or days == 0 or paths <= 0:
+        return {"stockout_probability": probability, "expected_lost_units": lost}
+
+    # Solo los que podrían quedarse sin stock: el peor día repetido todo el plazo supera lo disponible
+    worst = history.max(axis=1) * lead_times
+    at_risk = np.flatnonzero((worst > available) & (lead_times > 0))
+    rng = np.random.default_rng(seed)
+    block = max(1, chunk_cells // paths)
+    for start in range(0, len(at_risk), block):
+        rows = at_risk[start:start + block]
+        sample = history[rows]
+        lead = lead_times[rows]
+        demand = np.zeros((len(rows), paths), dtype=np.float32)
+        for day in range(int(lead.max())):
+            # Un día de la historia por producto y camino; los productos con plazo más corto ya terminaron
+            picks = rng.integers(0, days, size=(len(rows), paths), dtype=np.int16)
+            drawn = np.take_along_axis(sample, picks, axis=1)
+            if day >= lead.min():
+                drawn *= (day < lead)[:, None]
+            demand += drawn
+        shortfall = demand - available[rows, None]
+        probability[rows] = (shortfall > 0).mean(axis=1)
+        lost[rows] = np.maximum(shortfall, 0).mean(axis=1)
+    return {"stockout_probability": probability, "expected_lost_units": lost}
+
+
+def risk_table(products: pd.DataFrame, history: np.ndarray, lead_time_days: float = 7,
+               supplier_lead_times: Optional[Dict[str, float]] = None, paths: int = 5000,
+               seed: Optional[int] = None) -> pd.DataFrame:
+    """Una fila por producto con su riesgo de quiebre en el plazo de entrega"""
+    lead_time = np.full(len(products), float(lead_time_days))
+    if supplier_lead_times:
+        lead_time = products["supplier"].map(supplier_lead_times).fillna(lead_time_days).to_numpy(dtype=float)
+    # Días enteros de demanda simulada
+    lead_days = np.ceil(lead_time).astype(np.int64)
+    available = (products["current_stock"] - products["committed_in_orders"]).to_numpy(dtype=np.float32)
+
+    result = simulate(history, available, lead_days, paths, seed)
+    expected_demand = history.mean(axis=1) * lead_days if history.shape[1] else np.zeros(len(products))
+    return products.assign(
+        lead_time_days=lead_days,
+        expected_demand=np.round(expected_demand, 2),
+        stockout_probability=np.round(result["stockout_probability"], 4),
+        expected_lost_units=np.round(result["expected_lost_units"], 2),
+        expected_lost_revenue=np.round(result["expected_lost_units"] * products["price"].to_numpy(), 2),
+    )[RISK_COLUMNS]
+
+
+def build_risk(db: Session, history_days: int = 90, lead_time_days: float = 7,
+               supplier_lead_times: Optional[Dict[str, float]] = None, paths: int = 5000,
+               seed: Optional[int] = 42, min_probability: float = 0.0, limit: Optional[int] = 100,
+               product_ids: Optional[Iterable[int]] = None) -> Dict:
+    """Productos con probabilidad de quiebre >= min_probability, los más riesgosos primero"""
+    # Import diferido: schemas toma los límites de este módulo y reorder importa queries, que importa schemas
+    from . import reorder
+
+    products = reorder.load_products(db, product_ids)
+    history = load_history(db, products["product_id"].to_numpy(dtype=np.int64), history_days, product_ids is not None)
+    table = risk_table(products, history, lead_time_days, supplier_lead_times, paths, seed)
+    at_risk = table[table["stockout_probability"] > 0]
+    selected = table[table["stockout_probability"] >= min_probability] if min_probability > 0 else at_risk
+    selected = selected.sort_values(["stockout_probability", "expected_lost_revenue"], ascending=False, kind="stable")
+    if limit is not None:
+        selected = selected.head(limit)
+    return {
+        "generated_at": datetime.utcnow(),
+        "paths": paths,
+        "history_days": history_days,
+        "products": len(table),
+        "products_at_risk": len(at_risk),
+        "expected_lost_units": float(table["expected_lost_units"].sum()),
+        "expected_lost_revenue": float(table["expected_lost_revenue"].sum()),
+        "risks": selected.to_dict(orient="records"),
+    }
+
+
+def risk_by_product(db: Session, product_ids: Iterable[int], **params) -> Dict[int, Dict]:
+    """Riesgo de unos pocos productos (por ejemplo, los que tienen alerta de demanda)"""
+    result = build_risk(db, product_ids=list(product_ids), limit=None, **params)
+    return {row["product_id"]: row for row in result["risks"]}
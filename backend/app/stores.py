@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, status
+from sqlalchemy.exc import IntegrityError
+from typing import List
+from . import queries, schemas, singleflight, tenancy
+
+router = APIRouter(prefix="/stores", tags=["stores"])
+
+@router.get("/", response_model=List[schemas.Store])
+def read_stores():
+    return tenancy.list_stores()
+
+@router.post("/", response_model=schemas.Store, status_code=status.HTTP_201_CREATED)
+def create_store(store: schemas.StoreCreate):
+    try:
+        return tenancy.create_store(store.name)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail="Ya existe una tienda con ese nombre")
+
+@router.get("/summary", response_model=List[schemas.StoreSummary])
+def read_stores_summary(days: int = 30):
+    # Una consulta por tienda, en paralelo: con bases separadas ninguna espera a otra
+    stores = {store["id"]: store["name"] for store in tenancy.list_stores()}
+    results = singleflight.aggregates.do(
+        ("stores_summary", days, tuple(stores)),
+        tenancy.for_each_store, lambda db: queries.store_summary(db, days), stores, read_only=True,
+    )
+    return [{"store_id": store_id, "store_name": stores[store_id], **summary} for store_id, summary in results.items()]
@@ -0,0 +1,688 @@
+"""
+Modo nodo: una tienda sigue vendiendo con su propia base SQLite mientras no
+hay conexión y se sincroniza con una instancia central cuando vuelve.
+
+- Registro de cambios: con SYNC_ENABLED=1 (en la central y en los nodos) cada
+  flush ORM de productos y ventas agrega filas a sync_changes, en la misma
+  transacción. Cada fila lleva el nodo de origen y su número allí, así que
+  un lote reenviado no se aplica dos veces.
+- Identidad: productos y ventas tienen un sync_id global. Las filas anteriores
+  a la sincronización usan "id:<id>", válido cuando ambas bases parten de la
+  misma copia o de la misma semilla.
+- Identificador del nodo: lo crea la migración 0006_sync en cada base, así que
+  una copia de la central llega con el de la central. Al arrancar como nodo,
+  prepare_node anota hasta dónde llega el registro heredado y, si
+  SYNC_NODE_ID cambió, pasa al identificador nuevo los cambios propios aún no
+  enviados. En el primer contacto con la central el nodo compara
+  identificadores: si es una copia toma uno nuevo, le pasa los cambios hechos
+  desde el arranque y deja la historia heredada como ya enviada.
+- Conflictos:
+  - El stock viaja como delta y se suma en ambos lados: las ventas hechas sin
+    conexión en el nodo y en la central se acumulan; el stock puede quedar
+    negativo si se vendió de más.
+  - Los demás campos del producto llevan un contador de versión por fila;
+    gana la versión mayor y, a igualdad, el nodo de mayor identificador.
+  - Las ventas solo se insertan y los borrados de productos ganan.
+- Transferencia: el nodo empuja sus cambios (POST /sync/push) y trae los de los
+  demás (GET /sync/pull) en lotes de SYNC_BATCH_SIZE comprimidos con gzip.
+  Cada lote confirmado avanza un cursor guardado en sync_state; una
+  transferencia cortada se retoma desde el último lote confirmado. El costo
+  depende de los cambios pendientes, no del tamaño de la base: las lecturas
+  son rangos del registro y búsquedas por sync_id.
+- SyncWorker sincroniza cada SYNC_INTERVAL_SECONDS si hay SYNC_CENTRAL_URL;
+  sin conexión reintenta con espera creciente y la tienda sigue operando.
+
+Ejecutar una sincronización manual con: python -m app.sync
+"""
+
+import gzip
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import requests
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from sqlalchemy import delete, event, func, insert, inspect, select, update
+from sqlalchemy.orm import Session
+
+from . import database, inventory_ledger, models, tenancy
+from .metrics import REGISTRY
+from .responses import dumps
+from .tenancy import get_db, session_for
+
+logger = logging.getLogger(__name__)
+
+SYNC_ENABLED = os.getenv("SYNC_ENABLED", "0").lower() in ("1", "true", "yes")
+# Central con la que se sincroniza este nodo; sin ella la instancia solo atiende a otros nodos
+SYNC_CENTRAL_URL = (os.getenv("SYNC_CENTRAL_URL") or "").rstrip("/") or None
+# Tienda en la central y tienda local que se sincronizan
+SYNC_STORE_ID = int(os.getenv("SYNC_STORE_ID", str(database.DEFAULT_STORE_ID)))
+SYNC_LOCAL_STORE_ID = int(os.getenv("SYNC_LOCAL_STORE_ID", str(database.DEFAULT_STORE_ID)))
+SYNC_INTERVAL_SECONDS = float(os.getenv("SYNC_INTERVAL_SECONDS", "30"))
+SYNC_MAX_BACKOFF_SECONDS = float(os.getenv("SYNC_MAX_BACKOFF_SECONDS", "600"))
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "500"))
+SYNC_TIMEOUT_SECONDS = float(os.getenv("SYNC_TIMEOUT_SECONDS", "30"))
+# Secreto compartido opcional: si está definido, /sync/push y /sync/pull lo exigen en X-Sync-Token
+SYNC_TOKEN = os.getenv("SYNC_TOKEN")
+SYNC_NODE_ID = os.getenv("SYNC_NODE_ID")
+
+# Campos del producto versionados; el stock se sincroniza aparte como delta
+PRODUCT_FIELDS = ("name", "description", "price", "min_stock", "category", "supplier")
+
+SYNC_CHANGES = REGISTRY.counter(
+    "papeleria_sync_changes_total", "Cambios sincronizados", ("direction",))
+SYNC_BYTES = REGISTRY.counter(
+    "papeleria_sync_bytes_total", "Bytes comprimidos transferidos por la sincronización", ("direction",))
+SYNC_ERRORS = REGISTRY.counter(
+    "papeleria_sync_errors_total", "Sincronizaciones fallidas (sin conexión o rechazadas)")
+
+changes_table = models.SyncChange.__table__
+state_table = models.SyncState.__table__
+products_table = models.Product.__table__
+sales_table = models.Sale.__table__
+
+# Session.info: la sesión está aplicando cambios remotos y no debe registrarlos como propios
+_APPLYING_KEY = "papeleria_sync_applying"
+
+# sync_state ("since:<central>#<tienda>"): último id del registro antes del primer arranque como nodo
+# de esa central; si la base resulta ser una copia suya, lo anterior es historia heredada y no se envía
+NODE_SINCE_PREFIX = "since:"
+
+_node_ids: Dict[str, str] = {}
+
+
+class SyncIdentityError(Exception):
+    """El nodo no puede sincronizarse con su identificador (SYNC_NODE_ID igual al de la central)"""
+
+
+def legacy_key(row_id: int) -> str:
+    return f"id:{row_id}"
+
+
+def node_id(bind) -> str:
+    """Identificador de este nodo en la base de `bind` (creado por la migración 0006_sync)"""
+    if SYNC_NODE_ID:
+        return SYNC_NODE_ID
+    url = str(bind.engine.url)
+    if url not in _node_ids:
+        value = bind.execute(select(state_table.c.value).where(state_table.c.key == "node_id")).scalar()
+        if value is None:
+            raise RuntimeError("Base sin node_id: ejecute las migraciones (python -m app.migrations)")
+        _node_ids[url] = value
+    return _node_ids[url]
+
+
+def get_state(conn, key: str, default: Optional[str] = None) -> Optional[str]:
+    value = conn.execute(select(state_table.c.value).where(state_table.c.key == key)).scalar()
+    return default if value is None else value
+
+
+def set_state(conn, key: str, value: str):
+    if conn.execute(update(state_table).where(state_table.c.key == key).values(value=value)).rowcount == 0:
+        conn.execute(insert(state_table).values(key=key, value=value))
+
+
+def cursor_key(central_url: str, store_id: int) -> str:
+    return f"{central_url}#{store_id}"
+
+
+def _unsent_after(conn, central_url: str, central_store_id: int) -> int:
+    """Último id del registro ya enviado o heredado: lo propio posterior está pendiente"""
+    key = cursor_key(central_url, central_store_id)
+    return max(int(get_state(conn, NODE_SINCE_PREFIX + key, "0")), int(get_state(conn, "push:" + key, "0")))
+
+
+def _restamp(conn, store_id: int, old: str, new: str, after: int) -> int:
+    """Pasa al identificador `new` los cambios propios registrados con `old` después de `after`"""
+    return conn.execute(update(changes_table).where(
+        changes_table.c.store_id == store_id, changes_table.c.origin == old,
+        changes_table.c.origin_seq.is_(None), changes_table.c.id > after,
+    ).values(origin=new)).rowcount
+
+
+def prepare_node(engine=None, store_id: int = SYNC_LOCAL_STORE_ID, central_url: Optional[str] = SYNC_CENTRAL_URL,
+                 central_store_id: int = SYNC_STORE_ID) -> Optional[str]:
+    """
+    Deja lista la base de un nodo antes de registrar cambios (al arrancar).
+
+    Si la base aún no habló con la central anota el último id del registro:
+    si resulta ser una copia de la central, lo anterior es historia heredada
+    y nunca se empuja (check_identity lo decide en el primer contacto). Si
+    SYNC_NODE_ID difiere del identificador guardado, los cambios propios aún
+    no enviados pasan al nuevo. Devuelve el identificador del nodo.
+    """
+    if not (SYNC_ENABLED and central_url):
+        return None
+    engine = engine if engine is not None else tenancy.engine_for(store_id)
+    with engine.begin() as conn:
+        key = cursor_key(central_url, central_store_id)
+        # Solo una base que nunca habló con la central puede ser una copia suya
+        if get_state(conn, NODE_SINCE_PREFIX + key) is None and get_state(conn, "central:" + key) is None \
+                and get_state(conn, "push:" + key) is None:
+            last = conn.execute(select(func.coalesce(func.max(changes_table.c.id), 0))).scalar()
+            set_state(conn, NODE_SINCE_PREFIX + key, str(last))
+        stored = get_state(conn, "node_id")
+        if SYNC_NODE_ID and stored != SYNC_NODE_ID:
+            moved = _restamp(conn, store_id, stored, SYNC_NODE_ID,
+                             _unsent_after(conn, central_url, central_store_id))
+            set_state(conn, "node_id", SYNC_NODE_ID)
+            logger.info("Nodo %s ahora es %s: %d cambios pendientes pasan al nuevo identificador",
+                        stored, SYNC_NODE_ID, moved)
+    _node_ids.pop(str(engine.url), None)
+    with engine.connect() as conn:
+        return node_id(conn)
+
+
+# --- Registro de cambios locales -------------------------------------------
+
+def _changed_fields(obj) -> List[str]:
+    attrs = inspect(obj).attrs
+    return [field for field in PRODUCT_FIELDS if attrs[field].history.has_changes()]
+
+
+def _stock_delta(obj) -> int:
+    history = inspect(obj).attrs.stock.history
+    if not history.has_changes():
+        return 0
+    old = history.deleted[0] if history.deleted else 0
+    return (obj.stock or 0) - (old or 0)
+
+
+def _before_flush(session, flush_context, instances):
+    if session.info.get(_APPLYING_KEY):
+        return
+    origin = None
+    for obj in session.new:
+        if isinstance(obj, (models.Product, models.Sale)) and obj.sync_id is None:
+            obj.sync_id = uuid.uuid4().hex
+        if isinstance(obj, models.Product):
+            origin = origin or node_id(session.connection())
+            obj.version, obj.sync_origin = 1, origin
+    for obj in session.dirty:
+        if isinstance(obj, models.Product) and _changed_fields(obj):
+            origin = origin or node_id(session.connection())
+            obj.version, obj.sync_origin = (obj.version or 1) + 1, origin
+
+
+def _product_change(obj, op: str, created: bool = False) -> Optional[Dict[str, Any]]:
+    key = obj.sync_id or legacy_key(obj.id)
+    if op == "delete":
+        return {"entity": "product", "op": op, "key": key, "version": obj.version, "payload": "{}"}
+    fields = list(PRODUCT_FIELDS) if created else _changed_fields(obj)
+    delta = (obj.stock or 0) if created else _stock_delta(obj)
+    if not fields and not delta:
+        return None
+    payload = {"stock": obj.stock or 0, "stock_delta": delta}
+    if fields:
+        # La fila completa: el receptor la aplica entera si gana la versión
+        payload["fields"] = {field: getattr(obj, field) for field in PRODUCT_FIELDS}
+    return {"entity": "product", "op": op, "key": key, "version": obj.version, "payload": dumps(payload).decode()}
+
+
+def _after_flush(session, flush_context):
+    if session.info.get(_APPLYING_KEY):
+        return
+    changes, new_sales = [], []
+    for obj in session.new:
+        if isinstance(obj, models.Product):
+            changes.append((obj.store_id, _product_change(obj, "upsert", created=True)))
+        elif isinstance(obj, models.Sale):
+            new_sales.append(obj)
+    for obj in session.dirty:
+        if isinstance(obj, models.Product):
+            changes.append((obj.store_id, _product_change(obj, "upsert")))
+    for obj in session.deleted:
+        if isinstance(obj, models.Product):
+            changes.append((obj.store_id, _product_change(obj, "delete")))
+
+    conn = session.connection()
+    if new_sales:
+        product_ids = {sale.product_id for sale in new_sales if sale.product_id is not None}
+        product_keys = {
+            row_id: sync_id or legacy_key(row_id) for row_id, sync_id in conn.execute(
+                select(products_table.c.id, products_table.c.sync_id).where(products_table.c.id.in_(product_ids))
+            )
+        } if product_ids else {}
+        for sale in new_sales:
+            changes.append((sale.store_id, {"entity": "sale", "op": "insert", "key": sale.sync_id, "version": 1,
+                                            "payload": dumps({
+                                                "product_key": product_keys.get(sale.product_id),
+                                                "quantity": sale.quantity, "total_price": sale.total_price,
+                                                "sale_date": sale.sale_date, "customer_phone": sale.customer_phone,
+                                            }).decode()}))
+
+    rows = [dict(change, store_id=store_id, origin=node_id(conn), created_at=datetime.utcnow())
+            for store_id, change in changes if change is not None]
+    if rows:
+        conn.execute(insert(changes_table), rows)
+
+
+def install(session_factory):
+    """Registra en sync_changes los cambios de productos y ventas de session_factory (con SYNC_ENABLED)"""
+    if not SYNC_ENABLED or getattr(session_factory, "_papeleria_sync", False):
+        return session_factory
+    event.listen(session_factory, "before_flush", _before_flush)
+    event.listen(session_factory, "after_flush", _after_flush)
+    session_factory._papeleria_sync = True
+    return session_factory
+
+
+# --- Aplicar cambios remotos -------------------------------------------------
+
+def _load_products(db: Session, keys: List[str]) -> Dict[str, models.Product]:
+    products = {}
+    if keys:
+        for product in db.query(models.Product).filter(models.Product.sync_id.in_(keys)):
+            products[product.sync_id] = product
+    legacy_ids = [int(key[3:]) for key in keys if key.startswith("id:") and key not in products]
+    if legacy_ids:
+        for product in db.query(models.Product).filter(
+                models.Product.id.in_(legacy_ids), models.Product.sync_id.is_(None)):
+            products[legacy_key(product.id)] = product
+    return products
+
+
+def _apply_product(db: Session, products: Dict[str, models.Product], change: Dict[str, Any]):
+    key, payload = change["key"], json.loads(change["payload"])
+    product = products.get(key)
+    if change["op"] == "delete":
+        # Borrar gana sobre cambios concurrentes
+        if product is not None:
+            db.delete(product)
+            products.pop(key)
+        return
+    fields = payload.get("fields")
+    if product is None:
+        if fields is None:
+            # Delta de stock de un producto que aquí no existe (borrado localmente)
+            return
+        product = models.Product(sync_id=key, stock=payload["stock"], version=change["version"],
+                                 sync_origin=change["origin"], **fields)
+        inventory_ledger.note(db, inventory_ledger.SYNC, f"sync:{change['origin']}", product)
+        db.add(product)
+        products[key] = product
+        return
+    if fields is not None and (change["version"], change["origin"]) > (product.version or 1, product.sync_origin or ""):
+        for field, value in fields.items():
+            setattr(product, field, value)
+        product.version, product.sync_origin = change["version"], change["origin"]
+    if payload["stock_delta"]:
+        inventory_ledger.note(db, inventory_ledger.SYNC, f"sync:{change['origin']}", product)
+        product.stock = (product.stock or 0) + payload["stock_delta"]
+    product.last_updated = datetime.utcnow()
+
+
+def apply_changes(db: Session, changes: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Aplica en la tienda de `db` cambios de otros nodos y los agrega a su propio
+    registro (para reenviarlos a terceros). No confirma la transacción.
+    """
+    db.info[_APPLYING_KEY] = True
+    conn = db.connection()
+    store_id = db.info.get(database.STORE_INFO_KEY, database.DEFAULT_STORE_ID)
+
+    # Ya recibidos (en un lote anterior cortado antes de confirmar el cursor del otro lado)
+    seqs_by_origin = defaultdict(list)
+    for change in changes:
+        seqs_by_origin[change["origin"]].append(change["origin_seq"])
+    seen = set()
+    for origin, seqs in seqs_by_origin.items():
+        seen.update((origin, seq) for seq in conn.execute(select(changes_table.c.origin_seq).where(
+            changes_table.c.origin == origin, changes_table.c.origin_seq.in_(seqs))).scalars())
+    fresh = []
+    for change in changes:
+        if (change["origin"], change["origin_seq"]) not in seen:
+            seen.add((change["origin"], change["origin_seq"]))
+            fresh.append(change)
+
+    product_changes = [change for change in fresh if change["entity"] == "product"]
+    sale_changes = [change for change in fresh if change["entity"] == "sale"]
+    sale_payloads = [json.loads(change["payload"]) for change in sale_changes]
+    products = _load_products(db, list({change["key"] for change in product_changes} | {
+        payload["product_key"] for payload in sale_payloads if payload.get("product_key")}))
+    for change in product_changes:
+        _apply_product(db, products, change)
+    db.flush()
+
+    if sale_changes:
+        existing = set(conn.execute(select(sales_table.c.sync_id).where(
+            sales_table.c.sync_id.in_([change["key"] for change in sale_changes]))).scalars())
+        for change, payload in zip(sale_changes, sale_payloads):
+            if change["key"] in existing:
+                continue
+            product = products.get(payload.get("product_key"))
+            # El stock no se toca: la venta llega acompañada del delta de stock de su producto
+            db.add(models.Sale(
+                sync_id=change["key"], product_id=product.id if product is not None else None,
+                quantity=payload["quantity"], total_price=payload["total_price"],
+                sale_date=datetime.fromisoformat(payload["sale_date"]) if payload.get("sale_date") else None,
+                customer_phone=payload.get("customer_phone"),
+            ))
+        db.flush()
+
+    if fresh:
+        conn.execute(insert(changes_table), [{
+            "store_id": store_id, "origin": change["origin"], "origin_seq": change["origin_seq"],
+            "entity": change["entity"], "op": change["op"], "key": change["key"], "version": change["version"],
+            "payload": change["payload"], "created_at": datetime.utcnow(),
+        } for change in fresh])
+    SYNC_CHANGES.inc(len(fresh), direction="applied")
+    return {"received": len(changes), "applied": len(fresh), "duplicates": len(changes) - len(fresh)}
+
+
+def changes_since(conn, store_id: int, since: int, limit: int, origin: Optional[str] = None,
+                  exclude_origin: Optional[str] = None, upto: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Cambios del registro posteriores a `since`, en formato de transferencia (origin_seq siempre presente)"""
+    stmt = select(changes_table).where(changes_table.c.store_id == store_id, changes_table.c.id > since)
+    if upto is not None:
+        stmt = stmt.where(changes_table.c.id <= upto)
+    if origin is not None:
+        stmt = stmt.where(changes_table.c.origin == origin)
+    if exclude_origin is not None:
+        stmt = stmt.where(changes_table.c.origin != exclude_origin)
+    rows = conn.execute(stmt.order_by(changes_table.c.id).limit(limit)).mappings().all()
+    return [{
+        "seq": row["id"], "origin": row["origin"],
+        "origin_seq": row["origin_seq"] if row["origin_seq"] is not None else row["id"],
+        "entity": row["entity"], "op": row["op"], "key": row["key"], "version": row["version"],
+        "payload": row["payload"],
+    } for row in rows]
+
+
+# --- Transferencia -------------------------------------------------------------
+
+def encode(content: Any) -> bytes:
+    return gzip.compress(dumps(content), compresslevel=6)
+
+
+def decode(body: bytes, content_encoding: Optional[str]) -> Any:
+    if content_encoding == "gzip":
+        body = gzip.decompress(body)
+    return json.loads(body)
+
+
+class SyncClient:
+    """Sincroniza la tienda local con la central: empuja lo propio y trae lo ajeno, lote por lote"""
+
+    def __init__(self, central_url: str = SYNC_CENTRAL_URL, store_id: int = SYNC_STORE_ID,
+                 local_store_id: int = SYNC_LOCAL_STORE_ID, batch_size: int = SYNC_BATCH_SIZE):
+        self.central_url = central_url
+        self.store_id = store_id
+        self.local_store_id = local_store_id
+        self.batch_size = batch_size
+        self.http = requests.Session()
+        self.http.headers.update({"X-Store-ID": str(store_id)})
+        if SYNC_TOKEN:
+            self.http.headers["X-Sync-Token"] = SYNC_TOKEN
+        self._cursor_key = cursor_key(central_url, store_id)
+
+    def check_identity(self):
+        """
+        Primer contacto con la central: si este nodo tiene su identificador es
+        una copia de su base. Toma uno nuevo, le pasa los cambios hechos desde
+        el arranque y marca la historia heredada como enviada y recibida.
+        """
+        db = session_for(self.local_store_id)
+        try:
+            conn = db.connection()
+            if get_state(conn, "central:" + self._cursor_key) is not None:
+                return
+            response = self.http.get(f"{self.central_url}/sync/status", timeout=SYNC_TIMEOUT_SECONDS)
+            response.raise_for_status()
+            central = response.json()["node_id"]
+            me = node_id(conn)
+            if me == central:
+                if SYNC_NODE_ID:
+                    raise SyncIdentityError(f"SYNC_NODE_ID={SYNC_NODE_ID} es el identificador de la central")
+                fresh = uuid.uuid4().hex
+                since = int(get_state(conn, NODE_SINCE_PREFIX + self._cursor_key, "0"))
+                moved = _restamp(conn, self.local_store_id, me, fresh, _unsent_after(conn, self.central_url, self.store_id))
+                set_state(conn, "node_id", fresh)
+                # Lo heredado ya está en ambas bases (mismos ids): no se empuja ni se vuelve a traer
+                for direction in ("push:", "pull:"):
+                    set_state(conn, direction + self._cursor_key,
+                              str(max(since, int(get_state(conn, direction + self._cursor_key, "0")))))
+                logger.warning("La base es una copia de la central %s: nuevo identificador de nodo %s "
+                               "(%d cambios pendientes)", central, fresh, moved)
+            # Sin copia no hay historia heredada: todo lo propio sigue pendiente
+            conn.execute(delete(state_table).where(state_table.c.key == NODE_SINCE_PREFIX + self._cursor_key))
+            set_state(conn, "central:" + self._cursor_key, central)
+            db.commit()
+            _node_ids.pop(str(db.get_bind().url), None)
+        finally:
+            db.close()
+
+    def push(self) -> int:
+        """Envía los cambios propios pendientes; devuelve cuántos aceptó la central"""
+        sent = 0
+        while True:
+            db = session_for(self.local_store_id)
+            try:
+                conn = db.connection()
+                me = node_id(conn)
+                cursor = int(get_state(conn, "push:" + self._cursor_key, "0"))
+                batch = changes_since(conn, self.local_store_id, cursor, self.batch_size, origin=me)
+                db.rollback()
+                if not batch:
+                    return sent
+                body = encode({"node": me, "changes": batch})
+                response = self.http.post(f"{self.central_url}/sync/push", data=body, timeout=SYNC_TIMEOUT_SECONDS,
+                                          headers={"Content-Encoding": "gzip", "Content-Type": "application/json"})
+                response.raise_for_status()
+                SYNC_BYTES.inc(len(body), direction="push")
+                SYNC_CHANGES.inc(len(batch), direction="push")
+                # El cursor avanza solo con el lote confirmado por la central
+                set_state(db.connection(), "push:" + self._cursor_key, str(batch[-1]["seq"]))
+                db.commit()
+                sent += len(batch)
+                if len(batch) < self.batch_size:
+                    return sent
+            finally:
+                db.close()
+
+    def pull(self) -> int:
+        """Trae y aplica los cambios de los demás nodos; devuelve cuántos se aplicaron"""
+        applied = 0
+        while True:
+            db = session_for(self.local_store_id)
+            try:
+                conn = db.connection()
+                me = node_id(conn)
+                cursor = int(get_state(conn, "pull:" + self._cursor_key, "0"))
+                response = self.http.get(f"{self.central_url}/sync/pull", timeout=SYNC_TIMEOUT_SECONDS, params={
+                    "since": cursor, "limit": self.batch_size, "node": me,
+                })
+                response.raise_for_status()
+                SYNC_BYTES.inc(len(response.content), direction="pull")
+                data = response.json()
+                if data["changes"]:
+                    applied += apply_changes(db, data["changes"])["applied"]
+                    SYNC_CHANGES.inc(len(data["changes"]), direction="pull")
+                # Cambios y cursor en la misma transacción: un corte no pierde ni repite lotes
+                set_state(db.connection(), "pull:" + self._cursor_key, str(data["last_seq"]))
+                db.commit()
+                if not data["more"]:
+                    return applied
+            finally:
+                db.close()
+
+    def sync(self) -> Dict[str, Any]:
+        start = time.perf_counter()
+        self.check_identity()
+        pushed = self.push()
+        pulled = self.pull()
+        return {"pushed": pushed, "pulled": pulled, "seconds": round(time.perf_counter() - start, 3)}
+
+
+def central_error(exc: requests.HTTPError) -> str:
+    """Estado y detalle de una respuesta de error de la central"""
+    response = exc.response
+    try:
+        detail = response.json().get("detail")
+    except ValueError:
+        detail = response.text[:200]
+    return f"La central respondió {response.status_code}: {detail}"
+
+
+class SyncWorker:
+    """Hilo de fondo que sincroniza cada `interval` segundos; sin conexión espera el doble hasta el máximo"""
+
+    def __init__(self, client: SyncClient, interval: float = SYNC_INTERVAL_SECONDS):
+        self.client = client
+        self.interval = interval
+        self.last_sync: Optional[Dict[str, Any]] = None
+        self.last_error: Optional[str] = None
+        self.last_success_at: Optional[datetime] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sync", daemon=True)
+        self._thread.start()
+
+    def run_once(self) -> Dict[str, Any]:
+        # Un solo ciclo a la vez (hilo de fondo o POST /sync/run)
+        with self._lock:
+            try:
+                self.last_sync = self.client.sync()
+            except Exception as exc:
+                SYNC_ERRORS.inc()
+                message = central_error(exc) if isinstance(exc, requests.HTTPError) else str(exc)
+                self.last_error = f"{datetime.utcnow().isoformat()} {message}"
+                raise
+            self.last_error = None
+            self.last_success_at = datetime.utcnow()
+            return self.last_sync
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.wait(delay):
+            try:
+                self.run_once()
+                delay = self.interval
+            except (requests.ConnectionError, requests.Timeout):
+                # Sin conexión: la tienda sigue trabajando con la base local
+                delay = min(delay * 2, SYNC_MAX_BACKOFF_SECONDS)
+                logger.info("Central no disponible; próximo intento en %.0f s", delay)
+            except requests.HTTPError as exc:
+                # La central respondió con error (token, identificador, fallo interno): se reintenta igual
+                delay = min(delay * 2, SYNC_MAX_BACKOFF_SECONDS)
+                logger.warning("%s; próximo intento en %.0f s", central_error(exc), delay)
+            except Exception:
+                delay = min(delay * 2, SYNC_MAX_BACKOFF_SECONDS)
+                logger.exception("No se pudo sincronizar con %s", self.client.central_url)
+
+    def close(self):
+        self._stop.set()
+
+
+_worker: Optional[SyncWorker] = None
+
+
+def start_worker() -> Optional[SyncWorker]:
+    """Arranca la sincronización de fondo si este proceso es un nodo (SYNC_ENABLED y SYNC_CENTRAL_URL)"""
+    global _worker
+    if _worker is None and SYNC_ENABLED and SYNC_CENTRAL_URL and SYNC_INTERVAL_SECONDS > 0:
+        _worker = SyncWorker(SyncClient())
+    return _worker
+
+
+# --- Endpoints -------------------------------------------------------------------
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+
+def _check_token(x_sync_token: Optional[str] = Header(None)):
+    if not SYNC_ENABLED:
+        raise HTTPException(status_code=404, detail="Sincronización desactivada (SYNC_ENABLED)")
+    if SYNC_TOKEN and x_sync_token != SYNC_TOKEN:
+        raise HTTPException(status_code=401, detail="Token de sincronización no válido")
+
+
+@router.post("/push", dependencies=[Depends(_check_token)])
+async def push_changes(request: Request, db: Session = Depends(get_db)):
+    """Recibe un lote comprimido de cambios de un nodo y lo aplica en la tienda del encabezado X-Store-ID"""
+    body = await request.body()
+    data = decode(body, request.headers.get("content-encoding"))
+    if data.get("node") == node_id(db.connection()):
+        raise HTTPException(status_code=400, detail="El nodo tiene el mismo identificador que esta instancia")
+    result = apply_changes(db, data.get("changes", []))
+    db.commit()
+    SYNC_BYTES.inc(len(body), direction="received")
+    return result
+
+
+@router.get("/pull", dependencies=[Depends(_check_token)])
+def pull_changes(since: int = 0, limit: int = SYNC_BATCH_SIZE, node: Optional[str] = None,
+                 db: Session = Depends(get_db)):
+    """Cambios de la tienda posteriores a `since`, sin los del propio nodo que pregunta; respuesta con gzip"""
+    limit = max(1, min(limit, 5000))
+    store_id = db.info[database.STORE_INFO_KEY]
+    conn = db.connection()
+    # Tope fijado antes de leer: lo confirmado después queda para la próxima consulta
+    upto = conn.execute(select(func.coalesce(func.max(changes_table.c.id), 0)).where(
+        changes_table.c.store_id == store_id)).scalar()
+    batch = changes_since(conn, store_id, since, limit, exclude_origin=node, upto=upto)
+    more = len(batch) == limit
+    # Sin más lotes el cursor salta hasta el tope: lo que falta son cambios del propio nodo
+    last_seq = batch[-1]["seq"] if more else max(upto, since)
+    body = encode({"changes": batch, "last_seq": last_seq, "more": more})
+    SYNC_BYTES.inc(len(body), direction="sent")
+    return Response(content=body, media_type="application/json", headers={"Content-Encoding": "gzip"})
+
+
+@router.get("/status")
+def sync_status(db: Session = Depends(get_db)):
+    conn = db.connection()
+    store_id = db.info[database.STORE_INFO_KEY]
+    status = {"enabled": SYNC_ENABLED, "node_id": node_id(conn), "central_url": SYNC_CENTRAL_URL,
+              "log_size": conn.execute(select(func.count()).select_from(changes_table).where(
+                  changes_table.c.store_id == store_id)).scalar()}
+    if SYNC_CENTRAL_URL:
+        key = cursor_key(SYNC_CENTRAL_URL, SYNC_STORE_ID)
+        status.update({
+            "push_cursor": int(get_state(conn, "push:" + key, "0")),
+            "pull_cursor": int(get_state(conn, "pull:" + key, "0")),
+            # La historia heredada de una copia de la central no cuenta como pendiente
+            "pending_changes": conn.execute(select(func.count()).select_from(changes_table).where(
+                changes_table.c.store_id == SYNC_LOCAL_STORE_ID, changes_table.c.origin == node_id(conn),
+                changes_table.c.origin_seq.is_(None),
+                changes_table.c.id > _unsent_after(conn, SYNC_CENTRAL_URL, SYNC_STORE_ID))).scalar(),
+        })
+    if _worker is not None:
+        status.update({"last_sync": _worker.last_sync, "last_success_at": _worker.last_success_at,
+                       "last_error": _worker.last_error})
+    return status
+
+
+@router.post("/run")
+def run_sync():
+    """Sincroniza ahora con la central (solo en un nodo)"""
+    if not (SYNC_ENABLED and SYNC_CENTRAL_URL):
+        raise HTTPException(status_code=400, detail="Esta instancia no es un nodo (SYNC_ENABLED y SYNC_CENTRAL_URL)")
+    try:
+        if _worker is not None:
+            return _worker.run_once()
+        return SyncClient().sync()
+    except (requests.ConnectionError, requests.Timeout):
+        raise HTTPException(status_code=503, detail="Central no disponible; los cambios siguen pendientes")
+    except requests.HTTPError as exc:
+        raise HTTPException(status_code=502, detail=f"{central_error(exc)}; los cambios siguen pendientes")
+    except SyncIdentityError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+if __name__ == "__main__":
+    from .migrations import run_migrations
+
+    run_migrations()
+    if not (SYNC_ENABLED and SYNC_CENTRAL_URL):
+        raise SystemExit("Defina SYNC_ENABLED=1 y SYNC_CENTRAL_URL para sincronizar este nodo")
+    prepare_node()
+    install(database.SessionLocal)
+    inventory_ledger.install(database.SessionLocal)
+    print(SyncClient().sync())
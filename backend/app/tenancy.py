@@ -0,0 +1,243 @@
+"""
+Multitienda: varias papelerías servidas por la misma aplicación.
+
+Productos, ventas, clientes y órdenes llevan store_id. Cada petición trabaja
+sobre una tienda (encabezado X-Store-ID; la tienda por defecto si falta):
+
+- get_db abre una sesión de la tienda. Una vez instalado (install), los SELECT
+  que pasan por esa sesión se filtran solos por store_id: las consultas ORM en
+  todas sus apariciones (with_loader_criteria) y las sentencias Core en las
+  tablas de su FROM de primer nivel. Las subconsultas Core no se filtran; en
+  este código solo seleccionan ids de producto, que ya pertenecen a una tienda.
+  Los registros nuevos reciben el store_id de la sesión al hacer flush.
+- Con STORE_DATABASE_URL (plantilla con {store_id}, p. ej.
+  sqlite:///./stores/store_{store_id}.db) cada tienda distinta de la principal
+  tiene su propio archivo y su propio pool de conexiones: SQLite bloquea las
+  escrituras por archivo, así que una tienda ocupada no frena las ventas de
+  otra. La tienda principal y el catálogo de tiendas siguen en DATABASE_URL.
+- get_read_db abre la sesión de lectura analítica de la tienda (réplica o
+  copia periódica, ver replicas.py).
+- heavy_job limita los trabajos pesados (pronósticos, planes de compra) a
+  STORE_HEAVY_JOBS simultáneos por tienda, para que una sola tienda no ocupe
+  todos los hilos del servidor.
+- for_each_store ejecuta una consulta en todas las tiendas en paralelo, un
+  hilo y una sesión por tienda, para los agregados entre tiendas.
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, TypeVar
+
+from fastapi import Header, HTTPException
+from sqlalchemy import Join, Select, Table, create_engine, event, insert, select
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import Session, with_loader_criteria
+
+from . import database, metrics, models, replicas
+from .migrations import run_migrations
+
+# Plantilla de URL por tienda; sin ella todas las tiendas comparten DATABASE_URL
+STORE_DATABASE_URL = os.getenv("STORE_DATABASE_URL")
+HEAVY_JOBS_PER_STORE = int(os.getenv("STORE_HEAVY_JOBS", "2"))
+STORE_PARALLELISM = int(os.getenv("STORE_PARALLELISM", "8"))
+
+TENANT_MODELS = (models.Product, models.Sale, models.Customer, models.Order, models.InventoryMovement,
+                 models.InventorySnapshot, models.Ticket, models.ProductAssociation, models.SalesDaily)
+TENANT_TABLES = tuple(model.__table__ for model in TENANT_MODELS)
+
+stores_table = models.Store.__table__
+
+T = TypeVar("T")
+
+_engines: Dict[int, Engine] = {}
+_engines_lock = threading.Lock()
+_known_stores: Set[int] = set()
+_heavy_slots: Dict[int, asyncio.Semaphore] = {}
+
+
+# --- Catálogo y bases por tienda ----------------------------------------
+
+def shard_url(store_id: int) -> Optional[str]:
+    """URL del archivo propio de la tienda, o None si usa la base principal"""
+    if not STORE_DATABASE_URL or store_id == database.DEFAULT_STORE_ID:
+        return None
+    return STORE_DATABASE_URL.format(store_id=store_id)
+
+
+def _create_shard_engine(url: str) -> Engine:
+    sqlite = url.startswith("sqlite")
+    if sqlite and make_url(url).database:
+        os.makedirs(os.path.dirname(os.path.abspath(make_url(url).database)), exist_ok=True)
+    engine = database.enable_wal(create_engine(url, connect_args={"check_same_thread": False} if sqlite else {}))
+    metrics.instrument_engine(engine)
+    run_migrations(engine)
+    return engine
+
+
+def engine_for(store_id: int) -> Engine:
+    """Engine de la tienda; la primera vez crea y migra su archivo"""
+    url = shard_url(store_id)
+    if url is None:
+        return database.engine
+    engine = _engines.get(store_id)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(store_id)
+            if engine is None:
+                engine = _engines[store_id] = _create_shard_engine(url)
+    return engine
+
+
+def list_stores() -> List[Dict[str, Any]]:
+    with database.engine.connect() as conn:
+        rows = conn.execute(select(stores_table).order_by(stores_table.c.id)).mappings().all()
+    return [dict(row) for row in rows]
+
+
+def store_exists(store_id: int) -> bool:
+    if store_id not in _known_stores:
+        # Otro proceso pudo crearla: se relee el catálogo antes de rechazarla
+        _known_stores.update(store["id"] for store in list_stores())
+    return store_id in _known_stores
+
+
+def store_engines() -> List[Engine]:
+    """Un engine por base distinta: la principal y los archivos propios de las tiendas"""
+    engines = {id(database.engine): database.engine}
+    for store in list_stores():
+        engine = engine_for(store["id"])
+        engines.setdefault(id(engine), engine)
+    return list(engines.values())
+
+
+def create_store(name: str) -> Dict[str, Any]:
+    """Registra la tienda en el catálogo y prepara su base si va en archivo propio"""
+    with database.engine.begin() as conn:
+        store_id = conn.execute(
+            insert(stores_table).values(name=name, created_at=datetime.utcnow())
+        ).inserted_primary_key[0]
+    engine_for(store_id)
+    _known_stores.add(store_id)
+    return next(store for store in list_stores() if store["id"] == store_id)
+
+
+def resolve_store(store_id: Optional[int]) -> int:
+    store_id = database.DEFAULT_STORE_ID if store_id is None else store_id
+    if not store_exists(store_id):
+        raise HTTPException(status_code=404, detail="Tienda no encontrada")
+    return store_id
+
+
+# --- Sesiones por tienda --------------------------------------------------
+
+def read_engine_for(store_id: int) -> Engine:
+    """Engine de lecturas analíticas de la tienda (réplica, copia SQLite o la base principal)"""
+    return replicas.read_engine(engine_for(store_id), store_id, own_database=shard_url(store_id) is not None)
+
+
+def session_for(store_id: int, read_only: bool = False) -> Session:
+    engine = read_engine_for(store_id) if read_only else engine_for(store_id)
+    return database.SessionLocal(bind=engine, info={database.STORE_INFO_KEY: store_id})
+
+
+def get_db(x_store_id: Optional[int] = Header(None)):
+    """Sesión de la tienda de la petición (encabezado X-Store-ID)"""
+    db = session_for(resolve_store(x_store_id))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_read_db(x_store_id: Optional[int] = Header(None)):
+    """Sesión de solo lectura para análisis; puede ir un intervalo atrasada (ver replicas.py)"""
+    db = session_for(resolve_store(x_store_id), read_only=True)
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+async def heavy_job(x_store_id: Optional[int] = Header(None)):
+    """
+    Dependencia de los endpoints pesados: como máximo HEAVY_JOBS_PER_STORE a la
+    vez por tienda. La espera ocurre en el event loop, antes de tomar un hilo.
+    """
+    store_id = resolve_store(x_store_id)
+    slot = _heavy_slots.get(store_id)
+    if slot is None:
+        slot = _heavy_slots.setdefault(store_id, asyncio.Semaphore(HEAVY_JOBS_PER_STORE))
+    async with slot:
+        yield
+
+
+def for_each_store(func: Callable[[Session], T], store_ids: Optional[Iterable[int]] = None,
+                   read_only: bool = False) -> Dict[int, T]:
+    """Ejecuta func con la sesión de cada tienda, en paralelo; devuelve {store_id: resultado}"""
+    ids = [store["id"] for store in list_stores()] if store_ids is None else list(store_ids)
+    if not ids:
+        return {}
+
+    def run(store_id: int) -> T:
+        db = session_for(store_id, read_only)
+        try:
+            return func(db)
+        finally:
+            db.close()
+
+    with ThreadPoolExecutor(max_workers=min(STORE_PARALLELISM, len(ids))) as pool:
+        return dict(zip(ids, pool.map(run, ids)))
+
+
+# --- Filtro por tienda ----------------------------------------------------
+
+def _tables(from_clause) -> Iterable[Table]:
+    if isinstance(from_clause, Join):
+        yield from _tables(from_clause.left)
+        yield from _tables(from_clause.right)
+    elif isinstance(from_clause, Table):
+        yield from_clause
+
+
+def scope_statement(stmt: Select, store_id: int) -> Select:
+    """Agrega store_id = :tienda por cada tabla de tienda del FROM de primer nivel"""
+    tables = [table for from_clause in stmt.get_final_froms() for table in _tables(from_clause)]
+    for table in TENANT_TABLES:
+        if table in tables:
+            stmt = stmt.where(table.c.store_id == store_id)
+    return stmt
+
+
+def _do_orm_execute(state):
+    store_id = state.session.info.get(database.STORE_INFO_KEY)
+    if store_id is None or not state.is_select or state.execution_options.get("all_stores", False):
+        return
+    if state.is_orm_statement:
+        state.statement = state.statement.options(*(
+            with_loader_criteria(model, model.store_id == store_id, include_aliases=True)
+            for model in TENANT_MODELS
+        ))
+    elif isinstance(state.statement, Select):
+        state.statement = scope_statement(state.statement, store_id)
+
+
+def _before_flush(session, flush_context, instances):
+    store_id = session.info.get(database.STORE_INFO_KEY)
+    if store_id is None:
+        return
+    for obj in session.new:
+        if isinstance(obj, TENANT_MODELS):
+            obj.store_id = store_id
+
+
+def install(session_factory):
+    """Filtra por tienda las sesiones de session_factory abiertas con session_for"""
+    if getattr(session_factory, "_papeleria_tenancy", False):
+        return session_factory
+    event.listen(session_factory, "do_orm_execute", _do_orm_execute)
+    event.listen(session_factory, "before_flush", _before_flush)
+    session_factory._papeleria_tenancy = True
+    return session_factory
@@ -0,0 +1,163 @@
+"""
+Reintentos y abuso en el webhook de WhatsApp.
+
+- Idempotencia: los proveedores reintentan el webhook si la respuesta tarda,
+  con el mismo identificador de mensaje (message_id, MessageSid o la cabecera
+  X-Message-ID). El primer envío se procesa y su respuesta se guarda; los
+  reintentos reciben la respuesta guardada sin volver a procesar (una venta no
+  se registra dos veces). Las respuestas se guardan en memoria (a lo sumo
+  WEBHOOK_DEDUPE_MAX, las más recientes) y en la tabla webhook_messages de la
+  base de la tienda, que cubre reinicios y varios procesos, durante
+  WEBHOOK_DEDUPE_TTL_SECONDS.
+  La fila del mensaje se agrega a la sesión antes de procesar y se confirma en
+  la misma transacción que la venta: si otro proceso confirmó primero el mismo
+  mensaje, la clave primaria lo rechaza y se responde lo que él guardó.
+- Ritmo por remitente: un balde de fichas por número (WEBHOOK_SENDER_RATE
+  mensajes por minuto, ráfagas de WEBHOOK_SENDER_BURST) para que un número
+  insistente no acapare al servidor. Los reintentos no gastan fichas.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Hashable, Mapping, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from . import models, singleflight
+from .ai_governor import TokenBucket
+from .database import STORE_INFO_KEY
+from .loyalty_engine import normalize_phone
+from .metrics import REGISTRY
+
+WEBHOOK_DEDUPE_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUPE_TTL_SECONDS", "86400"))
+WEBHOOK_DEDUPE_MAX = int(os.getenv("WEBHOOK_DEDUPE_MAX", "10000"))
+# 0 = sin límite por remitente
+WEBHOOK_SENDER_RATE = float(os.getenv("WEBHOOK_SENDER_RATE", "20"))
+WEBHOOK_SENDER_BURST = int(os.getenv("WEBHOOK_SENDER_BURST", "5"))
+# Remitentes con balde en memoria; los que llevan más tiempo sin escribir se olvidan
+WEBHOOK_SENDERS_MAX = 10000
+# Cada cuánto se borran de la tabla los mensajes vencidos
+PURGE_INTERVAL_SECONDS = 3600
+
+# Un reintento de un mensaje que se interrumpió antes de guardar su respuesta
+ALREADY_PROCESSED = "Tu mensaje ya fue recibido. ¿Necesitas algo más?"
+RATE_LIMITED = "Estás enviando muchos mensajes seguidos. Espera un momento y vuelve a escribir, por favor."
+
+WEBHOOK_MESSAGES = REGISTRY.counter(
+    "papeleria_webhook_messages_total", "Mensajes del webhook de WhatsApp procesados, repetidos o frenados por ritmo",
+    ("outcome",))
+
+
+class Duplicate(Exception):
+    pass
+
+
+def message_id_of(data: Mapping, headers: Mapping) -> Optional[str]:
+    """Identificador del mensaje en el proveedor; None si no viene (el mensaje se procesa sin deduplicar)"""
+    message_id = data.get("message_id") or data.get("MessageSid") or headers.get("x-message-id")
+    return str(message_id) if message_id else None
+
+
+class DedupeStore:
+    def __init__(self, ttl_seconds: int = WEBHOOK_DEDUPE_TTL_SECONDS, max_entries: int = WEBHOOK_DEDUPE_MAX):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._responses: "OrderedDict[Hashable, Tuple[str, float]]" = OrderedDict()
+        self._last_purge: Dict[str, float] = {}
+
+    @staticmethod
+    def _key(db: Session, message_id: str) -> Hashable:
+        return singleflight.scope_of(db)[0], message_id
+
+    def _remember(self, key: Hashable, response: str):
+        with self._lock:
+            self._responses[key] = (response, time.monotonic() + self.ttl_seconds)
+            self._responses.move_to_end(key)
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def replay(self, db: Session, message_id: str) -> Optional[str]:
+        """Respuesta guardada de un mensaje ya procesado, o None si es nuevo"""
+        key = self._key(db, message_id)
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is not None:
+                if cached[1] > time.monotonic():
+                    return cached[0]
+                del self._responses[key]
+        row = db.get(models.WebhookMessage, message_id)
+        if row is None or row.received_at < datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+            return None
+        response = row.response or ALREADY_PROCESSED
+        self._remember(key, response)
+        return response
+
+    def claim(self, db: Session, message_id: str, sender: Optional[str]) -> models.WebhookMessage:
+        """Agrega el mensaje a la sesión; se confirma junto con lo que haga el procesamiento.
+        Lanza Duplicate si otro proceso ya lo registró"""
+        existing = db.get(models.WebhookMessage, message_id)
+        if existing is not None:
+            if existing.received_at >= datetime.utcnow() - timedelta(seconds=self.ttl_seconds):
+                raise Duplicate(message_id)
+            # Un mensaje vencido que vuelve a llegar se procesa de nuevo
+            db.delete(existing)
+            db.flush()
+        row = models.WebhookMessage(message_id=message_id, store_id=db.info.get(STORE_INFO_KEY), sender=sender,
+                                    received_at=datetime.utcnow())
+        db.add(row)
+        return row
+
+    def complete(self, db: Session, row: models.WebhookMessage, response: str):
+        row.response = response
+        db.commit()
+        self._remember(self._key(db, row.message_id), response)
+        self._purge(db)
+
+    def _purge(self, db: Session):
+        scope = singleflight.scope_of(db)[0]
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_purge.get(scope, 0.0) < PURGE_INTERVAL_SECONDS:
+                return
+            self._last_purge[scope] = now
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        db.query(models.WebhookMessage).filter(models.WebhookMessage.received_at < cutoff).delete(
+            synchronize_session=False)
+        db.commit()
+
+
+class SenderLimiter:
+    """Un balde de fichas por remitente, con los remitentes más recientes en memoria"""
+
+    def __init__(self, per_minute: float = WEBHOOK_SENDER_RATE, burst: int = WEBHOOK_SENDER_BURST,
+                 max_senders: int = WEBHOOK_SENDERS_MAX):
+        self.rate = per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_senders = max_senders
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def allow(self, sender: Optional[str]) -> bool:
+        if self.rate <= 0:
+            return True
+        # Los mensajes sin remitente comparten un balde
+        key = normalize_phone(sender) or ""
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+                if len(self._buckets) > self.max_senders:
+                    self._buckets.popitem(last=False)
+            self._buckets.move_to_end(key)
+            if bucket.wait_time(time.monotonic()) > 0:
+                return False
+            bucket.take()
+            return True
+
+
+dedupe = DedupeStore()
+senders = SenderLimiter()
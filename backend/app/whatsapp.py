@@ -1,24 +1,49 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, schemas, database
+from . import models, schemas, database, basket_engine, loyalty_engine, singleflight, faq, webhook_guard
+from .tenancy import get_db
 from .prediction import predict_demand
 from datetime import datetime
 import json
+import re
 
 router = APIRouter()
 
 # Simulación de recepción de mensajes de WhatsApp
 @router.post("/whatsapp/webhook")
-async def whatsapp_webhook(request: Request, db: Session = Depends(database.SessionLocal)):
+async def whatsapp_webhook(request: Request, db: Session = Depends(get_db)):
     data = await request.json()
 
     # Simular mensaje de WhatsApp
     message = data.get("message", "")
     sender = data.get("sender", "")
 
+    # Reintento del proveedor: la misma respuesta, sin volver a procesar (ver webhook_guard.py)
+    message_id = webhook_guard.message_id_of(data, request.headers)
+    if message_id is not None:
+        replay = webhook_guard.dedupe.replay(db, message_id)
+        if replay is not None:
+            webhook_guard.WEBHOOK_MESSAGES.inc(outcome="duplicate")
+            return {"response": replay}
+
+    if not webhook_guard.senders.allow(sender):
+        webhook_guard.WEBHOOK_MESSAGES.inc(outcome="rate_limited")
+        return {"response": webhook_guard.RATE_LIMITED}
+
     # Procesar el mensaje (lógica básica)
-    response = process_message(message, sender, db)
+    try:
+        row = webhook_guard.dedupe.claim(db, message_id, sender) if message_id is not None else None
+        response = process_message(message, sender, db)
+        if row is not None:
+            webhook_guard.dedupe.complete(db, row, response)
+    except (IntegrityError, webhook_guard.Duplicate):
+        # Otro proceso confirmó antes el mismo mensaje: se descarta lo hecho aquí
+        db.rollback()
+        webhook_guard.WEBHOOK_MESSAGES.inc(outcome="duplicate")
+        return {"response": webhook_guard.dedupe.replay(db, message_id) or webhook_guard.ALREADY_PROCESSED}
 
+    webhook_guard.WEBHOOK_MESSAGES.inc(outcome="processed")
     return {"response": response}
 
 def process_message(message: str, sender: str, db: Session):
@@ -31,17 +56,59 @@ def process_message(message: str, sender: str, db: Session):
         return f"Productos disponibles: {', '.join(product_list)}"
     
     elif "venta" in message or "vendí" in message:
-        # Registrar venta (simplificado)
-        # Aquí se debería parsear el mensaje para extraer producto y cantidad
-        return "Venta registrada. ¿Necesitas algo más?"
+        # Registrar venta: "vendí 3 cuadernos y 2 lápices"; las líneas van en un ticket, el remitente
+        # queda como comprador y suma puntos de fidelización en la próxima corrida (ver loyalty_engine.py)
+        lines = []
+        for segment in re.split(r",| y ", message):
+            words = segment.split()
+            position = next((i for i, word in enumerate(words) if word.isdigit()), None)
+            if position is None:
+                continue
+            quantity = int(words[position])
+            product_name = " ".join(words[position + 1:])
+            if not quantity or not product_name:
+                continue
+            product = db.query(models.Product).filter(models.Product.name.ilike(f"%{product_name}%")).first()
+            if product is None:
+                return f"No encontré el producto '{product_name}'."
+            lines.append((product, quantity))
+        if not lines:
+            return "Indica cantidad y producto, por ejemplo: 'vendí 3 cuadernos'."
+        needed = {}
+        for product, quantity in lines:
+            needed[product] = needed.get(product, 0) + quantity
+        for product, quantity in needed.items():
+            if product.stock < quantity:
+                return f"Stock insuficiente: {product.name} tiene {product.stock} unidades."
+        # Sin teléfono válido ("web", "x") la venta queda sin comprador y no promete puntos
+        phone = loyalty_engine.normalize_phone(sender)
+        ticket = basket_engine.register_ticket(db, lines, "whatsapp", phone)
+        db.commit()
+        detail = ", ".join(f"{quantity} x {product.name}" for product, quantity in lines)
+        response = f"Venta registrada: {detail} por ${ticket.total_price:,.0f}."
+        points = loyalty_engine.points_for(ticket.total_price)
+        if phone and points:
+            response += f" Sumarás {points} puntos de fidelización."
+        # Sugerencia precalculada por la minería de canastas
+        in_ticket = {product.id for product, _ in lines}
+        suggestions = [related["name"] for related in basket_engine.related(db, lines[0][0].id)
+                       if related["related_product_id"] not in in_ticket and related["stock"] > 0][:3]
+        if suggestions:
+            response += f" Quienes compran {lines[0][0].name} también llevan: {', '.join(suggestions)}."
+        return response + " ¿Necesitas algo más?"
     
     elif "predicción" in message or "demanda" in message:
         # Obtener predicción para un producto (ejemplo)
         product = db.query(models.Product).first()
         if product:
-            prediction = predict_demand(product.id, db, 30)
+            prediction = singleflight.forecasts.do(("predict_demand", singleflight.scope_of(db), product.id, 30),
+                                                   predict_demand, product.id, db, 30)
             return f"Predicción para {product.name}: {prediction['predicted_demand']} unidades en 30 días."
         return "No hay productos para predecir."
     
     else:
+        # Horarios, ubicación, precios de impresión, fidelización...: respuesta del índice local
+        match = faq.lookup(message)
+        if match is not None:
+            return match.answer
         return "¡Hola! Soy PapelBot. ¿En qué puedo ayudarte? Puedo informarte sobre disponibilidad, registrar ventas o dar predicciones de demanda."
\ No newline at end of file
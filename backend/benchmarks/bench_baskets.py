@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la minería de canastas sobre líneas de tickets sintéticas
+Ejecutar desde backend/ con: python -m benchmarks.bench_baskets [--lines 5000000 --products 20000]
+
+Genera tickets como seed_data.py (2,5 líneas en promedio, popularidad sesgada y
+la mitad de las líneas acompañantes tomadas de los 3 ids siguientes al primer
+producto) y mide mine_pairs, la parte que no depende de la base. Con --db mide
+además basket_engine.run completo (lectura, minería y escritura) sobre una base
+generada con seed_data.py, y la lectura de los relacionados de un producto.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def synthetic_lines(count: int, products: int, basket_lines: float = 2.5, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    opens = rng.random(count) < 1 / basket_lines
+    opens[0] = True
+    ticket = np.cumsum(opens)
+    first = np.flatnonzero(opens)[ticket - 1]
+    popularity = 1 / np.arange(1, products + 1) ** 0.8
+    product = rng.choice(products, size=count, p=popularity / popularity.sum())
+    companion = ~opens & (rng.random(count) < 0.5)
+    product[companion] = (product[first[companion]] + rng.integers(1, 4, int(companion.sum()))) % products
+    return ticket, product + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--lines", type=int, default=5_000_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--db", help="Base SQLite generada con seed_data.py para medir la corrida completa")
+    args = parser.parse_args()
+
+    if args.db:
+        # Antes de importar la app: la corrida completa usa esta base
+        os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    from app import basket_engine
+
+    tickets, products = synthetic_lines(args.lines, args.products)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        rules = basket_engine.mine_pairs(tickets, products)
+        timings.append(time.perf_counter() - start)
+    covered = len(np.unique(rules["product_id"]))
+    print(f"{args.lines:,} líneas en {tickets[-1]:,} tickets, {args.products:,} productos")
+    print(f"mine_pairs: {min(timings):.2f} s (mejor de {args.repeat}), {args.lines / min(timings):,.0f} líneas/s")
+    print(f"Reglas: {len(rules['product_id']):,} para {covered:,} productos "
+          f"(BASKET_MIN_TICKETS={basket_engine.MIN_TICKETS}, BASKET_MIN_LIFT={basket_engine.MIN_LIFT})")
+
+    if args.db:
+        from app.database import SessionLocal
+
+        start = time.perf_counter()
+        stats = basket_engine.run(window_days=3650)
+        print(f"run sobre {args.db}: {time.perf_counter() - start:.2f} s, {stats}")
+        with SessionLocal() as db:
+            product_ids = np.random.default_rng(0).integers(1, args.products + 1, 1000)
+            start = time.perf_counter()
+            for product_id in product_ids:
+                basket_engine.related(db, int(product_id))
+            print(f"Relacionados de un producto: {(time.perf_counter() - start) / len(product_ids) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
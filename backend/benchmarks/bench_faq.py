@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Respuestas locales de preguntas frecuentes frente a la IA
+Ejecutar desde backend/ con: python -m benchmarks.bench_faq [--repeat 50 --llm-ms 1500]
+
+Pasa una mezcla de preguntas de clientes por AIAPIClient.answer con el
+proveedor simulado (AI_PROVIDER=stub, --llm-ms de latencia) y muestra qué parte
+se respondió con el índice local, el tiempo ahorrado y la latencia de cada
+camino (p50/p99; la búsqueda local se repite --repeat veces para medirla).
+Las preguntas llevan la respuesta esperada ('faq' o 'ai') para contar también
+los aciertos del umbral FAQ_MIN_SCORE.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+# (pregunta, camino esperado)
+QUESTIONS = (
+    ("¿A qué hora abren el sábado?", "faq"),
+    ("horario de atencion", "faq"),
+    ("donde estan ubicados", "faq"),
+    ("teléfono de la papelería", "faq"),
+    ("cuanto cuesta imprimir a color", "faq"),
+    ("¿Cuánto vale anillar un trabajo?", "faq"),
+    ("como acumulo puntos", "faq"),
+    ("¿cuántos puntos necesito para ser oro?", "faq"),
+    ("hacen fotocopias?", "faq"),
+    ("¿hacen domicilios?", "faq"),
+    ("venden memorias usb", "faq"),
+    ("cuando es la temporada alta", "faq"),
+    ("¿me cotizan la lista escolar de mi hija?", "faq"),
+    ("escribe un poema sobre cuadernos", "ai"),
+    ("qué regalo me recomiendas para mi jefe", "ai"),
+    ("me ayudas a redactar un correo para un proveedor", "ai"),
+    ("cuánto vendimos hoy comparado con ayer", "ai"),
+    ("qué le regalo a un niño de 5 años que empieza el colegio", "ai"),
+    # Preguntas de catálogo y de negocio: ni la especificación del README ni otra respuesta curada
+    ("cuál es el producto más vendido", "ai"),
+    ("precio del cuaderno", "ai"),
+    ("¿tienen cuadernos Norma grande?", "ai"),
+    ("qué margen tiene el anillado", "ai"),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=50, help="Repeticiones de la búsqueda local para medir su latencia")
+    parser.add_argument("--llm-ms", type=float, default=1500, help="Latencia simulada del proveedor de IA")
+    args = parser.parse_args()
+
+    # Antes de importar el cliente: proveedor simulado y sin límites de ritmo
+    os.environ["AI_PROVIDER"] = "stub"
+    os.environ["AI_STUB_LATENCY_MS"] = str(args.llm_ms)
+    os.environ["AI_RATE_LIMITS"] = ""
+    from app import faq
+    from app.ai_api import AIAPIClient
+
+    client = AIAPIClient()
+    start = time.perf_counter()
+    faq.get_index()
+    print(f"Índice: {len(faq.get_index().documents)} documentos en {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    latencies = {"faq": [], "ai": []}
+    wrong = []
+    # Primero las que van a la IA: así el ahorro se estima con su latencia observada
+    for question, expected in sorted(QUESTIONS, key=lambda item: item[1] != "ai"):
+        start = time.perf_counter()
+        _, source = client.answer(question, "")
+        path = "ai" if source == "ai" else "faq"
+        latencies[path].append(time.perf_counter() - start)
+        if path != expected:
+            wrong.append((question, expected, path))
+    stats = faq.stats()
+
+    # Más muestras de la búsqueda local, fuera de las estadísticas de desvío
+    for _ in range(args.repeat):
+        for question, expected in QUESTIONS:
+            if expected == "faq":
+                start = time.perf_counter()
+                faq.lookup(question)
+                latencies["faq"].append(time.perf_counter() - start)
+
+    for path, values in latencies.items():
+        if values:
+            values = np.array(values) * 1000
+            print(f"{path:>4}: {len(values):5d} respuestas  p50 {np.percentile(values, 50):9.3f} ms"
+                  f"  p99 {np.percentile(values, 99):9.3f} ms")
+    print(f"Resueltas localmente: {stats['deflection_rate']:.1%} de {stats['queries']} preguntas")
+    print(f"Latencia ahorrada: {stats['latency_saved_seconds']:.1f} s "
+          f"({stats['latency_saved_seconds'] / max(1, stats['answered_locally']) * 1000:.0f} ms por respuesta local)")
+    print(f"Umbral FAQ_MIN_SCORE={faq.FAQ_MIN_SCORE}: {len(QUESTIONS) - len(wrong)}/{len(QUESTIONS)} preguntas por el camino esperado")
+    for question, expected, path in wrong:
+        print(f"  {question!r}: esperado {expected}, fue {path}")
+
+
+if __name__ == "__main__":
+    main()
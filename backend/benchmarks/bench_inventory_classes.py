@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la clasificación ABC/XYZ y el stock muerto del catálogo completo, de la base a la respuesta
+Ejecutar desde backend/ con: python -m benchmarks.bench_inventory_classes [--products 5000 --sales 2000000]
+
+Genera (o reutiliza) con seed_data.py una base sintética en --db y mide cada
+parte de build_classification por separado (catálogo, agregados por producto
+y período de los días cerrados desde sales_daily, agregados con esos días ya
+en caché más las ventas de hoy, clasificación y resumen) y GET
+/inventory/classification completo, con filtros, página y serialización de
+la respuesta, con los días cerrados precalculados y sin ellos.
+"""
+
+import argparse
+import os
+import time
+
+
+def best_of(func, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=5_000)
+    parser.add_argument("--sales", type=int, default=2_000_000)
+    parser.add_argument("--history-days", type=int, default=730)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join("benchmarks", "data", "inventory_classes.db"))
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    # Antes de importar la app: todo corre sobre la base sintética
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from fastapi.testclient import TestClient
+
+    from app import database, inventory_analytics, sales_rollup
+    from app.main import app
+    from benchmarks.dataset import build_dataset
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    dataset = build_dataset(db_path, products=args.products, sales=args.sales, years=2)
+    print(f"{args.products:,} SKU, {args.sales:,} ventas, ventana de {args.history_days} días "
+          f"(base generada en {dataset['build_seconds']} s)")
+
+    days = args.history_days
+    today = sales_rollup.today()
+    with database.SessionLocal() as db:
+        catalog_seconds, catalog = best_of(lambda: inventory_analytics.load_catalog(db), args.repeat)
+        closed_seconds, _ = best_of(
+            lambda: inventory_analytics.closed_day_stats(db, today, today - days + 1, 7, 90), args.repeat)
+        stats_seconds, stats = best_of(lambda: inventory_analytics.load_sales_stats(db, days), args.repeat)
+
+        def classify():
+            rows = inventory_analytics.classify(catalog, stats, history_days=days)
+            return rows, inventory_analytics.summarize(rows)
+
+        classify_seconds, (rows, summary) = best_of(classify, args.repeat)
+        total_seconds, _ = best_of(lambda: inventory_analytics.build_classification(db, history_days=days),
+                                   args.repeat)
+
+    # Sin el arranque de la app (ni StatsWarmer) para que nada compita con las mediciones
+    client = TestClient(app)
+
+    def request():
+        response = client.get("/inventory/classification", params={"history_days": days, "limit": 5000})
+        response.raise_for_status()
+        return response
+
+    # Sin precálculo: la petición agrega los días cerrados; luego StatsWarmer los deja listos
+    inventory_analytics._closed_cache.clear()
+    cold_seconds, _ = best_of(request, 1)
+    warm_seconds, _ = best_of(lambda: inventory_analytics.warm(history_days=days), 1)
+    endpoint_seconds, response = best_of(request, args.repeat)
+
+    print(f"Catálogo:                          {catalog_seconds * 1000:7.1f} ms")
+    print(f"Días cerrados (sales_daily, SQL):  {closed_seconds * 1000:7.1f} ms")
+    print(f"Agregados con caché + hoy:         {stats_seconds * 1000:7.1f} ms ({len(stats):,} productos con ventas)")
+    print(f"Clasificación y resumen:           {classify_seconds * 1000:7.1f} ms")
+    print(f"build_classification:              {total_seconds * 1000:7.1f} ms")
+    print(f"Precálculo (StatsWarmer):          {warm_seconds * 1000:7.1f} ms en segundo plano")
+    print(f"GET /inventory/classification:     {endpoint_seconds * 1000:7.1f} ms "
+          f"({len(response.json()['products']):,} filas, mejor de {args.repeat}); "
+          f"sin precálculo {cold_seconds * 1000:.1f} ms")
+    print("ABC:", rows["abc"].value_counts().sort_index().to_dict(),
+          " XYZ:", rows["xyz"].value_counts().sort_index().to_dict())
+    print(f"Stock muerto: {summary['dead_stock_products']:,} productos, capital {summary['dead_stock_value']:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark de serialización de respuestas: JSONResponse estándar frente a FastJSONResponse
+Mide el camino completo de FastAPI para un endpoint con response_model: validación y dump
+del valor devuelto (serialize_response) y render del cuerpo con cada clase de respuesta.
+Ejecutar desde backend/ con: python -m benchmarks.bench_json_responses [--products 10000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+from app import schemas
+from app.responses import ORJSON_AVAILABLE, FastJSONResponse
+
+
+def build_payloads(count: int):
+    now = datetime.utcnow()
+    # Lo que devuelven los endpoints: diccionarios que FastAPI valida contra el response_model
+    products = [dict(
+        id=i,
+        name=f"Producto {i:05d}",
+        description="Artículo de papelería generado para el benchmark",
+        price=500 + (i % 200) * 250,
+        stock=i % 120,
+        min_stock=10,
+        category="Útiles Escolares",
+        supplier="Norma",
+        store_id=1,
+        last_updated=now,
+    ) for i in range(count)]
+    alerts = [dict(
+        product_id=i,
+        product_name=f"Producto {i:05d}",
+        current_stock=i % 20,
+        predicted_demand=25.5,
+        alert_type="Demanda alta prevista",
+        message="Se espera vender 25.5 unidades en los próximos 30 días.",
+    ) for i in range(count)]
+    return products, alerts
+
+
+def response_field(name: str, response_model):
+    """Campo de respuesta como el que arma APIRoute para response_model"""
+    return create_model_field(name=f"Response_{name}", type_=response_model, mode="serialization")
+
+
+def render(response_class, field, items) -> bytes:
+    """Camino de FastAPI para un endpoint síncrono: serialize_response y luego la clase de respuesta"""
+    content = asyncio.run(serialize_response(field=field, response_content=items, is_coroutine=False))
+    return response_class(content).body
+
+
+def standard_path(field, items) -> bytes:
+    """Lo que hacía FastAPI antes: JSONResponse (json.dumps) como clase por defecto"""
+    return render(JSONResponse, field, items)
+
+
+def fast_path(field, items) -> bytes:
+    """Clase de respuesta por defecto de la aplicación"""
+    return render(FastJSONResponse, field, items)
+
+
+def best_of(func, repeat: int, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    products, alerts = build_payloads(args.products)
+    cases = [
+        ("List[schemas.Product]", response_field("products", List[schemas.Product]), products),
+        ("List[schemas.DemandAlert]", response_field("alerts", List[schemas.DemandAlert]), alerts),
+    ]
+
+    print(f"Serialización de {args.products:,} elementos (orjson disponible: {ORJSON_AVAILABLE})")
+    for name, field, items in cases:
+        # Mismo documento con ambas clases
+        assert json.loads(standard_path(field, items)) == json.loads(fast_path(field, items))
+        before = best_of(standard_path, args.repeat, field, items)
+        after = best_of(fast_path, args.repeat, field, items)
+        print(f"{name:<26} estándar {before * 1000:8.1f} ms   rápida {after * 1000:8.1f} ms   "
+              f"{before / after:4.1f}x")
+
+
+if __name__ == "__main__":
+    main()
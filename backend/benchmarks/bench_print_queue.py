@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Simulación de la cola de impresión: espera en cola según la carga
+Ejecutar desde backend/ con: python -m benchmarks.bench_print_queue [--printers 40,40 --jobs 20000]
+
+Llegadas de Poisson con tasa ajustada para cada utilización objetivo
+(carga = llegadas × tiempo medio de servicio / impresoras), tamaños como los de
+seed_data.py (1 a 199 páginas) y un 10 % de trabajos urgentes. Cada impresora
+que se libera toma el primero de la cola según print_queue.queue_key, el mismo
+orden que usa la API; con --fifo se compara contra orden de llegada.
+"""
+
+import argparse
+import heapq
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import print_queue
+
+LOADS = (0.5, 0.7, 0.8, 0.9, 0.95, 0.99)
+EPOCH = datetime(2025, 1, 1)
+
+
+def synthetic_jobs(count: int, mean_service: float, printers: int, load: float, urgent_share: float,
+                   rng: np.random.Generator):
+    """(llegada en segundos, páginas, prioridad, fecha de entrega) por trabajo"""
+    rate = load * printers / mean_service
+    arrivals = np.cumsum(rng.exponential(1 / rate, count))
+    pages = rng.integers(1, 200, count)
+    priority = np.where(rng.random(count) < urgent_share, 0, 1)
+    # Urgente: entrega en 1,5 horas; normal: en 4 horas
+    due = arrivals + np.where(priority == 0, 1.5 * 3600, 4 * 3600)
+    return arrivals, pages, priority, due
+
+
+def simulate(arrivals, pages, priority, due, speeds, fifo: bool = False):
+    """Simulación de eventos discretos sin expulsión; devuelve la espera en cola y el fin de cada trabajo"""
+    count = len(arrivals)
+    wait = np.empty(count)
+    finish = np.empty(count)
+    free = [(0.0, printer_id) for printer_id in speeds]
+    heapq.heapify(free)
+    waiting = []
+    next_arrival = 0
+    for _ in range(count):
+        now = free[0][0]
+        if not waiting and arrivals[next_arrival] > now:
+            now = arrivals[next_arrival]
+        while next_arrival < count and arrivals[next_arrival] <= now:
+            i = next_arrival
+            key = (i,) if fifo else print_queue.queue_key(
+                int(priority[i]), EPOCH + timedelta(seconds=float(due[i])), int(pages[i]), i)
+            heapq.heappush(waiting, (key, i))
+            next_arrival += 1
+        _, job = heapq.heappop(waiting)
+        _, printer_id = heapq.heappop(free)
+        done = now + print_queue.job_seconds(int(pages[job]), speeds[printer_id])
+        heapq.heappush(free, (done, printer_id))
+        wait[job] = now - arrivals[job]
+        finish[job] = done
+    return wait, finish
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--printers", default=",".join(str(int(s)) for s in print_queue.PRINTER_SPEEDS),
+                        help="Páginas por minuto de cada impresora")
+    parser.add_argument("--jobs", type=int, default=20_000)
+    parser.add_argument("--urgent-share", type=float, default=0.1)
+    parser.add_argument("--fifo", action="store_true", help="Compara además contra atención por orden de llegada")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    speeds = print_queue.printers(tuple(float(s) for s in args.printers.split(",")))
+    mean_pages = 100
+    mean_service = np.mean([print_queue.job_seconds(mean_pages, speed) for speed in speeds.values()])
+    print(f"{len(speeds)} impresoras ({args.printers} ppm), {args.jobs:,} trabajos, "
+          f"servicio medio {mean_service / 60:.1f} min")
+    print(f"{'carga':>6} {'orden':>6} {'espera p50':>11} {'p95':>8} {'p99':>8} {'urg. p95':>9} {'tarde':>7} {'sim.':>7}")
+
+    for load in LOADS:
+        rng = np.random.default_rng(args.seed)
+        jobs = synthetic_jobs(args.jobs, mean_service, len(speeds), load, args.urgent_share, rng)
+        for fifo in ((False, True) if args.fifo else (False,)):
+            start = time.perf_counter()
+            wait, finish = simulate(*jobs, speeds, fifo=fifo)
+            elapsed = time.perf_counter() - start
+            minutes = wait / 60
+            urgent = jobs[2] == 0
+            late = np.mean(finish > jobs[3]) * 100
+            print(f"{load:>6.2f} {'fifo' if fifo else 'cola':>6} {np.percentile(minutes, 50):>9.1f} m "
+                  f"{np.percentile(minutes, 95):>6.1f} m {np.percentile(minutes, 99):>6.1f} m "
+                  f"{np.percentile(minutes[urgent], 95):>7.1f} m {late:>6.1f}% {elapsed:>6.2f}s")
+
+    # Costo de estimar la cola completa como lo hace GET /orders/print-queue
+    rng = np.random.default_rng(args.seed)
+    now = datetime.utcnow()
+    pending = sorted((
+        {"id": i, "priority": int(p), "pages": int(n), "due_date": now + timedelta(hours=float(h))}
+        for i, (p, n, h) in enumerate(zip(rng.integers(0, 2, 10_000), rng.integers(1, 200, 10_000),
+                                          rng.uniform(1, 48, 10_000)))
+    ), key=lambda job: print_queue.queue_key(job["priority"], job["due_date"], job["pages"], job["id"]))
+    start = time.perf_counter()
+    print_queue.schedule(pending, [], speeds, now)
+    print(f"schedule() de 10.000 pendientes: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark del listado de productos: ORM + Pydantic frente a Core + TypeAdapter
+Ejecutar desde backend/ con: python -m benchmarks.bench_product_listing [--products 10000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models, queries, schemas
+from app.database import Base
+
+
+def seed_products(engine, count: int):
+    rows = [{
+        "name": f"Producto {i:05d}",
+        "description": "Artículo de papelería generado para el benchmark",
+        "price": 500 + (i % 200) * 250,
+        "stock": i % 120,
+        "min_stock": 10,
+        "category": "Útiles Escolares" if i % 2 else "Papelería",
+        "supplier": "Norma" if i % 3 else "Maped",
+        "last_updated": datetime.utcnow(),
+    } for i in range(count)]
+    with engine.begin() as conn:
+        conn.execute(insert(models.Product.__table__), rows)
+
+
+orm_adapter = TypeAdapter(List[schemas.Product])
+
+
+def orm_listing(db, count: int) -> bytes:
+    """Ruta anterior: instancias ORM validadas y serializadas como lo hace FastAPI"""
+    products = db.query(models.Product).limit(count).all()
+    validated = orm_adapter.validate_python(products, from_attributes=True)
+    return json.dumps(orm_adapter.dump_python(validated, mode="json")).encode()
+
+
+def core_listing(db, count: int) -> bytes:
+    """Ruta nueva: tuplas Core serializadas directamente"""
+    return queries.dump_products(queries.list_products(db, limit=count))
+
+
+def measure(name: str, func, session_factory, count: int, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        db = session_factory()
+        try:
+            start = time.perf_counter()
+            payload = func(db, count)
+            timings.append(time.perf_counter() - start)
+        finally:
+            db.close()
+
+    # Asignaciones medidas en una pasada aparte para no distorsionar los tiempos
+    db = session_factory()
+    try:
+        tracemalloc.start()
+        func(db, count)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        db.close()
+
+    best = min(timings)
+    print(f"{name:<22} {best * 1000:9.1f} ms  {count / best:12,.0f} filas/s  "
+          f"pico {peak / 1024 / 1024:7.2f} MiB  {len(payload) / 1024:8.0f} KiB JSON")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        Base.metadata.create_all(bind=engine)
+        seed_products(engine, args.products)
+        session_factory = sessionmaker(bind=engine)
+
+        print(f"Listado de {args.products:,} productos (mejor de {args.repeat})")
+        before = measure("ORM + schemas.Product", orm_listing, session_factory, args.products, args.repeat)
+        after = measure("Core + TypeAdapter", core_listing, session_factory, args.products, args.repeat)
+        print(f"Aceleración: {before / after:.1f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
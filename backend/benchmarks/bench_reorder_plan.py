@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark del plan de reabastecimiento del catálogo completo, de la base a la respuesta
+Ejecutar desde backend/ con: python -m benchmarks.bench_reorder_plan [--products 10000 --sales 2000000]
+
+Genera (o reutiliza) con seed_data.py una base sintética en --db y mide cada
+parte de build_reorder_plan por separado (productos, estadísticas de demanda
+desde sales_daily, cálculo del plan) y POST /reorder-plan completo, con
+validación y serialización de la respuesta.
+"""
+
+import argparse
+import os
+import time
+
+
+def best_of(func, repeat: int):
+    timings, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--sales", type=int, default=2_000_000)
+    parser.add_argument("--history-days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join("benchmarks", "data", "reorder_plan.db"))
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    # Antes de importar la app: todo corre sobre la base sintética
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from fastapi.testclient import TestClient
+
+    from app import database, reorder
+    from app.main import app
+    from benchmarks.dataset import build_dataset
+
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    dataset = build_dataset(db_path, products=args.products, sales=args.sales, years=2)
+    print(f"{args.products:,} SKU, {args.sales:,} ventas, ventana de {args.history_days} días "
+          f"(base generada en {dataset['build_seconds']} s)")
+
+    params = dict(supplier_lead_times={"Kingston": 15}, min_order_value=200_000,
+                  supplier_min_order_values={"Panamericana": 1_000_000}, budget=50_000_000)
+    with database.SessionLocal() as db:
+        products_seconds, products = best_of(lambda: reorder.load_products(db), args.repeat)
+        stats_seconds, stats = best_of(lambda: reorder.load_demand_stats(db, args.history_days), args.repeat)
+
+        def plan():
+            lines = reorder.plan_quantities(products, stats, supplier_lead_times=params["supplier_lead_times"])
+            approved, deferred = reorder.apply_constraints(
+                lines, params["min_order_value"], params["supplier_min_order_values"], params["budget"])
+            return lines, approved, deferred, reorder.group_purchase_orders(approved, params["min_order_value"])
+
+        plan_seconds, (lines, approved, deferred, orders) = best_of(plan, args.repeat)
+        total_seconds, _ = best_of(
+            lambda: reorder.build_reorder_plan(db, history_days=args.history_days, **params), args.repeat)
+
+    with TestClient(app) as client:
+        body = dict(params, history_days=args.history_days)
+        endpoint_seconds, response = best_of(lambda: client.post("/reorder-plan", json=body), args.repeat)
+        response.raise_for_status()
+
+    print(f"Productos:               {products_seconds * 1000:7.1f} ms")
+    print(f"Demanda (sales_daily):   {stats_seconds * 1000:7.1f} ms ({len(stats):,} productos con ventas)")
+    print(f"Cálculo del plan:        {plan_seconds * 1000:7.1f} ms")
+    print(f"build_reorder_plan:      {total_seconds * 1000:7.1f} ms")
+    print(f"POST /reorder-plan:      {endpoint_seconds * 1000:7.1f} ms ({len(response.content) / 2 ** 20:.1f} MiB)")
+    print(f"Líneas: {len(lines):,} -> aprobadas {len(approved):,}, diferidas {len(deferred):,}, "
+          f"órdenes de compra {len(orders)} (mejor de {args.repeat})")
+
+
+if __name__ == "__main__":
+    main()
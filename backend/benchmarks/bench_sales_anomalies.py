@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark del detector de ventas atípicas sobre un flujo sintético de ventas
+Ejecutar desde backend/ con: python -m benchmarks.bench_sales_anomalies [--sales 1000000 --products 20000]
+
+Genera ventas normales (cantidades de Poisson con media propia por producto,
+popularidad sesgada, repartidas en --days días) e inyecta --typos ventas con
+la cantidad multiplicada por 100 después de la primera mitad del flujo. Mide
+el costo de DetectorState.observe por venta, la memoria del estado, cuántas
+ventas normales marca (falsos positivos) y cuántos errores detecta. Con --db
+mide además la recuperación del estado desde sales_daily de una base generada
+con seed_data.py.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+
+def synthetic_sales(count: int, products: int, days: int, typos: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, products + 1) ** 0.8
+    product = rng.choice(products, size=count, p=popularity / popularity.sum()) + 1
+    day = np.sort(rng.integers(0, days, count))
+    quantity = rng.poisson(rng.uniform(0.5, 4, products + 1)[product]) + 1
+    typo = np.zeros(count, dtype=bool)
+    typo[rng.choice(np.arange(count // 2, count), typos, replace=False)] = True
+    quantity[typo] *= 100
+    return product, quantity, day, typo
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sales", type=int, default=1_000_000)
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--typos", type=int, default=100)
+    parser.add_argument("--db", help="Base SQLite generada con seed_data.py para medir la recuperación del estado")
+    args = parser.parse_args()
+
+    if args.db:
+        # Antes de importar la app: la recuperación lee esta base
+        os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    from app import sales_anomalies
+
+    products, quantities, days, typos = synthetic_sales(args.sales, args.products, args.days, args.typos)
+    state = sales_anomalies.DetectorState()
+    flagged = np.zeros(args.sales, dtype=bool)
+    kinds = {sales_anomalies.SALE: 0, sales_anomalies.DAY: 0}
+    start = time.perf_counter()
+    for i, (product_id, quantity, day) in enumerate(zip(products.tolist(), quantities.tolist(), days.tolist())):
+        anomalies = state.observe("bench", product_id, float(quantity), day)
+        for anomaly in anomalies:
+            kinds[anomaly["kind"]] += 1
+            flagged[i] |= anomaly["kind"] == sales_anomalies.SALE
+    elapsed = time.perf_counter() - start
+    print(f"{args.sales:,} ventas de {len(state):,} productos en {args.days} días")
+    print(f"observe: {elapsed:.2f} s, {elapsed / args.sales * 1e6:.2f} µs por venta")
+    print(f"Estado: {sales_anomalies.STATE_DTYPE.itemsize} bytes por producto, "
+          f"{state._records.nbytes / 2 ** 20:.1f} MiB en el arreglo")
+    normal = ~typos
+    print(f"Errores detectados: {int((flagged & typos).sum())} de {int(typos.sum())}; "
+          f"ventas normales marcadas: {int((flagged & normal).sum())} ({(flagged & normal).mean():.4%}); "
+          f"días atípicos: {kinds[sales_anomalies.DAY]}")
+
+    if args.db:
+        from app import sales_rollup
+        from app.database import SessionLocal
+
+        with SessionLocal() as db:
+            conn = db.connection()
+            today = sales_rollup.today()
+            product_ids = np.random.default_rng(0).integers(1, args.products + 1, 1000).tolist()
+            recovered = sales_anomalies.DetectorState()
+            start = time.perf_counter()
+            for product_id in product_ids:
+                daily = sales_anomalies._load_product_days(conn, 1, product_id, today - recovered.recovery_days)
+                recovered.recover(str(conn.engine.url), product_id, daily, today)
+            print(f"Recuperación desde sales_daily: {(time.perf_counter() - start) / len(product_ids) * 1000:.3f} ms "
+                  f"por producto ({recovered.recovery_days} días)")
+
+
+if __name__ == "__main__":
+    main()
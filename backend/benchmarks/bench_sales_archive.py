@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark del archivado de ventas a almacenamiento frío
+Ejecutar desde backend/ con: python -m benchmarks.bench_sales_archive [--sales 2000000 --days 1095 --retention 365]
+
+Crea una base SQLite temporal con --sales ventas repartidas en --days días,
+archiva las anteriores a --retention días y mide: el archivado, el tamaño de
+los archivos frente al espacio que ocupaban en la base, el VACUUM, una
+consulta por ventana de fechas de la base antes y después, y la lectura
+unida (base + archivos) de un año de ventas completas y de un producto.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sales", type=int, default=2_000_000)
+    parser.add_argument("--products", type=int, default=2_000)
+    parser.add_argument("--days", type=int, default=1095)
+    parser.add_argument("--retention", type=int, default=365)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_sales_archive_")
+    path = os.path.join(workdir, "ventas.db")
+    # Antes de importar la app: todo corre sobre la base temporal
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from sqlalchemy import func, select
+
+    from app import database, models, sales_archive, sales_rollup
+    from app.migrations import run_migrations
+
+    try:
+        run_migrations()
+        rng = np.random.default_rng(42)
+        now = datetime.utcnow()
+        seconds = rng.integers(0, args.days * 86400, args.sales)
+        product = rng.integers(1, args.products + 1, args.sales)
+        quantity = rng.integers(1, 5, args.sales)
+        sales = models.Sale.__table__
+        start = time.perf_counter()
+        with database.engine.begin() as conn:
+            for begin in range(0, args.sales, 100_000):
+                conn.execute(sales.insert(), [
+                    {"store_id": 1, "product_id": int(p), "quantity": int(q), "total_price": float(q) * 1500.0,
+                     "sale_date": now - timedelta(seconds=int(s))}
+                    for p, q, s in zip(product[begin:begin + 100_000], quantity[begin:begin + 100_000],
+                                       seconds[begin:begin + 100_000])
+                ])
+            sales_rollup.rebuild(conn)
+        print(f"{args.sales:,} ventas en {args.days} días cargadas en {time.perf_counter() - start:.1f} s "
+              f"(formato {sales_archive.ARCHIVE_FORMAT})")
+
+        def window_query():
+            since = now - timedelta(days=90)
+            with database.engine.connect() as conn:
+                begin = time.perf_counter()
+                conn.execute(select(func.count(), func.sum(sales.c.quantity)).where(sales.c.sale_date >= since)).one()
+                conn.execute(select(func.count()).select_from(sales)).scalar()
+                return time.perf_counter() - begin
+
+        size_before = os.path.getsize(path)
+        window_before = window_query()
+        before = now - timedelta(days=args.retention)
+        start = time.perf_counter()
+        with database.engine.begin() as conn:
+            result = sales_archive.archive(conn, before, os.path.join(workdir, "archivo"))
+        archive_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        reclaimed = sales_archive.vacuum(database.engine)
+        vacuum_seconds = time.perf_counter() - start
+        window_after = window_query()
+
+        print(f"Archivado: {result['archived']:,} ventas en {result['files']} archivos, {archive_seconds:.1f} s "
+              f"({result['archived'] / archive_seconds:,.0f} ventas/s)")
+        print(f"Archivos: {result['bytes'] / 2 ** 20:.1f} MiB ({result['bytes'] / max(result['archived'], 1):.1f} "
+              f"bytes por venta); VACUUM: {vacuum_seconds:.1f} s, {reclaimed / 2 ** 20:.1f} MiB recuperados")
+        print(f"Base: {size_before / 2 ** 20:.1f} MiB -> {os.path.getsize(path) / 2 ** 20:.1f} MiB")
+        print(f"Ventana de 90 días + conteo total en la base: {window_before * 1000:.0f} ms -> {window_after * 1000:.0f} ms")
+
+        with database.SessionLocal() as db:
+            year_start = now - timedelta(days=args.retention + 365)
+            start = time.perf_counter()
+            year = sales_archive.load_sales(db, year_start, before)
+            print(f"Lectura unida de un año archivado: {len(year):,} ventas en {time.perf_counter() - start:.2f} s")
+            start = time.perf_counter()
+            history = sales_archive.load_sales(db, product_ids=[1], columns=["sale_date", "quantity"])
+            print(f"Historia completa de un producto (base + archivos): {len(history):,} ventas en "
+                  f"{(time.perf_counter() - start) * 1000:.0f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
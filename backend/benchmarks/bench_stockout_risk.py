@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la simulación de riesgo de quiebre sobre un catálogo sintético
+Ejecutar desde backend/ con: python -m benchmarks.bench_stockout_risk [--products 10000 --paths 5000]
+
+Genera la historia diaria de cada producto (popularidad sesgada, días sin
+ventas incluidos) y un stock disponible que deja a todos en riesgo, para que
+ningún producto se descarte sin simular (el peor caso). Mide simulate con su
+pico de memoria (tracemalloc) y compara la probabilidad de un producto con la
+exacta, que sale de convolucionar su distribución diaria tantas veces como
+días tiene el plazo. Con --db mide además build_risk completo sobre una base
+generada con seed_data.py.
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+
+import numpy as np
+
+
+def synthetic_history(count: int, history_days: int, seed: int = 42):
+    rng = np.random.default_rng(seed)
+    selling = 0.6 / np.arange(1, count + 1) ** 0.3
+    history = (rng.random((count, history_days)) < selling[:, None]) * (rng.poisson(2, (count, history_days)) + 1)
+    return history.astype(np.float32)
+
+
+def exact_probability(daily: np.ndarray, available: float, lead_days: int) -> float:
+    values, counts = np.unique(daily.astype(np.int64), return_counts=True)
+    pmf = np.zeros(values.max() + 1)
+    pmf[values] = counts / len(daily)
+    total = np.array([1.0])
+    for _ in range(lead_days):
+        total = np.convolve(total, pmf)
+    return float(total[int(available) + 1:].sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--paths", type=int, default=5000)
+    parser.add_argument("--history-days", type=int, default=90)
+    parser.add_argument("--lead-time", type=int, default=7)
+    parser.add_argument("--db", help="Base SQLite generada con seed_data.py para medir la corrida completa")
+    args = parser.parse_args()
+
+    if args.db:
+        # Antes de importar la app: la corrida completa usa esta base
+        os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+    from app import stockout_risk
+
+    history = synthetic_history(args.products, args.history_days)
+    # Disponible por debajo de la demanda media del plazo: todos se simulan
+    available = np.floor(history.mean(axis=1) * args.lead_time * 0.8).astype(np.float32)
+    lead_times = np.full(args.products, args.lead_time)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = stockout_risk.simulate(history, available, lead_times, args.paths, seed=1)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    cells = args.products * args.paths * args.lead_time
+    print(f"{args.products:,} SKU × {args.paths:,} caminos × {args.lead_time} días "
+          f"(STOCKOUT_CHUNK_CELLS={stockout_risk.CHUNK_CELLS:,})")
+    print(f"simulate: {elapsed:.2f} s, {cells / elapsed / 1e6:,.0f} M días simulados/s, pico {peak / 2**20:,.0f} MiB")
+    print(f"Probabilidad media de quiebre {result['stockout_probability'].mean():.1%}, "
+          f"unidades perdidas esperadas {result['expected_lost_units'].sum():,.0f}")
+    product = args.products // 2
+    print(f"Producto {product}: simulada {result['stockout_probability'][product]:.4f}, "
+          f"exacta {exact_probability(history[product], available[product], args.lead_time):.4f}")
+
+    if args.db:
+        from app.database import SessionLocal
+
+        with SessionLocal() as db:
+            start = time.perf_counter()
+            report = stockout_risk.build_risk(db, paths=args.paths, lead_time_days=args.lead_time)
+            print(f"build_risk sobre {args.db}: {time.perf_counter() - start:.2f} s, "
+                  f"{report['products_at_risk']:,} de {report['products']:,} productos con riesgo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Base de datos sintética grande para las pruebas de carga.
+
+La genera seed_data.py (carga masiva con todos los índices y ANALYZE al final). Los
+parámetros se guardan junto al archivo para reutilizarlo entre corridas
+mientras no cambien.
+"""
+
+import json
+import os
+import time
+from typing import Dict
+
+import seed_data
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+def build_dataset(path: str, products: int = 20_000, sales: int = 5_000_000, years: int = 2,
+                  seed: int = 42, force: bool = False) -> Dict:
+    """Crea (o reutiliza) la base sintética en `path` y devuelve sus parámetros"""
+    # format cambia cuando seed_data.py genera otras tablas (2: ventas agrupadas en tickets, 3: agregados diarios,
+    # 4: ventas en orden cronológico)
+    params = {"products": products, "sales": sales, "years": years, "seed": seed, "format": 4}
+    if not force and os.path.exists(path) and os.path.exists(_meta_path(path)):
+        with open(_meta_path(path)) as f:
+            meta = json.load(f)
+        if meta.get("params") == params:
+            return meta
+
+    start = time.perf_counter()
+    # Con todos los índices: las pruebas de carga miden las consultas, no el primer arranque
+    seed_data.seed(path, products=products, sales=sales, years=years, seed=seed, replace=True, all_indexes=True)
+    meta = {"params": params, "build_seconds": round(time.perf_counter() - start, 2)}
+    with open(_meta_path(path), "w") as f:
+        json.dump(meta, f)
+    return meta
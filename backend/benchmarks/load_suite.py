@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Prueba de carga de punta a punta del backend con una carga mixta
+Ejecutar desde backend/ con: python -m benchmarks.load_suite [--mode inprocess|http] [--duration 30]
+
+Siembra (o reutiliza) una base sintética grande, lanza --concurrency clientes
+que eligen operaciones según los pesos de --mix (listados, cambios de stock,
+pronósticos, alertas, mensajes del webhook) y reporta rendimiento y
+percentiles de latencia por operación. Cada corrida se guarda como JSON en
+--output-dir con el commit actual; --compare A.json B.json muestra la
+diferencia entre dos corridas. Los proveedores de IA se reemplazan por el
+proveedor local "stub" para no depender de la red ni de claves.
+
+Modos:
+  inprocess  la app ASGI se llama directamente con httpx (sin red)
+  http       contra --url, o contra un uvicorn que la suite levanta y detiene
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_DB = os.path.join("benchmarks", "data", "load_suite.db")
+DEFAULT_OUTPUT_DIR = os.path.join("benchmarks", "results")
+DEFAULT_MIX = {
+    "list_products": 25,
+    "get_product": 15,
+    "low_stock": 5,
+    "low_rotation": 2,
+    "stock_update": 15,
+    "forecast": 15,
+    "reorder_suggestion": 5,
+    "webhook": 18,
+    "demand_alerts": 5,
+}
+WEBHOOK_MESSAGES = (
+    "Hola, ¿tienen cuadernos?",
+    "¿Qué disponibilidad hay de colores?",
+    "predicción de demanda por favor",
+    "vendí 3 lápices",
+    "buenas tardes",
+)
+# Respuestas esperadas por operación; cualquier otra cuenta como error
+EXPECTED_STATUS = {"stock_update": (200, 400)}
+REGRESSION_THRESHOLD = 0.10
+
+Request = Tuple[str, str, Optional[dict]]
+
+
+def _product_id(rng: random.Random, products: int) -> int:
+    return rng.randint(1, products)
+
+
+OPERATIONS: Dict[str, Callable[[random.Random, int], Request]] = {
+    "list_products": lambda rng, n: ("GET", f"/products/?skip={rng.randrange(0, max(n - 100, 1))}&limit=100", None),
+    "get_product": lambda rng, n: ("GET", f"/products/{_product_id(rng, n)}", None),
+    "low_stock": lambda rng, n: ("GET", "/products/low-stock/", None),
+    "low_rotation": lambda rng, n: ("GET", "/products/low-rotation/", None),
+    "stock_update": lambda rng, n: ("POST", f"/products/{_product_id(rng, n)}/stock", {
+        "quantity": rng.randint(1, 3), "operation": rng.choice(("add", "subtract")),
+    }),
+    "forecast": lambda rng, n: ("GET", f"/products/{_product_id(rng, n)}/demand-prediction", None),
+    "reorder_suggestion": lambda rng, n: ("GET", f"/products/{_product_id(rng, n)}/reorder-suggestion", None),
+    "webhook": lambda rng, n: ("POST", "/whatsapp/webhook", {
+        "message": rng.choice(WEBHOOK_MESSAGES), "sender": f"+57300{rng.randint(0, 9999999):07d}",
+    }),
+    "demand_alerts": lambda rng, n: ("GET", "/products/demand-alerts", None),
+}
+
+
+def parse_mix(raw: Optional[str]) -> Dict[str, float]:
+    """"forecast=30,webhook=0" -> pesos por operación sobre los predeterminados"""
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, (raw or "").split(",")):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise SystemExit(f"Operación desconocida en --mix: {name}")
+        mix[name.strip()] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def add(self, operation: str, seconds: float, ok: bool):
+        if not self.recording:
+            return
+        self.latencies.setdefault(operation, []).append(seconds)
+        if not ok:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    @staticmethod
+    def _summary(latencies: List[float], errors: int, elapsed: float) -> Dict:
+        ms = np.asarray(latencies) * 1000
+        p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99]) if len(ms) else (0.0,) * 4
+        return {
+            "requests": len(ms),
+            "errors": errors,
+            "throughput_rps": round(len(ms) / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(float(ms.mean()), 3) if len(ms) else 0.0,
+            "p50_ms": round(float(p50), 3),
+            "p90_ms": round(float(p90), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "max_ms": round(float(ms.max()), 3) if len(ms) else 0.0,
+        }
+
+    def report(self, elapsed: float) -> Dict:
+        operations = {
+            name: self._summary(values, self.errors.get(name, 0), elapsed)
+            for name, values in sorted(self.latencies.items())
+        }
+        everything = [value for values in self.latencies.values() for value in values]
+        return {"totals": self._summary(everything, sum(self.errors.values()), elapsed), "operations": operations}
+
+
+async def _worker(client, recorder: Recorder, mix: Dict[str, float], products: int,
+                  seed: int, stop_at: List[float]):
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < stop_at[0]:
+        operation = rng.choices(names, weights)[0]
+        method, url, body = OPERATIONS[operation](rng, products)
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, json=body)
+            ok = response.status_code in EXPECTED_STATUS.get(operation, (200,))
+        except Exception:
+            ok = False
+        recorder.add(operation, time.perf_counter() - start, ok)
+
+
+async def run_load(client, mix: Dict[str, float], products: int, duration: float, warmup: float,
+                   concurrency: int, seed: int) -> Dict:
+    recorder = Recorder()
+    stop_at = [time.perf_counter() + warmup + duration]
+    workers = [
+        asyncio.create_task(_worker(client, recorder, mix, products, seed + i, stop_at))
+        for i in range(concurrency)
+    ]
+    await asyncio.sleep(warmup)
+    recorder.recording = True
+    started = time.perf_counter()
+    await asyncio.gather(*workers)
+    return recorder.report(time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(env: Dict[str, str], timeout: float = 60.0) -> Tuple[subprocess.Popen, str]:
+    """Levanta uvicorn en un puerto libre y espera a que responda"""
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("El servidor uvicorn terminó antes de estar listo")
+        try:
+            httpx.get(url + "/", timeout=1.0)
+            return server, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"El servidor no respondió en {timeout:.0f} s")
+
+
+def git_commit() -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                    capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "desconocido", "dirty": None}
+
+
+def print_report(result: Dict):
+    print(f"\nCommit {result['commit']}{' (con cambios)' if result['dirty'] else ''} | modo {result['mode']} | "
+          f"{result['config']['concurrency']} clientes × {result['config']['duration']} s")
+    header = f"{'operación':<20}{'peticiones':>11}{'errores':>9}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    rows = list(result["operations"].items()) + [("TOTAL", result["totals"])]
+    for name, stats in rows:
+        print(f"{name:<20}{stats['requests']:>11,}{stats['errors']:>9}{stats['throughput_rps']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def compare(old_path: str, new_path: str) -> int:
+    """Compara dos corridas; devuelve 1 si alguna operación empeoró más del umbral"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['commit']} -> {new['commit']}")
+    header = f"{'operación':<20}{'req/s':>22}{'p95 ms':>24}"
+    print(header)
+    print("-" * len(header))
+    regressions = 0
+    rows = [(name, old["operations"].get(name), stats) for name, stats in new["operations"].items()]
+    rows.append(("TOTAL", old["totals"], new["totals"]))
+    for name, before, after in rows:
+        if not before:
+            print(f"{name:<20}{'(nueva)':>22}")
+            continue
+        rps_change = (after["throughput_rps"] - before["throughput_rps"]) / (before["throughput_rps"] or 1)
+        p95_change = (after["p95_ms"] - before["p95_ms"]) / (before["p95_ms"] or 1)
+        flag = ""
+        if rps_change < -REGRESSION_THRESHOLD or p95_change > REGRESSION_THRESHOLD:
+            regressions += 1
+            flag = "  <- regresión"
+        print(f"{name:<20}{before['throughput_rps']:>9.1f} -> {after['throughput_rps']:<8.1f}{rps_change:>+5.0%}"
+              f"{before['p95_ms']:>10.1f} -> {after['p95_ms']:<8.1f}{p95_change:>+5.0%}{flag}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--url", help="Servidor ya levantado (modo http); por defecto se levanta uno")
+    parser.add_argument("--db", default=DEFAULT_DB, help="Archivo SQLite de la base sintética")
+    parser.add_argument("--products", type=int, default=20_000)
+    parser.add_argument("--sales", type=int, default=5_000_000)
+    parser.add_argument("--reseed", action="store_true", help="Regenera la base aunque exista")
+    parser.add_argument("--duration", type=float, default=30.0, help="Segundos medidos")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Segundos de calentamiento sin medir")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mix", help="Pesos por operación, p. ej. forecast=30,demand_alerts=1")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--ai-latency-ms", type=float, default=0.0, help="Latencia simulada del proveedor de IA")
+    parser.add_argument("--output-dir", default=DEFAULT_OUTPUT_DIR)
+    parser.add_argument("--compare", nargs=2, metavar=("ANTERIOR", "NUEVA"), help="Compara dos resultados JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(compare(*args.compare))
+
+    mix = parse_mix(args.mix)
+    db_path = os.path.abspath(args.db)
+    env = {
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "AI_PROVIDER": "stub",
+        "AI_STUB_LATENCY_MS": str(args.ai_latency_ms),
+    }
+    # La URL de la base se lee al importar app.database: el entorno va antes de importar la app
+    os.environ.update(env)
+    import httpx
+    from benchmarks.dataset import build_dataset
+
+    if args.url is None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        print(f"Preparando base sintética en {db_path} ...")
+        dataset = build_dataset(db_path, products=args.products, sales=args.sales, force=args.reseed)
+        print(f"Base lista ({dataset['params']['products']:,} productos, {dataset['params']['sales']:,} ventas)")
+    else:
+        dataset = {"params": {"products": args.products, "external_url": args.url}}
+
+    server = None
+    if args.mode == "inprocess":
+        import logging
+        import warnings
+        from app.main import app
+
+        # Los avisos de N+1 y de sklearn por petición ahogarían la salida de la suite
+        logging.getLogger("app.metrics").setLevel(logging.ERROR)
+        warnings.filterwarnings("ignore", category=UserWarning, module="sklearn")
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load-suite", timeout=None)
+    else:
+        url = args.url
+        if url is None:
+            server, url = start_server(env)
+        client = httpx.AsyncClient(base_url=url, timeout=None,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+
+    async def session():
+        async with client:
+            return await run_load(client, mix, args.products, args.duration, args.warmup,
+                                  args.concurrency, args.seed)
+
+    try:
+        report = asyncio.run(session())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+
+    result = {
+        "suite": "load_suite",
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        **git_commit(),
+        "mode": args.mode,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "dataset": dataset,
+        "config": {
+            "duration": args.duration, "warmup": args.warmup, "concurrency": args.concurrency,
+            "mix": mix, "seed": args.seed, "ai_latency_ms": args.ai_latency_ms,
+        },
+        **report,
+    }
+    print_report(result)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(
+        args.output_dir, f"{datetime.now():%Y%m%d-%H%M%S}_{result['commit']}_{args.mode}.json"
+    )
+    with open(path, "w") as f:
+        json.dump(result, f, indent=2)
+    print(f"\nResultados guardados en {path}")
+
+
+if __name__ == "__main__":
+    main()
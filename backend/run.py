@@ -1,5 +1,12 @@
+import os
+import sys
+
+# python run.py --profile activa el modo de perfilado (ver app/profiling.py)
+if "--profile" in sys.argv:
+    os.environ["PROFILING_ENABLED"] = "1"
+
 import uvicorn
 from app.main import app
 
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
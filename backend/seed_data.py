@@ -0,0 +1,564 @@
+#!/usr/bin/env python3
+"""
+Generador de datos sintéticos a gran escala
+Ejecutar con: python seed_data.py --db datos.db --products 20000 --sales 10000000 [--years 3] [--seed 42]
+
+Genera catálogo, clientes, listas escolares, órdenes y varios años de ventas
+con estacionalidad (temporadas escolares de enero-febrero y agosto, diciembre,
+fines de semana y crecimiento anual). A diferencia de init_sample_data.py, que
+agrega objetos ORM uno a uno, escribe con executemany en transacciones grandes
+sobre sqlite3 directamente, con PRAGMAs de carga (sin diario ni fsync) y sin
+índices secundarios: los índices y las estadísticas del planificador se crean
+una sola vez al final, y los de consulta de las tablas masivas
+(DEFERRED_INDEXES) quedan para el primer arranque salvo con --all-indexes. Los
+agregados diarios, los pronósticos de demanda y las alertas iniciales salen de
+las columnas generadas en memoria, sin volver a recorrer la tabla sales.
+"""
+
+import argparse
+import calendar
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+from app import alert_engine, inventory_ledger, migrations, prediction, sales_rollup
+from app.database import DEFAULT_STORE_ID, SQLALCHEMY_DATABASE_URL, Base
+
+CATALOG = {
+    "Útiles Escolares": (
+        ["Cuaderno 100h", "Cuaderno 50h", "Lápiz #2", "Esfero", "Borrador", "Sacapuntas", "Regla 30cm",
+         "Colores x12", "Marcadores", "Pegamento en Barra", "Tijeras Escolares", "Carpeta", "Block Iris",
+         "Compás", "Escuadra", "Corrector"],
+        ["Norma", "Bic", "Mirado", "Maped", "Faber-Castell", "Pelikan", "Pritt", "Milán"],
+        (500, 18_000),
+    ),
+    "Papelería": (
+        ["Resma Carta 75g", "Resma Oficio", "Cartulina", "Papel Seda", "Sobres", "Etiquetas", "Papel Kraft",
+         "Foamy", "Papel Silueta"],
+        ["Panamericana", "Reprograf", "Norma", "Kimberly"],
+        (300, 30_000),
+    ),
+    "Arte": (
+        ["Témperas x6", "Pinceles", "Acuarelas", "Plastilina", "Crayolas", "Lienzo", "Vinilos"],
+        ["Faber-Castell", "Pelikan", "Crayola", "Parchesitos"],
+        (2_000, 45_000),
+    ),
+    "Oficina": (
+        ["Grapadora", "Clips", "Perforadora", "Archivador AZ", "Notas Adhesivas", "Resaltador", "Cinta"],
+        ["Rank", "3M", "Stabilo", "Norma", "Bic"],
+        (1_000, 40_000),
+    ),
+    "Tecnología": (
+        ["Memoria USB 16GB", "Memoria USB 64GB", "Mouse Óptico", "Teclado USB", "Audífonos", "Cable USB-C",
+         "Calculadora Científica"],
+        ["Kingston", "Logitech", "Genius", "Casio", "SanDisk"],
+        (8_000, 120_000),
+    ),
+    "Accesorios": (
+        ["Mochila Escolar", "Cartuchera", "Lonchera", "Maletín de Geometría", "Forro Plástico"],
+        ["JanSport", "Totto", "Norma", "Maped"],
+        (3_000, 150_000),
+    ),
+}
+SCHOOL_CATEGORIES = ("Útiles Escolares", "Papelería", "Arte")
+VARIANTS = ["Azul", "Negro", "Rojo", "Verde", "Surtido", "Grande", "Pequeño", "Pastel", "Neón", "Clásico"]
+FIRST_NAMES = ["María", "Carlos", "Ana", "Luis", "Laura", "Andrés", "Camila", "Juan", "Valentina", "Santiago",
+               "Daniela", "Felipe", "Paula", "Jorge", "Natalia", "Diego", "Sara", "Mateo", "Lucía", "Sebastián"]
+LAST_NAMES = ["González", "Rodríguez", "López", "Martínez", "García", "Pérez", "Gómez", "Díaz", "Torres",
+              "Ramírez", "Vargas", "Rojas", "Moreno", "Castro", "Ortiz", "Herrera", "Medina", "Suárez"]
+SCHOOL_PREFIXES = ["Colegio", "Liceo", "Institución Educativa", "Gimnasio", "Escuela"]
+SCHOOL_NAMES = ["San José", "La Salle", "Santa María", "Los Andes", "El Rosario", "San Francisco", "Nueva Granada",
+                "Simón Bolívar", "La Presentación", "Campestre", "Santander", "Antonio Nariño"]
+GRADES = ["Transición"] + [f"{grade}°" for grade in range(1, 12)]
+ORDER_TYPES = np.array(["impresion", "producto", "lista_escolar"])
+MEMBERSHIP_LEVELS = np.array(["Bronce", "Plata", "Oro"])
+
+DEFAULT_SIZES = {
+    "products": 5_000,
+    "customers": 20_000,
+    "schools": 40,
+    "orders": 20_000,
+    "sales": 1_000_000,
+}
+CHUNK_SIZE = 500_000
+# Líneas de venta promedio por ticket
+BASKET_LINES = 2.5
+
+# PRAGMAs solo para la carga: sin diario ni fsync, caché grande y conexión exclusiva
+LOAD_PRAGMAS = (
+    "PRAGMA journal_mode=OFF",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA locking_mode=EXCLUSIVE",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",
+)
+# Índices de consulta de las tablas masivas que la carga no necesita: sin --all-indexes los crea el primer
+# run_migrations (arranque de la API o python -m app.migrations). Los únicos y parciales, que validan o
+# sirven a las escrituras, y los de tablas pequeñas se crean siempre
+DEFERRED_INDEXES = (
+    "ix_sales_product_id",
+    "ix_sales_date_product_store",
+    "ix_sales_ticket_product",
+    "ix_sales_daily_store_day",
+    "ix_tickets_created_at",
+)
+
+
+def sqlite_path(url: str) -> str:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or not parsed.database:
+        raise SystemExit(f"El generador solo escribe en archivos SQLite (DATABASE_URL={url})")
+    return parsed.database
+
+
+def _fmt(moment: datetime) -> str:
+    # Mismo formato con el que SQLAlchemy guarda DateTime en SQLite
+    return moment.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def _popularity(rng: np.random.Generator, count: int, skew: float = 0.8) -> np.ndarray:
+    """Pesos de cola larga en orden aleatorio: pocos productos concentran la mayoría de las ventas"""
+    weights = 1.0 / np.arange(1, count + 1) ** skew
+    return rng.permutation(weights / weights.sum())
+
+
+def generate_products(rng: np.random.Generator, count: int, now: datetime) -> Dict[str, np.ndarray]:
+    categories = np.array(list(CATALOG))
+    category = categories[rng.integers(0, len(categories), count)]
+    item_names = np.empty(count, dtype=object)
+    suppliers = np.empty(count, dtype=object)
+    prices = np.empty(count)
+    for cat in categories:
+        idx = np.flatnonzero(category == cat)
+        items, brands, (low, high) = CATALOG[cat]
+        item_names[idx] = np.array(items, dtype=object)[rng.integers(0, len(items), len(idx))]
+        suppliers[idx] = np.array(brands, dtype=object)[rng.integers(0, len(brands), len(idx))]
+        # Precio log-uniforme en el rango de la categoría, redondeado a $100
+        prices[idx] = np.round(np.exp(rng.uniform(np.log(low), np.log(high), len(idx))) / 100) * 100
+    variants = np.array(VARIANTS, dtype=object)[rng.integers(0, len(VARIANTS), count)]
+    # La referencia hace único el nombre (products.name es UNIQUE)
+    names = np.array([
+        f"{item} {brand} {variant} Ref {number:06d}"
+        for number, (item, brand, variant) in enumerate(zip(item_names, suppliers, variants), start=1)
+    ], dtype=object)
+    min_stock = rng.integers(2, 40, count)
+    return {
+        "id": np.arange(1, count + 1),
+        "name": names,
+        "category": category,
+        "supplier": suppliers,
+        "price": prices,
+        "min_stock": min_stock,
+        "stock": (min_stock * rng.uniform(0.3, 6.0, count)).astype(int),
+        "school": np.isin(category, SCHOOL_CATEGORIES),
+        "last_updated": np.full(count, _fmt(now)),
+    }
+
+
+def insert_products(conn: sqlite3.Connection, products: Dict[str, np.ndarray], store_id: int):
+    conn.executemany(
+        "INSERT INTO products (id, store_id, name, description, price, stock, min_stock, category, supplier, "
+        "last_updated) VALUES (?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)",
+        zip(products["id"].tolist(), repeat(store_id), products["name"].tolist(), products["price"].tolist(),
+            products["stock"].tolist(), products["min_stock"].tolist(), products["category"].tolist(),
+            products["supplier"].tolist(), products["last_updated"].tolist()),
+    )
+
+
+def insert_customers(conn: sqlite3.Connection, rng: np.random.Generator, count: int, now: datetime,
+                     store_id: int):
+    first = np.array(FIRST_NAMES)[rng.integers(0, len(FIRST_NAMES), count)]
+    last = np.array(LAST_NAMES)[rng.integers(0, len(LAST_NAMES), count)]
+    # Teléfonos únicos: muestra sin reemplazo del rango de celulares
+    phones = rng.choice(10_000_000, size=count, replace=False) + 3_000_000_000
+    points = rng.gamma(1.2, 250, count).astype(int)
+    level = MEMBERSHIP_LEVELS[np.digitize(points, (500, 1_500))]
+    last_purchase = [_fmt(now - timedelta(days=int(days))) for days in rng.integers(0, 365, count)]
+    conn.executemany(
+        "INSERT INTO customers (id, store_id, name, phone_number, loyalty_points, membership_level, "
+        "last_purchase) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        zip(range(1, count + 1), repeat(store_id), (f"{a} {b}" for a, b in zip(first.tolist(), last.tolist())),
+            (f"+57{phone}" for phone in phones.tolist()), points.tolist(), level.tolist(), last_purchase),
+    )
+
+
+def insert_school_lists(conn: sqlite3.Connection, rng: np.random.Generator, schools: int, years: List[int],
+                        products: Dict[str, np.ndarray]) -> int:
+    school_ids = products["id"][products["school"]]
+    if not len(school_ids) or not schools:
+        return 0
+    names = [f"{SCHOOL_PREFIXES[i % len(SCHOOL_PREFIXES)]} {SCHOOL_NAMES[i % len(SCHOOL_NAMES)]}"
+             + (f" {i // len(SCHOOL_NAMES) + 1}" if i >= len(SCHOOL_NAMES) else "") for i in range(schools)]
+    lists, items = [], []
+    list_id = 0
+    for year in years:
+        for school in names:
+            for grade in GRADES:
+                list_id += 1
+                lists.append((list_id, school, grade, year))
+                count = int(rng.integers(6, 16))
+                chosen = rng.choice(school_ids, size=min(count, len(school_ids)), replace=False)
+                items.extend(
+                    (list_id, int(product_id), int(quantity))
+                    for product_id, quantity in zip(chosen, rng.integers(1, 6, len(chosen)))
+                )
+    conn.executemany("INSERT INTO school_lists (id, school_name, grade, year) VALUES (?, ?, ?, ?)", lists)
+    conn.executemany(
+        "INSERT INTO school_list_items (school_list_id, product_id, quantity) VALUES (?, ?, ?)", items
+    )
+    return len(lists)
+
+
+def insert_orders(conn: sqlite3.Connection, rng: np.random.Generator, count: int, customers: int,
+                  products: Dict[str, np.ndarray], now: datetime, store_id: int):
+    if not count:
+        return
+    age_days = rng.exponential(45, count).clip(0, 365)
+    created = [now - timedelta(days=float(days)) for days in age_days]
+    due = [moment + timedelta(days=int(days)) for moment, days in zip(created, rng.integers(1, 11, count))]
+    order_type = ORDER_TYPES[rng.choice(len(ORDER_TYPES), count, p=[0.5, 0.35, 0.15])]
+    # Las órdenes viejas casi siempre están cerradas; las recientes siguen abiertas
+    recent = age_days < 10
+    status = np.where(recent, np.where(rng.random(count) < 0.7, "Pendiente", "En proceso"),
+                      np.where(rng.random(count) < 0.92, "Entregado", "Cancelado"))
+    customer_id = np.where(rng.random(count) < 0.8, rng.integers(1, max(customers, 1) + 1, count), 0)
+
+    # Ítems de todas las órdenes de producto en un solo sorteo; las de impresión no llevan producto
+    printing = order_type == "impresion"
+    lines = np.where(printing, 1, rng.integers(1, 6, count))
+    order_of_line = np.repeat(np.arange(count), lines)
+    line_printing = printing[order_of_line]
+    product_index = rng.choice(len(products["id"]), size=len(order_of_line), p=_popularity(rng, len(products["id"])))
+    quantity = np.where(line_printing, rng.integers(1, 200, len(order_of_line)),
+                        rng.integers(1, 10, len(order_of_line)))
+    unit_price = np.where(line_printing, 200.0, products["price"][product_index])
+    totals = np.bincount(order_of_line, weights=quantity * unit_price, minlength=count)
+    # Las de impresión tienen una sola línea: sus páginas son la cantidad; una de cada diez es urgente
+    pages = np.bincount(order_of_line, weights=quantity, minlength=count).astype(int)
+    priority = np.where(printing & (rng.random(count) < 0.1), 0, 1)
+    items = zip(
+        (order_of_line + 1).tolist(),
+        (None if printed else int(i) + 1 for printed, i in zip(line_printing.tolist(), product_index.tolist())),
+        ("Impresión B/N carta" if printed else None for printed in line_printing.tolist()),
+        quantity.tolist(),
+        unit_price.tolist(),
+    )
+
+    conn.executemany(
+        "INSERT INTO orders (id, store_id, customer_id, order_type, status, details, total_amount, created_at, "
+        "due_date, priority, pages) VALUES (?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?)",
+        zip(range(1, count + 1), repeat(store_id), (int(c) or None for c in customer_id.tolist()), order_type.tolist(),
+            status.tolist(), totals.tolist(), map(_fmt, created), map(_fmt, due), priority.tolist(),
+            (int(p) if printed else None for p, printed in zip(pages.tolist(), printing.tolist()))),
+    )
+    conn.executemany(
+        "INSERT INTO order_items (order_id, product_id, description, quantity, unit_price) VALUES (?, ?, ?, ?, ?)",
+        items,
+    )
+
+
+def season_weights(start: datetime, days: int, yearly_growth: float = 0.08) -> Tuple[np.ndarray, np.ndarray]:
+    """Peso relativo de ventas por día y si el día cae en temporada escolar"""
+    dates = np.datetime64(start.date()) + np.arange(days)
+    month = dates.astype("datetime64[M]").astype(int) % 12 + 1
+    day_of_month = (dates - dates.astype("datetime64[M]")).astype(int) + 1
+    weekday = (dates.astype(int) + 3) % 7  # 0 = lunes
+
+    # Calendario A (mediados de enero a febrero) y calendario B (agosto)
+    school_season = ((month == 1) & (day_of_month >= 10)) | (month == 2) | (month == 8)
+    weights = np.where(school_season, 2.5, 1.0)
+    weights = weights * np.where(month == 12, 1.4, 1.0)
+    weights = weights * np.select([weekday == 5, weekday == 6], [1.3, 0.4], 1.0)
+    weights = weights * (1 + yearly_growth) ** (np.arange(days) / 365)
+    return weights / weights.sum(), school_season
+
+
+def sales_chunks(rng: np.random.Generator, products: Dict[str, np.ndarray], count: int, start: datetime,
+                 days: int, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[List, ...]]:
+    """Columnas (product_id, quantity, epoch, total, ticket_id) por bloque, como arreglos de NumPy"""
+    day_p, school_season = season_weights(start, days)
+    general_p = _popularity(rng, len(products["id"]))
+    school_idx = np.flatnonzero(products["school"])
+    school_p = _popularity(rng, len(school_idx)) if len(school_idx) else None
+    start_epoch = calendar.timegm(start.date().timetuple())
+    prices = products["price"]
+
+    generated = 0
+    next_ticket = 1
+    while generated < count:
+        size = min(chunk_size, count - generated)
+        # Tickets de líneas consecutivas; la primera línea abre el ticket y fija el día y la hora
+        opens = rng.random(size) < 1 / BASKET_LINES
+        opens[0] = True
+        ticket = np.cumsum(opens) - 1
+        first = np.flatnonzero(opens)[ticket]
+        day = rng.choice(days, size=size, p=day_p)[first]
+        product = rng.choice(len(general_p), size=size, p=general_p)
+        if school_p is not None:
+            # En temporada escolar más de la mitad de las ventas son útiles
+            seasonal = school_season[day] & (rng.random(size) < 0.6)
+            product[seasonal] = school_idx[rng.choice(len(school_idx), size=int(seasonal.sum()), p=school_p)]
+        # La mitad de las demás líneas son un producto que acompaña al primero (uno de los 3 ids siguientes)
+        companion = ~opens & (rng.random(size) < 0.5)
+        product[companion] = (product[first[companion]] + rng.integers(1, 4, int(companion.sum()))) % len(general_p)
+        quantity = rng.geometric(0.45, size).clip(max=20)
+        # Horario de atención de 7:00 a 19:00
+        epoch = (start_epoch + day * 86_400 + rng.integers(7 * 3600, 19 * 3600, size))[first]
+        # El bloque va en orden de fecha, con los tickets numerados en ese orden, como los escribiría la tienda:
+        # los índices por fecha y por ticket se construyen al final sobre tramos ya ordenados
+        order = np.lexsort((ticket, epoch))
+        product, quantity, epoch, ticket = product[order], quantity[order], epoch[order], ticket[order]
+        opens = np.empty(size, dtype=bool)
+        opens[0], opens[1:] = True, ticket[1:] != ticket[:-1]
+        ticket = np.cumsum(opens) - 1
+        yield product + 1, quantity, epoch, quantity * prices[product], ticket + next_ticket
+        generated += size
+        next_ticket += int(ticket[-1]) + 1
+
+
+class DateTexts:
+    """
+    sale_date como texto en el formato de SQLAlchemy, armado con NumPy desde
+    dos tablas fijas (fecha de cada día y hora de cada segundo) en lugar de
+    formatear cada venta en SQLite con strftime
+    """
+
+    def __init__(self, start: datetime, days: int):
+        self.start_epoch = calendar.timegm(start.date().timetuple())
+        first = start.date()
+        self.dates = np.frombuffer("".join(
+            (first + timedelta(days=day)).strftime("%Y-%m-%d ") for day in range(days + 1)
+        ).encode(), dtype=np.uint8).reshape(days + 1, 11)
+        self.clock = np.frombuffer("".join(
+            f"{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}.000000" for second in range(86_400)
+        ).encode(), dtype=np.uint8).reshape(86_400, 15)
+
+    def __call__(self, epoch: np.ndarray) -> List[str]:
+        offset = epoch - self.start_epoch
+        # Una línea por venta: un solo decode y splitlines en lugar de un str por fila desde NumPy
+        text = np.empty((len(epoch), 27), dtype=np.uint8)
+        text[:, :11] = self.dates[offset // 86_400]
+        text[:, 11:26] = self.clock[offset % 86_400]
+        text[:, 26] = ord("\n")
+        return text.tobytes().decode("ascii").splitlines()
+
+
+def insert_sales(conn: sqlite3.Connection, rng: np.random.Generator, products: Dict[str, np.ndarray],
+                 count: int, start: datetime, days: int, store_id: int,
+                 chunk_size: int = CHUNK_SIZE) -> Dict[str, np.ndarray]:
+    """Carga las ventas y sus tickets; devuelve product_id, quantity y seconds (desde `start`) de cada venta"""
+    statement = (
+        "INSERT INTO sales (product_id, quantity, sale_date, total_price, ticket_id, store_id) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    ticket_statement = "INSERT INTO tickets (id, created_at, total_price, channel, store_id) VALUES (?, ?, ?, 'seed', ?)"
+    date_texts = DateTexts(start, days)
+    # Columnas compactas (9 bytes por venta) para pronósticos y agregados sin volver a leer sales
+    kept = {"product_id": [], "quantity": [], "seconds": []}
+    for product, quantity, epoch, total, ticket in sales_chunks(rng, products, count, start, days, chunk_size):
+        conn.executemany(statement, zip(product.tolist(), quantity.tolist(), date_texts(epoch), total.tolist(),
+                                        ticket.tolist(), repeat(store_id)))
+        ticket_ids, first = np.unique(ticket, return_index=True)
+        totals = np.bincount(ticket - ticket_ids[0], weights=total)
+        conn.executemany(ticket_statement, zip(ticket_ids.tolist(), date_texts(epoch[first]), totals.tolist(),
+                                               repeat(store_id)))
+        kept["product_id"].append(product.astype(np.int32))
+        kept["quantity"].append(quantity.astype(np.int8))
+        kept["seconds"].append((epoch - date_texts.start_epoch).astype(np.int32))
+    return {name: np.concatenate(parts) if parts else np.empty(0, dtype=np.int32) for name, parts in kept.items()}
+
+
+def forecast_sums(sales: Dict[str, np.ndarray]) -> pd.DataFrame:
+    """
+    Sumas de la regresión de predict_demand_batch (n, Σx, Σy, Σxy, Σx², máx x) por producto.
+
+    Se calculan sobre las columnas que dejó insert_sales en lugar del GROUP BY
+    sobre sales; x son los días completos desde la primera venta del producto,
+    como en la consulta.
+    """
+    product, seconds = sales["product_id"], sales["seconds"]
+    if len(product) == 0:
+        return pd.DataFrame(columns=["product_id", "n", "sx", "sy", "sxy", "sxx", "max_x"])
+    size = int(product.max()) + 1
+    first = np.full(size, np.iinfo(np.int32).max, dtype=np.int32)
+    np.minimum.at(first, product, seconds)
+    x = ((seconds - first[product]) // 86_400).astype(np.float64)
+    y = sales["quantity"].astype(np.float64)
+    n = np.bincount(product, minlength=size)
+    max_x = np.zeros(size)
+    np.maximum.at(max_x, product, x)
+    sold = np.flatnonzero(n)
+    return pd.DataFrame({
+        "product_id": sold,
+        "n": n[sold],
+        "sx": np.bincount(product, weights=x, minlength=size)[sold],
+        "sy": np.bincount(product, weights=y, minlength=size)[sold],
+        "sxy": np.bincount(product, weights=x * y, minlength=size)[sold],
+        "sxx": np.bincount(product, weights=x * x, minlength=size)[sold],
+        "max_x": max_x[sold],
+    })
+
+
+def insert_daily(conn: sqlite3.Connection, sales: Dict[str, np.ndarray], prices: np.ndarray, start: datetime,
+                 store_id: int) -> int:
+    """
+    Agregados diarios (sales_daily) de las ventas cargadas, desde las columnas
+    que dejó insert_sales: un código por producto y día y np.bincount para las
+    unidades, los ingresos y el número de ventas. Mientras la tabla producto ×
+    día no sea mucho mayor que las ventas, el código es directamente la
+    posición en esa tabla y no hace falta ordenarlos con np.unique. Devuelve
+    las filas escritas.
+    """
+    product = sales["product_id"].astype(np.int64)
+    if len(product) == 0:
+        return 0
+    day = sales_rollup.day_number(start) + sales["seconds"] // 86_400
+    first_day = int(day.min())
+    span = int(day.max()) - first_day + 1
+    codes = product * span + (day - first_day)
+    keys = None
+    if (int(product.max()) + 1) * span > 4 * len(codes):
+        keys, codes = np.unique(codes, return_inverse=True)
+    quantity = sales["quantity"].astype(np.float64)
+    units = np.bincount(codes, weights=quantity).astype(np.int64)
+    revenue = np.bincount(codes, weights=quantity * prices[product - 1])
+    count = np.bincount(codes)
+    if keys is None:
+        keys = np.flatnonzero(count)
+        units, revenue, count = units[keys], revenue[keys], count[keys]
+    conn.executemany(
+        "INSERT INTO sales_daily (store_id, product_id, day, units, revenue, sales) VALUES (?, ?, ?, ?, ?, ?)",
+        zip(repeat(store_id), (keys // span).tolist(), (keys % span + first_day).tolist(), units.tolist(),
+            revenue.tolist(), count.tolist()))
+    return len(keys)
+
+
+def deferred_index(index) -> bool:
+    return index.name in DEFERRED_INDEXES
+
+
+def _drop_secondary_indexes(conn: sqlite3.Connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            conn.execute(f"DROP INDEX IF EXISTS {index.name}")
+
+
+def seed(path: str, products: int = DEFAULT_SIZES["products"], customers: int = DEFAULT_SIZES["customers"],
+         schools: int = DEFAULT_SIZES["schools"], orders: int = DEFAULT_SIZES["orders"],
+         sales: int = DEFAULT_SIZES["sales"], years: int = 3, seed: int = 42, chunk_size: int = CHUNK_SIZE,
+         replace: bool = False, store_id: int = DEFAULT_STORE_ID, all_indexes: bool = False,
+         log=print) -> Dict[str, float]:
+    """
+    Crea la base en `path` y la llena con datos de la tienda store_id; devuelve los segundos de cada etapa.
+    Sin all_indexes, DEFERRED_INDEXES quedan para el primer run_migrations (arranque de la API).
+    """
+    if os.path.exists(path):
+        if not replace:
+            raise SystemExit(f"{path} ya existe; use --replace para regenerarla")
+        os.remove(path)
+
+    timings = {}
+    started = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    now = datetime.utcnow().replace(microsecond=0)
+    start = now - timedelta(days=365 * years)
+    days = (now.date() - start.date()).days + 1
+
+    engine = create_engine(f"sqlite:///{path}")
+    migrations.run_migrations(engine)
+    engine.dispose()
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    for pragma in LOAD_PRAGMAS:
+        conn.execute(pragma)
+    _drop_secondary_indexes(conn)
+
+    def stage(name, func, *args):
+        stage_start = time.perf_counter()
+        conn.execute("BEGIN")
+        result = func(conn, *args)
+        conn.execute("COMMIT")
+        timings[name] = time.perf_counter() - stage_start
+        log(f"  {name:<14} {timings[name]:6.1f} s")
+        return result
+
+    log(f"Generando datos en {path} (semilla {seed}) ...")
+    catalog = generate_products(rng, products, now)
+    stage("productos", insert_products, catalog, store_id)
+    stage("clientes", insert_customers, rng, customers, now, store_id)
+    stage("listas", insert_school_lists, rng, schools, list(range(start.year + 1, now.year + 2)), catalog)
+    stage("órdenes", insert_orders, rng, orders, customers, catalog, now, store_id)
+    loaded = stage("ventas", insert_sales, rng, catalog, sales, start, days, store_id, chunk_size)
+    # Agregados diarios de las ventas cargadas, que la sesión ORM no vio pasar: antes de los índices
+    stage("agregados", insert_daily, loaded, catalog["price"], start, store_id)
+    conn.close()
+
+    # Índices y estadísticas una sola vez, con todas las filas ya cargadas (salvo DEFERRED_INDEXES)
+    index_start = time.perf_counter()
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        migrations.create_missing_indexes(connection, skip=None if all_indexes else deferred_index)
+        connection.exec_driver_sql("ANALYZE")
+    timings["índices"] = time.perf_counter() - index_start
+    log(f"  {'índices':<14} {timings['índices']:6.1f} s")
+    if not all_indexes:
+        log(f"  (pendientes hasta el primer arranque o python -m app.migrations: {', '.join(DEFERRED_INDEXES)})")
+
+    # Las filas se cargaron por fuera de la sesión ORM: pronósticos con las columnas ya generadas (sin releer
+    # sales) y alertas materializadas de una vez
+    alerts_start = time.perf_counter()
+    with engine.begin() as connection:
+        forecasts = prediction.forecast_from_sums(forecast_sums(loaded), alert_engine.DEMAND_HORIZON_DAYS)
+        alert_engine.store_forecasts(connection, forecasts)
+        alert_engine.evaluate_products(connection)
+    timings["alertas"] = time.perf_counter() - alerts_start
+    log(f"  {'alertas':<14} {timings['alertas']:6.1f} s")
+
+    # Saldo inicial del libro de inventario: el stock cargado de cada producto
+    ledger_start = time.perf_counter()
+    with engine.begin() as connection:
+        inventory_ledger.reconcile(connection, reference="seed_data")
+    engine.dispose()
+    timings["inventario"] = time.perf_counter() - ledger_start
+    log(f"  {'inventario':<14} {timings['inventario']:6.1f} s")
+
+    timings["total"] = time.perf_counter() - started
+    return timings
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db", help="Archivo SQLite destino (por defecto el de DATABASE_URL)")
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--{name}", type=int, default=default)
+    parser.add_argument("--years", type=int, default=3, help="Años de historia de ventas")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Ventas generadas por bloque")
+    parser.add_argument("--replace", action="store_true", help="Borra la base si ya existe")
+    parser.add_argument("--store-id", type=int, default=DEFAULT_STORE_ID,
+                        help="Tienda de los datos (para el archivo propio de una tienda, ver STORE_DATABASE_URL)")
+    parser.add_argument("--all-indexes", action="store_true",
+                        help="Crea también los índices de análisis de ventas, tickets y agregados (si no, los "
+                             "crea el primer arranque de la API)")
+    args = parser.parse_args(argv)
+
+    path = args.db or sqlite_path(SQLALCHEMY_DATABASE_URL)
+    timings = seed(
+        path, products=args.products, customers=args.customers, schools=args.schools, orders=args.orders,
+        sales=args.sales, years=args.years, seed=args.seed, chunk_size=args.chunk_size, replace=args.replace,
+        store_id=args.store_id, all_indexes=args.all_indexes,
+    )
+    rate = args.sales / timings["ventas"] if timings["ventas"] else 0
+    print(f"Listo en {timings['total']:.1f} s ({rate:,.0f} ventas/s)")
+
+
+if __name__ == "__main__":
+    main()
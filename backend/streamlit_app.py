@@ -3,7 +3,11 @@ import pandas as pd
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app.database import SessionLocal, Product, Sale, Customer
+from app import ai_governor, alert_engine, basket_engine, inventory_analytics, inventory_ledger, queries, sales_anomalies, sales_rollup, singleflight, stockout_risk, sync, tenancy
+from app.migrations import run_migrations
+from app.profiling import start_page_profile, finish_page_profile
 from app.prediction import predict_demand
+from app.school_demand import build_reorder_plan
 from app.ai_api import ai_client
 from datetime import datetime, timezone
 
@@ -28,52 +32,79 @@ st.markdown("""
 
 st.markdown("---")
 
-# Función para obtener sesión de BD
-def get_db():
-    return SessionLocal()
+# Las ventas y cambios de stock hechos desde la app también actualizan las alertas
+tenancy.install(SessionLocal)
+alert_engine.install(SessionLocal)
+# Cada cambio de stock hecho aquí (ventas del chatbot, productos nuevos) queda en el libro de inventario
+inventory_ledger.install(SessionLocal)
+# Ventas y cambios de stock hechos aquí también entran al registro de sincronización (modo nodo)
+sync.install(SessionLocal)
+# Y los agregados diarios de ventas que lee la analítica de inventario
+sales_rollup.install(SessionLocal)
+# Las ventas registradas aquí también pasan por el detector de ventas atípicas
+sales_anomalies.install(SessionLocal)
+
+# Crear tablas nuevas y aplicar migraciones pendientes una vez por proceso
+@st.cache_resource
+def init_database():
+    run_migrations()
+    # En un nodo sin la API corriendo, Streamlit mantiene la sincronización con la central
+    sync.start_worker()
+    return True
+
+init_database()
 
 # Sidebar con navegación
 st.sidebar.title("📋 Menú Principal")
+
+# Tienda activa: todas las consultas y ventas de la página quedan dentro de ella
+stores = {store["id"]: store["name"] for store in tenancy.list_stores()}
+store_id = st.sidebar.selectbox("🏪 Tienda", list(stores), format_func=stores.get) if len(stores) > 1 else next(iter(stores))
+
+# Función para obtener sesión de BD
+def get_db():
+    return tenancy.session_for(store_id)
+
+# Páginas de solo lectura: réplica o copia periódica si están configuradas
+def get_read_db():
+    return tenancy.session_for(store_id, read_only=True)
+
 page = st.sidebar.radio(
     "Selecciona una opción:",
-    ["🏠 Dashboard", "📦 Inventario", "📊 Predicciones", "💬 Chatbot Inteligente", "⚠️ Alertas"]
+    ["🏠 Dashboard", "📦 Inventario", "📊 Predicciones", "🧮 Clasificación ABC/XYZ", "🏫 Listas Escolares", "💬 Chatbot Inteligente", "⚠️ Alertas"]
 )
 
+# Perfilado opcional de la página (PROFILING_ENABLED=1; ?profile=1 en la URL lo fuerza)
+page_profile = start_page_profile(page, forced=st.query_params.get("profile") == "1")
+
 # Dashboard principal
 if page == "🏠 Dashboard":
     st.header("🏠 Dashboard Principal")
 
-    db = get_db()
+    db = get_read_db()
     try:
+        # Varias sesiones abriendo el tablero a la vez comparten una sola pasada de agregados
+        summary = singleflight.aggregates.do(("dashboard", singleflight.scope_of(db), 30),
+                                             queries.dashboard_summary, db, 30)
+
         # Estadísticas generales
         col1, col2, col3, col4 = st.columns(4)
 
         with col1:
-            total_products = db.query(Product).count()
-            st.metric("Total Productos", total_products)
+            st.metric("Total Productos", summary["product_count"])
 
         with col2:
-            total_stock = db.query(func.sum(Product.stock)).scalar() or 0
-            st.metric("Stock Total", int(total_stock))
+            st.metric("Stock Total", summary["stock_units"])
 
         with col3:
-            low_stock = db.query(Product).filter(Product.stock < Product.min_stock).count()
-            st.metric("Productos con Stock Bajo", low_stock)
+            st.metric("Productos con Stock Bajo", summary["low_stock"])
 
         with col4:
-            total_sales = db.query(Sale).count()
-            st.metric("Total Ventas", total_sales)
+            st.metric("Total Ventas", summary["sales_count"])
 
         # Productos más vendidos (últimos 30 días)
         st.subheader("📈 Productos Más Vendidos (Últimos 30 días)")
-        thirty_days_ago = datetime.now(timezone.utc) - pd.Timedelta(days=30)
-
-        sales_data = db.query(
-            Product.name,
-            func.sum(Sale.quantity).label('total_quantity')
-        ).join(Sale, Product.id == Sale.product_id).filter(
-            Sale.sale_date >= thirty_days_ago
-        ).group_by(Product.id).order_by(func.sum(Sale.quantity).desc()).limit(10).all()
+        sales_data = summary["top_products"]
 
         if sales_data:
             df_sales = pd.DataFrame(sales_data, columns=['Producto', 'Cantidad Vendida'])
@@ -92,18 +123,15 @@ elif page == "📦 Inventario":
     try:
         # Lista de productos
         st.subheader("Lista de Productos")
-        products = db.query(Product).all()
+        products = queries.list_products(db, limit=None)
 
         if products:
-            df_products = pd.DataFrame([{
-                'ID': p.id,
-                'Nombre': p.name,
-                'Precio': f"${p.price:,.0f}",
-                'Stock': p.stock,
-                'Stock Mínimo': p.min_stock,
-                'Categoría': p.category or 'N/A',
-                'Proveedor': p.supplier or 'N/A'
-            } for p in products])
+            df_products = pd.DataFrame(products, columns=[
+                'id', 'name', 'price', 'stock', 'min_stock', 'category', 'supplier'
+            ])
+            df_products['price'] = df_products['price'].map(lambda price: f"${price:,.0f}")
+            df_products[['category', 'supplier']] = df_products[['category', 'supplier']].fillna('N/A')
+            df_products.columns = ['ID', 'Nombre', 'Precio', 'Stock', 'Stock Mínimo', 'Categoría', 'Proveedor']
 
             st.dataframe(df_products, width='stretch')
 
@@ -149,12 +177,11 @@ elif page == "📦 Inventario":
 elif page == "📊 Predicciones":
     st.header("📊 Predicciones de Demanda")
 
-    db = get_db()
+    db = get_read_db()
     try:
-        products = db.query(Product).all()
+        product_names = queries.list_product_names(db)
 
-        if products:
-            product_names = {p.id: p.name for p in products}
+        if product_names:
             selected_product = st.selectbox(
                 "Selecciona un producto para predecir demanda:",
                 options=list(product_names.keys()),
@@ -165,7 +192,9 @@ elif page == "📊 Predicciones":
                 days_ahead = st.slider("Días hacia adelante", 7, 90, 30)
 
                 if st.button("Generar Predicción"):
-                    prediction = predict_demand(selected_product, db, days_ahead)
+                    prediction = singleflight.forecasts.do(
+                        ("predict_demand", singleflight.scope_of(db), selected_product, days_ahead),
+                        predict_demand, selected_product, db, days_ahead)
 
                     col1, col2, col3 = st.columns(3)
                     with col1:
@@ -176,13 +205,12 @@ elif page == "📊 Predicciones":
                         st.metric("Confianza", prediction.get('message', 'N/A'))
 
                     # Mostrar datos históricos si existen
-                    sales = db.query(Sale).filter(Sale.product_id == selected_product).order_by(Sale.sale_date).all()
+                    sales = queries.list_sales_history(db, selected_product)
                     if sales:
                         st.subheader("📈 Historial de Ventas")
-                        df_history = pd.DataFrame([{
-                            'Fecha': s.sale_date.strftime('%Y-%m-%d'),
-                            'Cantidad': s.quantity
-                        } for s in sales])
+                        df_history = pd.DataFrame(sales)
+                        df_history['Fecha'] = df_history.pop('sale_date').dt.strftime('%Y-%m-%d')
+                        df_history = df_history.rename(columns={'quantity': 'Cantidad'})[['Fecha', 'Cantidad']]
 
                         st.line_chart(df_history.set_index('Fecha'))
         else:
@@ -191,6 +219,135 @@ elif page == "📊 Predicciones":
     finally:
         db.close()
 
+# Clasificación ABC/XYZ y stock muerto de todo el catálogo
+elif page == "🧮 Clasificación ABC/XYZ":
+    st.header("🧮 Clasificación ABC/XYZ del Inventario")
+
+    db = get_read_db()
+    try:
+        col1, col2 = st.columns(2)
+        with col1:
+            history_days = st.slider("Historia analizada (días)", 90, 1095, 730, step=5)
+        with col2:
+            dead_stock_days = st.slider("Sin ventas para considerarse stock muerto (días)", 30, 365, 60)
+
+        # Mismos parámetros que GET /inventory/classification: peticiones simultáneas comparten el cálculo
+        params = {
+            "history_days": history_days, "period_days": 7, "recent_days": 90, "dead_stock_days": dead_stock_days,
+            "a_share": 0.8, "b_share": 0.95, "x_cv": 0.5, "y_cv": 1.0, "cost_ratio": 1.0,
+        }
+        result = singleflight.forecasts.do(("inventory_classification", singleflight.scope_of(db), params),
+                                           inventory_analytics.build_classification, db, **params)
+        summary, rows = result["summary"], result["rows"]
+
+        if summary["products"]:
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Productos", f"{summary['products']:,}")
+            with col2:
+                st.metric("Stock muerto", f"{summary['dead_stock_products']:,} productos")
+            with col3:
+                st.metric("Capital inmovilizado", f"${summary['dead_stock_value']:,.0f}")
+
+            # A: 80 % de los ingresos; X: demanda semanal estable (CV <= 0,5), Z: errática o sin ventas
+            st.subheader("Matriz ABC × XYZ (productos)")
+            matrix = pd.DataFrame(summary["matrix"])
+            st.dataframe(matrix.pivot(index="abc", columns="xyz", values="products").fillna(0).astype(int),
+                         width='stretch')
+
+            st.subheader("🪦 Stock Muerto")
+            dead = pd.DataFrame(inventory_analytics.select_rows(rows, dead_stock=True, limit=50))
+            if dead.empty:
+                st.success("Todos los productos con stock se vendieron en el período.")
+            else:
+                dead = dead[['product_name', 'current_stock', 'days_since_last_sale', 'dead_stock_value']]
+                dead.columns = ['Producto', 'Stock', 'Días sin ventas', 'Capital']
+                dead['Días sin ventas'] = dead['Días sin ventas'].fillna(f"Más de {history_days}")
+                dead['Capital'] = dead['Capital'].map(lambda value: f"${value:,.0f}")
+                st.dataframe(dead, width='stretch')
+
+            st.subheader("Productos por Clase")
+            col1, col2 = st.columns(2)
+            with col1:
+                abc = st.selectbox("Clase ABC", ["Todas", *inventory_analytics.ABC_CLASSES])
+            with col2:
+                xyz = st.selectbox("Clase XYZ", ["Todas", *inventory_analytics.XYZ_CLASSES])
+            selected = pd.DataFrame(inventory_analytics.select_rows(
+                rows, None if abc == "Todas" else abc, None if xyz == "Todas" else xyz, limit=200))
+            if not selected.empty:
+                selected = selected[['product_name', 'abc', 'xyz', 'revenue', 'units_sold', 'days_of_cover',
+                                     'sell_through']]
+                selected.columns = ['Producto', 'ABC', 'XYZ', 'Ingresos', 'Unidades', 'Días de cobertura',
+                                    'Sell-through']
+                selected['Ingresos'] = selected['Ingresos'].map(lambda value: f"${value:,.0f}")
+                st.dataframe(selected, width='stretch')
+        else:
+            st.warning("No hay productos registrados para clasificar")
+
+    finally:
+        db.close()
+
+# Proyección de temporada escolar
+elif page == "🏫 Listas Escolares":
+    st.header("🏫 Proyección de Temporada Escolar")
+
+    db = get_read_db()
+    try:
+        year = st.number_input("Año escolar", min_value=2000, max_value=2100, value=datetime.now().year, step=1)
+        grades = queries.list_school_grades(db, int(year))
+
+        if grades:
+            st.subheader("👩‍🎓 Estudiantes esperados por grado")
+            enrollment = st.data_editor(
+                pd.DataFrame({'Grado': grades, 'Estudiantes': 30}),
+                disabled=['Grado'],
+                hide_index=True
+            )
+
+            if st.button("Calcular Proyección"):
+                plan = build_reorder_plan(
+                    db,
+                    int(year),
+                    enrollment_by_grade=dict(zip(enrollment['Grado'], enrollment['Estudiantes'].fillna(0).astype(int)))
+                )
+
+                if plan.empty:
+                    st.info("Las listas de este año no tienen productos del catálogo asociados")
+                else:
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("Demanda Proyectada", f"{int(plan['projected_demand'].sum()):,} unidades")
+                    with col2:
+                        st.metric("Unidades a Pedir", f"{int(plan['suggested_order_quantity'].sum()):,}")
+                    with col3:
+                        st.metric("Inversión Estimada", f"${plan['estimated_cost'].sum():,.0f}")
+
+                    df_plan = plan.rename(columns={
+                        'product_id': 'ID',
+                        'product_name': 'Producto',
+                        'supplier': 'Proveedor',
+                        'school_count': 'Colegios',
+                        'projected_demand': 'Demanda Proyectada',
+                        'current_stock': 'Stock Actual',
+                        'committed_in_orders': 'En Órdenes Abiertas',
+                        'available_stock': 'Disponible',
+                        'shortfall': 'Faltante',
+                        'suggested_order_quantity': 'Cantidad a Pedir',
+                        'estimated_cost': 'Costo Estimado'
+                    })
+                    st.dataframe(df_plan, width='stretch')
+                    st.download_button(
+                        "📥 Descargar plan (CSV)",
+                        df_plan.to_csv(index=False).encode('utf-8'),
+                        file_name=f"plan_temporada_{int(year)}.csv",
+                        mime="text/csv"
+                    )
+        else:
+            st.info("No hay listas escolares registradas para ese año")
+
+    finally:
+        db.close()
+
 # Chatbot Inteligente Interno
 elif page == "💬 Chatbot Inteligente":
     st.header("💬 Chatbot Inteligente PapelBot")
@@ -302,7 +459,7 @@ elif page == "💬 Chatbot Inteligente":
         # Consultas de disponibilidad - Mejorado con IA
         if 'tienen' in message or 'hay' in message or 'disponible' in message:
             # Primero intentar con lógica local mejorada
-            all_products = db.query(Product).all()
+            all_products = db.execute(queries.select_products()).all()
             found_products = []
 
             # Buscar productos con mejor coincidencia
@@ -356,7 +513,8 @@ Instrucciones específicas:
 - Si no hay stock, sugiere cuándo podría llegar
 """
 
-                ai_response = ai_client.ask_ai(f"Usuario pregunta: '{message}'. Basándote en nuestro catálogo, ¿tenemos este producto?", ai_context, max_tokens=200)
+                ai_response = ai_client.ask_ai(f"Usuario pregunta: '{message}'. Basándote en nuestro catálogo, ¿tenemos este producto?", ai_context, max_tokens=200,
+                                               priority=ai_governor.STAFF)
                 if ai_response:
                     return f"🤖 **Respuesta Inteligente:** {ai_response}\n\n💡 *Respuesta generada con IA basada en nuestro catálogo*"
                 else:
@@ -365,7 +523,7 @@ Instrucciones específicas:
         # Consultas de stock
         if 'stock' in message:
             if 'poco' in message or 'bajo' in message:
-                low_stock_products = db.query(Product).filter(Product.stock < Product.min_stock).all()
+                low_stock_products = db.execute(queries.select_low_stock_products()).all()
                 if low_stock_products:
                     response = "⚠️ **PRODUCTOS CON STOCK BAJO:**\n\n"
                     for product in low_stock_products[:5]:  # Máximo 5 productos
@@ -376,7 +534,7 @@ Instrucciones específicas:
                     return "✅ **EXCELENTE:** Todos los productos tienen stock suficiente. ¡Ninguna alerta de inventario!"
             else:
                 # Buscar producto específico
-                for product in db.query(Product).all():
+                for product in db.execute(queries.select_products()).all():
                     if product.name.lower() in message:
                         return f"📊 **STOCK DE {product.name.upper()}:**\n\n📦 Unidades disponibles: {product.stock}\n🎯 Stock mínimo: {product.min_stock}\n📈 Estado: {'✅ Suficiente' if product.stock >= product.min_stock else '⚠️ Bajo'}"
 
@@ -401,17 +559,15 @@ Instrucciones específicas:
                     product = db.query(Product).filter(Product.name.ilike(f'%{product_name}%')).first()
                     if product:
                         if product.stock >= quantity:
-                            # Registrar venta
-                            sale = Sale(
-                                product_id=product.id,
-                                quantity=quantity,
-                                total_price=product.price * quantity
-                            )
-                            db.add(sale)
-                            product.stock -= quantity
+                            # Registrar venta como ticket (ver basket_engine.py)
+                            basket_engine.register_ticket(db, [(product, quantity)], "streamlit")
                             db.commit()
 
-                            return f"✅ **VENTA REGISTRADA**\n\n📦 Producto: {product.name}\n🔢 Cantidad: {quantity} unidades\n💰 Total: ${product.price * quantity:,.0f}\n📊 Stock restante: {product.stock} unidades"
+                            response = f"✅ **VENTA REGISTRADA**\n\n📦 Producto: {product.name}\n🔢 Cantidad: {quantity} unidades\n💰 Total: ${product.price * quantity:,.0f}\n📊 Stock restante: {product.stock} unidades"
+                            related = [r["name"] for r in basket_engine.related(db, product.id, 3) if r["stock"] > 0]
+                            if related:
+                                response += f"\n\n🛒 Se compra con: {', '.join(related)}"
+                            return response
                         else:
                             return f"❌ **STOCK INSUFICIENTE**\n\n📦 {product.name} tiene solo {product.stock} unidades disponibles\n💡 No se puede vender {quantity} unidades."
                     else:
@@ -424,34 +580,24 @@ Instrucciones específicas:
         # Predicciones de demanda
         if 'predic' in message or 'demanda' in message:
             if 'alertas' in message:
-                # Mostrar productos con demanda crítica
-                products = db.query(Product).all()
-                alerts = []
-
-                for product in products:
-                    prediction = predict_demand(product.id, db, 30)
-                    predicted_demand = prediction.get("predicted_demand", 0)
-
-                    if predicted_demand > product.stock:
-                        alerts.append({
-                            'name': product.name,
-                            'stock': product.stock,
-                            'predicted': predicted_demand
-                        })
+                # Mostrar productos con demanda crítica (alertas materializadas)
+                alerts = queries.list_active_alerts(db, alert_engine.HIGH_DEMAND)
 
                 if alerts:
                     response = "🚨 **ALERTAS DE DEMANDA CRÍTICA:**\n\n"
                     for alert in alerts[:5]:
-                        response += f"• {alert['name']}: Stock {alert['stock']} vs Demanda {alert['predicted']:.1f}\n"
+                        response += f"• {alert['product_name']}: Stock {alert['current_stock']} vs Demanda {alert['value']:.1f}\n"
                     response += "\n📞 Recomiendo reabastecer estos productos urgentemente."
                     return response
                 else:
                     return "✅ **SIN ALERTAS:** Todos los productos tienen stock suficiente para la demanda predicha."
             else:
                 # Predicción específica
-                for product in db.query(Product).all():
+                for product in db.execute(queries.select_products()).all():
                     if product.name.lower() in message:
-                        prediction = predict_demand(product.id, db, 30)
+                        prediction = singleflight.forecasts.do(
+                            ("predict_demand", singleflight.scope_of(db), product.id, 30),
+                            predict_demand, product.id, db, 30)
                         predicted_demand = prediction.get("predicted_demand", 0)
 
                         return f"🔮 **PREDICCIÓN DE DEMANDA**\n\n📦 Producto: {product.name}\n📊 Demanda predicha (30 días): {predicted_demand:.1f} unidades\n📦 Stock actual: {product.stock}\n⚠️ Estado: {'✅ Suficiente' if product.stock >= predicted_demand else '🚨 Reabastecer'}"
@@ -471,14 +617,16 @@ Instrucciones específicas:
 
             return f"💰 **VENTAS DE HOY**\n\n📊 Número de ventas: {sales_count}\n💵 Total vendido: ${today_sales:,.0f}\n📈 Promedio por venta: ${today_sales/sales_count if sales_count > 0 else 0:,.0f}"
 
-        # Si no pudo responder con lógica local, intentar con IA con contexto completo
-        all_products = db.query(Product).all()
-        products_catalog = "\n".join([f"- {p.name}: ${p.price:,.0f} (stock: {p.stock})" for p in all_products])
+        # Preguntas frecuentes (horarios, precios de impresión, fidelización...) se responden con el
+        # índice local; el contexto completo solo se arma si hay que consultar a la IA
+        def full_context():
+            all_products = db.execute(queries.select_products()).all()
+            products_catalog = "\n".join([f"- {p.name}: ${p.price:,.0f} (stock: {p.stock})" for p in all_products])
 
-        recent_sales = db.query(Sale).order_by(Sale.sale_date.desc()).limit(5).all()
-        sales_summary = "\n".join([f"- {s.quantity} x Producto ID {s.product_id}: ${s.total_price:,.0f}" for s in recent_sales])
+            recent_sales = db.query(Sale).order_by(Sale.sale_date.desc()).limit(5).all()
+            sales_summary = "\n".join([f"- {s.quantity} x Producto ID {s.product_id}: ${s.total_price:,.0f}" for s in recent_sales])
 
-        context = f"""
+            return f"""
 PAPELERÍA INTELIGENTE ANDES - CONTEXTO COMPLETO:
 
 📍 INFORMACIÓN DEL NEGOCIO:
@@ -505,7 +653,10 @@ PAPELERÍA INTELIGENTE ANDES - CONTEXTO COMPLETO:
 - Si no sabes algo específico, admítelo y sugiere alternativas
 """
 
-        ai_response = ai_client.ask_ai(f"Pregunta del cliente: '{question}'", context, max_tokens=400)
+        ai_response, source = ai_client.answer(message, full_context, max_tokens=400, priority=ai_governor.STAFF,
+                                               prompt=f"Pregunta del cliente: '{message}'")
+        if ai_response and source != "ai":
+            return f"{ai_response}\n\n⚡ *Respuesta inmediata de preguntas frecuentes*"
         if ai_response:
             return f"🤖 **PapelBot IA:** {ai_response}\n\n💡 *Respuesta inteligente generada con IA*"
         else:
@@ -593,7 +744,7 @@ elif page == "⚠️ Alertas":
     try:
         # Alertas de stock bajo
         st.subheader("📉 Productos con Stock Bajo")
-        low_stock_products = db.query(Product).filter(Product.stock < Product.min_stock).all()
+        low_stock_products = db.execute(queries.select_low_stock_products()).all()
 
         if low_stock_products:
             for product in low_stock_products:
@@ -603,10 +754,7 @@ elif page == "⚠️ Alertas":
 
         # Alertas de baja rotación
         st.subheader("🐌 Productos de Baja Rotación")
-        sixty_days_ago = datetime.now(timezone.utc) - pd.Timedelta(days=60)
-
-        recent_sales_ids = db.query(Sale.product_id).filter(Sale.sale_date >= sixty_days_ago).distinct().subquery()
-        low_rotation_products = db.query(Product).filter(~Product.id.in_(recent_sales_ids)).all()
+        low_rotation_products = db.execute(queries.select_low_rotation_products(days=60)).all()
 
         if low_rotation_products:
             for product in low_rotation_products:
@@ -614,33 +762,56 @@ elif page == "⚠️ Alertas":
         else:
             st.success("✅ Todos los productos tienen rotación activa")
 
-        # Alertas de demanda
+        # Alertas de demanda (materializadas por el motor de alertas, sin pronosticar el catálogo)
         st.subheader("🔮 Alertas de Demanda")
-        products = db.query(Product).all()
-        demand_alerts = []
-
-        for product in products:
-            prediction = predict_demand(product.id, db, 30)
-            predicted_demand = prediction.get("predicted_demand", 0)
-
-            if predicted_demand > product.stock:
-                demand_alerts.append({
-                    'producto': product.name,
-                    'stock_actual': product.stock,
-                    'demanda_predicha': predicted_demand
-                })
+        demand_alerts = queries.list_active_alerts(db, alert_engine.HIGH_DEMAND)
 
         if demand_alerts:
             for alert in demand_alerts:
-                st.error(f"🚨 **{alert['producto']}**: Stock insuficiente para demanda predicha "
-                        f"({alert['stock_actual']} vs {alert['demanda_predicha']:.1f})")
+                st.error(f"🚨 **{alert['product_name']}**: Stock insuficiente para demanda predicha "
+                        f"({alert['current_stock']} vs {alert['value']:.1f})")
         else:
             st.success("✅ No hay alertas de demanda crítica")
 
+        # Ventas atípicas detectadas al registrarlas; se cierran a mano una vez revisadas
+        st.subheader("🔎 Ventas Atípicas")
+        anomaly_alerts = queries.list_active_alerts(db, alert_engine.SALE_ANOMALY)
+
+        if anomaly_alerts:
+            for alert in anomaly_alerts:
+                st.warning(f"🔎 {alert['message']}")
+                if st.button("Marcar como revisada", key=f"resolve_anomaly_{alert['id']}"):
+                    sales_anomalies.resolve(db, alert['id'])
+                    db.commit()
+                    st.rerun()
+        else:
+            st.success("✅ No hay ventas atípicas sin revisar")
+
+        # Riesgo de quiebre simulado (Monte Carlo): probabilidad y no solo "pronóstico > stock"
+        st.subheader("🎲 Riesgo de Quiebre en el Plazo de Entrega")
+        lead_time_days = st.slider("Plazo de entrega (días)", 1, 30, 7)
+        params = {"history_days": 90, "lead_time_days": lead_time_days, "supplier_lead_times": {}, "paths": 5000,
+                  "seed": 42, "min_probability": 0.2, "limit": 20}
+        report = singleflight.forecasts.do(("stockout_risk", singleflight.scope_of(db), params),
+                                           stockout_risk.build_risk, db, **params)
+        if report["risks"]:
+            st.caption(f"{report['products_at_risk']} productos con riesgo; ventas perdidas esperadas "
+                       f"${report['expected_lost_revenue']:,.0f}")
+            df_risk = pd.DataFrame(report["risks"])[[
+                'product_name', 'current_stock', 'expected_demand', 'stockout_probability', 'expected_lost_units'
+            ]]
+            df_risk['stockout_probability'] = df_risk['stockout_probability'].map(lambda value: f"{value:.0%}")
+            df_risk.columns = ['Producto', 'Stock', 'Demanda esperada', 'Prob. de quiebre', 'Unidades perdidas']
+            st.dataframe(df_risk, width='stretch')
+        else:
+            st.success("✅ Ningún producto supera el 20 % de probabilidad de quiebre")
+
     finally:
         db.close()
 
 # Footer
 st.sidebar.markdown("---")
 st.sidebar.markdown("📞 **Soporte:** papelbot@andes.edu.co")
-st.sidebar.markdown("🏢 **Ubicación:** Andes, Antioquia, Colombia")
\ No newline at end of file
+st.sidebar.markdown("🏢 **Ubicación:** Andes, Antioquia, Colombia")
+
+finish_page_profile(page_profile)
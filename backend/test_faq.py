@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Prueba del umbral del índice local de preguntas frecuentes: las preguntas
+curadas se responden localmente y las de catálogo o de negocio van a la IA,
+sin responder con la especificación del README.
+Ejecutar desde backend/ con: python test_faq.py  (o python -m pytest test_faq.py)
+"""
+
+from app import faq
+from benchmarks.bench_faq import QUESTIONS
+
+
+def test_threshold():
+    """Cada pregunta de bench_faq toma el camino esperado con FAQ_MIN_SCORE"""
+    for question, expected in QUESTIONS:
+        match = faq.lookup(question)
+        path = "ai" if match is None else "faq"
+        assert path == expected, (question, match)
+
+
+def test_readme_business_knowledge_only():
+    """Del README solo se indexa el conocimiento del negocio, no la especificación del agente"""
+    titles = {title for source, title, _ in faq.get_index().documents if source == "readme"}
+    assert titles, "no se indexó ninguna sección del README"
+    sections = dict(faq.readme_sections(sections=("Funcionalidades Principales",)))
+    assert sections and not titles & set(sections), titles & set(sections)
+
+
+if __name__ == "__main__":
+    for test in (test_threshold, test_readme_business_knowledge_only):
+        test()
+        print(f"✅ {test.__name__}")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Prueba de la sincronización entre dos instancias: una central y un nodo que
+arranca desde una copia de la base central, cada una con su propia base
+SQLite temporal y su propio servidor.
+Ejecutar desde backend/ con: python test_sync.py  (o python -m pytest test_sync.py)
+"""
+
+import atexit
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Instance:
+    """Un servidor de la API con su propia base, en un subproceso"""
+
+    def __init__(self, name: str, db_path: str, **env):
+        self.name = name
+        self.db_path = db_path
+        self.env = env
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.process = None
+
+    def start(self, **env):
+        environment = dict(os.environ, DATABASE_URL=f"sqlite:///{self.db_path}", SYNC_ENABLED="1")
+        environment.update(self.env, **env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=environment)
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            try:
+                requests.get(self.url + "/", timeout=1)
+                return self
+            except requests.ConnectionError:
+                if self.process.poll() is not None:
+                    raise RuntimeError(f"{self.name} terminó al arrancar ({self.process.returncode})")
+                time.sleep(0.2)
+        raise RuntimeError(f"{self.name} no respondió en 60 s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=30)
+        self.process = None
+
+    def get(self, path: str, **kwargs):
+        response = requests.get(self.url + path, timeout=30, **kwargs)
+        response.raise_for_status()
+        return response.json()
+
+    def post(self, path: str, expect: int = 200, **kwargs):
+        response = requests.post(self.url + path, timeout=60, **kwargs)
+        assert response.status_code == expect, (self.name, path, response.status_code, response.text)
+        return response.json()
+
+    def stock(self, name: str) -> int:
+        return next(product["stock"] for product in self.get("/products/") if product["name"] == name)
+
+    def sell(self, name: str, quantity: int):
+        product = next(product for product in self.get("/products/") if product["name"] == name)
+        self.post("/baskets/tickets", expect=201,
+                  json={"lines": [{"product_id": product["id"], "quantity": quantity}]})
+
+
+_cluster = {}
+
+
+def cluster():
+    """Central con un producto y un nodo arrancado desde una copia de su base (una vez por ejecución)"""
+    if _cluster:
+        return _cluster["central"], _cluster["node"]
+    workdir = tempfile.mkdtemp(prefix="papeleria-sync-")
+    central = Instance("central", os.path.join(workdir, "central.db")).start()
+    central.post("/products/", expect=201, json={
+        "name": "Cuaderno cuadriculado", "price": 4500, "stock": 100, "min_stock": 10, "category": "Cuadernos"})
+
+    # La tienda arranca con una copia de la base central (historia y node_id incluidos)
+    node_path = os.path.join(workdir, "node.db")
+    with sqlite3.connect(central.db_path) as source, sqlite3.connect(node_path) as target:
+        source.backup(target)
+    node = Instance("node", node_path, SYNC_CENTRAL_URL=central.url, SYNC_INTERVAL_SECONDS="0").start()
+
+    def cleanup():
+        node.stop()
+        central.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    atexit.register(cleanup)
+    _cluster.update(central=central, node=node, workdir=workdir)
+    return central, node
+
+
+def test_node_bootstrap():
+    """Una copia de la central toma su propio identificador y no reenvía ni vuelve a traer lo heredado"""
+    central, node = cluster()
+    central_id = central.get("/sync/status")["node_id"]
+    assert node.get("/sync/status")["node_id"] == central_id
+
+    node.sell("Cuaderno cuadriculado", 1)
+    result = node.post("/sync/run")
+    # Cada venta son dos cambios: la venta y el delta de stock del producto
+    assert result["pushed"] == 2 and result["pulled"] == 0, result
+
+    status = node.get("/sync/status")
+    assert status["node_id"] != central_id
+    assert status["pending_changes"] == 0
+    assert central.stock("Cuaderno cuadriculado") == node.stock("Cuaderno cuadriculado") == 99
+
+
+def test_stock_delta_merge():
+    """Ventas en ambos lados sin sincronizar: los deltas de stock se suman en las dos bases"""
+    central, node = cluster()
+    before = central.stock("Cuaderno cuadriculado")
+    central.sell("Cuaderno cuadriculado", 3)
+    node.sell("Cuaderno cuadriculado", 2)
+
+    result = node.post("/sync/run")
+    assert result["pushed"] == 2 and result["pulled"] == 2, result
+    assert central.stock("Cuaderno cuadriculado") == node.stock("Cuaderno cuadriculado") == before - 5
+
+
+def test_resent_batch():
+    """Un lote reenviado (cursor perdido antes de confirmarse) no se aplica dos veces"""
+    central, node = cluster()
+    before = central.stock("Cuaderno cuadriculado")
+    node.sell("Cuaderno cuadriculado", 4)
+    node.post("/sync/run")
+    assert central.stock("Cuaderno cuadriculado") == before - 4
+
+    # El nodo olvida su cursor de envío: vuelve a empujar todo lo propio
+    with sqlite3.connect(node.db_path) as conn:
+        conn.execute("UPDATE sync_state SET value = '0' WHERE key LIKE 'push:%'")
+    result = node.post("/sync/run")
+    assert result["pushed"] > 0, result
+    assert central.stock("Cuaderno cuadriculado") == node.stock("Cuaderno cuadriculado") == before - 4
+
+
+def test_central_errors_and_node_id_change():
+    """Un error de la central es 502; con SYNC_NODE_ID nuevo lo pendiente viaja con ese identificador"""
+    central, node = cluster()
+    node.sell("Cuaderno cuadriculado", 1)
+    node.stop()
+
+    # Ruta equivocada: la central responde 404 y /sync/run lo informa como 502
+    node.start(SYNC_CENTRAL_URL=central.url + "/v0")
+    node.post("/sync/run", expect=502)
+    node.stop()
+
+    node.start(SYNC_NODE_ID="tienda-andes")
+    status = node.get("/sync/status")
+    assert status["node_id"] == "tienda-andes" and status["pending_changes"] == 2, status
+    assert node.post("/sync/run")["pushed"] == 2
+    assert central.stock("Cuaderno cuadriculado") == node.stock("Cuaderno cuadriculado")
+    assert node.get("/sync/status")["pending_changes"] == 0
+
+
+if __name__ == "__main__":
+    for test in (test_node_bootstrap, test_stock_delta_merge, test_resent_batch,
+                 test_central_errors_and_node_id_change):
+        test()
+        print(f"✅ {test.__name__}")